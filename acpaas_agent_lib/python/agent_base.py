@@ -1,7 +1,8 @@
-def create_message(tipo, origen, destino, id_mensaje=None, respuesta_a=None, id_sesion=None, numero_secuencia=None, requiere_ack=False, datos=None):
-    import uuid
-    from datetime import datetime
+import json
+import uuid
+from datetime import datetime
 
+def create_message(tipo, origen, destino, id_mensaje=None, respuesta_a=None, id_sesion=None, numero_secuencia=None, requiere_ack=False, datos=None):
     if id_mensaje is None:
         id_mensaje = str(uuid.uuid4())
     
@@ -20,8 +21,6 @@ def create_message(tipo, origen, destino, id_mensaje=None, respuesta_a=None, id_
     
     return message 
 
-import json
-
 def parse_message(json_str):
     """
     Parses a JSON string into a message dictionary and validates required fields.
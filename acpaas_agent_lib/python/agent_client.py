@@ -0,0 +1,677 @@
+"""
+Persistent, multiplexed agent connection to an ACPaaS hub.
+
+``AgentClient`` keeps one mTLS WebSocket open to a hub URL and reuses it for
+every message the agent sends, instead of paying a TLS handshake per job:
+
+* any number of sessions (``id_sesion``) share the socket; ``Session`` keeps
+  the ``numero_secuencia`` counter of each one;
+* ``request`` correlates the reply by ``respuesta_a`` to an asyncio future,
+  and ``stream`` yields every reply of a task that streams partial results;
+* ``requiere_ack`` messages are tracked by an ``AckTracker`` and retransmitted,
+  inbound ones are acknowledged and de-duplicated; with ``ack_delay`` the ACKs
+  of consecutive session messages are merged into range ACKs;
+* batch frames from the hub (``lotes`` in CAPABILITY_ANNOUNCE) are unpacked;
+* ``send_payload``/``request_payload`` send large payloads as chunked
+  transfers (chunking.py), and a chunked message is delivered once, with an
+  ``IncomingPayload`` under ``message["carga"]`` to read the chunks from;
+* inbound session messages are handed over in ``numero_secuencia`` order by a
+  ``Resequencer``, which answers gaps it gives up on with ERROR SEQUENCE_GAP;
+* FLOW_CONTROL PAUSE/RESUME and the credit windows gate ``send``;
+* a dropped connection is re-established with jittered exponential backoff,
+  re-registering and retransmitting whatever was still unacknowledged.
+
+``ClientPool`` shares one ``AgentClient`` per hub URL across the tasks of a
+process. The hub routes to a single live connection per agent identity, so a
+second socket to the same URL would only replace the first one.
+"""
+
+import asyncio
+import inspect
+import logging
+import random
+import uuid
+
+import websockets
+
+from acpaas_agent_lib.python.chunking import (
+    DEFAULT_CHUNK_SIZE, FRAGMENT_FIELD, PAYLOAD_FIELD, IncomingPayload, PayloadSource)
+from acpaas_agent_lib.python.codec import (
+    FORMAT_JSON, SUPPORTED_FORMATS, build_message, decode_chunk, decode_frame, encode_chunk, encode_frame,
+    is_batch_frame, is_chunk_frame, negotiate_format, split_batch)
+from acpaas_agent_lib.python.compression import DeflateSettings
+from acpaas_agent_lib.python.flow_control import PAUSE, RESUME, FlowController
+from acpaas_agent_lib.python.reliability import AckCoalescer, AckTracker, DedupWindow, TimerWheel, ack_range
+from acpaas_agent_lib.python.sequencing import Resequencer
+
+logger = logging.getLogger(__name__)
+
+SERVER_AGENT_ID = "acpaas_server"
+# ``datos.estado`` de los RESPUESTA_TAREA intermedios de una tarea que envía resultados parciales
+TASK_PARTIAL = "parcial"
+# Bytes de un fragmento recibido, mientras el mensaje pasa por el Resequencer
+_CHUNK_DATA = "_datos_fragmento"
+
+
+class AgentError(Exception):
+    """An ERROR message received in reply to a request.
+
+    Attributes:
+        codigo_error (str): The ``codigo_error`` reported by the peer.
+        message (dict): The full ERROR message.
+    """
+
+    def __init__(self, message):
+        datos = message.get("datos") or {}
+        self.codigo_error = datos.get("codigo_error")
+        self.message = message
+        super().__init__(f"{self.codigo_error}: {datos.get('mensaje_error')}")
+
+
+class Session:
+    """One ``id_sesion`` multiplexed over an ``AgentClient`` connection."""
+
+    __slots__ = ("client", "destino", "id_sesion", "numero_secuencia")
+
+    def __init__(self, client, destino, id_sesion=None):
+        self.client = client
+        self.destino = destino
+        self.id_sesion = id_sesion or str(uuid.uuid4())
+        self.numero_secuencia = 0
+
+    def _next_sequence(self):
+        self.numero_secuencia += 1
+        return self.numero_secuencia
+
+    async def send(self, tipo, datos=None, requiere_ack=False, respuesta_a=None):
+        return await self.client.send(self.destino, tipo, datos, id_sesion=self.id_sesion,
+                                      numero_secuencia=self._next_sequence(), requiere_ack=requiere_ack,
+                                      respuesta_a=respuesta_a)
+
+    async def request(self, tipo, datos=None, timeout=None, requiere_ack=False):
+        return await self.client.request(self.destino, tipo, datos, timeout=timeout, id_sesion=self.id_sesion,
+                                         numero_secuencia=self._next_sequence(), requiere_ack=requiere_ack)
+
+    def stream(self, tipo, datos=None, timeout=None, requiere_ack=True):
+        return self.client.stream(self.destino, tipo, datos, timeout=timeout, id_sesion=self.id_sesion,
+                                  numero_secuencia=self._next_sequence(), requiere_ack=requiere_ack)
+
+    async def send_payload(self, tipo, payload, datos=None, respuesta_a=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        return await self.client.send_payload(self.destino, tipo, payload, datos, chunk_size=chunk_size,
+                                              session=self, respuesta_a=respuesta_a)
+
+    async def request_payload(self, tipo, payload, datos=None, timeout=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        return await self.client.request_payload(self.destino, tipo, payload, datos, timeout=timeout,
+                                                 chunk_size=chunk_size, session=self)
+
+    async def close(self):
+        """Sends SESSION_CLOSE and releases the session's flow-control window."""
+        try:
+            await self.send("SESSION_CLOSE", {"motivo": "completed"})
+        finally:
+            self.client.flow.close_session(self.id_sesion)
+            self.client.sequencer.forget(self.id_sesion)
+
+
+class AgentClient:
+    """A persistent, self-healing connection of one agent to one hub.
+
+    Args:
+        agent_id (str): Our identifier; must match the CN of the certificate.
+        url (str): Hub URL, e.g. ``wss://localhost:8080/``.
+        ssl_context (ssl.SSLContext, optional): Client mTLS context.
+        uri (str, optional): Reachability URI announced in REGISTRO.
+        max_sesiones (int, optional): ``max_sesiones_concurrentes`` announced
+            to the hub; None for no limit.
+        on_message (callable, optional): ``on_message(message)`` for inbound
+            messages that are not replies to our own requests. May be a
+            coroutine function; each call then runs in its own task.
+        wheel (TimerWheel, optional): Shared timer wheel for ACK and gap deadlines.
+        gap_timeout (float): Seconds to wait for a missing ``numero_secuencia``
+            before skipping it.
+        reorder_buffer (int): Out-of-order messages held per session and sender.
+        batching (bool): Announce ``lotes`` so the hub may send batch frames.
+        ack_delay (float): When positive, hold back the ACKs of session
+            messages up to this long and send one range MESSAGE_ACK per run of
+            consecutive ``numero_secuencia``; the senders must understand
+            range ACKs (``AgentClient`` does).
+        deflate (DeflateSettings, optional): permessage-deflate offered to the
+            hub; None connects without compression.
+        connect (callable, optional): Replacement for ``websockets.connect``.
+        **flow_options: ``connection_window`` / ``session_window`` for the
+            ``FlowController``.
+    """
+
+    def __init__(self, agent_id, url, ssl_context=None, server_id=SERVER_AGENT_ID, uri=None,
+                 capacidades=(), max_sesiones=None, payload_formats=SUPPORTED_FORMATS, on_message=None, wheel=None,
+                 request_timeout=30.0, ack_timeout=5.0, max_retries=5, reconnect_delay=0.5,
+                 max_reconnect_delay=30.0, gap_timeout=2.0, reorder_buffer=256, batching=True, ack_delay=0.0,
+                 deflate=DeflateSettings(), connect=None, **flow_options):
+        self.agent_id = agent_id
+        self.url = url
+        self.ssl_context = ssl_context
+        self.server_id = server_id
+        self.uri = uri or url
+        self.capacidades = list(capacidades)
+        self.max_sesiones = max_sesiones
+        self.payload_formats = tuple(payload_formats)
+        self.payload_format = FORMAT_JSON
+        self.batching = batching
+        self.on_message = on_message
+        self.request_timeout = request_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.deflate = deflate
+        self._connect = connect or websockets.connect
+
+        self._own_wheel = wheel is None
+        self.wheel = wheel or TimerWheel()
+        self.flow = FlowController(server_id, **flow_options)
+        self.tracker = AckTracker(self._retransmit, self.wheel, timeout=ack_timeout, max_retries=max_retries,
+                                  on_expired=self._ack_expired)
+        self.dedup = DedupWindow()
+        self.acks = AckCoalescer(self._send_range_ack, self.wheel, ack_delay) if ack_delay > 0 else None
+        self.sequencer = Resequencer(self._deliver, self.wheel, gap_timeout, reorder_buffer, on_gap=self._report_gap)
+        self.pending = {}
+        self.streams = {}
+        self.transfers = {}
+        self.paused_transfers = {}
+        self.connections = 0
+
+        self._websocket = None
+        self._connected = None
+        self._runner = None
+        self._closing = False
+
+    # --- Ciclo de vida ---
+
+    async def start(self, timeout=None):
+        """Connects (retrying as needed) and returns once registered with the hub."""
+        if self._runner is None:
+            self._connected = asyncio.Event()
+            if self._own_wheel:
+                self.wheel.start()
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+        await asyncio.wait_for(self._wait_connected(), timeout)
+        return self
+
+    async def close(self):
+        self._closing = True
+        if self._websocket is not None:
+            await self._websocket.close()
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+        self.tracker.cancel_all(ConnectionError("client closed"))
+        self._fail_pending(ConnectionError("client closed"))
+        self._abort_transfers(ConnectionError("client closed"))
+        if self._own_wheel:
+            self.wheel.stop()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def connected(self):
+        return self._connected is not None and self._connected.is_set()
+
+    async def _wait_connected(self):
+        if self._runner is None:
+            raise RuntimeError("AgentClient is not started")
+        while not self._connected.is_set():
+            waiter = asyncio.ensure_future(self._connected.wait())
+            try:
+                await asyncio.wait((waiter, self._runner), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if self._runner.done():
+                raise ConnectionError("client closed")
+        return self._websocket
+
+    async def _run(self):
+        attempt = 0
+        while not self._closing:
+            try:
+                websocket = await self._connect(self.url, ssl=self.ssl_context, compression=None,
+                                                extensions=self.deflate.client_extensions() if self.deflate else None)
+            except Exception as e:
+                delay = self._backoff(attempt)
+                attempt += 1
+                logger.warning("Connection to %s failed (%s); retrying in %.2fs.", self.url, e, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            reader = asyncio.get_running_loop().create_task(self._read(websocket))
+            try:
+                await self._handshake(websocket, reader)
+            except Exception as e:
+                logger.warning("Handshake with %s failed: %s", self.url, e)
+                reader.cancel()
+                await websocket.close()
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            attempt = 0
+            self.connections += 1
+            self._websocket = websocket
+            self._connected.set()
+            logger.info("Connected to %s as '%s'.", self.url, self.agent_id)
+            self._resend_unacknowledged()
+            try:
+                await reader
+            finally:
+                self._connected.clear()
+                self._websocket = None
+                self.flow.reset()
+            if not self._closing:
+                logger.warning("Connection to %s lost; reconnecting.", self.url)
+
+    def _backoff(self, attempt):
+        delay = min(self.reconnect_delay * 2 ** attempt, self.max_reconnect_delay)
+        # Jitter: evita que todos los agentes reconecten a la vez tras un corte del hub
+        return delay * (0.5 + random.random() / 2)
+
+    async def _handshake(self, websocket, reader):
+        self.payload_format = FORMAT_JSON
+        registro = build_message("REGISTRO", self.agent_id, self.server_id, datos={"uri": self.uri})
+        await self._exchange(websocket, reader, registro)
+        announce = build_message("CAPABILITY_ANNOUNCE", self.agent_id, self.server_id, datos={
+            "version_protocolo": "1.1",
+            "capacidades": self.capacidades,
+            "max_sesiones_concurrentes": self.max_sesiones,
+            "formatos_payload": list(self.payload_formats),
+            "lotes": self.batching,
+            "acks_por_rango": True,
+        })
+        await self._exchange(websocket, reader, announce)
+
+    async def _exchange(self, websocket, reader, message):
+        future = self.pending[message["id_mensaje"]] = asyncio.get_running_loop().create_future()
+        try:
+            await websocket.send(encode_frame(message))
+            await asyncio.wait((future, reader), timeout=self.request_timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not future.done():
+                raise ConnectionError(f"no reply to {message['tipo']}")
+            return future.result()
+        finally:
+            self.pending.pop(message["id_mensaje"], None)
+
+    def _resend_unacknowledged(self):
+        for entry in list(self.tracker.in_flight.values()):
+            self._retransmit(entry.frame)
+
+    # --- Envío ---
+
+    async def send(self, destino, tipo, datos=None, **fields):
+        """Sends a message, waiting for flow control and for the connection.
+
+        ``requiere_ack`` messages are retransmitted until acknowledged, also
+        across reconnects; use ``acked`` to wait for the MESSAGE_ACK.
+
+        Returns:
+            dict: The message as sent.
+        """
+        message = build_message(tipo, self.agent_id, destino, datos=datos, **fields)
+        await self._send_message(message)
+        return message
+
+    async def _send_message(self, message, chunk=None):
+        await self.flow.acquire(message)
+        websocket = await self._wait_connected()
+        if chunk is None:
+            frame = encode_frame(message, self.payload_format)
+        else:
+            frame = encode_chunk(message, chunk, self.payload_format)
+        if message["requiere_ack"]:
+            self.tracker.track(message["id_mensaje"], frame, message.get("id_sesion"),
+                               message.get("numero_secuencia"))
+        try:
+            await websocket.send(frame)
+        except websockets.ConnectionClosed:
+            if not message["requiere_ack"]:
+                raise
+            # Se retransmite al reconectar
+
+    def acked(self, message):
+        """Returns a future resolved when the MESSAGE_ACK for ``message`` arrives."""
+        return self.tracker.wait(message["id_mensaje"])
+
+    async def request(self, destino, tipo, datos=None, timeout=None, **fields):
+        """Sends a message and waits for the reply whose ``respuesta_a`` matches it.
+
+        Raises:
+            AgentError: If the reply is an ERROR message.
+            asyncio.TimeoutError: If no reply arrives within ``timeout``.
+        """
+        message = build_message(tipo, self.agent_id, destino, datos=datos, **fields)
+        future = self.pending[message["id_mensaje"]] = asyncio.get_running_loop().create_future()
+        try:
+            await self._send_message(message)
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self.pending.pop(message["id_mensaje"], None)
+
+    async def stream(self, destino, tipo, datos=None, timeout=None, **fields):
+        """Sends a message and yields its replies until the final one.
+
+        A task handler that streams (see runtime.py) answers with RESPUESTA_TAREA
+        messages whose ``datos.estado`` is ``"parcial"``, then a final one. Each
+        reply is yielded as it arrives and none is kept afterwards.
+
+        Raises:
+            AgentError: If a reply is an ERROR message.
+            asyncio.TimeoutError: If ``timeout`` passes without a reply.
+        """
+        message = build_message(tipo, self.agent_id, destino, datos=datos, **fields)
+        replies = self.streams[message["id_mensaje"]] = asyncio.Queue()
+        try:
+            await self._send_message(message)
+            while True:
+                reply = await asyncio.wait_for(replies.get(), timeout or self.request_timeout)
+                if reply["tipo"] == "ERROR":
+                    raise AgentError(reply)
+                yield reply
+                if (reply.get("datos") or {}).get("estado") != TASK_PARTIAL:
+                    return
+        finally:
+            self.streams.pop(message["id_mensaje"], None)
+
+    async def send_payload(self, destino, tipo, payload, datos=None, chunk_size=DEFAULT_CHUNK_SIZE, session=None,
+                           **fields):
+        """Sends ``payload`` as a chunked transfer (PROTOCOL_SPEC 3.6).
+
+        The payload is read one chunk at a time (see ``PayloadSource``) and
+        each chunk goes out as a ``tipo`` message with ``requiere_ack``. The
+        first one also carries ``datos``. A chunk holds its flow-control
+        credits until it is acknowledged, so at most a credit window of chunks
+        is in memory however large the payload is.
+
+        Args:
+            payload: Bytes-like object, file path or binary file.
+            session (Session, optional): Session the chunks belong to; each
+                one takes its next ``numero_secuencia``.
+            **fields: Other message fields (``respuesta_a``...); an
+                ``id_mensaje`` applies to the first chunk.
+
+        Returns:
+            dict: The first chunk, whose ``id_mensaje`` identifies the transfer.
+        """
+        if session is not None:
+            fields["id_sesion"] = session.id_sesion
+        id_mensaje = fields.pop("id_mensaje", None)
+        fields.pop("requiere_ack", None)
+        first = None
+        with PayloadSource(payload, chunk_size) as source:
+            parte = 0
+            for offset, chunk, fin in source:
+                parte += 1
+                if session is not None:
+                    fields["numero_secuencia"] = session._next_sequence()
+                message = build_message(tipo, self.agent_id, destino, id_mensaje=id_mensaje, requiere_ack=True,
+                                        **fields)
+                id_mensaje = None
+                fragmento = {"transferencia": first["id_mensaje"] if first else message["id_mensaje"],
+                             "parte": parte, "offset": offset, "fin": fin}
+                if first is None:
+                    first = message
+                    fragmento["tamano_total"] = source.size
+                    message["datos"] = dict(datos or {}, **{FRAGMENT_FIELD: fragmento})
+                else:
+                    message["datos"] = {FRAGMENT_FIELD: fragmento}
+                await self._send_message(message, chunk)
+        return first
+
+    async def request_payload(self, destino, tipo, payload, datos=None, timeout=None, **options):
+        """Sends ``payload`` with ``send_payload`` and waits for the reply to the transfer.
+
+        ``timeout`` starts once the last chunk has been sent.
+
+        Raises:
+            AgentError: If the reply is an ERROR message.
+            asyncio.TimeoutError: If no reply arrives within ``timeout``.
+        """
+        id_mensaje = str(uuid.uuid4())
+        future = self.pending[id_mensaje] = asyncio.get_running_loop().create_future()
+        try:
+            await self.send_payload(destino, tipo, payload, datos, id_mensaje=id_mensaje, **options)
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self.pending.pop(id_mensaje, None)
+
+    def session(self, destino, id_sesion=None):
+        """Returns a new ``Session`` with ``destino`` on this connection."""
+        return Session(self, destino, id_sesion)
+
+    def _retransmit(self, frame):
+        websocket = self._websocket
+        if websocket is not None:
+            asyncio.ensure_future(websocket.send(frame)).add_done_callback(_ignore_result)
+
+    def _ack_expired(self, id_mensaje, frame):
+        self.flow.release(id_mensaje)
+
+    # --- Recepción ---
+
+    async def _read(self, websocket):
+        try:
+            async for frame in websocket:
+                if is_batch_frame(frame):
+                    try:
+                        frames = split_batch(frame)
+                    except ValueError as e:
+                        logger.warning("Dropping invalid batch from %s: %s", self.url, e)
+                        continue
+                else:
+                    frames = (frame,)
+                for frame in frames:
+                    try:
+                        if is_chunk_frame(frame):
+                            message, chunk = decode_chunk(frame)
+                            message[_CHUNK_DATA] = chunk
+                        else:
+                            message = decode_frame(frame)
+                    except ValueError as e:
+                        logger.warning("Dropping invalid frame from %s: %s", self.url, e)
+                        continue
+                    self._dispatch(websocket, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.acks is not None:
+                # Lo no confirmado se retransmite tras reconectar y se confirma entonces
+                self.acks.clear()
+
+    def _acknowledge(self, websocket, message):
+        if self.acks is not None and message.get("id_sesion") is not None \
+                and message.get("numero_secuencia") is not None:
+            self.acks.add(message["origen"], message["id_sesion"], message["numero_secuencia"],
+                          message["id_mensaje"])
+            return
+        ack = build_message("MESSAGE_ACK", self.agent_id, message["origen"], respuesta_a=message["id_mensaje"],
+                            id_sesion=message.get("id_sesion"), numero_secuencia=message.get("numero_secuencia"))
+        asyncio.ensure_future(websocket.send(encode_frame(ack, self.payload_format))).add_done_callback(
+            _ignore_result)
+
+    def _send_range_ack(self, origen, id_sesion, first, last, id_mensaje):
+        websocket = self._websocket
+        if websocket is None:
+            return
+        ack = build_message("MESSAGE_ACK", self.agent_id, origen, respuesta_a=id_mensaje, id_sesion=id_sesion,
+                            numero_secuencia=last,
+                            datos={"desde_secuencia": first, "hasta_secuencia": last} if first != last else None)
+        asyncio.ensure_future(websocket.send(encode_frame(ack, self.payload_format))).add_done_callback(
+            _ignore_result)
+
+    def _dispatch(self, websocket, message):
+        tipo = message["tipo"]
+        if message.get("requiere_ack"):
+            self._acknowledge(websocket, message)
+            if self.dedup.check(message["id_mensaje"]):
+                logger.debug("Dropping duplicate %s %s.", tipo, message["id_mensaje"])
+                return
+
+        if self.flow.handle(message):
+            return
+        if tipo == "MESSAGE_ACK":
+            self.tracker.ack(message.get("respuesta_a"))
+            bounds = ack_range(message)
+            if bounds is not None:
+                for id_mensaje in self.tracker.ack_range(message["id_sesion"], *bounds):
+                    self.flow.release(id_mensaje)
+            return
+        if tipo == "HEARTBEAT":
+            # Prueba de vida del hub (PROTOCOL_SPEC 4.7): sin respuesta, cierra la conexión
+            reply = build_message("HEARTBEAT_ACK", self.agent_id, message["origen"], respuesta_a=message["id_mensaje"])
+            asyncio.ensure_future(websocket.send(encode_frame(reply, self.payload_format))).add_done_callback(
+                _ignore_result)
+            return
+        if tipo == "CAPABILITY_ANNOUNCE" and message["origen"] == self.server_id:
+            datos = message.get("datos") or {}
+            self.payload_format = negotiate_format(self.payload_formats, datos.get("formatos_payload"))
+        self.sequencer.push(message)
+
+    def _deliver(self, message):
+        tipo = message["tipo"]
+        if tipo == "SESSION_CLOSE":
+            self.sequencer.forget(message.get("id_sesion"))
+            if self.transfers:
+                self._abort_transfers(ConnectionError("session closed"), message.get("id_sesion"))
+        chunk = message.pop(_CHUNK_DATA, None)
+        if chunk is not None and not self._receive_chunk(message, chunk):
+            return
+
+        respuesta_a = message.get("respuesta_a")
+        replies = self.streams.get(respuesta_a)
+        if replies is not None:
+            replies.put_nowait(message)
+            return
+        future = self.pending.get(respuesta_a)
+        if future is not None and not future.done():
+            if tipo == "ERROR":
+                future.set_exception(AgentError(message))
+            else:
+                future.set_result(message)
+            return
+
+        if self.on_message is not None:
+            result = self.on_message(message)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(_log_handler_failure)
+        elif tipo == "ERROR":
+            logger.warning("ERROR from '%s': %s", message["origen"], (message.get("datos") or {}).get("mensaje_error"))
+
+    # --- Transferencias por partes ---
+
+    def _receive_chunk(self, message, chunk):
+        """Feeds a chunk to its transfer. True if it is the first one, which is delivered like any message."""
+        fragmento = (message.get("datos") or {}).get(FRAGMENT_FIELD)
+        if not isinstance(fragmento, dict):
+            logger.warning("Dropping chunk %s without datos.%s.", message["id_mensaje"], FRAGMENT_FIELD)
+            return False
+        key = (message["origen"], fragmento.get("transferencia"))
+        first = fragmento.get("parte") == 1
+        if first:
+            scope = (message["origen"], message.get("id_sesion"))
+            incoming = IncomingPayload(key[1], fragmento.get("tamano_total"), message.get("id_sesion"),
+                                       pause=lambda: self._pause_transfer(scope, True),
+                                       resume=lambda: self._pause_transfer(scope, False))
+            message[PAYLOAD_FIELD] = incoming
+        else:
+            incoming = self.transfers.get(key)
+            if incoming is None:
+                logger.warning("Dropping chunk %d of unknown transfer %s.", fragmento.get("parte") or 0, key[1])
+                return False
+        incoming.feed(chunk, fragmento.get("offset"), bool(fragmento.get("fin")))
+        if incoming.done:
+            self.transfers.pop(key, None)
+        elif first:
+            self.transfers[key] = incoming
+        return first
+
+    def _pause_transfer(self, scope, pause):
+        # Varias transferencias pueden compartir sesión: PAUSE con la primera, RESUME con la última
+        count = self.paused_transfers.get(scope, 0) + (1 if pause else -1)
+        if count > 0:
+            self.paused_transfers[scope] = count
+        else:
+            self.paused_transfers.pop(scope, None)
+        websocket = self._websocket
+        if websocket is None or count != (1 if pause else 0):
+            return
+        origen, id_sesion = scope
+        control = build_message("FLOW_CONTROL", self.agent_id, origen, id_sesion=id_sesion,
+                                datos={"accion": PAUSE if pause else RESUME, "valor": None})
+        asyncio.ensure_future(websocket.send(encode_frame(control, self.payload_format))).add_done_callback(
+            _ignore_result)
+
+    def _abort_transfers(self, exc, id_sesion=None):
+        for key, incoming in list(self.transfers.items()):
+            if id_sesion is None or incoming.id_sesion == id_sesion:
+                del self.transfers[key]
+                incoming.abort(exc)
+
+    def _report_gap(self, id_sesion, origen, first, last):
+        error = build_message("ERROR", self.agent_id, origen, id_sesion=id_sesion, datos={
+            "codigo_error": "SEQUENCE_GAP",
+            "mensaje_error": f"Messages #{first}-#{last} of session {id_sesion} never arrived",
+            "detalles_adicionales": {"primero": first, "ultimo": last},
+        })
+        asyncio.ensure_future(self._send_message(error)).add_done_callback(_ignore_result)
+
+    def _fail_pending(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+
+def _ignore_result(future):
+    if not future.cancelled():
+        future.exception()
+
+
+def _log_handler_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("on_message handler failed", exc_info=future.exception())
+
+
+class ClientPool:
+    """Shares one started ``AgentClient`` per hub URL.
+
+    Args:
+        agent_id (str): Identity used for every connection.
+        ssl_context (ssl.SSLContext, optional): Client mTLS context.
+        **options: Passed on to ``AgentClient``.
+    """
+
+    def __init__(self, agent_id, ssl_context=None, **options):
+        self.agent_id = agent_id
+        self.ssl_context = ssl_context
+        self.options = options
+        self.clients = {}
+        self.wheel = TimerWheel()
+
+    async def get(self, url):
+        """Returns the connected client for ``url``, connecting it on first use."""
+        client = self.clients.get(url)
+        if client is None:
+            if not self.clients:
+                self.wheel.start()
+            client = self.clients[url] = AgentClient(self.agent_id, url, self.ssl_context, wheel=self.wheel,
+                                                     **self.options)
+        return await client.start()
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.close() for client in clients.values()))
+        self.wheel.stop()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
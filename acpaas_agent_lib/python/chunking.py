@@ -0,0 +1,279 @@
+"""
+Chunked transfer of large payloads (PROTOCOL_SPEC 3.6).
+
+A payload too large to travel inline in ``datos`` (datasets, model outputs)
+is sent as a sequence of chunk frames of the same ``tipo``. Every chunk is a
+message of its own, with its own ``id_mensaje``, ``numero_secuencia`` and
+``requiere_ack``, so acknowledgement, retransmission, sequencing and the
+credit windows of flow control apply to it unchanged. All of them name the
+transfer in ``datos.fragmento.transferencia``: the ``id_mensaje`` of the
+first chunk, which also carries the ``datos`` of the logical message.
+
+``PayloadSource`` reads the sender's payload one chunk at a time: slices of
+a ``memoryview`` for bytes-like payloads and of an ``mmap`` for files, so the
+payload itself is never copied or loaded as a whole. The pages of a mapped
+file are dropped once their chunk has been sent.
+
+``IncomingPayload`` is the receiving end. It yields the chunks in order as
+they arrive, or spools them to disk. When more than ``high_water`` chunks are
+waiting to be read it asks the sender to PAUSE, and to RESUME once the reader
+has caught up. Memory on both ends is therefore bounded by the chunk size
+times the credit window and the high-water mark, whatever the payload size.
+"""
+
+import asyncio
+import collections
+import io
+import mmap
+import os
+import tempfile
+
+FRAGMENT_FIELD = "fragmento"
+# Clave del mensaje entregado (no viaja por la red) con el IncomingPayload de la transferencia
+PAYLOAD_FIELD = "carga"
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+# Por debajo del max_size de 1 MiB de websockets, con sitio para el mensaje y para ir en un lote
+MAX_CHUNK_SIZE = 768 * 1024
+DEFAULT_HIGH_WATER = 8
+DEFAULT_LOW_WATER = 2
+
+
+class Payload:
+    """A task result to send as a chunked transfer instead of inline.
+
+    Args:
+        source: Bytes-like object, file path or binary file (see ``PayloadSource``).
+        resultado: Inline ``resultado`` sent with the first chunk.
+    """
+
+    __slots__ = ("source", "resultado")
+
+    def __init__(self, source, resultado=None):
+        self.source = source
+        self.resultado = resultado
+
+
+class PayloadSource:
+    """Reads the chunks of a payload to send, lazily and without copying it.
+
+    Iterating yields ``(offset, chunk, fin)``. ``chunk`` is a ``memoryview``
+    that is only valid until the next chunk is requested. An empty payload
+    yields one empty chunk, so every transfer has a first and a last chunk.
+
+    Args:
+        payload: A bytes-like object (``bytes``, ``bytearray``, a ``memoryview``
+            of an ``mmap``...), a file path, or a binary file object, read
+            from its current position to the end.
+        chunk_size (int): Bytes per chunk.
+    """
+
+    def __init__(self, payload, chunk_size=DEFAULT_CHUNK_SIZE):
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+        self.chunk_size = chunk_size
+        self._file = None
+        self._own_file = False
+        self._mmap = None
+        self._view = None
+        self._start = 0
+        if isinstance(payload, (str, os.PathLike)):
+            self._file = open(payload, "rb")
+            self._own_file = True
+        elif hasattr(payload, "read"):
+            self._file = payload
+        else:
+            self._view = memoryview(payload).cast("B")
+        if self._file is not None:
+            self._map_file()
+        self.size = len(self._view) - self._start if self._view is not None else None
+
+    def _map_file(self):
+        try:
+            fileno = self._file.fileno()
+            self._start = self._file.tell()
+            if os.fstat(fileno).st_size > self._start:
+                self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            # Tubería, socket o fichero en memoria: se lee por partes
+            self._mmap = None
+            self._start = 0
+            return
+        if self._mmap is None:
+            self._view = memoryview(b"")
+            self._start = 0
+            return
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mmap)
+
+    def __iter__(self):
+        if self._view is None:
+            return self._read_chunks()
+        return self._slice_chunks()
+
+    def _slice_chunks(self):
+        view, start, size = self._view, self._start, self.size
+        offset = 0
+        while True:
+            end = min(offset + self.chunk_size, size)
+            chunk = view[start + offset:start + end]
+            try:
+                yield offset, chunk, end == size
+            finally:
+                chunk.release()
+            self._drop_pages(start + offset, start + end)
+            if end == size:
+                return
+            offset = end
+
+    def _drop_pages(self, begin, end):
+        # Páginas ya enviadas: sin esto el fichero entero acabaría contando en la memoria residente
+        if self._mmap is not None and hasattr(mmap, "MADV_DONTNEED"):
+            begin -= begin % mmap.PAGESIZE
+            self._mmap.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+    def _read_chunks(self):
+        offset = 0
+        chunk = self._file.read(self.chunk_size)
+        while True:
+            following = self._file.read(self.chunk_size) if len(chunk) == self.chunk_size else b""
+            yield offset, memoryview(chunk), not following
+            if not following:
+                return
+            offset += len(chunk)
+            chunk = following
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._own_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IncomingPayload:
+    """Receiving end of one chunked transfer.
+
+    Read it with ``async for`` (each chunk is a ``memoryview``), ``read`` or
+    ``spool``, once. Chunks that arrive out of place (a gap, or a transfer
+    cut short by the session closing) make the reader raise instead of
+    returning corrupt data.
+
+    Args:
+        transferencia (str): ``id_mensaje`` of the first chunk.
+        tamano_total (int, optional): Size announced by the sender.
+        id_sesion (str, optional): Session the chunks arrive in.
+        pause (callable, optional): Called when ``high_water`` chunks are
+            waiting to be read.
+        resume (callable, optional): Called when the reader is back down to
+            ``low_water`` after a ``pause``.
+    """
+
+    def __init__(self, transferencia, tamano_total=None, id_sesion=None, pause=None, resume=None,
+                 high_water=DEFAULT_HIGH_WATER, low_water=DEFAULT_LOW_WATER):
+        if not 0 <= low_water < high_water:
+            raise ValueError("low_water must be below high_water")
+        self.transferencia = transferencia
+        self.tamano_total = tamano_total
+        self.id_sesion = id_sesion
+        self.received = 0
+        self.done = False
+        self.paused = False
+        self._pause = pause
+        self._resume = resume
+        self.high_water = high_water
+        self.low_water = low_water
+        self._chunks = collections.deque()
+        self._error = None
+        self._waiter = None
+
+    def feed(self, data, offset, fin):
+        """Appends the chunk at ``offset``; ``fin`` marks the last one."""
+        if self.done:
+            return
+        if offset != self.received:
+            self.abort(ValueError(f"Transfer {self.transferencia}: chunk at offset {offset}, "
+                                  f"expected {self.received}"))
+            return
+        self.received += len(data)
+        self._chunks.append(data)
+        if fin:
+            self.done = True
+        elif not self.paused and self._pause is not None and len(self._chunks) >= self.high_water:
+            self.paused = True
+            self._pause()
+        self._wake()
+
+    def abort(self, exc):
+        """Ends the transfer; the reader raises ``exc`` once it reaches the missing data."""
+        if self.done:
+            return
+        self.done = True
+        self._error = exc
+        self._wake()
+        self._release_pause()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _release_pause(self):
+        if self.paused:
+            self.paused = False
+            if self._resume is not None:
+                self._resume()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._chunks:
+            if self.done:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        chunk = self._chunks.popleft()
+        if self.paused and len(self._chunks) <= self.low_water:
+            self._release_pause()
+        return chunk
+
+    async def read(self):
+        """Returns the whole payload as ``bytes``; only for payloads that fit in memory."""
+        return b"".join([chunk async for chunk in self])
+
+    async def spool(self, path=None):
+        """Writes the payload to ``path`` (default: a new temporary file) and returns the path.
+
+        The writes run in the default executor, so the event loop keeps
+        serving other traffic while the disk catches up.
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="acpaas-", suffix=".part")
+            target = os.fdopen(fd, "wb")
+        else:
+            target = open(path, "wb")
+        loop = asyncio.get_running_loop()
+        try:
+            with target:
+                async for chunk in self:
+                    await loop.run_in_executor(None, target.write, chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path
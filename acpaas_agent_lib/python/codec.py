@@ -0,0 +1,630 @@
+"""
+Fast-path message codec: bytes in, bytes out.
+
+``encode_message``/``decode_message`` are drop-in replacements for
+``json.dumps(create_message(...))`` and ``parse_message`` on hot paths. They
+use orjson when it is installed and fall back to the stdlib ``json`` module,
+and ``decode_message`` applies every rule of PROTOCOL_SPEC section 3.2 through
+a single validator compiled once at import time.
+
+``encode_binary``/``decode_binary`` implement the compact ``acpaas-bin/1``
+encoding (PROTOCOL_SPEC 3.3) that peers can select through
+``formatos_payload`` in CAPABILITY_ANNOUNCE; ``decode_frame`` accepts either.
+
+``encode_batch``/``split_batch`` pack several frames into one WebSocket frame
+(PROTOCOL_SPEC 3.4), for peers that announced ``lotes`` in CAPABILITY_ANNOUNCE.
+
+Dictionary-compressed formats (PROTOCOL_SPEC 3.5, compression.py) plug in
+through ``register_dictionary_codec``; ``encode_frame``/``decode_frame`` then
+handle them like the built-in ones.
+
+``encode_chunk``/``decode_chunk`` carry one piece of a chunked transfer
+(PROTOCOL_SPEC 3.6, chunking.py): a message followed by raw bytes that never
+go through JSON. ``decode_frame`` reads only the message of such a frame.
+"""
+
+import calendar
+import re
+import struct
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+    import json
+
+MESSAGE_TYPES = frozenset([
+    "INIT", "ACK", "ERROR",
+    "REGISTRO", "ACK_REGISTRO",
+    "CAPABILITY_ANNOUNCE", "CAPABILITY_ACK",
+    "SESSION_INIT", "SESSION_ACCEPT", "SESSION_REJECT", "SESSION_CLOSE",
+    "SOLICITUD_TAREA", "RESPUESTA_TAREA",
+    "FLOW_CONTROL", "MESSAGE_ACK",
+    "HEARTBEAT", "HEARTBEAT_ACK",
+])
+
+REQUIRED_FIELDS = ("tipo", "id_mensaje", "origen", "destino", "timestamp")
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "acpaas-bin/1"
+# Orden de preferencia al negociar
+SUPPORTED_FORMATS = (FORMAT_BINARY, FORMAT_JSON)
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+    _JSONError = orjson.JSONDecodeError
+else:
+    JSON_BACKEND = "json"
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def _dumps(obj):
+        return _encoder.encode(obj).encode("utf-8")
+
+    _loads = json.loads
+    _JSONError = ValueError
+
+
+# --- Timestamps ---
+
+_last_second = None
+_last_prefix = ""
+_epoch_cache = {}
+
+
+def format_timestamp_us(us):
+    """Formats microseconds since the epoch as ``YYYY-MM-DDTHH:MM:SS.ffffffZ``.
+
+    The date/time prefix is formatted once per second and reused, so most calls
+    only format the microseconds.
+    """
+    global _last_second, _last_prefix
+    second, micros = divmod(us, 1_000_000)
+    if second != _last_second:
+        _last_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_second = second
+    return f"{_last_prefix}.{micros:06d}Z"
+
+
+def utc_timestamp(now=None):
+    """Returns ``now`` (default: the current time) as an ISO8601 UTC string."""
+    if now is None:
+        return format_timestamp_us(time.time_ns() // 1000)
+    return format_timestamp_us(round(now * 1_000_000))
+
+
+def parse_timestamp_us(timestamp):
+    """Converts an ISO8601 timestamp to integer microseconds since the epoch."""
+    if len(timestamp) == 27 and timestamp[19] == "." and timestamp[26] == "Z":
+        # Formato propio (utc_timestamp): se cachean los segundos del prefijo
+        prefix = timestamp[:19]
+        second = _epoch_cache.get(prefix)
+        if second is None:
+            if len(_epoch_cache) > 4096:
+                _epoch_cache.clear()
+            second = _epoch_cache[prefix] = calendar.timegm(time.strptime(prefix, "%Y-%m-%dT%H:%M:%S"))
+        return second * 1_000_000 + int(timestamp[20:26])
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return calendar.timegm(parsed.utctimetuple()) * 1_000_000 + parsed.microsecond
+
+
+# --- Construcción y codificación ---
+
+def build_message(tipo, origen, destino, id_mensaje=None, respuesta_a=None, id_sesion=None,
+                  numero_secuencia=None, requiere_ack=False, datos=None):
+    """Same contract as ``agent_base.create_message``, without per-call imports."""
+    return {
+        "tipo": tipo,
+        "id_mensaje": id_mensaje if id_mensaje is not None else str(uuid.uuid4()),
+        "origen": origen,
+        "destino": destino,
+        "respuesta_a": respuesta_a,
+        "timestamp": utc_timestamp(),
+        "id_sesion": id_sesion,
+        "numero_secuencia": numero_secuencia,
+        "requiere_ack": requiere_ack,
+        "datos": datos or {},
+    }
+
+
+def encode_message(message):
+    """Serializes a message dictionary to compact UTF-8 JSON bytes."""
+    return _dumps(message)
+
+
+def decode_message(data, validate=True):
+    """
+    Parses a JSON frame (bytes, bytearray, memoryview or str) into a message.
+
+    Args:
+        data: The raw frame.
+        validate (bool): Apply the PROTOCOL_SPEC 3.2 rules (default True).
+
+    Returns:
+        dict: The parsed message.
+
+    Raises:
+        ValueError: If the JSON is invalid or the message breaks a rule.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    try:
+        message = _loads(data)
+    except _JSONError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if validate:
+        validate_message(message)
+    return message
+
+
+# --- Validación (PROTOCOL_SPEC 3.2) ---
+
+_UUID4_MATCH = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-4[0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}\Z").match
+# Año, mes y día quedan en grupos para comprobar el calendario (31 de abril, 29 de febrero...)
+_TIMESTAMP_MATCH = re.compile(
+    r"(?!0000)([0-9]{4})-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])T(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]"
+    r"(?:\.[0-9]{1,9})?(?:Z|[+-](?:[01][0-9]|2[0-3]):?[0-5][0-9])?\Z").match
+_AGENT_ID_MATCH = re.compile(r"[^\s\x00-\x1f]{1,255}\Z").match
+
+
+def _compile_validator():
+    uuid4_match = _UUID4_MATCH
+    timestamp_match = _TIMESTAMP_MATCH
+    monthrange = calendar.monthrange
+    agent_id_match = _AGENT_ID_MATCH
+    message_types = MESSAGE_TYPES
+    required = REQUIRED_FIELDS
+    required_keys = frozenset(REQUIRED_FIELDS)
+
+    def validate(message):
+        if type(message) is not dict:
+            raise ValueError("Message must be a JSON object")
+        if not required_keys <= message.keys():
+            missing = [field for field in required if field not in message]
+            raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+        value = message["id_mensaje"]
+        if type(value) is not str or not uuid4_match(value):
+            raise ValueError("id_mensaje must be a UUID v4 string")
+        if message["tipo"] not in message_types:
+            raise ValueError(f"Unknown tipo: {message['tipo']!r}")
+        value = message["origen"]
+        if type(value) is not str or not agent_id_match(value):
+            raise ValueError("origen must be a valid agent identifier")
+        value = message["destino"]
+        if type(value) is not str or not agent_id_match(value):
+            raise ValueError("destino must be a valid agent identifier")
+        value = message["timestamp"]
+        match = timestamp_match(value) if type(value) is str else None
+        if match is None:
+            raise ValueError("timestamp must be an ISO8601 string")
+        if value[8] > "2" or value[5:10] == "02-29":
+            # Solo los días 29-31 pueden no existir en su mes
+            year, month, day = map(int, match.groups())
+            if day > monthrange(year, month)[1]:
+                raise ValueError("timestamp must be an ISO8601 string")
+
+        value = message.get("numero_secuencia")
+        if value is not None and (type(value) is not int or value < 0):
+            raise ValueError("numero_secuencia must be a non-negative integer")
+        value = message.get("respuesta_a")
+        if value is not None and (type(value) is not str or not uuid4_match(value)):
+            raise ValueError("respuesta_a must be a UUID v4 string")
+        value = message.get("id_sesion")
+        if value is not None and (type(value) is not str or not uuid4_match(value)):
+            raise ValueError("id_sesion must be a UUID v4 string")
+        value = message.get("requiere_ack")
+        if value is not None and type(value) is not bool:
+            raise ValueError("requiere_ack must be a boolean")
+        value = message.get("datos")
+        if value is not None and type(value) is not dict:
+            raise ValueError("datos must be an object or null")
+        return message
+
+    return validate
+
+
+validate_message = _compile_validator()
+validate_message.__doc__ = """Checks a decoded message against PROTOCOL_SPEC 3.2; raises ValueError."""
+
+
+# --- Codificación binaria acpaas-bin/1 (PROTOCOL_SPEC 3.3) ---
+
+BINARY_MAGIC = 0xAC
+BINARY_VERSION = 1
+
+# Códigos fijos: no reordenar, forman parte del formato de cable
+TIPO_CODES = {
+    "INIT": 1, "ACK": 2, "ERROR": 3,
+    "REGISTRO": 4, "ACK_REGISTRO": 5,
+    "CAPABILITY_ANNOUNCE": 6, "CAPABILITY_ACK": 7,
+    "SESSION_INIT": 8, "SESSION_ACCEPT": 9, "SESSION_REJECT": 10, "SESSION_CLOSE": 11,
+    "SOLICITUD_TAREA": 12, "RESPUESTA_TAREA": 13,
+    "FLOW_CONTROL": 14, "MESSAGE_ACK": 15,
+    "HEARTBEAT": 16, "HEARTBEAT_ACK": 17,
+}
+TIPO_NAMES = {code: tipo for tipo, code in TIPO_CODES.items()}
+
+FLAG_REQUIERE_ACK = 0x01
+FLAG_RESPUESTA_A = 0x02
+FLAG_ID_SESION = 0x04
+FLAG_SECUENCIA = 0x08
+FLAG_DATOS_NULL = 0x10
+
+# magic, versión, tipo, flags, timestamp (µs), id_mensaje
+_BINARY_HEADER = struct.Struct("!BBBBq16s")
+_UUID = struct.Struct("!16s")
+_SEQ = struct.Struct("!Q")
+
+
+def _uuid_bytes(value):
+    if len(value) != 36:
+        raise ValueError(f"Invalid UUID: {value!r}")
+    return bytes.fromhex(value.replace("-", ""))
+
+
+def _uuid_str(raw):
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _is_uuid4(raw):
+    return len(raw) == 16 and raw[6] >> 4 == 4 and raw[8] >> 6 == 2
+
+
+def encode_binary(message):
+    """
+    Serializes a message dictionary to the ``acpaas-bin/1`` encoding.
+
+    The fixed header carries magic, version, a tipo code, presence flags, the
+    timestamp as int64 microseconds and ``id_mensaje`` as 16 raw bytes. It is
+    followed by the optional ``respuesta_a``/``id_sesion`` (16 bytes each) and
+    ``numero_secuencia`` (uint64), the length-prefixed ``origen``/``destino``
+    and finally ``datos`` as JSON.
+
+    Raises:
+        ValueError: If a field cannot be represented (unknown tipo, malformed
+            UUID or timestamp, identifiers longer than 255 bytes, a
+            ``numero_secuencia`` beyond 64 bits).
+    """
+    try:
+        tipo_code = TIPO_CODES[message["tipo"]]
+    except KeyError:
+        raise ValueError(f"Unknown tipo: {message.get('tipo')!r}")
+
+    flags = FLAG_REQUIERE_ACK if message.get("requiere_ack") else 0
+    tail = []
+    respuesta_a = message.get("respuesta_a")
+    if respuesta_a is not None:
+        flags |= FLAG_RESPUESTA_A
+        tail.append(_uuid_bytes(respuesta_a))
+    id_sesion = message.get("id_sesion")
+    if id_sesion is not None:
+        flags |= FLAG_ID_SESION
+        tail.append(_uuid_bytes(id_sesion))
+    numero_secuencia = message.get("numero_secuencia")
+    if numero_secuencia is not None:
+        if numero_secuencia >= 1 << 64:
+            raise ValueError("numero_secuencia does not fit in 64 bits")
+        flags |= FLAG_SECUENCIA
+        tail.append(_SEQ.pack(numero_secuencia))
+
+    for field in ("origen", "destino"):
+        encoded = message[field].encode("utf-8")
+        if len(encoded) > 255:
+            raise ValueError(f"{field} is longer than 255 bytes")
+        tail.append(bytes((len(encoded),)))
+        tail.append(encoded)
+
+    datos = message.get("datos")
+    if datos is None:
+        flags |= FLAG_DATOS_NULL
+    elif datos:
+        tail.append(_dumps(datos))
+
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, tipo_code, flags,
+                                 parse_timestamp_us(message["timestamp"]), _uuid_bytes(message["id_mensaje"]))
+    return header + b"".join(tail)
+
+
+def decode_binary(data, validate=True):
+    """
+    Parses an ``acpaas-bin/1`` frame into a message dictionary.
+
+    The result has the same fields and types as a decoded JSON message, with the
+    timestamp rendered back to ISO8601. The fixed-size fields cannot hold
+    malformed UUIDs, timestamps or sequence numbers, so validation only checks
+    the UUID version bits, the agent identifiers and ``datos``.
+
+    Raises:
+        ValueError: If the frame is truncated, malformed or breaks a rule.
+    """
+    try:
+        magic, version, tipo_code, flags, timestamp_us, id_mensaje = _BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError("Not an acpaas-bin/1 frame")
+        offset = _BINARY_HEADER.size
+        respuesta_a = id_sesion = numero_secuencia = None
+        if flags & FLAG_RESPUESTA_A:
+            respuesta_a = data[offset:offset + 16]
+            offset += 16
+        if flags & FLAG_ID_SESION:
+            id_sesion = data[offset:offset + 16]
+            offset += 16
+        if flags & FLAG_SECUENCIA:
+            numero_secuencia = _SEQ.unpack_from(data, offset)[0]
+            offset += 8
+        length = data[offset]
+        origen = bytes(data[offset + 1:offset + 1 + length]).decode("utf-8")
+        offset += 1 + length
+        length = data[offset]
+        destino = bytes(data[offset + 1:offset + 1 + length]).decode("utf-8")
+        offset += 1 + length
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Truncated or malformed binary frame: {e}")
+
+    tipo = TIPO_NAMES.get(tipo_code)
+    if tipo is None:
+        raise ValueError(f"Unknown tipo code: {tipo_code}")
+
+    if flags & FLAG_DATOS_NULL:
+        datos = None
+    elif offset < len(data):
+        try:
+            datos = _loads(bytes(data[offset:]))
+        except _JSONError as e:
+            raise ValueError(f"Invalid JSON in datos: {e}")
+    else:
+        datos = {}
+
+    if validate:
+        if not _is_uuid4(id_mensaje) or (respuesta_a is not None and not _is_uuid4(respuesta_a)) \
+                or (id_sesion is not None and not _is_uuid4(id_sesion)):
+            raise ValueError("id_mensaje, respuesta_a and id_sesion must be UUID v4 values")
+        if not _AGENT_ID_MATCH(origen) or not _AGENT_ID_MATCH(destino):
+            raise ValueError("origen and destino must be valid agent identifiers")
+        if datos is not None and type(datos) is not dict:
+            raise ValueError("datos must be an object or null")
+
+    return {
+        "tipo": tipo,
+        "id_mensaje": _uuid_str(id_mensaje),
+        "origen": origen,
+        "destino": destino,
+        "respuesta_a": _uuid_str(respuesta_a) if respuesta_a is not None else None,
+        "timestamp": format_timestamp_us(timestamp_us),
+        "id_sesion": _uuid_str(id_sesion) if id_sesion is not None else None,
+        "numero_secuencia": numero_secuencia,
+        "requiere_ack": bool(flags & FLAG_REQUIERE_ACK),
+        "datos": datos,
+    }
+
+
+def is_binary_frame(frame):
+    """True if ``frame`` is an ``acpaas-bin/1`` frame rather than JSON."""
+    return not isinstance(frame, str) and len(frame) > 0 and frame[0] == BINARY_MAGIC
+
+
+# --- Formatos con diccionario (PROTOCOL_SPEC 3.5) ---
+
+DICTIONARY_MAGIC = 0xAD
+
+# formato -> codec y id del diccionario -> codec (compression.DictionaryCodec)
+_dictionary_formats = {}
+_dictionary_ids = {}
+
+
+def register_dictionary_codec(dictionary_codec):
+    """Makes ``dictionary_codec.format`` known to ``encode_frame``, ``decode_frame`` and ``frame_matches``."""
+    _dictionary_formats[dictionary_codec.format] = dictionary_codec
+    _dictionary_ids[dictionary_codec.id] = dictionary_codec
+
+
+def is_dictionary_frame(frame):
+    """True if ``frame`` was compressed with a preset dictionary."""
+    return not isinstance(frame, str) and len(frame) > 0 and frame[0] == DICTIONARY_MAGIC
+
+
+def _dictionary_codec(frame):
+    dictionary_codec = _dictionary_ids.get(int.from_bytes(frame[2:6], "big")) if len(frame) >= 6 else None
+    if dictionary_codec is None:
+        raise ValueError("Frame compressed with an unknown dictionary")
+    return dictionary_codec
+
+
+def decode_frame(frame, validate=True):
+    """Decodes a frame in whichever supported format it was sent.
+
+    For a chunk frame only the message is decoded; the chunk is left alone.
+    """
+    if is_binary_frame(frame):
+        return decode_binary(frame, validate)
+    if is_dictionary_frame(frame):
+        return _dictionary_codec(frame).decode(frame, validate)
+    if is_chunk_frame(frame):
+        return decode_chunk(frame, validate)[0]
+    return decode_message(frame, validate)
+
+
+def encode_frame(message, payload_format=FORMAT_JSON):
+    """Encodes ``message`` for a peer that negotiated ``payload_format``.
+
+    JSON is returned as ``str`` so it travels as a WebSocket text frame; the
+    binary encoding is returned as ``bytes``. Dictionary formats return
+    either, depending on the size of the message.
+    """
+    if payload_format == FORMAT_BINARY:
+        return encode_binary(message)
+    if payload_format != FORMAT_JSON:
+        dictionary_codec = _dictionary_formats.get(payload_format)
+        if dictionary_codec is not None:
+            return dictionary_codec.encode(message)
+    return _dumps(message).decode("utf-8")
+
+
+def frame_matches(frame, payload_format):
+    """True if ``frame`` can be delivered untouched to a peer that negotiated ``payload_format``.
+
+    JSON is accepted by everyone, but a peer that negotiated a more compact
+    format gets one: binary for ``acpaas-bin/1``, and compressed for a
+    dictionary format when the message is large enough to be worth it.
+    """
+    if is_binary_frame(frame):
+        return payload_format == FORMAT_BINARY
+    if is_chunk_frame(frame):
+        # El receptor de un fragmento lo pidió explícitamente: nunca se recodifica
+        return True
+    if is_dictionary_frame(frame):
+        dictionary_codec = _dictionary_formats.get(payload_format)
+        return dictionary_codec is not None and int.from_bytes(frame[2:6], "big") == dictionary_codec.id
+    if payload_format == FORMAT_JSON:
+        return True
+    dictionary_codec = _dictionary_formats.get(payload_format)
+    return dictionary_codec is not None and len(frame) < dictionary_codec.min_size
+
+
+def negotiate_format(local_formats, remote_formats):
+    """Picks the first of ``local_formats`` that the peer also announced.
+
+    Falls back to JSON, which every peer must understand.
+    """
+    remote = set(remote_formats or ())
+    for payload_format in local_formats:
+        if payload_format in remote:
+            return payload_format
+    return FORMAT_JSON
+
+
+# --- Lotes de mensajes (PROTOCOL_SPEC 3.4) ---
+
+BATCH_MAGIC = 0xAB
+BATCH_VERSION = 1
+MAX_BATCH_MESSAGES = 0xFFFF
+
+# magic, versión, número de mensajes; cada mensaje va precedido de su longitud
+_BATCH_HEADER = struct.Struct("!BBH")
+_BATCH_LENGTH = struct.Struct("!I")
+
+
+def is_batch_frame(frame):
+    """True if ``frame`` is a batch of frames rather than a single message."""
+    return not isinstance(frame, str) and len(frame) > 0 and frame[0] == BATCH_MAGIC
+
+
+def encode_batch(frames):
+    """
+    Packs encoded frames (``str`` JSON or ``bytes`` acpaas-bin/1) into one batch frame.
+
+    Every entry keeps its own encoding, so a batch can mix both formats. The
+    result is ``bytes`` and travels as a WebSocket binary frame.
+
+    Raises:
+        ValueError: If there are no frames or more than ``MAX_BATCH_MESSAGES``.
+    """
+    if not 0 < len(frames) <= MAX_BATCH_MESSAGES:
+        raise ValueError(f"A batch holds 1 to {MAX_BATCH_MESSAGES} frames, not {len(frames)}")
+    parts = [_BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, len(frames))]
+    length = _BATCH_LENGTH.pack
+    for frame in frames:
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        parts.append(length(len(frame)))
+        parts.append(frame)
+    return b"".join(parts)
+
+
+def split_batch(frame):
+    """
+    Unpacks a batch frame into the frames it carries, in order.
+
+    JSON entries are returned as ``str`` and binary ones as ``bytes``, exactly
+    as ``encode_frame`` produces them, so each can be decoded or forwarded on
+    its own.
+
+    Raises:
+        ValueError: If the batch is truncated, malformed or nested.
+    """
+    data = memoryview(frame)
+    try:
+        magic, version, count = _BATCH_HEADER.unpack_from(data)
+        if magic != BATCH_MAGIC or version != BATCH_VERSION:
+            raise ValueError("Not an acpaas batch frame")
+        offset = _BATCH_HEADER.size
+        frames = []
+        for _ in range(count):
+            size = _BATCH_LENGTH.unpack_from(data, offset)[0]
+            offset += _BATCH_LENGTH.size
+            if size == 0 or offset + size > len(data):
+                raise ValueError("Truncated batch entry")
+            entry = data[offset:offset + size]
+            offset += size
+            if entry[0] == BATCH_MAGIC:
+                raise ValueError("Batches cannot be nested")
+            frames.append(bytes(entry) if entry[0] in _BINARY_MAGICS else str(entry, "utf-8"))
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Truncated or malformed batch frame: {e}")
+    if offset != len(data):
+        raise ValueError("Trailing bytes after the last batch entry")
+    return frames
+
+
+# --- Fragmentos de una transferencia por partes (PROTOCOL_SPEC 3.6) ---
+
+CHUNK_MAGIC = 0xAE
+CHUNK_VERSION = 1
+
+# magic, versión, longitud del mensaje; detrás, el mensaje y los bytes del fragmento
+_CHUNK_HEADER = struct.Struct("!BBI")
+
+# Primer byte de las entradas de un lote que no son JSON
+_BINARY_MAGICS = frozenset((BINARY_MAGIC, DICTIONARY_MAGIC, CHUNK_MAGIC))
+
+
+def is_chunk_frame(frame):
+    """True if ``frame`` carries a chunk of a chunked transfer."""
+    return not isinstance(frame, str) and len(frame) > 0 and frame[0] == CHUNK_MAGIC
+
+
+def encode_chunk(message, data, payload_format=FORMAT_JSON):
+    """
+    Packs ``message`` and the raw bytes ``data`` into one chunk frame.
+
+    ``data`` may be any bytes-like object (a ``memoryview`` of an ``mmap``,
+    for instance); it is copied once, into the frame, and never encoded.
+    The result is ``bytes`` and travels as a WebSocket binary frame.
+    """
+    envelope = encode_frame(message, payload_format)
+    if isinstance(envelope, str):
+        envelope = envelope.encode("utf-8")
+    return b"".join((_CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, len(envelope)), envelope, data))
+
+
+def decode_chunk(frame, validate=True):
+    """
+    Splits a chunk frame into its message and its raw bytes.
+
+    Returns:
+        tuple: ``(message, data)``; ``data`` is a ``memoryview`` of ``frame``.
+
+    Raises:
+        ValueError: If the frame is truncated or its message is invalid.
+    """
+    data = memoryview(frame)
+    try:
+        magic, version, length = _CHUNK_HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f"Truncated chunk frame: {e}")
+    if magic != CHUNK_MAGIC or version != CHUNK_VERSION:
+        raise ValueError("Not an acpaas chunk frame")
+    start = _CHUNK_HEADER.size
+    if length == 0 or start + length > len(data):
+        raise ValueError("Truncated chunk frame")
+    envelope = data[start:start + length]
+    if envelope[0] == CHUNK_MAGIC or envelope[0] == BATCH_MAGIC:
+        raise ValueError("A chunk frame must carry a single message")
+    return decode_frame(bytes(envelope), validate), data[start + length:]
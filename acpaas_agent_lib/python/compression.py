@@ -0,0 +1,310 @@
+"""
+Per-connection compression: permessage-deflate with a size threshold, and
+dictionary-compressed payloads.
+
+``DeflateSettings`` builds the permessage-deflate (RFC 7692) extension
+factories for ``websockets.serve``/``websockets.connect``. Messages shorter
+than ``min_size`` are sent uncompressed. RFC 7692 allows that per message
+(RSV1 clear) and every receiver accepts it, so ACKs, heartbeats and other
+control traffic cost no zlib calls. ``window_bits`` and ``mem_level`` bound
+the zlib state each connection keeps; see ``memory_per_connection``.
+
+``DictionaryCodec`` is a payload format for ``formatos_payload``
+(PROTOCOL_SPEC 3.5). Every message above its threshold is deflated on its
+own with a preset dictionary, so the first occurrence of a field name, tipo
+or common value already has a match to refer to. This is the approach of
+zstd dictionaries, done with zlib's ``zdict`` because zstd is not a
+dependency of this project. A message carries no compressor state over to
+the next one, so the format costs no memory per connection. The format name
+includes the dictionary id, so it is only negotiated between peers that hold
+the same dictionary. ``train_dictionary`` builds a dictionary from sample
+messages, and ``protocol_codec`` returns the built-in one trained on protocol
+traffic.
+"""
+
+import collections
+import functools
+import random
+import struct
+import uuid
+import zlib
+
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory, PerMessageDeflate, ServerPerMessageDeflateFactory)
+from websockets.frames import CONT, CTRL_OPCODES
+
+from acpaas_agent_lib.python import codec
+from acpaas_agent_lib.python.codec import build_message, decode_message, encode_message, format_timestamp_us
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_WINDOW_BITS = 12
+DEFAULT_MEM_LEVEL = 5
+DEFAULT_LEVEL = 6
+
+DICTIONARY_FORMAT_PREFIX = "acpaas-zdict/1;id="
+DICTIONARY_VERSION = 1
+DEFAULT_DICTIONARY_SIZE = 4096
+DEFAULT_DICTIONARY_MIN_SIZE = 256
+# Igual que max_size de websockets: un mensaje descomprimido no puede pasar de aquí
+MAX_DECOMPRESSED_SIZE = 2 ** 20
+
+# magic, versión, id del diccionario (CRC-32)
+_DICTIONARY_HEADER = struct.Struct("!BBI")
+
+
+def deflate_memory(window_bits, mem_level):
+    """Bytes of zlib state for one compressor plus one decompressor (zlib's zconf.h formula)."""
+    return (1 << (window_bits + 2)) + (1 << (mem_level + 9)) + (1 << window_bits) + 7 * 1024
+
+
+# --- permessage-deflate con umbral ---
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """``PerMessageDeflate`` that leaves single-frame messages under ``min_size`` bytes uncompressed.
+
+    Chunk frames (PROTOCOL_SPEC 3.6) are never compressed either: they carry
+    opaque bytes, often already compressed, at rates zlib cannot keep up with.
+    """
+
+    def __init__(self, *args, min_size=DEFAULT_MIN_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+
+    def encode(self, frame):
+        if frame.fin and frame.opcode is not CONT and frame.opcode not in CTRL_OPCODES \
+                and (len(frame.data) < self.min_size or codec.is_chunk_frame(frame.data)):
+            return frame
+        return super().encode(frame)
+
+
+def _with_threshold(extension, min_size):
+    return ThresholdPerMessageDeflate(
+        extension.remote_no_context_takeover, extension.local_no_context_takeover,
+        extension.remote_max_window_bits, extension.local_max_window_bits, extension.compress_settings,
+        min_size=min_size)
+
+
+class _ServerFactory(ServerPerMessageDeflateFactory):
+
+    def __init__(self, settings):
+        super().__init__(server_no_context_takeover=settings.no_context_takeover,
+                         client_no_context_takeover=settings.no_context_takeover,
+                         server_max_window_bits=settings.window_bits, client_max_window_bits=settings.window_bits,
+                         compress_settings=settings.compress_settings,
+                         # Sin límite para el cliente, su ventana (y nuestro descompresor) podría ser de 32 KiB
+                         require_client_max_window_bits=True)
+        self.min_size = settings.min_size
+
+    def process_request_params(self, params, accepted_extensions):
+        response, extension = super().process_request_params(params, accepted_extensions)
+        return response, _with_threshold(extension, self.min_size)
+
+
+class _ClientFactory(ClientPerMessageDeflateFactory):
+
+    def __init__(self, settings):
+        super().__init__(server_no_context_takeover=settings.no_context_takeover,
+                         client_no_context_takeover=settings.no_context_takeover,
+                         server_max_window_bits=settings.window_bits, client_max_window_bits=settings.window_bits,
+                         compress_settings=settings.compress_settings)
+        self.min_size = settings.min_size
+
+    def process_response_params(self, params, accepted_extensions):
+        return _with_threshold(super().process_response_params(params, accepted_extensions), self.min_size)
+
+
+class DeflateSettings:
+    """permessage-deflate configuration for one side of a connection.
+
+    Args:
+        min_size (int): Messages shorter than this many bytes are not compressed.
+        window_bits (int): LZ77 window (9-15) in both directions; 12 is 4 KiB.
+        mem_level (int): zlib ``memLevel`` (1-9) of the compressor.
+        level (int): zlib compression level (0-9).
+        no_context_takeover (bool): Reset the compressor after every message,
+            trading ratio on similar consecutive messages for no state between
+            messages.
+    """
+
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, window_bits=DEFAULT_WINDOW_BITS, mem_level=DEFAULT_MEM_LEVEL,
+                 level=DEFAULT_LEVEL, no_context_takeover=False):
+        if not 9 <= window_bits <= 15:
+            raise ValueError("window_bits must be between 9 and 15")
+        if not 1 <= mem_level <= 9:
+            raise ValueError("mem_level must be between 1 and 9")
+        if not 0 <= level <= 9:
+            raise ValueError("level must be between 0 and 9")
+        self.min_size = min_size
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.level = level
+        self.no_context_takeover = no_context_takeover
+
+    @property
+    def compress_settings(self):
+        return {"level": self.level, "memLevel": self.mem_level}
+
+    def server_extensions(self):
+        """Extension factories for ``websockets.serve(..., compression=None, extensions=...)``."""
+        return [_ServerFactory(self)]
+
+    def client_extensions(self):
+        """Extension factories for ``websockets.connect(..., compression=None, extensions=...)``."""
+        return [_ClientFactory(self)]
+
+    def memory_per_connection(self):
+        """Upper bound in bytes of the zlib state a connection keeps between messages."""
+        if self.no_context_takeover:
+            return 0
+        return deflate_memory(self.window_bits, self.mem_level)
+
+
+# --- Formato con diccionario (PROTOCOL_SPEC 3.5) ---
+
+class DictionaryCodec:
+    """Payload format that deflates each message with a preset dictionary.
+
+    Messages encoded to fewer than ``min_size`` bytes of JSON are sent as
+    plain JSON text, which every peer accepts. Larger ones become a binary
+    frame: magic ``0xAD``, version, the CRC-32 of the dictionary and the raw
+    deflate stream.
+
+    Args:
+        dictionary (bytes): Preset dictionary, e.g. from ``train_dictionary``.
+        min_size (int): Smallest JSON message worth compressing.
+        level (int): zlib compression level.
+        window_bits (int, optional): LZ77 window of the compressor; defaults
+            to the smallest one that covers the dictionary, which is cheaper
+            to copy per message. Frames always decode with a 32 KiB window.
+    """
+
+    def __init__(self, dictionary, min_size=DEFAULT_DICTIONARY_MIN_SIZE, level=DEFAULT_LEVEL, window_bits=None):
+        if not dictionary:
+            raise ValueError("The dictionary is empty")
+        self.dictionary = bytes(dictionary)
+        self.id = zlib.crc32(self.dictionary)
+        self.format = f"{DICTIONARY_FORMAT_PREFIX}{self.id:08x}"
+        self.min_size = min_size
+        if window_bits is None:
+            # zlib no usa los últimos 262 bytes de la ventana (MIN_LOOKAHEAD) para buscar coincidencias
+            window_bits = min(15, max(9, (len(self.dictionary) + 262 - 1).bit_length()))
+        self.window_bits = window_bits
+        self._header = _DICTIONARY_HEADER.pack(codec.DICTIONARY_MAGIC, DICTIONARY_VERSION, self.id)
+        # Compresor con el diccionario ya cargado: cada mensaje parte de una copia
+        self._primed = zlib.compressobj(level, zlib.DEFLATED, -window_bits, DEFAULT_MEM_LEVEL, zdict=self.dictionary)
+
+    def register(self):
+        """Lets ``codec.encode_frame``/``decode_frame`` use this format; returns ``self``."""
+        codec.register_dictionary_codec(self)
+        return self
+
+    def encode(self, message):
+        data = encode_message(message)
+        if len(data) < self.min_size:
+            return data.decode("utf-8")
+        compressor = self._primed.copy()
+        return b"".join((self._header, compressor.compress(data), compressor.flush()))
+
+    def decode(self, frame, validate=True):
+        """Decompresses and decodes a frame of this format; raises ValueError if it is malformed."""
+        try:
+            magic, version, dictionary_id = _DICTIONARY_HEADER.unpack_from(frame)
+        except struct.error as e:
+            raise ValueError(f"Truncated dictionary frame: {e}")
+        if magic != codec.DICTIONARY_MAGIC or version != DICTIONARY_VERSION or dictionary_id != self.id:
+            raise ValueError(f"Not a {self.format} frame")
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self.dictionary)
+        try:
+            data = decompressor.decompress(memoryview(frame)[_DICTIONARY_HEADER.size:], MAX_DECOMPRESSED_SIZE)
+        except zlib.error as e:
+            raise ValueError(f"Invalid compressed frame: {e}")
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"Message larger than {MAX_DECOMPRESSED_SIZE} bytes once decompressed")
+        if not decompressor.eof:
+            raise ValueError("Truncated compressed frame")
+        return decode_message(data, validate)
+
+
+def train_dictionary(samples, size=DEFAULT_DICTIONARY_SIZE, segment=12, min_share=0.05):
+    """Builds a preset dictionary from sample messages (dicts or encoded frames).
+
+    Every ``segment``-byte substring is scored by how many samples contain
+    it. Runs of substrings found in at least ``min_share`` of the samples
+    are joined into fragments. The fragments that cover the most bytes
+    across all samples are kept until ``size`` is reached. The best ones go
+    last, where zlib refers to them with the shortest distances. The result
+    depends only on the samples and their order.
+    """
+    encoded = [encode_message(sample) if isinstance(sample, dict) else
+               sample.encode("utf-8") if isinstance(sample, str) else bytes(sample) for sample in samples]
+    if not encoded:
+        raise ValueError("No samples to train on")
+    documents = collections.Counter()
+    for data in encoded:
+        documents.update({data[i:i + segment] for i in range(len(data) - segment + 1)})
+    threshold = max(2, int(min_share * len(encoded)))
+
+    fragments = collections.Counter()
+    for data in encoded:
+        start = None
+        for i in range(len(data) - segment + 2):
+            common = i <= len(data) - segment and documents[data[i:i + segment]] >= threshold
+            if common and start is None:
+                start = i
+            elif not common and start is not None:
+                fragments[data[start:i - 1 + segment]] += 1
+                start = None
+
+    chosen = []
+    total = 0
+    for fragment, count in sorted(fragments.items(), key=lambda item: (-item[1] * len(item[0]), item[0])):
+        if total >= size:
+            break
+        if any(fragment in kept for kept in chosen):
+            continue
+        fragment = fragment[:size - total]
+        chosen.append(fragment)
+        total += len(fragment)
+    if not chosen:
+        raise ValueError("The samples have nothing in common to put in a dictionary")
+    return b"".join(reversed(chosen))
+
+
+def protocol_samples(count=400):
+    """The sample messages the built-in dictionary is trained on."""
+    # Corpus fijo (semilla, marcas de tiempo e ids deterministas): el diccionario y su id no cambian
+    rng = random.Random(1)
+
+    def new_id():
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    agents = [f"agente_{name}" for name in ("py", "ocr", "nlp", "planner", "js")]
+    samples = []
+    for n in range(count):
+        origen, destino = rng.sample(agents, 2)
+        id_sesion = new_id()
+        tipo, datos = rng.choice([
+            ("SOLICITUD_TAREA", {"descripcion_tarea": "procesar_documento",
+                                 "parametros": {"idioma": "es", "formato": "json", "paginas": rng.randint(1, 99)}}),
+            ("RESPUESTA_TAREA", {"estado": "exito", "resultado": {"texto": "ok", "confianza": rng.random()},
+                                 "mensaje_error": None}),
+            ("SESSION_INIT", {"requisitos": {"required_capability": "task_processing", "timeout_min": 5}}),
+            ("SESSION_CLOSE", {"motivo": "completed"}),
+            ("MESSAGE_ACK", {}),
+            ("ERROR", {"codigo_error": "DESTINATION_NOT_FOUND", "mensaje_error": "Agent is not connected",
+                       "detalles_adicionales": None}),
+            ("CAPABILITY_ANNOUNCE", {"version_protocolo": "1.1", "capacidades": ["task_processing"],
+                                     "max_sesiones_concurrentes": None, "formatos_payload": ["json"]}),
+            ("FLOW_CONTROL", {"accion": "PAUSE", "valor": {"destino": destino}}),
+        ])
+        message = build_message(tipo, origen, destino, id_mensaje=new_id(), respuesta_a=new_id(),
+                                id_sesion=id_sesion, numero_secuencia=n, requiere_ack=bool(n % 2), datos=datos)
+        message["timestamp"] = format_timestamp_us(1_700_000_000_000_000 + n * 7_919_000)
+        samples.append(message)
+    return samples
+
+
+@functools.lru_cache(maxsize=None)
+def protocol_codec():
+    """The ``DictionaryCodec`` for the built-in dictionary trained on protocol messages, registered."""
+    return DictionaryCodec(train_dictionary(protocol_samples())).register()
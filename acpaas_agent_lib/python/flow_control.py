@@ -0,0 +1,243 @@
+"""
+Sender-side flow control (PRD 4.5): FLOW_CONTROL PAUSE/RESUME and credit
+windows returned through MESSAGE_ACK.
+
+A sender holds one ``FlowController`` per connection. Before a message goes
+out, ``acquire`` waits until nothing that applies to it is paused and a credit
+is free in both the connection window and the session window. Every message
+with ``requiere_ack`` keeps its credits until the matching MESSAGE_ACK (or its
+expiry) hands them back via ``release``.
+"""
+
+import asyncio
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAUSE = "PAUSE"
+RESUME = "RESUME"
+
+DEFAULT_CONNECTION_WINDOW = 256
+DEFAULT_SESSION_WINDOW = 32
+
+# Mensajes "no críticos" que PAUSE detiene (PROTOCOL_SPEC 4.5)
+GATED_TYPES = frozenset({"SESSION_INIT", "SOLICITUD_TAREA", "RESPUESTA_TAREA"})
+
+
+class CreditWindow:
+    """Counting semaphore with FIFO waiters and an explicit ``release``.
+
+    Args:
+        limit (int): Credits available when nothing is in flight.
+    """
+
+    __slots__ = ("limit", "in_use", "_waiters")
+
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = collections.deque()
+
+    @property
+    def available(self):
+        return self.limit - self.in_use
+
+    def try_acquire(self):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Takes one credit, waiting in arrival order while the window is full."""
+        if self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El crédito ya se había entregado: devolverlo
+                self.release()
+            raise
+
+    def release(self, count=1):
+        """Returns ``count`` credits, handing them to waiters first."""
+        self.in_use = max(0, self.in_use - count)
+        waiters = self._waiters
+        while waiters and self.in_use < self.limit:
+            future = waiters.popleft()
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+
+class PauseGate:
+    """Set of active PAUSE scopes and the waiters blocked on them.
+
+    A scope is ``None`` (the whole connection), ``("destino", agent_id)`` or
+    ``("sesion", id_sesion)``.
+    """
+
+    __slots__ = ("_paused",)
+
+    def __init__(self):
+        self._paused = {}
+
+    def __bool__(self):
+        return bool(self._paused)
+
+    def __contains__(self, scope):
+        return scope in self._paused
+
+    def pause(self, scope):
+        if scope not in self._paused:
+            self._paused[scope] = asyncio.Event()
+
+    def resume(self, scope):
+        event = self._paused.pop(scope, None)
+        if event is not None:
+            event.set()
+
+    def resume_all(self):
+        for scope in list(self._paused):
+            self.resume(scope)
+
+    def blocking(self, destino, id_sesion):
+        """Returns the event of a paused scope covering the message, or None."""
+        paused = self._paused
+        if not paused:
+            return None
+        for scope in (None, ("destino", destino), ("sesion", id_sesion)):
+            event = paused.get(scope)
+            if event is not None:
+                return event
+        return None
+
+    async def wait(self, destino, id_sesion):
+        while True:
+            event = self.blocking(destino, id_sesion)
+            if event is None:
+                return
+            await event.wait()
+
+
+class FlowController:
+    """Send gate for one connection: PAUSE scopes plus credit windows.
+
+    A PAUSE from a peer agent applies to everything sent to that agent (or to
+    one session when ``id_sesion`` is set). A PAUSE from the hub names the
+    congested destination in ``datos.valor.destino``; without it the whole
+    connection is paused.
+
+    Args:
+        server_id (str): Identifier of the hub.
+        connection_window (int): Unacknowledged messages allowed on the
+            connection.
+        session_window (int): Unacknowledged messages allowed per session.
+    """
+
+    def __init__(self, server_id="acpaas_server", connection_window=DEFAULT_CONNECTION_WINDOW,
+                 session_window=DEFAULT_SESSION_WINDOW):
+        self.server_id = server_id
+        self.gate = PauseGate()
+        self.connection = CreditWindow(connection_window)
+        self.session_window = session_window
+        self.sessions = {}
+        self.pending = {}
+
+    @property
+    def paused(self):
+        return bool(self.gate)
+
+    async def acquire(self, message):
+        """Waits until ``message`` may be sent and charges its credits.
+
+        Control traffic (anything not listed in ``GATED_TYPES``) is never held
+        back, so ACKs, errors and FLOW_CONTROL itself always get through.
+        """
+        if message["tipo"] not in GATED_TYPES:
+            return
+        destino = message["destino"]
+        id_sesion = message.get("id_sesion")
+        await self.gate.wait(destino, id_sesion)
+        if not message.get("requiere_ack"):
+            return
+
+        await self.connection.acquire()
+        if id_sesion is not None:
+            window = self.sessions.get(id_sesion)
+            if window is None:
+                window = self.sessions[id_sesion] = CreditWindow(self.session_window)
+            try:
+                await window.acquire()
+            except BaseException:
+                self.connection.release()
+                raise
+        self.pending[message["id_mensaje"]] = id_sesion
+
+    def release(self, id_mensaje):
+        """Returns the credits held by ``id_mensaje``. Returns False if it held none."""
+        if id_mensaje not in self.pending:
+            return False
+        id_sesion = self.pending.pop(id_mensaje)
+        self.connection.release()
+        if id_sesion is not None:
+            window = self.sessions.get(id_sesion)
+            if window is not None:
+                window.release()
+        return True
+
+    def close_session(self, id_sesion):
+        """Forgets the window of a closed session."""
+        self.sessions.pop(id_sesion, None)
+        self.gate.resume(("sesion", id_sesion))
+
+    def handle(self, message):
+        """Applies an inbound FLOW_CONTROL or MESSAGE_ACK.
+
+        Returns:
+            bool: True if ``message`` was a FLOW_CONTROL (fully consumed here).
+        """
+        tipo = message["tipo"]
+        if tipo == "MESSAGE_ACK":
+            self.release(message.get("respuesta_a"))
+            return False
+        if tipo != "FLOW_CONTROL":
+            return False
+
+        datos = message.get("datos") or {}
+        accion = datos.get("accion")
+        scope = self._scope(message, datos)
+        if accion == PAUSE:
+            logger.info("Paused by '%s' (scope %s).", message["origen"], scope)
+            self.gate.pause(scope)
+        elif accion == RESUME:
+            logger.info("Resumed by '%s' (scope %s).", message["origen"], scope)
+            self.gate.resume(scope)
+        else:
+            logger.warning("Ignoring FLOW_CONTROL with unknown accion %r from '%s'.", accion, message["origen"])
+        return True
+
+    def _scope(self, message, datos):
+        if message.get("id_sesion") is not None:
+            return ("sesion", message["id_sesion"])
+        if message["origen"] != self.server_id:
+            return ("destino", message["origen"])
+        valor = datos.get("valor")
+        if isinstance(valor, dict) and valor.get("destino"):
+            return ("destino", valor["destino"])
+        return None
+
+    def reset(self):
+        """Clears pauses and credits after a reconnect."""
+        self.gate.resume_all()
+        self.pending.clear()
+        for window in (self.connection, *self.sessions.values()):
+            window.in_use = 0
+            window.release(0)
+        self.sessions.clear()
@@ -0,0 +1,187 @@
+"""
+In-process counters, gauges and fixed-bucket histograms in Prometheus text format.
+
+Recording is meant for hot paths on the event loop thread:
+
+* ``Counter.inc`` adds to an attribute (``inc_label`` to a dict entry per label value);
+* ``Histogram.observe`` is one ``bisect`` over a tuple of fixed bucket bounds
+  and one list increment, with no locks; buckets are made cumulative only
+  when rendered;
+* ``Gauge`` values are usually computed by a callback at scrape time, so the
+  code being measured does nothing at all.
+
+``REGISTRY`` is the process-wide registry; ``Registry.render`` produces the
+text exposition format (version 0.0.4) served on ``/metrics``.
+"""
+
+import asyncio
+import bisect
+import math
+
+# Segundos: de 50 µs a 10 s, en pasos de ~x2.5
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+DEFAULT_LAG_INTERVAL = 0.25
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label.
+
+    Args:
+        name (str): Metric name (``*_total`` by convention).
+        help (str): One-line description.
+        label (str, optional): Label name; count with ``inc_label(value)`` instead of ``inc``.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.value = 0
+        self.values = {}
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def inc_label(self, label_value, amount=1):
+        values = self.values
+        values[label_value] = values.get(label_value, 0) + amount
+
+    def samples(self):
+        if self.label is None:
+            return [(self.name, "", self.value)]
+        return [(self.name, f'{{{self.label}="{_escape(key)}"}}', value) for key, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """Value that goes up and down; read from ``callback()`` at scrape time if one is given."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, callback=None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, "", self.callback() if self.callback is not None else self.value)]
+
+
+class Histogram:
+    """Distribution over fixed buckets.
+
+    Args:
+        name (str): Metric name (``*_seconds`` for durations).
+        help (str): One-line description.
+        buckets (tuple): Increasing upper bounds; ``+Inf`` is implicit.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError("Histogram buckets must be strictly increasing")
+        self.name = name
+        self.help = help
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile ``q`` (0 < q <= 1), or None if empty."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def samples(self):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            lines.append((self.name + "_bucket", f'{{le="{_number(bound)}"}}', cumulative))
+        lines.append((self.name + "_sum", "", self.sum))
+        lines.append((self.name + "_count", "", cumulative))
+        return lines
+
+
+class Registry:
+    """Named metrics of one process. Registering an existing name replaces it."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self.register(Counter(name, help, label))
+
+    def gauge(self, name, help, callback=None):
+        return self.register(Gauge(name, help, callback))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def get(self, name):
+        return self.metrics.get(name)
+
+    def render(self):
+        """Returns every metric in Prometheus text exposition format."""
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, labels, value in metric.samples():
+                lines.append(f"{sample}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+async def monitor_event_loop(histogram, interval=DEFAULT_LAG_INTERVAL):
+    """Records how late the event loop wakes up from a ``sleep(interval)``, until cancelled.
+
+    A loop busy with a long callback wakes the sleeper late by that long, so the
+    histogram shows the stalls every other task on the loop suffered.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - started - interval))
@@ -0,0 +1,93 @@
+"""
+Sampling profiler that can be switched on in a running process.
+
+``StackSampler`` runs a daemon thread that wakes up every ``interval``
+seconds, reads the current stack of one thread (by default the one that
+created it, i.e. the event loop) through ``sys._current_frames`` and counts
+identical stacks. Nothing is installed in the profiled thread, so it runs
+at full speed between samples, and a stopped sampler costs nothing.
+
+``collapsed`` returns the counts as ``outer;...;inner count`` lines, the
+input format of flamegraph.pl and speedscope.
+"""
+
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_MAX_DEPTH = 64
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled at a fixed interval.
+
+    Args:
+        thread_id (int, optional): Thread to sample; defaults to the calling thread.
+        interval (float): Seconds between samples.
+        max_depth (int): Innermost frames kept per stack.
+    """
+
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL, max_depth=DEFAULT_MAX_DEPTH):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        # Se vacía el mismo dict: un hilo de muestreo ya en marcha sigue escribiendo en él
+        self.stacks.clear()
+        self.samples = 0
+
+    def _run(self):
+        stacks = self.stacks
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            del frame
+            key = ";".join(reversed(names))
+            stacks[key] = stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self, limit=None):
+        """Returns the sampled stacks as collapsed-stack text, most frequent first."""
+        ordered = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)
+        if limit is not None:
+            ordered = ordered[:limit]
+        return "".join(f"{stack} {count}\n" for stack, count in ordered)
+
+
+def sample_for(seconds, thread_id=None, interval=DEFAULT_INTERVAL):
+    """Blocks for ``seconds`` while sampling ``thread_id``; returns the collapsed stacks."""
+    sampler = StackSampler(thread_id, interval)
+    sampler.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler.collapsed()
@@ -0,0 +1,453 @@
+"""
+Reliable delivery helpers (PRD 4.5.2/4.5.3): ACK tracking with bounded
+retransmission, duplicate suppression and the timer wheel that drives them.
+
+All timers of a process live in one ``TimerWheel`` advanced by a single asyncio
+task, so the cost of waiting for ACKs does not grow with the number of
+in-flight messages: scheduling and cancelling are O(1) and each tick only
+touches the timers that are due.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import random
+
+logger = logging.getLogger(__name__)
+
+
+class AckTimeoutError(Exception):
+    """Raised when a message was retransmitted ``max_retries`` times without an ACK."""
+
+
+# --- Timer wheel ---
+
+class Timer:
+    """Handle returned by ``TimerWheel.schedule``."""
+
+    __slots__ = ("deadline", "callback", "args", "cancelled", "wheel")
+
+    def __init__(self, deadline, callback, args, wheel):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.wheel = wheel
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.wheel.active -= 1
+
+
+class TimerWheel:
+    """Hierarchical timer wheel with ``levels`` wheels of ``slots`` buckets.
+
+    Level 0 buckets are one ``resolution`` wide; every upper level is ``slots``
+    times coarser and cascades its bucket down when the level below wraps.
+    With the defaults (10 ms, 256 slots, 4 levels) timers up to ~490 days
+    away are held exactly. Cancelled timers are dropped lazily when their
+    bucket is reached.
+    """
+
+    def __init__(self, resolution=0.01, slots=256, levels=4, now=0.0):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._horizon = slots ** levels - 1
+        self.current = int(now / resolution)
+        self.active = 0
+        self._task = None
+        self._idle = None
+        self._loop = None
+
+    def __len__(self):
+        return self.active
+
+    @property
+    def running(self):
+        """True while the task started by ``start`` is advancing the wheel."""
+        return self._task is not None
+
+    def schedule(self, delay, callback, *args):
+        """Runs ``callback(*args)`` once ``delay`` seconds have elapsed."""
+        ticks = max(1, math.ceil(delay / self.resolution))
+        if self.active == 0 and self._loop is not None:
+            # La rueda no avanza mientras está vacía; resincronizar con el reloj del loop
+            self.current = int(self._loop.time() / self.resolution)
+        timer = Timer(self.current + ticks, callback, args, self)
+        self._insert(timer)
+        self.active += 1
+        if self._idle is not None and not self._idle.is_set():
+            self._idle.set()
+        return timer
+
+    def _insert(self, timer):
+        ticks = timer.deadline - self.current
+        if ticks <= 0:
+            timer.deadline = self.current + 1
+            ticks = 1
+        if ticks > self._horizon:
+            ticks = self._horizon
+        level = 0
+        while ticks >= 1 << (self._bits * (level + 1)):
+            level += 1
+        index = (min(timer.deadline, self.current + ticks) >> (self._bits * level)) & self._mask
+        self._wheels[level][index].append(timer)
+
+    def advance(self, now):
+        """Fires every timer due at or before ``now`` (same clock as ``now`` at creation)."""
+        target = int(now / self.resolution)
+        if self.active == 0:
+            if target > self.current:
+                self.current = target
+            return
+        wheel0 = self._wheels[0]
+        mask = self._mask
+        while self.current < target:
+            self.current += 1
+            tick = self.current
+            index = tick & mask
+            if index == 0:
+                self._cascade(tick)
+            bucket = wheel0[index]
+            if not bucket:
+                continue
+            wheel0[index] = []
+            for timer in bucket:
+                if timer.cancelled:
+                    continue
+                if timer.deadline > tick:
+                    self._insert(timer)
+                    continue
+                self.active -= 1
+                timer.cancelled = True
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logger.exception("Timer callback failed")
+            if self.active == 0:
+                self.current = max(self.current, target)
+                return
+
+    def _cascade(self, tick):
+        for level in range(1, self.levels):
+            index = (tick >> (self._bits * level)) & self._mask
+            wheel = self._wheels[level]
+            bucket = wheel[index]
+            wheel[index] = []
+            for timer in bucket:
+                if not timer.cancelled:
+                    self._insert(timer)
+            if index != 0:
+                break
+
+    # --- Integración con asyncio ---
+
+    def start(self, loop=None):
+        """Starts the single task that advances the wheel on ``loop``'s clock."""
+        loop = loop or asyncio.get_running_loop()
+        self.current = int(loop.time() / self.resolution)
+        self._idle = asyncio.Event()
+        self._loop = loop
+        self._task = loop.create_task(self._run(loop))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._loop = None
+
+    async def _run(self, loop):
+        while True:
+            if self.active == 0:
+                # Sin temporizadores no hay nada que avanzar: dormir hasta el próximo schedule()
+                self._idle.clear()
+                await self._idle.wait()
+            await asyncio.sleep(self.resolution)
+            self.advance(loop.time())
+
+
+# --- Seguimiento de ACKs ---
+
+class _InFlight:
+    __slots__ = ("frame", "attempts", "timer", "waiter", "sequence")
+
+    def __init__(self, frame, sequence=None):
+        self.frame = frame
+        self.attempts = 0
+        self.timer = None
+        self.waiter = None
+        self.sequence = sequence
+
+
+class AckTracker:
+    """Tracks ``requiere_ack`` messages until their MESSAGE_ACK arrives.
+
+    Entries live in a dict keyed by ``id_mensaje``. When an ACK does not arrive
+    within ``timeout`` the frame is passed to ``send`` again, with the timeout
+    multiplied by ``backoff`` on every attempt (capped at ``max_timeout``, plus
+    up to ``jitter`` of random spread). After ``max_retries`` retransmissions
+    the entry is dropped and ``on_expired(id_mensaje, frame)`` is called.
+
+    Session messages tracked with their ``numero_secuencia`` are also indexed
+    by ``(id_sesion, numero_secuencia)``, so a range MESSAGE_ACK can settle
+    all of them with ``ack_range``.
+
+    Args:
+        send (callable): Non-blocking ``send(frame)`` used for retransmissions,
+            e.g. a function that queues the frame on the connection writer.
+        wheel (TimerWheel): Shared timer wheel driving the deadlines.
+    """
+
+    def __init__(self, send, wheel, timeout=5.0, max_retries=5, backoff=2.0, max_timeout=60.0,
+                 jitter=0.1, on_expired=None):
+        self.send = send
+        self.wheel = wheel
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_timeout = max_timeout
+        self.jitter = jitter
+        self.on_expired = on_expired
+        self.in_flight = {}
+        self.sequenced = {}
+        self.retransmissions = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def __contains__(self, message_id):
+        return message_id in self.in_flight
+
+    def track(self, message_id, frame, id_sesion=None, numero_secuencia=None):
+        """Starts waiting for the ACK of a frame that has just been sent."""
+        entry = self.in_flight.get(message_id)
+        if entry is None:
+            sequence = None
+            if id_sesion is not None and numero_secuencia is not None:
+                sequence = (id_sesion, numero_secuencia)
+                self.sequenced[sequence] = message_id
+            entry = self.in_flight[message_id] = _InFlight(frame, sequence)
+        elif entry.timer is not None:
+            entry.timer.cancel()
+        entry.timer = self.wheel.schedule(self._delay(0), self._expire, message_id)
+
+    def wait(self, message_id):
+        """Returns a future resolved when ``message_id`` is acknowledged.
+
+        The future fails with ``AckTimeoutError`` once retries are exhausted.
+        """
+        entry = self.in_flight.get(message_id)
+        future = asyncio.get_running_loop().create_future()
+        if entry is None:
+            future.set_result(None)
+        else:
+            if entry.waiter is None:
+                entry.waiter = []
+            entry.waiter.append(future)
+        return future
+
+    def ack(self, message_id):
+        """Marks ``message_id`` as acknowledged. Returns False if it was not in flight."""
+        entry = self.in_flight.pop(message_id, None)
+        if entry is None:
+            return False
+        entry.timer.cancel()
+        if entry.sequence is not None:
+            del self.sequenced[entry.sequence]
+        if entry.waiter:
+            for future in entry.waiter:
+                if not future.done():
+                    future.set_result(None)
+        return True
+
+    def ack_range(self, id_sesion, first, last):
+        """Acknowledges the messages of ``id_sesion`` numbered ``first`` to ``last``.
+
+        Returns:
+            list: The ``id_mensaje`` of every message that was still in flight.
+        """
+        sequenced = self.sequenced
+        if last - first >= len(sequenced):
+            # Rango más ancho que lo pendiente: recorrer lo pendiente, no el rango
+            keys = [key for key in sequenced if key[0] == id_sesion and first <= key[1] <= last]
+        else:
+            keys = [(id_sesion, n) for n in range(first, last + 1) if (id_sesion, n) in sequenced]
+        acked = [sequenced[key] for key in keys]
+        for message_id in acked:
+            self.ack(message_id)
+        return acked
+
+    def cancel_all(self, exc=None):
+        """Forgets every in-flight message, failing waiters with ``exc``."""
+        entries, self.in_flight = self.in_flight, {}
+        self.sequenced = {}
+        for entry in entries.values():
+            entry.timer.cancel()
+            for future in entry.waiter or ():
+                if not future.done():
+                    if exc is None:
+                        future.cancel()
+                    else:
+                        future.set_exception(exc)
+
+    def _delay(self, attempts):
+        delay = min(self.timeout * self.backoff ** attempts, self.max_timeout)
+        if self.jitter:
+            delay *= 1 + random.random() * self.jitter
+        return delay
+
+    def _expire(self, message_id):
+        entry = self.in_flight.get(message_id)
+        if entry is None:
+            return
+        if entry.attempts >= self.max_retries:
+            del self.in_flight[message_id]
+            if entry.sequence is not None:
+                del self.sequenced[entry.sequence]
+            self.expired += 1
+            logger.debug("No ACK for %s after %d retransmissions; giving up.", message_id, entry.attempts)
+            for future in entry.waiter or ():
+                if not future.done():
+                    future.set_exception(AckTimeoutError(message_id))
+            if self.on_expired is not None:
+                self.on_expired(message_id, entry.frame)
+            return
+        entry.attempts += 1
+        self.retransmissions += 1
+        logger.debug("ACK timeout for %s; retransmission %d.", message_id, entry.attempts)
+        entry.timer = self.wheel.schedule(self._delay(entry.attempts), self._expire, message_id)
+        self.send(entry.frame)
+
+
+# --- ACKs por rango ---
+
+def ack_range(message):
+    """Returns ``(first, last)`` if ``message`` is a range MESSAGE_ACK, otherwise None.
+
+    A range ACK carries ``id_sesion`` and ``datos.desde_secuencia`` /
+    ``datos.hasta_secuencia``; it acknowledges every message its recipient sent
+    in that session with a ``numero_secuencia`` in the range (PROTOCOL_SPEC 4.6).
+    """
+    datos = message.get("datos")
+    if not datos or message.get("id_sesion") is None:
+        return None
+    first = datos.get("desde_secuencia")
+    last = datos.get("hasta_secuencia")
+    if type(first) is not int or type(last) is not int or not 0 <= first <= last:
+        return None
+    return first, last
+
+
+class _Run:
+    __slots__ = ("first", "last", "id_mensaje", "timer")
+
+    def __init__(self, sequence, id_mensaje):
+        self.first = self.last = sequence
+        self.id_mensaje = id_mensaje
+        self.timer = None
+
+
+class AckCoalescer:
+    """Acknowledges consecutive session messages with one range MESSAGE_ACK.
+
+    ``add`` records a received message instead of acknowledging it at once.
+    Messages from the same sender and session that arrive with consecutive
+    ``numero_secuencia`` extend one run; the run is acknowledged ``delay``
+    seconds after its first message, when it reaches ``max_range`` messages or
+    when a message arrives out of order, whichever comes first.
+
+    Args:
+        send (callable): ``send(origen, id_sesion, first, last, id_mensaje)``
+            emits the MESSAGE_ACK; ``id_mensaje`` is the last message of the run.
+        wheel (TimerWheel): Shared timer wheel for the flush deadlines.
+        delay (float): Longest time an ACK is held back.
+        max_range (int): Messages acknowledged by one range ACK at most.
+    """
+
+    def __init__(self, send, wheel, delay=0.01, max_range=64):
+        if max_range < 1:
+            raise ValueError("max_range must be at least 1")
+        self.send = send
+        self.wheel = wheel
+        self.delay = delay
+        self.max_range = max_range
+        self.runs = {}
+
+    def __len__(self):
+        return len(self.runs)
+
+    def add(self, origen, id_sesion, numero_secuencia, id_mensaje):
+        key = (origen, id_sesion)
+        run = self.runs.get(key)
+        if run is not None:
+            if numero_secuencia == run.last + 1:
+                run.last = numero_secuencia
+                run.id_mensaje = id_mensaje
+                if run.last - run.first + 1 >= self.max_range:
+                    self.flush(key)
+                return
+            # Fuera de orden o retransmitido: el rango acumulado ya no puede crecer
+            self.flush(key)
+        run = self.runs[key] = _Run(numero_secuencia, id_mensaje)
+        if self.max_range == 1:
+            self.flush(key)
+        else:
+            run.timer = self.wheel.schedule(self.delay, self.flush, key)
+
+    def flush(self, key):
+        run = self.runs.pop(key, None)
+        if run is None:
+            return
+        if run.timer is not None:
+            run.timer.cancel()
+        self.send(key[0], key[1], run.first, run.last, run.id_mensaje)
+
+    def flush_all(self):
+        for key in list(self.runs):
+            self.flush(key)
+
+    def clear(self):
+        """Forgets the held ACKs without sending them (e.g. the connection is gone)."""
+        runs, self.runs = self.runs, {}
+        for run in runs.values():
+            if run.timer is not None:
+                run.timer.cancel()
+
+
+# --- Deduplicación en el receptor ---
+
+class DedupWindow:
+    """Remembers the last ``capacity`` message IDs to drop retransmitted duplicates."""
+
+    __slots__ = ("capacity", "_seen", "_order")
+
+    def __init__(self, capacity=10_000):
+        self.capacity = capacity
+        self._seen = set()
+        self._order = collections.deque()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, message_id):
+        return message_id in self._seen
+
+    def check(self, message_id):
+        """Records ``message_id``; returns True if it was already seen (a duplicate)."""
+        if message_id in self._seen:
+            return True
+        self._seen.add(message_id)
+        self._order.append(message_id)
+        if len(self._order) > self.capacity:
+            self._seen.discard(self._order.popleft())
+        return False
@@ -0,0 +1,323 @@
+"""
+Task execution runtime for agents built on ``AgentClient``.
+
+``AgentRuntime`` takes over the client's ``on_message`` and dispatches every
+inbound message to a handler:
+
+* SOLICITUD_TAREA goes to the handler registered with ``task`` for its
+  ``descripcion_tarea``. The runtime answers RESPUESTA_TAREA itself, with
+  the handler's return value or ``estado`` ``"fallo"`` and the exception.
+* SESSION_INIT is accepted while fewer than ``max_sesiones`` sessions are
+  open and rejected with 503 otherwise. The limit is also announced to the
+  hub as ``max_sesiones_concurrentes``. SESSION_CLOSE ends the session and
+  cancels its running tasks.
+* Any other ``tipo`` goes to the handler registered with ``on``.
+
+Where a task handler runs is chosen when it is registered. Coroutine
+functions run on the event loop, plain functions in a thread pool (blocking
+I/O), and ``executor="process"`` functions in a process pool (CPU-bound
+work). A long computation therefore never delays the ACKs, heartbeats and
+other traffic handled on the loop. Process handlers must be picklable,
+module-level functions.
+
+A handler that is a generator or async generator streams its result. Each
+yielded value is sent at once as a RESPUESTA_TAREA with ``estado``
+``"parcial"`` and ``requiere_ack``. The final RESPUESTA_TAREA carries the
+number of ``partes``. Every partial result holds a flow-control credit until
+it is acknowledged, so when the receiver falls behind the generator waits
+instead of piling up results in memory. Callers read such replies with
+``AgentClient.stream``.
+
+Large inputs and outputs travel as chunked transfers (chunking.py). The
+payload of a chunked SOLICITUD_TAREA reaches the handler as
+``parametros["carga"]``. Coroutine handlers get the ``IncomingPayload`` to
+read as the chunks arrive. Pool handlers get the path of a temporary file the
+payload was spooled to, deleted when the handler returns. A handler that
+returns a ``chunking.Payload`` has it sent back as a chunked RESPUESTA_TAREA.
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import os
+
+from acpaas_agent_lib.python.agent_client import TASK_PARTIAL
+from acpaas_agent_lib.python.chunking import PAYLOAD_FIELD, Payload
+
+logger = logging.getLogger(__name__)
+
+ON_LOOP = "loop"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTORS = (ON_LOOP, THREAD, PROCESS)
+
+TASK_OK = "exito"
+TASK_FAILED = "fallo"
+
+_DONE = object()
+
+
+class TaskHandler:
+    """A registered task handler and where it runs."""
+
+    __slots__ = ("function", "executor", "streaming")
+
+    def __init__(self, function, executor=None):
+        is_async = inspect.iscoroutinefunction(function) or inspect.isasyncgenfunction(function)
+        if executor is None:
+            executor = ON_LOOP if is_async else THREAD
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {', '.join(EXECUTORS)}")
+        if is_async != (executor == ON_LOOP):
+            raise ValueError("Coroutine and async generator handlers run on the event loop; "
+                             "plain functions run in a thread or process pool")
+        if executor == PROCESS and inspect.isgeneratorfunction(function):
+            raise ValueError("A generator cannot stream results out of a process pool")
+        self.function = function
+        self.executor = executor
+        self.streaming = inspect.isasyncgenfunction(function) or inspect.isgeneratorfunction(function)
+
+
+class AgentRuntime:
+    """Runs the task handlers of one agent on top of its ``AgentClient``.
+
+    Create the runtime before ``client.start()``, so the announced
+    ``max_sesiones_concurrentes`` is the runtime's.
+
+    Args:
+        client (AgentClient): Connection to serve; its ``on_message`` is replaced.
+        max_sesiones (int, optional): Sessions open at once; None for no limit.
+        threads (int, optional): Size of the thread pool, created on first use.
+        processes (int, optional): Size of the process pool, created on first
+            use (default: one per CPU).
+        thread_pool (concurrent.futures.Executor, optional): Pool to use
+            instead of creating one; not shut down by ``close``.
+        process_pool (concurrent.futures.Executor, optional): Likewise.
+    """
+
+    def __init__(self, client, max_sesiones=None, threads=None, processes=None, thread_pool=None,
+                 process_pool=None):
+        if max_sesiones is not None and max_sesiones < 1:
+            raise ValueError("max_sesiones must be at least 1")
+        self.client = client
+        self.max_sesiones = max_sesiones
+        self.threads = threads
+        self.processes = processes
+        self._pools = {THREAD: thread_pool, PROCESS: process_pool}
+        self._own_pools = []
+        self.tasks = {}
+        self.handlers = {}
+        self.sessions = {}
+        self.running = {}
+        client.on_message = self.dispatch
+        client.max_sesiones = max_sesiones
+
+    # --- Registro de handlers ---
+
+    def task(self, descripcion_tarea, executor=None):
+        """Decorator registering the handler of ``descripcion_tarea``.
+
+        The handler is called with the task's ``parametros`` (a dict) and
+        returns the ``resultado``, or yields partial results.
+
+        Args:
+            executor (str, optional): ``"loop"``, ``"thread"`` or ``"process"``;
+                by default coroutine functions run on the loop and plain
+                functions in the thread pool.
+        """
+        def register(function):
+            self.tasks[descripcion_tarea] = TaskHandler(function, executor)
+            return function
+        return register
+
+    def on(self, tipo):
+        """Decorator registering ``handler(message)`` for ``tipo``; it runs on the event loop.
+
+        SESSION_INIT and SESSION_CLOSE handlers are called after the runtime
+        has handled the message.
+        """
+        def register(function):
+            self.handlers[tipo] = function
+            return function
+        return register
+
+    # --- Despacho ---
+
+    def dispatch(self, message):
+        """``on_message`` of the client: routes one inbound message."""
+        tipo = message["tipo"]
+        if tipo == "SOLICITUD_TAREA":
+            self._start_task(message)
+            return
+        if tipo == "SESSION_INIT":
+            self._open_session(message)
+        elif tipo == "SESSION_CLOSE":
+            self._close_session(message)
+        handler = self.handlers.get(tipo)
+        if handler is not None:
+            result = handler(message)
+            if inspect.isawaitable(result):
+                self._spawn(result)
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        task.add_done_callback(_log_failure)
+        return task
+
+    def _pool(self, executor):
+        pool = self._pools[executor]
+        if pool is None:
+            if executor == THREAD:
+                pool = concurrent.futures.ThreadPoolExecutor(self.threads, thread_name_prefix="acpaas-task")
+            else:
+                pool = concurrent.futures.ProcessPoolExecutor(self.processes)
+            self._pools[executor] = pool
+            self._own_pools.append(pool)
+        return pool
+
+    # --- Sesiones ---
+
+    def _has_free_slot(self):
+        return self.max_sesiones is None or len(self.sessions) < self.max_sesiones
+
+    def _open_session(self, message):
+        id_sesion = message.get("id_sesion")
+        if id_sesion is None or id_sesion in self.sessions:
+            return
+        if not self._has_free_slot():
+            self._spawn(self.client.send(message["origen"], "SESSION_REJECT", {
+                "motivo": "Recursos insuficientes", "codigo_error": 503,
+            }, respuesta_a=message["id_mensaje"], id_sesion=id_sesion))
+            return
+        session = self.sessions[id_sesion] = self.client.session(message["origen"], id_sesion)
+        self._spawn(session.send("SESSION_ACCEPT", respuesta_a=message["id_mensaje"]))
+
+    def _close_session(self, message):
+        id_sesion = message.get("id_sesion")
+        session = self.sessions.pop(id_sesion, None)
+        if session is None:
+            return
+        for task, task_session in list(self.running.values()):
+            if task_session == id_sesion:
+                task.cancel()
+        if message["origen"] == self.client.server_id:
+            # Cierre por timeout o desconexión del otro extremo: no hay a quién contestar
+            self.client.flow.close_session(id_sesion)
+            self.client.sequencer.forget(id_sesion)
+        else:
+            self._spawn(session.close())
+
+    # --- Tareas ---
+
+    def _start_task(self, message):
+        id_sesion = message.get("id_sesion")
+        session = self.sessions.get(id_sesion)
+        if session is None and id_sesion is not None:
+            # Tarea sin SESSION_INIT previo: la sesión se abre implícitamente si hay plaza
+            if not self._has_free_slot():
+                self._spawn(self._reply(message, None, _failure("Recursos insuficientes")))
+                return
+            session = self.sessions[id_sesion] = self.client.session(message["origen"], id_sesion)
+        task = self._spawn(self._run_task(message, session))
+        self.running[message["id_mensaje"]] = (task, id_sesion)
+        task.add_done_callback(lambda _, id_mensaje=message["id_mensaje"]: self.running.pop(id_mensaje, None))
+
+    async def _run_task(self, message, session):
+        datos = message.get("datos") or {}
+        descripcion = datos.get("descripcion_tarea")
+        handler = self.tasks.get(descripcion)
+        incoming = message.get(PAYLOAD_FIELD)
+        if handler is None:
+            if incoming is not None:
+                incoming.abort(LookupError(descripcion))
+            await self._reply(message, session, _failure(f"Unknown task '{descripcion}'"))
+            return
+        parametros = datos.get("parametros") or {}
+        spooled = None
+        payload = None
+        try:
+            if incoming is not None:
+                if handler.executor == ON_LOOP:
+                    parametros[PAYLOAD_FIELD] = incoming
+                else:
+                    parametros[PAYLOAD_FIELD] = spooled = await incoming.spool()
+            if handler.streaming:
+                partes = await self._stream(handler, parametros, message, session)
+                result = {"estado": TASK_OK, "resultado": None, "error_detalle": None, "partes": partes}
+            else:
+                resultado = await self._call(handler, parametros)
+                if isinstance(resultado, Payload):
+                    payload, resultado = resultado.source, resultado.resultado
+                result = {"estado": TASK_OK, "resultado": resultado, "error_detalle": None}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Task '%s' (%s) failed: %s", descripcion, message["id_mensaje"], e)
+            result = _failure(str(e), type(e).__name__)
+        finally:
+            if spooled is not None:
+                os.unlink(spooled)
+            elif incoming is not None:
+                # Lo que el handler no llegó a leer se descarta sin detener al emisor
+                incoming.abort(EOFError("Task finished before reading its payload"))
+        await self._reply(message, session, result, payload)
+
+    async def _call(self, handler, parametros):
+        if handler.executor == ON_LOOP:
+            return await handler.function(parametros)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(handler.executor), handler.function, parametros)
+
+    async def _stream(self, handler, parametros, message, session):
+        partes = 0
+        if handler.executor == ON_LOOP:
+            async for resultado in handler.function(parametros):
+                partes += 1
+                await self._reply(message, session, _partial(resultado, partes))
+            return partes
+        # Generador síncrono: cada next() corre en el pool, el envío en el bucle
+        loop = asyncio.get_running_loop()
+        pool = self._pool(handler.executor)
+        generator = handler.function(parametros)
+        while True:
+            resultado = await loop.run_in_executor(pool, next, generator, _DONE)
+            if resultado is _DONE:
+                return partes
+            partes += 1
+            await self._reply(message, session, _partial(resultado, partes))
+
+    async def _reply(self, message, session, datos, payload=None):
+        if payload is not None:
+            await self.client.send_payload(message["origen"], "RESPUESTA_TAREA", payload, datos, session=session,
+                                           respuesta_a=message["id_mensaje"])
+        elif session is not None:
+            await session.send("RESPUESTA_TAREA", datos, requiere_ack=True, respuesta_a=message["id_mensaje"])
+        else:
+            await self.client.send(message["origen"], "RESPUESTA_TAREA", datos, requiere_ack=True,
+                                   respuesta_a=message["id_mensaje"])
+
+    # --- Cierre ---
+
+    async def close(self):
+        """Cancels the running tasks and shuts down the pools the runtime created."""
+        tasks = [task for task, _ in self.running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for pool in self._own_pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._own_pools.clear()
+
+
+def _partial(resultado, parte):
+    return {"estado": TASK_PARTIAL, "resultado": resultado, "parte": parte}
+
+
+def _failure(mensaje, tipo=None):
+    return {"estado": TASK_FAILED, "resultado": None, "error_detalle": {"tipo": tipo, "mensaje": mensaje}}
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Runtime task failed", exc_info=future.exception())
@@ -0,0 +1,140 @@
+"""
+In-order delivery of session messages by ``numero_secuencia`` (PRD 4.5.4).
+
+Each sender numbers its messages within a session 1, 2, 3... Retransmissions
+and reconnects can make them arrive twice or out of order. ``Resequencer``
+keeps one stream per ``(id_sesion, origen)``:
+
+* the expected message is delivered at once, an O(1) check when nothing is
+  buffered;
+* later messages wait in a bounded buffer until the gap before them fills;
+* anything below the expected number is a duplicate and is dropped;
+* a gap still open after ``gap_timeout`` (or a full buffer) is reported
+  through ``on_gap`` and skipped, and the buffered messages are delivered.
+
+Gap timers share the process ``TimerWheel``, so idle streams cost nothing.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FIRST_SEQUENCE = 1
+# MESSAGE_ACK repite el numero_secuencia del mensaje confirmado: no forma parte del flujo del emisor
+UNSEQUENCED_TYPES = frozenset({"MESSAGE_ACK"})
+
+
+class _Stream:
+    __slots__ = ("expected", "buffer", "timer")
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.buffer = {}
+        self.timer = None
+
+
+class Resequencer:
+    """Delivers each sender's session messages in ``numero_secuencia`` order.
+
+    Args:
+        deliver (callable): ``deliver(message)`` called once per message, in order.
+        wheel (TimerWheel): Shared timer wheel for gap deadlines.
+        gap_timeout (float): Seconds to wait for a missing message.
+        max_buffer (int): Out-of-order messages held per stream; one more
+            forces the oldest gap to be skipped.
+        on_gap (callable, optional): ``on_gap(id_sesion, origen, first, last)``
+            called with the range of sequence numbers given up on.
+    """
+
+    def __init__(self, deliver, wheel, gap_timeout=2.0, max_buffer=256, on_gap=None):
+        if max_buffer < 1:
+            raise ValueError("max_buffer must be at least 1")
+        self.deliver = deliver
+        self.wheel = wheel
+        self.gap_timeout = gap_timeout
+        self.max_buffer = max_buffer
+        self.on_gap = on_gap
+        self.streams = {}
+        self.duplicates = 0
+        self.gaps = 0
+
+    def push(self, message):
+        """Accepts an inbound message; delivers it and any messages it unblocks."""
+        id_sesion = message.get("id_sesion")
+        sequence = message.get("numero_secuencia")
+        if id_sesion is None or sequence is None or message["tipo"] in UNSEQUENCED_TYPES:
+            self.deliver(message)
+            return
+        senders = self.streams.get(id_sesion)
+        if senders is None:
+            senders = self.streams[id_sesion] = {}
+        origen = message["origen"]
+        stream = senders.get(origen)
+        if stream is None:
+            stream = senders[origen] = _Stream(FIRST_SEQUENCE)
+
+        if sequence == stream.expected:
+            stream.expected = sequence + 1
+            self.deliver(message)
+            if stream.buffer:
+                self._drain(stream)
+                self._rearm(stream, id_sesion, origen)
+        elif sequence < stream.expected or sequence in stream.buffer:
+            self.duplicates += 1
+            logger.debug("Dropping duplicate #%d of session %s from '%s'", sequence, id_sesion, origen)
+        else:
+            stream.buffer[sequence] = message
+            if len(stream.buffer) > self.max_buffer:
+                self._skip_gap(stream, id_sesion, origen)
+                self._rearm(stream, id_sesion, origen)
+            elif stream.timer is None:
+                stream.timer = self.wheel.schedule(self.gap_timeout, self._expire, id_sesion, origen)
+
+    def _drain(self, stream):
+        buffer = stream.buffer
+        deliver = self.deliver
+        message = buffer.pop(stream.expected, None)
+        while message is not None:
+            stream.expected += 1
+            deliver(message)
+            message = buffer.pop(stream.expected, None)
+
+    def _rearm(self, stream, id_sesion, origen):
+        # El hueco que se esperaba ya no existe: el plazo corre desde ahora para el siguiente
+        if stream.timer is not None:
+            stream.timer.cancel()
+            stream.timer = None
+        if stream.buffer:
+            stream.timer = self.wheel.schedule(self.gap_timeout, self._expire, id_sesion, origen)
+
+    def _skip_gap(self, stream, id_sesion, origen):
+        resume = min(stream.buffer)
+        first, last = stream.expected, resume - 1
+        self.gaps += 1
+        logger.warning("Session %s: messages #%d-#%d from '%s' missing; skipping them", id_sesion, first, last,
+                       origen)
+        stream.expected = resume
+        if self.on_gap is not None:
+            self.on_gap(id_sesion, origen, first, last)
+        self._drain(stream)
+
+    def _expire(self, id_sesion, origen):
+        stream = self.streams.get(id_sesion, {}).get(origen)
+        if stream is None:
+            return
+        stream.timer = None
+        if stream.buffer:
+            self._skip_gap(stream, id_sesion, origen)
+            self._rearm(stream, id_sesion, origen)
+
+    def forget(self, id_sesion):
+        """Drops the streams of a finished session (buffered messages are discarded)."""
+        senders = self.streams.pop(id_sesion, None)
+        if senders:
+            for stream in senders.values():
+                if stream.timer is not None:
+                    stream.timer.cancel()
+
+    def pending(self):
+        """Number of buffered out-of-order messages across all streams."""
+        return sum(len(stream.buffer) for senders in self.streams.values() for stream in senders.values())
@@ -0,0 +1,187 @@
+"""
+Shared mTLS contexts for the hub, the agents and the tests.
+
+Every ``SSLContext`` in the project is built here from the PEM files laid out
+by scripts/ (``<name>-cert.pem``, ``<name>-key.pem``, ``ca-cert.pem``):
+
+* contexts are cached per file set, so the chain and CA are parsed once per
+  process no matter how many connections or clients use them;
+* server contexts issue TLS 1.3 session tickets, and client contexts remember
+  the last session per server hostname and offer it on the next connection,
+  so a reconnect resumes instead of repeating the certificate exchange;
+* ``reload_changed`` / ``watch`` reload the certificate chain of a cached
+  context in place when its files change, so new handshakes use the new
+  certificate without a restart. Existing connections are not touched.
+
+Server contexts also note when each connection's handshake started, so the
+hub can report handshake time (``handshake_elapsed``).
+"""
+
+import asyncio
+import logging
+import os
+import pathlib
+import ssl
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUM_TICKETS = 2
+DEFAULT_WATCH_INTERVAL = 5.0
+
+
+def agent_files(cert_dir, name):
+    """Returns ``(cert, key, ca)`` paths for ``name`` in a scripts/-style directory."""
+    cert_dir = pathlib.Path(cert_dir)
+    return cert_dir / f"{name}-cert.pem", cert_dir / f"{name}-key.pem", cert_dir / "ca-cert.pem"
+
+
+class SessionCachingContext(ssl.SSLContext):
+    """Client context that offers the previous session of each server hostname.
+
+    asyncio creates one ``SSLObject`` per connection through ``wrap_bio``; the
+    last one per hostname is kept so its session (available once the server's
+    TLS 1.3 ticket has arrived) can be handed to the next connection.
+    """
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self._sessions = {}
+        self._last_objects = {}
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if not server_side and session is None:
+            session = self.session_for(server_hostname)
+        sslobj = super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+        if not server_side:
+            self._last_objects[server_hostname] = sslobj
+        return sslobj
+
+    def session_for(self, server_hostname):
+        """Returns the most recent resumable session for ``server_hostname``, if any."""
+        previous = self._last_objects.get(server_hostname)
+        if previous is not None:
+            session = previous.session
+            if session is not None and (session.has_ticket or session.id):
+                self._sessions[server_hostname] = session
+        return self._sessions.get(server_hostname)
+
+    def forget_sessions(self):
+        self._sessions.clear()
+        self._last_objects.clear()
+
+
+class ServerContext(ssl.SSLContext):
+    """Server context that stamps each connection's ``SSLObject`` with its handshake start time."""
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        sslobj = super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+        sslobj.handshake_started = time.perf_counter()
+        return sslobj
+
+
+def handshake_elapsed(ssl_object):
+    """Seconds since the TLS handshake of ``ssl_object`` started, or None if not known."""
+    started = getattr(ssl_object, "handshake_started", None)
+    return None if started is None else time.perf_counter() - started
+
+
+class _Entry:
+    __slots__ = ("context", "files", "mtimes")
+
+    def __init__(self, context, files):
+        self.context = context
+        self.files = files
+        self.mtimes = _mtimes(files)
+
+
+_contexts = {}
+
+
+def _mtimes(files):
+    return tuple(os.stat(path).st_mtime_ns for path in files)
+
+
+def _load(context, cert_file, key_file, ca_file):
+    context.load_cert_chain(cert_file, key_file)
+    context.load_verify_locations(cafile=ca_file)
+
+
+def server_context(cert_file, key_file, ca_file, num_tickets=DEFAULT_NUM_TICKETS):
+    """Returns the cached mTLS server context for these files.
+
+    Clients must present a certificate signed by ``ca_file``. ``num_tickets``
+    session tickets are sent after each full handshake.
+
+    Raises:
+        FileNotFoundError: If one of the files does not exist.
+        ssl.SSLError: If the files cannot be loaded.
+    """
+    files = (str(cert_file), str(key_file), str(ca_file))
+    key = ("server", files, num_tickets)
+    entry = _contexts.get(key)
+    if entry is None:
+        context = ServerContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.num_tickets = num_tickets
+        _load(context, *files)
+        entry = _contexts[key] = _Entry(context, files)
+    return entry.context
+
+
+def client_context(cert_file, key_file, ca_file, check_hostname=True):
+    """Returns the cached mTLS client context (a ``SessionCachingContext``).
+
+    Raises:
+        FileNotFoundError: If one of the files does not exist.
+        ssl.SSLError: If the files cannot be loaded.
+    """
+    files = (str(cert_file), str(key_file), str(ca_file))
+    key = ("client", files, check_hostname)
+    entry = _contexts.get(key)
+    if entry is None:
+        context = SessionCachingContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.check_hostname = check_hostname
+        context.verify_mode = ssl.CERT_REQUIRED
+        _load(context, *files)
+        entry = _contexts[key] = _Entry(context, files)
+    return entry.context
+
+
+def reload_changed():
+    """Reloads every cached context whose PEM files changed on disk.
+
+    A file set that fails to load (e.g. caught half-written) keeps its previous
+    certificate and is retried on the next call.
+
+    Returns:
+        list: The contexts that were reloaded.
+    """
+    reloaded = []
+    for entry in _contexts.values():
+        try:
+            mtimes = _mtimes(entry.files)
+        except OSError as e:
+            logger.warning("Cannot stat certificate files %s: %s", entry.files, e)
+            continue
+        if mtimes == entry.mtimes:
+            continue
+        try:
+            _load(entry.context, *entry.files)
+        except (OSError, ssl.SSLError) as e:
+            logger.warning("Reloading %s failed, keeping the previous certificate: %s", entry.files[0], e)
+            continue
+        entry.mtimes = mtimes
+        if isinstance(entry.context, SessionCachingContext):
+            entry.context.forget_sessions()
+        logger.info("Reloaded TLS certificate %s", entry.files[0])
+        reloaded.append(entry.context)
+    return reloaded
+
+
+async def watch(interval=DEFAULT_WATCH_INTERVAL):
+    """Polls the cached contexts' files every ``interval`` seconds; runs until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        reload_changed()
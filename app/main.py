@@ -1,26 +1,46 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-import ssl
+from fastapi.responses import PlainTextResponse
+import asyncio
+import logging
 import os
 
+from acpaas_agent_lib.python import tls
+from acpaas_agent_lib.python.metrics import REGISTRY, monitor_event_loop
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
-# Load SSL context for WSS
-ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-ssl_context.load_cert_chain(certfile="scripts/agente_py-cert.pem", keyfile="scripts/agente_py-key.pem")
-ssl_context.load_verify_locations(cafile="scripts/ca-cert.pem")
-ssl_context.verify_mode = ssl.CERT_REQUIRED
+# Load SSL context for WSS (shared, cached mTLS context with session tickets)
+ssl_context = tls.server_context("scripts/agente_py-cert.pem", "scripts/agente_py-key.pem", "scripts/ca-cert.pem")
+
+WS_MESSAGES_IN = REGISTRY.counter("acpaas_app_ws_messages_in_total", "WebSocket messages received by the app")
+WS_MESSAGES_OUT = REGISTRY.counter("acpaas_app_ws_messages_out_total", "WebSocket messages sent by the app")
+WS_BYTES_IN = REGISTRY.counter("acpaas_app_ws_bytes_in_total", "WebSocket text received by the app, in characters")
+LOOP_LAG_SECONDS = REGISTRY.histogram("acpaas_event_loop_lag_seconds", "How late the event loop runs a timer")
+
+@app.on_event("startup")
+async def start_monitors():
+    app.state.lag_monitor = asyncio.create_task(monitor_event_loop(LOOP_LAG_SECONDS))
 
 @app.get("/")
 async def read_root():
     return {"Hello": "World"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws/{agent_id}")
 async def websocket_endpoint(websocket: WebSocket, agent_id: str):
     await websocket.accept()
     try:
         while True:
             data = await websocket.receive_text()
-            print(f"Received message from {agent_id}: {data}")
+            WS_MESSAGES_IN.inc()
+            WS_BYTES_IN.inc(len(data))
+            logger.debug("Received message from %s: %d chars", agent_id, len(data))
             await websocket.send_text(f"Echo: {data}")
+            WS_MESSAGES_OUT.inc()
     except WebSocketDisconnect:
-        print(f"Client {agent_id} disconnected") 
\ No newline at end of file
+        print(f"Client {agent_id} disconnected")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_ack_tracker.py - AckTracker + TimerWheel with up to 100k in-flight messages
+#
+# Mide:
+#   * coste de track()/ack() por mensaje
+#   * CPU del proceso mientras N mensajes esperan su ACK (debe ser plano en N)
+#   * coste de una tormenta de retransmisiones (todos los timeouts a la vez)
+#   * referencia: una tarea asyncio por mensaje esperando su timeout
+#
+#   python benchmarks/bench_ack_tracker.py --in-flight 0 10000 100000 --idle 3
+
+import argparse
+import asyncio
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.reliability import AckTracker, TimerWheel
+
+
+async def tracker_run(in_flight, idle_seconds):
+    wheel = TimerWheel(resolution=0.01)
+    wheel.start()
+    sent = []
+    tracker = AckTracker(sent.append, wheel, timeout=600.0, jitter=0.1)
+    ids = [f"msg-{i}" for i in range(in_flight)]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for message_id in ids:
+        tracker.track(message_id, message_id)
+    track_us = (time.perf_counter() - started) / max(1, in_flight) * 1e6
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cpu_before = time.process_time()
+    await asyncio.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_before) / idle_seconds * 100
+
+    started = time.perf_counter()
+    for message_id in ids:
+        tracker.ack(message_id)
+    ack_us = (time.perf_counter() - started) / max(1, in_flight) * 1e6
+
+    # Tormenta: todos vencen en el mismo tick
+    storm = AckTracker(sent.append, wheel, timeout=0.05, jitter=0, max_retries=5)
+    for message_id in ids:
+        storm.track(message_id, message_id)
+    started = time.perf_counter()
+    while storm.retransmissions < in_flight:
+        await asyncio.sleep(0.01)
+    storm_ms = (time.perf_counter() - started - 0.05) * 1000
+    storm.cancel_all()
+    wheel.stop()
+
+    return {
+        "in_flight": in_flight,
+        "track_us": round(track_us, 3),
+        "ack_us": round(ack_us, 3),
+        "bytes_per_in_flight": round(memory / max(1, in_flight)),
+        "idle_cpu_percent": round(idle_cpu, 2),
+        "retransmit_storm_ms": round(max(0.0, storm_ms), 1) if in_flight else 0.0,
+    }
+
+
+async def task_per_message_run(in_flight, idle_seconds):
+    """Referencia: una tarea asyncio.sleep por mensaje en vuelo."""
+    async def wait_ack():
+        await asyncio.sleep(600.0)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(wait_ack()) for _ in range(in_flight)]
+    await asyncio.sleep(0)
+    create_us = (time.perf_counter() - started) / max(1, in_flight) * 1e6
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cpu_before = time.process_time()
+    await asyncio.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_before) / idle_seconds * 100
+
+    started = time.perf_counter()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    cancel_us = (time.perf_counter() - started) / max(1, in_flight) * 1e6
+    return {
+        "in_flight": in_flight,
+        "track_us": round(create_us, 3),
+        "ack_us": round(cancel_us, 3),
+        "bytes_per_in_flight": round(memory / max(1, in_flight)),
+        "idle_cpu_percent": round(idle_cpu, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AckTracker scaling with in-flight messages")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[0, 10_000, 100_000])
+    parser.add_argument("--idle", type=float, default=3.0, help="Seconds to sample idle CPU")
+    args = parser.parse_args()
+
+    results = {
+        "timer_wheel": [asyncio.run(tracker_run(n, args.idle)) for n in args.in_flight],
+        "task_per_message": [asyncio.run(task_per_message_run(n, args.idle)) for n in args.in_flight],
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_agent_client.py - Handshake por petición vs conexión persistente de AgentClient
+#
+# Arranca lib/server.py con certificados desechables y mide la latencia de una
+# petición/respuesta (HEARTBEAT -> HEARTBEAT_ACK):
+#   * per_request: conexión mTLS nueva + REGISTRO + petición + cierre, como hacía
+#     connect_and_run para cada trabajo
+#   * pooled: la misma petición sobre la conexión de un AgentClient ya registrado
+#   * pooled_concurrent: --concurrency peticiones en vuelo multiplexadas
+#
+#   python benchmarks/bench_agent_client.py --requests 200
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from acpaas_agent_lib.python.agent_client import AgentClient
+from acpaas_agent_lib.python.codec import build_message, decode_message, encode_message
+from benchmarks.bench_workers import client_context, wait_for_port
+from benchmarks.certs import generate_cert_dir
+
+AGENT_ID = "bench_agent_0"
+SERVER_ID = "acpaas_server"
+
+
+def summarize(samples_ms, elapsed=None):
+    samples_ms = sorted(samples_ms)
+    result = {
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p99_ms": round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+    }
+    if elapsed is not None:
+        result["requests_per_s"] = round(len(samples_ms) / elapsed, 1)
+    return result
+
+
+async def reply_to(websocket, message):
+    await websocket.send(encode_message(message))
+    async for frame in websocket:
+        reply = decode_message(frame)
+        if reply["respuesta_a"] == message["id_mensaje"]:
+            return reply
+
+
+async def per_request(url, context, requests):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with websockets.connect(url, ssl=context) as websocket:
+            await reply_to(websocket, build_message("REGISTRO", AGENT_ID, SERVER_ID, datos={"uri": url}))
+            await reply_to(websocket, build_message("HEARTBEAT", AGENT_ID, SERVER_ID))
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+async def pooled(url, context, requests, concurrency):
+    async with AgentClient(AGENT_ID, url, context) as client:
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            await client.request(SERVER_ID, "HEARTBEAT")
+            samples.append((time.perf_counter() - started) * 1000)
+        sequential = summarize(samples)
+
+        concurrent_samples = []
+
+        async def one():
+            started = time.perf_counter()
+            await client.request(SERVER_ID, "HEARTBEAT")
+            concurrent_samples.append((time.perf_counter() - started) * 1000)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded():
+            async with semaphore:
+                await one()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded() for _ in range(requests * 10)))
+        concurrent = summarize(concurrent_samples, time.perf_counter() - started)
+    return sequential, concurrent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request handshakes vs a pooled AgentClient connection")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    cert_dir = generate_cert_dir([AGENT_ID])
+    env = dict(os.environ, ACPAAS_CERT_DIR=str(cert_dir))
+    server = subprocess.Popen([sys.executable, str(REPO_ROOT / "lib" / "server.py"), "--port", str(args.port),
+                               "--host", "127.0.0.1"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        url = f"wss://localhost:{args.port}/"
+        context = client_context(cert_dir, AGENT_ID)
+        results = {"per_request": asyncio.run(per_request(url, context, args.requests))}
+        results["pooled"], results["pooled_concurrent"] = asyncio.run(
+            pooled(url, context, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_broadcast.py - Latencia de difusión (BROADCAST) a N conexiones WebSocket locales
+#
+# Servidor websockets en el mismo proceso (ws://, sin TLS ni compresión) con
+# --clients agentes conectados. Mide, para cada ronda, el tiempo desde que se
+# difunde un mensaje hasta que lo ha recibido el último cliente (los clientes
+# comparten CPU con el servidor, así que domina el coste de recibir):
+#   prepared:  MessageRouter.broadcast (codificar una vez, frame serializado una vez
+#              y escrito directamente en el transporte de cada destinatario)
+#   queued:    MessageRouter.broadcast sin frame preconstruido (writer de cada
+#              destinatario y send() por conexión)
+#   naive:     bucle secuencial codificando y esperando send() destinatario a destinatario
+#
+#   python benchmarks/bench_broadcast.py --clients 5000 --rounds 20
+
+import argparse
+import asyncio
+import json
+import pathlib
+import statistics
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from acpaas_agent_lib.python.agent_base import create_message
+from acpaas_agent_lib.python.codec import encode_frame
+from lib.router import MessageRouter
+
+
+class Fleet:
+    """Clientes conectados que cuentan cuántos han recibido la ronda actual."""
+
+    def __init__(self, count):
+        self.count = count
+        self.received = 0
+        self.done = None
+
+    def on_message(self):
+        self.received += 1
+        if self.received == self.count:
+            self.done.set_result(time.perf_counter())
+
+    def arm(self):
+        self.received = 0
+        self.done = asyncio.get_running_loop().create_future()
+
+
+async def client(url, fleet, ready):
+    async with websockets.connect(url, compression=None, max_queue=None, open_timeout=120) as websocket:
+        ready.release()
+        async for _ in websocket:
+            fleet.on_message()
+
+
+async def naive_broadcast(router, message):
+    for peer in list(router.peers.values()):
+        await peer.connection.send(encode_frame(message, peer.payload_format))
+
+
+async def run(args):
+    router = MessageRouter(queue_size=1024)
+
+    async def handler(websocket):
+        await router.serve(websocket, websocket.request.path.lstrip("/"))
+
+    server = await websockets.serve(handler, "127.0.0.1", 0, compression=None, max_queue=None)
+    port = server.sockets[0].getsockname()[1]
+    fleet = Fleet(args.clients)
+    ready = asyncio.Semaphore(0)
+    clients = []
+    for i in range(args.clients):
+        clients.append(asyncio.create_task(client(f"ws://127.0.0.1:{port}/agent_{i}", fleet, ready)))
+        if i % 200 == 199:
+            await asyncio.sleep(0)  # no saturar el backlog de accept
+    for _ in range(args.clients):
+        await ready.acquire()
+    while len(router.peers) < args.clients:
+        await asyncio.sleep(0.01)
+
+    datos = {"descripcion_tarea": "bench", "parametros": {"blob": "x" * args.payload_size}}
+    message = create_message("SOLICITUD_TAREA", "bench_origin", "BROADCAST", datos=datos)
+    results = []
+    for mode in ("prepared", "queued", "naive"):
+        raw = mode == "prepared"
+        for peer in router.peers.values():
+            peer.raw_frames = raw and peer.connection.protocol.extensions == []
+        latencies = []
+        calls = []
+        for _ in range(args.rounds):
+            fleet.arm()
+            started = time.perf_counter()
+            if mode == "naive":
+                await naive_broadcast(router, message)
+            else:
+                router.broadcast(message)
+            calls.append((time.perf_counter() - started) * 1000)
+            finished = await fleet.done
+            latencies.append((finished - started) * 1000)
+        latencies.sort()
+        results.append({
+            "mode": mode,
+            "clients": args.clients,
+            "payload_bytes": len(encode_frame(message)),
+            "fanout_p50_ms": round(statistics.median(latencies), 2),
+            "fanout_max_ms": round(latencies[-1], 2),
+            # Tiempo que el hub pasa dentro de la llamada de difusión (bloqueando su bucle)
+            "broadcast_call_p50_ms": round(statistics.median(calls), 2),
+        })
+
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    server.close()
+    await server.wait_closed()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BROADCAST fan-out latency to local WebSocket connections")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--payload-size", type=int, default=512)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
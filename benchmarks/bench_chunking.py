@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_chunking.py - Memoria pico de una transferencia por partes frente al tamaño de la carga
+#
+# Arranca lib/server.py con certificados desechables y, para cada tamaño de
+# --sizes, envía un fichero de ese tamaño de un AgentClient a otro a través del
+# hub con send_payload (PROTOCOL_SPEC 3.6). Cada tamaño corre en un proceso
+# nuevo, que mide:
+#   * peak_rss_growth_mb: memoria residente pico menos la de antes de empezar,
+#     emisor y receptor juntos (debería ser la misma para 256 MB que para 4 GB)
+#   * mb_per_s: caudal de extremo a extremo
+#   * hub_peak_rss_mb: memoria pico del proceso del hub hasta ese momento
+# y, como referencia, lo que cuesta en memoria la carga en línea en ``datos``
+# (base64 + JSON, codificar y decodificar) para los tamaños de --inline-sizes.
+#
+#   python benchmarks/bench_chunking.py --sizes 256M,1G,4G
+#   python benchmarks/bench_chunking.py --sizes 1G --spool-dir /tmp   # el receptor vuelca a disco
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.agent_client import AgentClient
+from acpaas_agent_lib.python.chunking import DEFAULT_CHUNK_SIZE
+from acpaas_agent_lib.python.codec import build_message, decode_message, encode_message
+from benchmarks.bench_workers import client_context, wait_for_port
+from benchmarks.certs import generate_cert_dir
+
+SENDER = "bench_sender"
+RECEIVER = "bench_receiver"
+UNITS = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB en Linux
+
+
+def hub_peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+# --- Procesos hijo: un tamaño por proceso, para que el pico de uno no tape al siguiente ---
+
+async def transfer(url, cert_dir, path, chunk_size, spool_dir):
+    received = asyncio.Queue()
+    receiver = AgentClient(RECEIVER, url, client_context(cert_dir, RECEIVER), on_message=received.put_nowait)
+    sender = AgentClient(SENDER, url, client_context(cert_dir, SENDER))
+    async with receiver, sender:
+        baseline = rss_mb()
+
+        async def consume():
+            message = await received.get()
+            while "carga" not in message:  # CAPABILITY_ANNOUNCE del hub y demás
+                message = await received.get()
+            incoming = message["carga"]
+            if spool_dir is not None:
+                spooled = await incoming.spool(os.path.join(spool_dir, "bench_chunking.out"))
+                size = os.path.getsize(spooled)
+                os.unlink(spooled)
+                return size
+            size = 0
+            async for chunk in incoming:
+                size += len(chunk)
+            return size
+
+        started = time.perf_counter()
+        session = sender.session(RECEIVER)
+        consumer = asyncio.ensure_future(consume())
+        await session.send_payload("SOLICITUD_TAREA", path, {"descripcion_tarea": "bench"}, chunk_size=chunk_size)
+        size = await consumer
+        elapsed = time.perf_counter() - started
+    return {
+        "bytes": size,
+        "seconds": round(elapsed, 2),
+        "mb_per_s": round(size / elapsed / 2 ** 20, 1),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def transfer_process(url, cert_dir, path, chunk_size, spool_dir, results):
+    results.put(asyncio.run(transfer(url, cert_dir, path, chunk_size, spool_dir)))
+
+
+def inline_process(size, results):
+    baseline = rss_mb()
+    data = os.urandom(size)
+    message = build_message("SOLICITUD_TAREA", SENDER, RECEIVER, datos={"carga": base64.b64encode(data).decode()})
+    del data
+    frame = encode_message(message)
+    del message
+    decoded = decode_message(frame)
+    base64.b64decode(decoded["datos"]["carga"])
+    results.put({"bytes": size, "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1)})
+
+
+def run_child(target, *args):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=target, args=(*args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of a chunked transfer vs payload size")
+    parser.add_argument("--port", type=int, default=18082)
+    parser.add_argument("--sizes", default="256M,1G,4G", help="Comma-separated payload sizes (K, M, G suffixes)")
+    parser.add_argument("--inline-sizes", default="16M,64M",
+                        help="Sizes for the inline reference (datos with base64); empty to skip")
+    parser.add_argument("--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--spool-dir", help="Have the receiver spool the payload to a file in this directory")
+    args = parser.parse_args()
+
+    cert_dir = generate_cert_dir([SENDER, RECEIVER])
+    env = dict(os.environ, ACPAAS_CERT_DIR=str(cert_dir))
+    server = subprocess.Popen([sys.executable, str(REPO_ROOT / "lib" / "server.py"), "--port", str(args.port),
+                               "--host", "127.0.0.1"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {"chunk_size": args.chunk_size, "chunked": [], "inline": []}
+    try:
+        wait_for_port(args.port)
+        url = f"wss://localhost:{args.port}/"
+        with tempfile.TemporaryDirectory() as workdir:
+            for size in map(parse_size, args.sizes.split(",")):
+                # Fichero disperso: no ocupa disco, pero se lee (y se mapea) como uno de verdad
+                path = os.path.join(workdir, "payload.bin")
+                with open(path, "wb") as f:
+                    f.truncate(size)
+                run = run_child(transfer_process, url, cert_dir, path, args.chunk_size, args.spool_dir)
+                run["hub_peak_rss_mb"] = round(hub_peak_rss_mb(server.pid), 1)
+                results["chunked"].append(run)
+                os.unlink(path)
+        if args.inline_sizes:
+            results["inline"] = [run_child(inline_process, parse_size(size)) for size in args.inline_sizes.split(",")]
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
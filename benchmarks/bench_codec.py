@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_codec.py - codec.encode_message/decode_message vs create_message/parse_message
+#
+#   python benchmarks/bench_codec.py --iterations 100000
+
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python import codec
+from acpaas_agent_lib.python.agent_base import create_message, parse_message
+
+
+def per_call_us(fn, iterations):
+    best = min(timeit.repeat(fn, number=iterations, repeat=5))
+    return round(best / iterations * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message codec microbenchmark")
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--payload-size", type=int, default=256)
+    args = parser.parse_args()
+
+    session = str(uuid.uuid4())
+    datos = {"descripcion_tarea": "bench", "parametros": {"blob": "x" * args.payload_size}}
+    fields = dict(id_sesion=session, numero_secuencia=7, requiere_ack=True, datos=datos)
+
+    text = json.dumps(create_message("SOLICITUD_TAREA", "agent_a", "agent_b", **fields))
+    raw = codec.encode_message(codec.build_message("SOLICITUD_TAREA", "agent_a", "agent_b", **fields))
+    message = codec.decode_message(raw)
+
+    n = args.iterations
+    results = {
+        "json_backend": codec.JSON_BACKEND,
+        "create_message+json.dumps_us": per_call_us(
+            lambda: json.dumps(create_message("SOLICITUD_TAREA", "agent_a", "agent_b", **fields)), n),
+        "build_message+encode_message_us": per_call_us(
+            lambda: codec.encode_message(codec.build_message("SOLICITUD_TAREA", "agent_a", "agent_b", **fields)), n),
+        "parse_message_us": per_call_us(lambda: parse_message(text), n),
+        "decode_message_validated_us": per_call_us(lambda: codec.decode_message(raw), n),
+        "decode_message_unvalidated_us": per_call_us(lambda: codec.decode_message(raw, validate=False), n),
+        "validate_message_us": per_call_us(lambda: codec.validate_message(message), n),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_compression.py - Bytes ahorrados frente a CPU y memoria por conexión de cada modo de compresión
+#
+# Pasa la misma mezcla de mensajes (ACKs y heartbeats pequeños, tareas con payload)
+# por cada configuración, comprimiendo y descomprimiendo como lo harían los dos extremos:
+#
+#   python benchmarks/bench_compression.py
+#   python benchmarks/bench_compression.py --messages 20000 --small-share 0.8 --payload-size 2048
+#
+# "deflate_all" es lo que negocia websockets por defecto (ventana de 32 KiB, todo comprimido).
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from websockets.frames import Frame, Opcode
+
+from acpaas_agent_lib.python.codec import build_message, decode_frame, encode_frame
+from acpaas_agent_lib.python.compression import (
+    DeflateSettings, DictionaryCodec, ThresholdPerMessageDeflate, protocol_codec, train_dictionary)
+
+
+def workload(count, small_share, payload_size, seed=7):
+    rng = random.Random(seed)
+    agents = ["agente_py", "agente_ocr", "agente_nlp"]
+    words = ["factura", "cliente", "importe", "fecha", "pedido", "estado", "total", "linea"]
+    session = str(uuid.uuid4())
+    messages = []
+    for n in range(count):
+        origen, destino = rng.sample(agents, 2)
+        if rng.random() < small_share:
+            tipo = rng.choice(["MESSAGE_ACK", "HEARTBEAT"])
+            message = build_message(tipo, origen, destino, respuesta_a=str(uuid.uuid4()))
+        else:
+            texto = " ".join(rng.choice(words) for _ in range(payload_size // 7))[:payload_size]
+            tipo, datos = rng.choice([
+                ("SOLICITUD_TAREA", {"descripcion_tarea": "procesar_documento",
+                                     "parametros": {"idioma": "es", "texto": texto}}),
+                ("RESPUESTA_TAREA", {"estado": "exito", "resultado": {"texto": texto}, "mensaje_error": None}),
+            ])
+            message = build_message(tipo, origen, destino, id_sesion=session, numero_secuencia=n,
+                                    requiere_ack=True, datos=datos)
+        messages.append(message)
+    return messages
+
+
+def deflate_pair(settings):
+    window = settings.window_bits
+    takeover = settings.no_context_takeover
+    sender = ThresholdPerMessageDeflate(takeover, takeover, window, window, settings.compress_settings,
+                                        min_size=settings.min_size)
+    receiver = ThresholdPerMessageDeflate(takeover, takeover, window, window, settings.compress_settings,
+                                          min_size=settings.min_size)
+    return sender, receiver
+
+
+def run_deflate(settings, frames):
+    """Sends ``frames`` over one simulated connection; returns (wire bytes, seconds of CPU)."""
+    sender, receiver = deflate_pair(settings) if settings else (None, None)
+    wire = 0
+    started = time.process_time()
+    for frame in frames:
+        data = Frame(Opcode.TEXT, frame.encode("utf-8"))
+        if sender is not None:
+            data = sender.encode(data)
+        wire += len(data.data)
+        if receiver is not None:
+            data = receiver.decode(data)
+        decode_frame(data.data, validate=False)
+    return wire, time.process_time() - started
+
+
+def run_dictionary(dictionary_codec, messages):
+    wire = 0
+    started = time.process_time()
+    for message in messages:
+        data = encode_frame(message, dictionary_codec.format)
+        wire += len(data.encode("utf-8") if isinstance(data, str) else data)
+        decode_frame(data, validate=False)
+    return wire, time.process_time() - started
+
+
+def measured_memory(settings, frames, connections=200):
+    """Bytes still allocated per connection after each one carried a few messages."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pairs = [deflate_pair(settings) for _ in range(connections)]
+    for sender, receiver in pairs:
+        for frame in frames:
+            receiver.decode(sender.encode(Frame(Opcode.TEXT, frame.encode("utf-8"))))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del pairs
+    return used // connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression ratio vs CPU and memory per connection")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--small-share", type=float, default=0.7, help="Share of ACKs and heartbeats")
+    parser.add_argument("--payload-size", type=int, default=1024, help="Characters of text in task messages")
+    args = parser.parse_args()
+
+    messages = workload(args.messages, args.small_share, args.payload_size)
+    frames = [encode_frame(message) for message in messages]
+    raw = sum(len(frame.encode("utf-8")) for frame in frames)
+    # Entrenado con otra muestra del mismo tráfico, no con los mensajes medidos
+    trained = DictionaryCodec(train_dictionary(workload(2000, args.small_share, args.payload_size, seed=99))).register()
+
+    modes = {
+        "none": None,
+        "deflate_all": DeflateSettings(min_size=0, window_bits=15, mem_level=8),
+        "threshold": DeflateSettings(),
+        "threshold_window_10": DeflateSettings(window_bits=10, mem_level=4),
+        "threshold_no_context_takeover": DeflateSettings(no_context_takeover=True),
+    }
+    results = {"messages": len(messages), "raw_bytes": raw}
+    for name, settings in modes.items():
+        wire, seconds = run_deflate(settings, frames)
+        results[name] = {
+            "wire_bytes_per_message": round(wire / len(frames), 1),
+            "saved_pct": round(100 * (1 - wire / raw), 1),
+            "cpu_us_per_message": round(seconds / len(frames) * 1e6, 2),
+            "memory_kib_per_connection": (round(measured_memory(settings, frames[:20]) / 1024, 1)
+                                          if settings else 0),
+        }
+    for name, dictionary_codec in (("protocol_dictionary", protocol_codec()), ("trained_dictionary", trained)):
+        wire, seconds = run_dictionary(dictionary_codec, messages)
+        results[name] = {
+            "wire_bytes_per_message": round(wire / len(messages), 1),
+            "saved_pct": round(100 * (1 - wire / raw), 1),
+            "cpu_us_per_message": round(seconds / len(messages) * 1e6, 2),
+            "memory_kib_per_connection": 0,
+            "dictionary_bytes": len(dictionary_codec.dictionary),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_directory.py - Selección de agente por capacidad: índice invertido vs recorrido lineal
+#
+# Para N agentes (cada uno con --caps-per-agent capacidades de un catálogo de
+# --capabilities y max_sesiones_concurrentes = --max-sessions) mide el coste de:
+#   * select + session_opened (abrir una sesión) con p2c y least_loaded
+#   * session_closed (liberar la plaza)
+#   * la referencia: recorrer todos los agentes buscando el menos cargado
+#
+#   python benchmarks/bench_directory.py --agents 1000 10000 100000
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from lib.directory import LEAST_LOADED, POWER_OF_TWO, AgentDirectory
+
+
+def populate(directory, agents, capabilities, caps_per_agent, max_sessions, rng):
+    catalog = [f"cap_{i}" for i in range(capabilities)]
+    started = time.perf_counter()
+    for i in range(agents):
+        directory.register(f"agent_{i}")
+        directory.announce(f"agent_{i}", rng.sample(catalog, caps_per_agent), max_sessions)
+    return catalog, (time.perf_counter() - started) / agents * 1e6
+
+
+def linear_select(directory, capability):
+    best = None
+    for record in directory.agents.values():
+        if capability in record.capacidades and record.has_free_slot:
+            if best is None or record.load < best.load:
+                best = record
+    return best
+
+
+def run(agents, strategy, args):
+    rng = random.Random(1)
+    directory = AgentDirectory(strategy, rng=random.Random(2))
+    catalog, announce_us = populate(directory, agents, args.capabilities, args.caps_per_agent,
+                                    args.max_sessions, rng)
+    # Ocupar la mitad de la capacidad total para que la selección tenga que discriminar
+    sessions = agents * args.max_sessions // 2
+    wanted = [rng.choice(catalog) for _ in range(sessions)]
+
+    started = time.perf_counter()
+    opened = []
+    for n, capability in enumerate(wanted):
+        record = directory.select(capability)
+        if record is not None:
+            directory.session_opened(record.agent_id, n)
+            opened.append(n)
+    open_us = (time.perf_counter() - started) / sessions * 1e6
+
+    started = time.perf_counter()
+    for n in opened:
+        directory.session_closed(n)
+    close_us = (time.perf_counter() - started) / max(1, len(opened)) * 1e6
+
+    result = {
+        "agents": agents,
+        "strategy": strategy,
+        "announce_us": round(announce_us, 2),
+        "select_and_open_us": round(open_us, 2),
+        "close_us": round(close_us, 2),
+        "sessions_placed": len(opened),
+    }
+    if strategy == POWER_OF_TWO:
+        probes = min(200, sessions)
+        started = time.perf_counter()
+        for capability in wanted[:probes]:
+            linear_select(directory, capability)
+        result["linear_scan_select_us"] = round((time.perf_counter() - started) / probes * 1e6, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capability-indexed agent selection vs a linear scan")
+    parser.add_argument("--agents", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--capabilities", type=int, default=100)
+    parser.add_argument("--caps-per-agent", type=int, default=5)
+    parser.add_argument("--max-sessions", type=int, default=8)
+    args = parser.parse_args()
+
+    results = [run(agents, strategy, args) for agents in args.agents for strategy in (POWER_OF_TWO, LEAST_LOADED)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_flow_control.py - Memoria del hub con un consumidor lento, con y sin FLOW_CONTROL
+#
+# Varios productores envían SOLICITUD_TAREA tan rápido como pueden a un único
+# consumidor que tarda --consumer-delay segundos por frame. Con control de flujo
+# los productores respetan PAUSE/RESUME del router; sin él, sólo la cola acotada
+# (RATE_LIMIT_EXCEEDED) contiene el crecimiento.
+#
+#   python benchmarks/bench_flow_control.py --producers 8 --seconds 5
+
+import argparse
+import asyncio
+import json
+import logging
+import pathlib
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.codec import build_message, decode_frame, encode_message
+from acpaas_agent_lib.python.flow_control import FlowController
+from lib.router import MessageRouter
+
+
+class ProducerConnection:
+    """Lado servidor de un productor: lo que el router le envía llega a su FlowController."""
+
+    def __init__(self, control):
+        self.control = control
+        self.errors = 0
+
+    async def send(self, frame):
+        message = decode_frame(frame, validate=False)
+        if message["tipo"] == "ERROR":
+            self.errors += 1
+        self.control.handle(message)
+
+
+class SlowConsumer:
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+
+    async def send(self, frame):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+
+
+async def run(producers, seconds, consumer_delay, queue_size, payload_bytes, flow_control):
+    router = MessageRouter(queue_size=queue_size)
+    consumer = SlowConsumer(consumer_delay)
+    target = router.attach("consumer", consumer)
+    datos = {"descripcion_tarea": "x" * payload_bytes, "parametros": None}
+
+    connections = []
+    for i in range(producers):
+        connection = ProducerConnection(FlowController())
+        connections.append((f"producer_{i}", router.attach(f"producer_{i}", connection), connection))
+
+    deadline = time.perf_counter() + seconds
+    peak_depth = 0
+    offered = 0
+
+    async def produce(agent_id, peer, connection):
+        nonlocal peak_depth, offered
+        while time.perf_counter() < deadline:
+            message = build_message("SOLICITUD_TAREA", agent_id, "consumer", datos=datos)
+            if flow_control:
+                try:
+                    await asyncio.wait_for(connection.control.acquire(message), deadline - time.perf_counter())
+                except (asyncio.TimeoutError, ValueError):
+                    break
+            router.handle_frame(peer, encode_message(message))
+            offered += 1
+            peak_depth = max(peak_depth, target.queue.qsize())
+            await asyncio.sleep(0)
+
+    tracemalloc.start()
+    await asyncio.gather(*(produce(*entry) for entry in connections))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for _, peer, _ in connections:
+        router.detach(peer)
+    router.detach(target)
+    return {
+        "flow_control": flow_control,
+        "offered": offered,
+        "delivered": consumer.received,
+        "rate_limit_errors": sum(connection.errors for _, _, connection in connections),
+        "peak_queue_depth": peak_depth,
+        "peak_traced_kib": round(peak_memory / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hub memory under a slow consumer, with and without flow control")
+    parser.add_argument("--producers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--consumer-delay", type=float, default=0.001)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--payload-bytes", type=int, default=1024)
+    args = parser.parse_args()
+    logging.getLogger("lib.router").setLevel(logging.ERROR)  # un RATE_LIMIT_EXCEEDED por frame rechazado
+
+    results = [asyncio.run(run(args.producers, args.seconds, args.consumer_delay, args.queue_size,
+                               args.payload_bytes, flow_control))
+               for flow_control in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_liveness.py - Coste de lib/liveness.py con decenas de miles de conexiones inactivas
+#
+# Vigila --connections conexiones con un LivenessMonitor sobre una rueda de
+# temporizadores avanzada a mano (reloj simulado) durante --periods periodos de
+# inactividad. Todas contestan al HEARTBEAT salvo --dead-share, que se dan por
+# muertas. Mide, para cada número de conexiones de --scale:
+#   * CPU por conexión y por periodo de inactividad (lo que debería ser plano)
+#   * coste de un tick sin vencimientos y de seen() (el tráfico entrante)
+#   * la referencia: lo mismo con una tarea asyncio por conexión que duerme y
+#     envía su ping, como el keepalive de websockets (--task-sample conexiones, reloj real)
+#
+#   python benchmarks/bench_liveness.py --scale 1000,10000,50000
+
+import argparse
+import asyncio
+import json
+import pathlib
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+from lib.liveness import LivenessMonitor
+
+
+def run_monitor(connections, periods, idle_timeout, probe_timeout, dead_share):
+    wheel = TimerWheel(resolution=0.01)
+    records = {}
+    dead = []
+    silent = set(range(int(connections * dead_share)))
+
+    def send_heartbeat(key):
+        if key not in silent:
+            monitor.seen(records[key])  # el HEARTBEAT_ACK llega en el mismo tick
+
+    monitor = LivenessMonitor(wheel, idle_timeout, probe_timeout, send_heartbeat=send_heartbeat,
+                              on_dead=dead.append)
+    # Las conexiones llegan repartidas a lo largo de un periodo, como en un hub real
+    for key in range(connections):
+        wheel.advance(key * idle_timeout / connections)
+        records[key] = monitor.watch(key)
+    now = idle_timeout
+
+    started = time.process_time()
+    end = now + periods * idle_timeout
+    while now < end:
+        now += 1.0
+        wheel.advance(now)
+    elapsed = time.process_time() - started
+
+    started = time.perf_counter()
+    for record in records.values():
+        monitor.seen(record)
+    seen_us = (time.perf_counter() - started) / connections * 1e6
+
+    return {
+        "connections": connections,
+        "heartbeats": monitor.heartbeats,
+        "dead": len(dead),
+        "cpu_s": round(elapsed, 3),
+        "cpu_us_per_connection_per_period": round(elapsed / connections / periods * 1e6, 3),
+        "cpu_pct_of_one_core": round(elapsed / (periods * idle_timeout) * 100, 4),
+        "seen_us": round(seen_us, 3),
+    }
+
+
+def idle_tick_us(ticks=10_000):
+    wheel = TimerWheel(resolution=0.01)
+    monitor = LivenessMonitor(wheel, idle_timeout=3600.0, send_heartbeat=lambda key: None,
+                              on_dead=lambda key: None)
+    for key in range(10_000):
+        monitor.watch(key)
+    started = time.perf_counter()
+    wheel.advance(ticks * wheel.resolution)
+    return round((time.perf_counter() - started) / ticks * 1e6, 3)
+
+
+async def task_reference(connections, interval, periods):
+    # Keepalive por conexión: una tarea que duerme, "envía" un ping y espera el pong
+    async def keepalive():
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            pong = loop.create_future()
+            loop.call_soon(pong.set_result, None)
+            await pong
+
+    tasks = [asyncio.ensure_future(keepalive()) for _ in range(connections)]
+    await asyncio.sleep(0)
+    started = time.process_time()
+    await asyncio.sleep(interval * periods)
+    elapsed = time.process_time() - started
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return round(elapsed / connections / periods * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Liveness monitor cost with many idle connections")
+    parser.add_argument("--scale", default="1000,10000,50000", help="Comma-separated connection counts")
+    parser.add_argument("--periods", type=int, default=5, help="Idle periods to simulate")
+    parser.add_argument("--idle-timeout", type=float, default=30.0)
+    parser.add_argument("--probe-timeout", type=float, default=10.0)
+    parser.add_argument("--dead-share", type=float, default=0.01)
+    parser.add_argument("--task-sample", type=int, default=10_000)
+    args = parser.parse_args()
+
+    results = {
+        "runs": [run_monitor(int(n), args.periods, args.idle_timeout, args.probe_timeout, args.dead_share)
+                 for n in args.scale.split(",")],
+        "idle_tick_us": idle_tick_us(),
+        # Periodo de 0.5 s en reloj real para que la prueba dure poco; el coste por despertar es el mismo
+        "asyncio_task_us_per_connection_per_period": asyncio.run(task_reference(args.task_sample, 0.5, 4)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
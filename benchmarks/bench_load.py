@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_load.py - Generador de carga para el hub WSS/mTLS (lib/server.py) y el endpoint de app/main.py
+#
+# Crea certificados desechables con los generadores de scripts/ (reutilizables
+# con --cert-dir), arranca el servidor y simula --agents agentes repartidos en
+# --clients procesos. Cada agente abre --sessions sesiones y en cada una
+# encadena SOLICITUD_TAREA -> RESPUESTA_TAREA con --payload bytes de datos
+# durante --duration segundos (tras --warmup segundos que no se miden).
+#
+#   --target hub      lib/server.py; el agente i abre sus sesiones con los
+#                     agentes siguientes, que responden a cada tarea
+#   --target fastapi  app/main.py bajo uvicorn; cada tarea es un eco por /ws/{agent_id}
+#
+#   --server subprocess  el servidor en su propio proceso (--server-args se le pasa tal cual)
+#   --server inprocess   el hub en un hilo de este proceso (solo --target hub)
+#
+# Con --ack cada SOLICITUD_TAREA lleva requiere_ack y el agente que la recibe
+# contesta MESSAGE_ACK antes de RESPUESTA_TAREA. Con --batch N el hub agrupa
+# hasta N mensajes por frame (--batch de lib/server.py) y los agentes anuncian
+# 'lotes' y mandan ACK + respuesta en un solo frame.
+#
+# Imprime un JSON con commit, configuración, tareas/s, percentiles de latencia
+# y CPU/memoria del servidor, además de CPU del servidor y segmentos TCP
+# enviados (servidor y agentes: uno por send() con TCP_NODELAY) por mensaje;
+# --output añade además una línea a un fichero JSONL para comparar ejecuciones
+# entre commits.
+#
+#   python benchmarks/bench_load.py --agents 20 --sessions 4 --payload 1024 --duration 10
+#   python benchmarks/bench_load.py --server-args "--workers 2" --output runs.jsonl
+#   python benchmarks/bench_load.py --ack --output runs.jsonl && python benchmarks/bench_load.py --ack --batch 32 --output runs.jsonl
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from acpaas_agent_lib.python import tls
+from acpaas_agent_lib.python.codec import (
+    build_message, decode_message, encode_batch, encode_message, is_batch_frame, split_batch)
+from benchmarks.bench_workers import wait_for_port
+from benchmarks.certs import SERVER_NAME, ensure_cert_dir, generate_cert_dir
+
+SERVER_ID = "acpaas_server"
+# app/main.py carga scripts/agente_py-*.pem como certificado de servidor
+FASTAPI_CERT_NAME = "agente_py"
+CONNECT_CONCURRENCY = 32
+
+
+def agent_ids(count):
+    return [f"load_agent_{i:04d}" for i in range(count)]
+
+
+# --- Medidas de proceso (/proc) ---
+
+def process_tree(pid):
+    pids = [pid]
+    for task in pathlib.Path(f"/proc/{pid}/task").glob("*/children"):
+        for child in task.read_text().split():
+            pids.extend(process_tree(int(child)))
+    return pids
+
+
+def cpu_seconds(pids):
+    total = 0
+    for pid in pids:
+        try:
+            fields = pathlib.Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()
+        except OSError:
+            continue
+        total += int(fields[11]) + int(fields[12])  # utime + stime
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def tcp_segments_sent():
+    """TCP segments sent so far in this network namespace (``OutSegs`` in /proc/net/snmp).
+
+    /proc/<pid>/io does not count send()/recv() on sockets. With TCP_NODELAY
+    (asyncio's default) every send() on loopback leaves as at least one
+    segment, so this counts the writes of the server and the agents together,
+    plus the bare ACKs.
+    """
+    try:
+        lines = [line.split() for line in pathlib.Path("/proc/net/snmp").read_text().splitlines()
+                 if line.startswith("Tcp:")]
+        return int(lines[1][lines[0].index("OutSegs")])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def memory_bytes(pids, field):
+    total = 0
+    for pid in pids:
+        try:
+            for line in pathlib.Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith(field + ":"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def at(pct):
+        return round(ordered[min(last, int(pct / 100.0 * len(ordered)))] * 1000, 3)
+
+    return {"p50": at(50), "p90": at(90), "p99": at(99), "p999": at(99.9), "max": round(ordered[-1] * 1000, 3)}
+
+
+# --- Agentes simulados ---
+
+class HubAgent:
+    """An agent connected to the hub: answers the tasks it receives and runs its own sessions."""
+
+    def __init__(self, agent_id, url, context, payload, ack=False, batching=False):
+        self.agent_id = agent_id
+        self.url = url
+        self.context = context
+        self.payload = payload
+        self.ack = ack
+        self.batching = batching
+        self.websocket = None
+        self.waiters = {}
+        self.replies = collections.Counter()
+        self.errors = 0
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, ssl=self.context, max_size=None)
+        self.reader = asyncio.create_task(self._read())
+        reply = await self.call(build_message("REGISTRO", self.agent_id, SERVER_ID, datos={"uri": self.url}))
+        if reply["tipo"] != "ACK_REGISTRO":
+            raise RuntimeError(f"REGISTRO of {self.agent_id} failed: {reply}")
+        if self.batching:
+            await self.call(build_message("CAPABILITY_ANNOUNCE", self.agent_id, SERVER_ID, datos={
+                "version_protocolo": "1.1", "capacidades": [], "formatos_payload": ["json"], "lotes": True}))
+
+    async def _read(self):
+        async for frame in self.websocket:
+            if is_batch_frame(frame):
+                for inner in split_batch(frame):
+                    await self._handle(decode_message(inner, validate=False))
+            else:
+                await self._handle(decode_message(frame, validate=False))
+
+    async def _handle(self, message):
+        send = self.websocket.send
+        tipo = message["tipo"]
+        if tipo == "MESSAGE_ACK":
+            return  # la respuesta confirma igualmente la tarea
+        if tipo == "SOLICITUD_TAREA":
+            id_sesion = message["id_sesion"]
+            self.replies[id_sesion] += 1
+            frames = [encode_message(build_message(
+                "RESPUESTA_TAREA", self.agent_id, message["origen"], respuesta_a=message["id_mensaje"],
+                id_sesion=id_sesion, numero_secuencia=self.replies[id_sesion],
+                datos={"estado": "exito", "resultado": message["datos"]}))]
+            if message["requiere_ack"]:
+                frames.insert(0, encode_message(build_message(
+                    "MESSAGE_ACK", self.agent_id, message["origen"], respuesta_a=message["id_mensaje"],
+                    id_sesion=id_sesion, numero_secuencia=message["numero_secuencia"])))
+            if self.batching and len(frames) > 1:
+                await send(encode_batch(frames))
+            else:
+                for frame in frames:
+                    await send(frame)
+        elif tipo == "SESSION_INIT":
+            await send(encode_message(build_message(
+                "SESSION_ACCEPT", self.agent_id, message["origen"], respuesta_a=message["id_mensaje"],
+                id_sesion=message["id_sesion"])))
+        elif tipo == "SESSION_CLOSE":
+            self.replies.pop(message.get("id_sesion"), None)
+        waiter = self.waiters.pop(message.get("respuesta_a"), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message)
+
+    async def call(self, message):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[message["id_mensaje"]] = future
+        await self.websocket.send(encode_message(message))
+        return await future
+
+    async def session(self, destino, warmup_end, deadline, samples):
+        id_sesion = str(uuid.uuid4())
+        reply = await self.call(build_message("SESSION_INIT", self.agent_id, destino, id_sesion=id_sesion))
+        if reply["tipo"] != "SESSION_ACCEPT":
+            self.errors += 1
+            return 0
+        datos = {"descripcion_tarea": "load", "parametros": {"blob": self.payload}}
+        count = n = 0
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            n += 1
+            reply = await self.call(build_message("SOLICITUD_TAREA", self.agent_id, destino, id_sesion=id_sesion,
+                                                  numero_secuencia=n, requiere_ack=self.ack, datos=datos))
+            if reply["tipo"] != "RESPUESTA_TAREA":
+                self.errors += 1
+            elif started >= warmup_end:
+                samples.append(time.perf_counter() - started)
+                count += 1
+        await self.websocket.send(encode_message(build_message("SESSION_CLOSE", self.agent_id, destino,
+                                                               id_sesion=id_sesion, datos={"motivo": "Fin"})))
+        return count
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class EchoAgent:
+    """A client of the app/main.py echo endpoint; replies come back in order on each connection."""
+
+    def __init__(self, agent_id, url, context, payload):
+        self.agent_id = agent_id
+        self.url = f"{url.rstrip('/')}/ws/{agent_id}"
+        self.context = context
+        self.payload = payload
+        self.pending = collections.deque()
+        self.errors = 0
+
+    async def connect(self):
+        self.websocket = await websockets.connect(self.url, ssl=self.context, max_size=None)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for frame in self.websocket:
+            self.pending.popleft().set_result(frame)
+
+    async def session(self, destino, warmup_end, deadline, samples):
+        datos = {"descripcion_tarea": "load", "parametros": {"blob": self.payload}}
+        loop = asyncio.get_running_loop()
+        count = n = 0
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            n += 1
+            frame = encode_message(build_message("SOLICITUD_TAREA", self.agent_id, destino, numero_secuencia=n,
+                                                 datos=datos))
+            future = loop.create_future()
+            self.pending.append(future)
+            await self.websocket.send(frame)
+            if not (await future).endswith(frame):
+                self.errors += 1
+            elif started >= warmup_end:
+                samples.append(time.perf_counter() - started)
+                count += 1
+        return count
+
+    async def close(self):
+        await self.websocket.close()
+
+
+async def run_agents(target, url, cert_dir, mine, everyone, args, barrier):
+    agent_class = HubAgent if target == "hub" else EchoAgent
+    options = {"ack": args.ack, "batching": args.batch > 1} if target == "hub" else {}
+    payload = "x" * args.payload
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(agent_id):
+        context = tls.client_context(*tls.agent_files(cert_dir, agent_id))
+        agent = agent_class(agent_id, url, context, payload, **options)
+        async with semaphore:
+            await agent.connect()
+        return agent
+
+    agents = await asyncio.gather(*(connect(agent_id) for agent_id in mine))
+    # Todos los agentes registrados (en todos los procesos) antes de generar tráfico
+    await loop.run_in_executor(None, barrier.wait)
+    warmup_end = time.perf_counter() + args.warmup
+    deadline = warmup_end + args.duration
+    samples = []
+    position = {agent_id: i for i, agent_id in enumerate(everyone)}
+    sessions = []
+    for agent in agents:
+        i = position[agent.agent_id]
+        for s in range(args.sessions):
+            destino = everyone[(i + 1 + s % (len(everyone) - 1)) % len(everyone)] if len(everyone) > 1 else None
+            sessions.append(agent.session(destino or SERVER_ID, warmup_end, deadline, samples))
+    completed = sum(await asyncio.gather(*sessions))
+    # Los demás procesos pueden seguir necesitando a nuestros agentes como destino
+    await loop.run_in_executor(None, barrier.wait)
+    for agent in agents:
+        await agent.close()
+    return {"completed": completed, "errors": sum(agent.errors for agent in agents), "samples": samples}
+
+
+def client_process(target, url, cert_dir, mine, everyone, args, barrier, results):
+    results.put(asyncio.run(run_agents(target, url, cert_dir, mine, everyone, args, barrier)))
+
+
+# --- Servidor bajo prueba ---
+
+def start_hub_subprocess(args, cert_dir):
+    env = dict(os.environ, ACPAAS_CERT_DIR=str(cert_dir))
+    command = [sys.executable, str(REPO_ROOT / "lib" / "server.py"), "--host", "127.0.0.1", "--port", str(args.port),
+               "--log-level", "WARNING", "--batch", str(args.batch), *shlex.split(args.server_args)]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_hub_in_process(args, cert_dir):
+    os.environ["ACPAAS_CERT_DIR"] = str(cert_dir)
+    from lib import server  # lee ACPAAS_CERT_DIR al importarse
+    logging.getLogger().setLevel(logging.WARNING)
+    server.router.batch_messages = args.batch
+    loop = asyncio.new_event_loop()
+    main_task = loop.create_task(server.main("127.0.0.1", args.port))
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(main_task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, name="hub", daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(main_task.cancel)
+        thread.join(timeout=5)
+
+    return stop
+
+
+def start_fastapi(args, cert_dir):
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+               "--log-level", "warning",
+               "--ssl-certfile", str(cert_dir / f"{SERVER_NAME}-cert.pem"),
+               "--ssl-keyfile", str(cert_dir / f"{SERVER_NAME}-key.pem"),
+               "--ssl-ca-certs", str(cert_dir / "ca-cert.pem"), "--ssl-cert-reqs", "2",
+               *shlex.split(args.server_args)]
+    # app/main.py abre scripts/agente_py-*.pem relativo al directorio de trabajo
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])))
+    return subprocess.Popen(command, cwd=cert_dir.parent, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_until_listening(port, server, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while server is not None and server.poll() is None and time.monotonic() < deadline:
+        try:
+            wait_for_port(port, timeout=0.5)
+            return
+        except RuntimeError:
+            continue
+    if server is not None and server.poll() is not None:
+        error = server.stderr.read().decode(errors="replace").strip() if server.stderr else ""
+        raise RuntimeError(f"Server exited with status {server.returncode}: {error[-500:]}")
+    wait_for_port(port, max(0.0, deadline - time.monotonic()))
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def prepare_certs(args, everyone):
+    names = everyone + ([FASTAPI_CERT_NAME] if args.target == "fastapi" else [])
+    if args.cert_dir:
+        root = pathlib.Path(args.cert_dir)
+    else:
+        root = pathlib.Path(tempfile.mkdtemp(prefix="acpaas-load-"))
+    # El directorio de certificados se llama scripts/, como espera app/main.py
+    if args.cert_dir:
+        return ensure_cert_dir(names, root / "scripts")
+    return generate_cert_dir(names, root / "scripts")
+
+
+def run(args):
+    everyone = agent_ids(args.agents)
+    cert_dir = prepare_certs(args, everyone)
+
+    server = stop = None
+    if args.target == "fastapi":
+        server = start_fastapi(args, cert_dir)
+    elif args.server == "inprocess":
+        stop = start_hub_in_process(args, cert_dir)
+    else:
+        server = start_hub_subprocess(args, cert_dir)
+    try:
+        wait_until_listening(args.port, server)
+        pids = process_tree(server.pid) if server is not None else [os.getpid()]
+
+        context = multiprocessing.get_context("spawn")
+        clients = max(1, min(args.clients, len(everyone)))
+        # Este proceso también espera en la barrera: mide CPU solo durante la ventana medida
+        barrier = context.Barrier(clients + 1)
+        results = context.Queue()
+        url = f"wss://localhost:{args.port}/"
+        processes = [context.Process(target=client_process, args=(args.target, url, cert_dir, everyone[i::clients],
+                                                                   everyone, args, barrier, results))
+                     for i in range(clients)]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        time.sleep(args.warmup)
+        cpu_before = cpu_seconds(pids)
+        segments_before = tcp_segments_sent()
+        time.sleep(args.duration)
+        cpu_used = cpu_seconds(pids) - cpu_before
+        segments_after = tcp_segments_sent()
+        segments = segments_after - segments_before if segments_before is not None and segments_after else None
+        rss = memory_bytes(pids, "VmRSS")
+        peak = memory_bytes(pids, "VmHWM")
+        barrier.wait()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        if stop is not None:
+            stop()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    samples = [sample for outcome in outcomes for sample in outcome["samples"]]
+    completed = sum(outcome["completed"] for outcome in outcomes)
+    # Mensajes que atraviesan el servidor por tarea: solicitud, respuesta y, con --ack, el MESSAGE_ACK
+    messages = completed * (3 if args.ack and args.target == "hub" else 2)
+    return {
+        "commit": git_commit(),
+        "target": args.target,
+        "server": args.server if args.target == "hub" else "subprocess",
+        "server_args": args.server_args,
+        "agents": args.agents,
+        "sessions_per_agent": args.sessions,
+        "payload_bytes": args.payload,
+        "ack": args.ack,
+        "batch": args.batch,
+        "duration_s": args.duration,
+        "clients": len(processes),
+        "tasks": completed,
+        "tasks_per_s": round(completed / args.duration, 1),
+        "messages_per_s": round(messages / args.duration, 1),
+        "errors": sum(outcome["errors"] for outcome in outcomes),
+        "latency_ms": percentiles(samples),
+        "server_cpu_s": round(cpu_used, 2),
+        "server_cpu_pct": round(100 * cpu_used / args.duration, 1),
+        "server_cpu_us_per_message": round(1e6 * cpu_used / messages, 2) if messages else None,
+        "tcp_segments_per_message": round(segments / messages, 3) if messages and segments is not None else None,
+        "server_rss_mb": round(rss / 2**20, 1),
+        "server_peak_rss_mb": round(peak / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the WSS/mTLS hub and the FastAPI endpoint")
+    parser.add_argument("--target", choices=["hub", "fastapi"], default="hub")
+    parser.add_argument("--server", choices=["subprocess", "inprocess"], default="subprocess")
+    parser.add_argument("--server-args", default="", help="Extra arguments for lib/server.py or uvicorn")
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions per agent")
+    parser.add_argument("--payload", type=int, default=256, help="Bytes of task data per SOLICITUD_TAREA")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--ack", action="store_true",
+                        help="Send tasks with requiere_ack; the receiving agent answers MESSAGE_ACK first")
+    parser.add_argument("--batch", type=int, default=1, metavar="N",
+                        help="Hub batches up to N messages per frame; agents announce 'lotes' (default: 1, off)")
+    parser.add_argument("--cert-dir", default=None,
+                        help="Keep certificates here and reuse them on later runs (default: a new temporary one)")
+    parser.add_argument("--output", default=None, help="Also append the result as one JSON line to this file")
+    args = parser.parse_args()
+    if args.target == "fastapi" and args.server == "inprocess":
+        parser.error("--server inprocess is only available for --target hub")
+    if args.target == "fastapi" and (args.ack or args.batch > 1):
+        parser.error("--ack and --batch are only available for --target hub")
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_logging.py - Throughput del router con distintas configuraciones de logging
+#
+# Repite bench_router.run con el log del servidor escrito a un fichero temporal:
+#   * silent: sin handlers (referencia)
+#   * production: INFO a través de la cola y el hilo de lib/eventlog.py
+#   * verbose_sync: un evento por mensaje con el frame completo, escrito en el
+#     hilo del bucle (como el antiguo logging.info por mensaje)
+#   * verbose_queued: lo mismo, pero a través de la cola
+#   * sampled: un evento de cada --sample mensajes, sin cuerpo, a través de la cola
+#
+#   python benchmarks/bench_logging.py --messages 200000
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.bench_router import run
+from lib import router
+from lib.eventlog import configure_logging
+
+LOG_FORMAT = '[%(asctime)s %(levelname)s %(filename)s:%(lineno)d Server] %(message)s'
+
+
+def reset_logging(path):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    if path is None:
+        root.setLevel(logging.WARNING)
+        return None
+    handler = logging.FileHandler(path, mode="w")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+    return handler
+
+
+def scenario(name, args, path, queued, level=logging.INFO, messages=False, sample_every=1, log_bodies=False):
+    reset_logging(path)
+    events = router.events
+    if queued:
+        queue_handler = configure_logging(level, messages=messages, sample_every=sample_every,
+                                          log_bodies=log_bodies)
+    else:
+        queue_handler = None
+        logging.getLogger().setLevel(level)
+        events.logger.setLevel(logging.DEBUG if messages else logging.INFO)
+        events.sample_every = sample_every
+        events.log_bodies = log_bodies
+        events.refresh()
+    result = asyncio.run(run(args.agents, args.messages, args.batch, args.payload_size))
+    reset_logging(None)  # cierra el handler de la cola y espera a que se escriba todo
+    return {
+        "scenario": name,
+        "messages_per_s": result["messages_per_s"],
+        "latency_p99_us": result["latency_p99_us"],
+        "log_bytes": os.path.getsize(path) if path else 0,
+        "log_records_dropped": queue_handler.dropped if queue_handler else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Router throughput under production and verbose log settings")
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--payload-size", type=int, default=128)
+    parser.add_argument("--sample", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "server.log")
+        results = [
+            scenario("silent", args, None, queued=False, level=logging.WARNING),
+            scenario("production", args, path, queued=True),
+            scenario("verbose_sync", args, path, queued=False, messages=True, log_bodies=True),
+            scenario("verbose_queued", args, path, queued=True, messages=True, log_bodies=True),
+            scenario("sampled", args, path, queued=True, messages=True, sample_every=args.sample),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
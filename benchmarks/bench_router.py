@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_router.py - Throughput and forward latency of lib/router.py
+#
+# Simula N agentes conectados (conexiones en memoria, sin TLS) y mide cuántos
+# mensajes por segundo enruta el MessageRouter y la latencia p99 desde que el
+# frame entra al router hasta que el writer del destino lo entrega.
+#
+#   python benchmarks/bench_router.py --agents 1000 --messages 200000
+
+import argparse
+import asyncio
+import json
+import pathlib
+import random
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.agent_base import create_message
+from lib.router import MessageRouter
+
+
+class SinkConnection:
+    """Conexión falsa que anota el instante de entrega de cada frame."""
+
+    __slots__ = ("delivered",)
+
+    def __init__(self, delivered):
+        self.delivered = delivered
+
+    async def send(self, frame):
+        self.delivered.append((frame, time.perf_counter()))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(agents, messages, batch, payload_size):
+    router = MessageRouter(queue_size=max(1024, batch * 2))
+    delivered = []
+    ids = [f"agent_{i:05d}" for i in range(agents)]
+    peers = [router.attach(agent_id, SinkConnection(delivered)) for agent_id in ids]
+
+    rng = random.Random(42)
+    payload = {"descripcion_tarea": "bench", "parametros": {"blob": "x" * payload_size}}
+    frames = []
+    sources = []
+    for i in range(messages):
+        src = rng.randrange(agents)
+        dst = (src + 1 + rng.randrange(agents - 1)) % agents
+        frames.append(json.dumps(create_message("SOLICITUD_TAREA", ids[src], ids[dst],
+                                                numero_secuencia=i, requiere_ack=True, datos=payload)))
+        sources.append(peers[src])
+
+    sent_at = {}
+    handle_frame = router.handle_frame
+    started = time.perf_counter()
+    for start in range(0, messages, batch):
+        end = min(start + batch, messages)
+        for i in range(start, end):
+            frame = frames[i]
+            sent_at[frame] = time.perf_counter()
+            handle_frame(sources[i], frame)
+        # Ceder el loop para que los writers entreguen el lote
+        while len(delivered) < end:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+
+    latencies_us = [(t1 - sent_at[frame]) * 1e6 for frame, t1 in delivered]
+    for peer in peers:
+        router.detach(peer)
+
+    return {
+        "agents": agents,
+        "messages": messages,
+        "batch": batch,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(messages / elapsed),
+        "latency_p50_us": round(percentile(latencies_us, 50), 1),
+        "latency_p99_us": round(percentile(latencies_us, 99), 1),
+        "dropped": sum(peer.dropped for peer in peers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and p99 forward latency of MessageRouter")
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=256, help="Frames routed between event-loop yields")
+    parser.add_argument("--payload-size", type=int, default=128)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.agents, args.messages, args.batch, args.payload_size))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_sessions.py - Memoria y coste de barrido de lib/sessions.py con cientos de miles de sesiones
+#
+# Abre --sessions sesiones repartidas entre --agents agentes sobre una rueda
+# de temporizadores avanzada a mano (reloj simulado) y mide:
+#   * memoria por sesión (tabla, índice por agente y temporizador; los id_sesion
+#     se generan antes de medir)
+#   * coste de open/accept/touch
+#   * coste de un tick sin vencimientos y del barrido que vence todas las sesiones
+#   * desconexión de un agente con k sesiones (drop_agent)
+#   * la referencia: memoria de una tarea asyncio por sesión (--task-sample tareas)
+#
+#   python benchmarks/bench_sessions.py --sessions 500000
+
+import argparse
+import asyncio
+import gc
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+from lib.sessions import SessionTable
+
+
+def per_op_us(started, count):
+    return round((time.perf_counter() - started) / count * 1e6, 3)
+
+
+def run_table(args):
+    ids = [str(uuid.uuid4()) for _ in range(args.sessions)]
+    agents = [f"agent_{i}" for i in range(args.agents)]
+    expired = []
+    wheel = TimerWheel(resolution=0.01)
+    table = SessionTable(wheel, idle_timeout=args.idle_timeout, on_expired=expired.append)
+    result = {"sessions": args.sessions, "agents": args.agents}
+
+    count = len(agents)
+    pairs = [(agents[n % count], agents[(n * 7 + 1) % count]) for n in range(len(ids))]
+
+    # Memoria (con tracemalloc) en una tabla aparte para no falsear los tiempos
+    probe = SessionTable(TimerWheel(resolution=0.01), idle_timeout=args.idle_timeout)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for id_sesion, (initiator, responder) in zip(ids, pairs):
+        probe.open(id_sesion, initiator, responder)
+        probe.accept(id_sesion)
+    gc.collect()
+    result["bytes_per_session"] = round((tracemalloc.get_traced_memory()[0] - before) / len(ids), 1)
+    tracemalloc.stop()
+    del probe
+    gc.collect()
+
+    started = time.perf_counter()
+    for id_sesion, (initiator, responder) in zip(ids, pairs):
+        table.open(id_sesion, initiator, responder)
+    result["open_us"] = per_op_us(started, len(ids))
+    started = time.perf_counter()
+    for id_sesion in ids:
+        table.accept(id_sesion)
+    result["accept_us"] = per_op_us(started, len(ids))
+
+    started = time.perf_counter()
+    for id_sesion in ids:
+        table.touch(id_sesion)
+    result["touch_us"] = per_op_us(started, len(ids))
+
+    # Ticks sin nada que vencer: la mayoría de los de una rueda con sesiones largas
+    ticks = 1000
+    started = time.perf_counter()
+    wheel.advance(ticks * wheel.resolution)
+    result["idle_tick_us"] = per_op_us(started, ticks)
+
+    victims = agents[:args.disconnects]
+    k = sum(len(table.by_agent[victim]) for victim in victims)
+    gc.collect()
+    started = time.perf_counter()
+    for victim in victims:
+        table.drop_agent(victim)
+    result["drop_agent_sessions"] = k // len(victims)
+    result["drop_agent_ms"] = round((time.perf_counter() - started) / len(victims) * 1000, 3)
+
+    remaining = len(table)
+    started = time.perf_counter()
+    wheel.advance(args.idle_timeout + 1.0)
+    elapsed = time.perf_counter() - started
+    result["sweep_expired"] = len(expired)
+    result["sweep_s"] = round(elapsed, 3)
+    result["sweep_us_per_session"] = round(elapsed / max(1, remaining) * 1e6, 3)
+    return result
+
+
+async def task_reference(count, timeout):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.ensure_future(asyncio.sleep(timeout)) for _ in range(count)]
+    await asyncio.sleep(0)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return round(used / count, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session table memory and sweep cost")
+    parser.add_argument("--sessions", type=int, default=500_000)
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--idle-timeout", type=float, default=1200.0)
+    parser.add_argument("--disconnects", type=int, default=100)
+    parser.add_argument("--task-sample", type=int, default=50_000)
+    args = parser.parse_args()
+
+    result = run_table(args)
+    result["asyncio_task_bytes_per_session"] = asyncio.run(task_reference(args.task_sample, args.idle_timeout))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
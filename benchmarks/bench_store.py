@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_store.py - Escritura, recuperación y reenvío del WAL de lib/store.py con millones de mensajes
+#
+# Guarda --messages tramas de --size bytes para --agents agentes desconectados,
+# con un fsync cada --sync-every mensajes (group commit), y mide:
+#   * append: mensajes/s y MB/s, incluido el fsync periódico
+#   * memoria del índice en memoria por mensaje pendiente
+#   * recuperación: tiempo de reabrir el directorio y reconstruir el índice
+#   * reenvío: next_batch + acknowledge de todo el backlog, con borrado de segmentos
+#
+#   python benchmarks/bench_store.py --messages 2000000 --dir /var/tmp/acpaas-store
+
+import argparse
+import gc
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from lib.store import MessageStore
+
+
+def disk_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def run(args, path):
+    agents = [f"agent_{i}" for i in range(args.agents)]
+    ids = [str(uuid.uuid4()) for _ in range(args.messages)]
+    frame = json.dumps({"tipo": "SOLICITUD_TAREA", "datos": "x" * max(0, args.size - 40)})
+    store = MessageStore(path, segment_bytes=args.segment_mb * 1024 * 1024, max_backlog=args.messages,
+                         dedup_capacity=args.dedup)
+    result = {"messages": args.messages, "agents": args.agents, "frame_bytes": len(frame)}
+
+    gc.collect()
+    append = store.append
+    count = len(agents)
+    started = time.perf_counter()
+    for n, id_mensaje in enumerate(ids):
+        append(agents[n % count], id_mensaje, frame)
+        if n % args.sync_every == 0:
+            store.sync()
+    store.sync()
+    elapsed = time.perf_counter() - started
+    written = disk_bytes(path)
+    result["append_msgs_per_s"] = round(args.messages / elapsed)
+    result["append_mb_per_s"] = round(written / elapsed / 1e6, 1)
+    result["disk_bytes_per_msg"] = round(written / args.messages, 1)
+    store.close()
+    del ids
+    gc.collect()
+
+    started = time.perf_counter()
+    store = MessageStore(path, segment_bytes=args.segment_mb * 1024 * 1024, max_backlog=args.messages,
+                         dedup_capacity=args.dedup)
+    result["recover_s"] = round(time.perf_counter() - started, 3)
+    index_bytes = sum(len(b.positions) * b.positions.itemsize + len(b.lengths) * b.lengths.itemsize
+                      + len(b.acked) for b in store.backlogs.values())
+    result["index_bytes_per_msg"] = round(index_bytes / len(store), 1)
+    result["recovered"] = len(store)
+
+    started = time.perf_counter()
+    replayed = 0
+    for agent in agents:
+        while store.pending(agent):
+            batch = store.next_batch(agent, args.batch)
+            for index, _, _ in batch:
+                store.acknowledge(agent, index)
+            replayed += len(batch)
+    store.sync()
+    elapsed = time.perf_counter() - started
+    result["replay_msgs_per_s"] = round(replayed / elapsed)
+    result["segments_left"] = len(store.segments)
+    result["disk_bytes_left"] = disk_bytes(path)
+    store.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write-ahead log append, recovery and replay throughput")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--sync-every", type=int, default=1000)
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--dedup", type=int, default=100_000)
+    parser.add_argument("--dir", default=None, help="Directory for the log (default: a temporary one)")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="bench-store-", dir=args.dir)
+    try:
+        print(json.dumps(run(args, path), indent=2))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
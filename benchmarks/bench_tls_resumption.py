@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_tls_resumption.py - Handshake mTLS completo vs reanudado contra lib/server.py
+#
+# Lanza --reconnects conexiones WebSocket concurrentes (una "tormenta de
+# reconexión") y mide:
+#   * latencia de conexión por cliente (TLS + upgrade WebSocket), p50/p99
+#   * CPU consumida por el proceso servidor durante la tormenta
+# full:    contexto cliente sin caché de sesiones (handshake completo con certificados)
+# resumed: tls.client_context, que ofrece el ticket de la conexión anterior
+#
+#   python benchmarks/bench_tls_resumption.py --reconnects 1000
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import ssl
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from acpaas_agent_lib.python import tls
+from benchmarks.bench_workers import wait_for_port
+from benchmarks.certs import generate_cert_dir
+
+AGENT_ID = "bench_agent_0"
+
+
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime y stime (campos 14 y 15 de proc(5))
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def full_handshake_context(cert_dir):
+    cert, key, ca = tls.agent_files(cert_dir, AGENT_ID)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_cert_chain(cert, key)
+    context.load_verify_locations(cafile=ca)
+    return context
+
+
+async def storm(url, context, reconnects):
+    latencies = []
+
+    async def one():
+        started = time.perf_counter()
+        async with websockets.connect(url, ssl=context, open_timeout=60):
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # Conexión previa: deja un ticket de sesión en el contexto (si lo cachea)
+    async with websockets.connect(url, ssl=context) as websocket:
+        await websocket.ping()
+    await asyncio.gather(*(one() for _ in range(reconnects)))
+    return latencies
+
+
+def run_mode(mode, url, context, reconnects, server_pid):
+    cpu_before = process_cpu_seconds(server_pid)
+    started = time.perf_counter()
+    latencies = sorted(asyncio.run(storm(url, context, reconnects)))
+    elapsed = time.perf_counter() - started
+    time.sleep(0.5)  # dejar que el servidor termine de cerrar conexiones
+    return {
+        "mode": mode,
+        "reconnects": reconnects,
+        "wall_s": round(elapsed, 3),
+        "handshake_p50_ms": round(statistics.median(latencies), 2),
+        "handshake_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "server_cpu_s": round(process_cpu_seconds(server_pid) - cpu_before, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs resumed mTLS handshakes during a reconnect storm")
+    parser.add_argument("--port", type=int, default=18082)
+    parser.add_argument("--reconnects", type=int, default=1000)
+    args = parser.parse_args()
+
+    cert_dir = generate_cert_dir([AGENT_ID])
+    env = dict(os.environ, ACPAAS_CERT_DIR=str(cert_dir))
+    server = subprocess.Popen([sys.executable, str(REPO_ROOT / "lib" / "server.py"), "--port", str(args.port),
+                               "--host", "127.0.0.1"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        url = f"wss://localhost:{args.port}/"
+        results = [
+            run_mode("full", url, full_handshake_context(cert_dir), args.reconnects, server.pid),
+            run_mode("resumed", url, tls.client_context(*tls.agent_files(cert_dir, AGENT_ID)), args.reconnects,
+                     server.pid),
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
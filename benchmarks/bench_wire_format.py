@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_wire_format.py - Wire size and encode/decode time: JSON vs acpaas-bin/1
+#
+#   python benchmarks/bench_wire_format.py --iterations 50000
+
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+import uuid
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python import codec
+
+# Payloads representativos de SOLICITUD_TAREA
+PAYLOADS = {
+    "minimal": {"descripcion_tarea": "ping", "parametros": None},
+    "typical": {
+        "descripcion_tarea": "Analizar el documento y devolver un resumen",
+        "parametros": {"documento_id": "doc-8812", "idioma": "es", "max_palabras": 200, "formato": "markdown"},
+        "timeout_sugerido_seg": 120,
+    },
+    "large": {
+        "descripcion_tarea": "Clasificar lote de registros",
+        "parametros": {"registros": [{"id": i, "texto": f"registro numero {i}", "etiquetas": ["a", "b"]}
+                                     for i in range(100)]},
+    },
+}
+
+
+def per_call_us(fn, iterations):
+    best = min(timeit.repeat(fn, number=iterations, repeat=5))
+    return round(best / iterations * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs acpaas-bin/1 wire format")
+    parser.add_argument("--iterations", type=int, default=50_000)
+    args = parser.parse_args()
+
+    results = {"json_backend": codec.JSON_BACKEND, "payloads": {}}
+    for name, datos in PAYLOADS.items():
+        message = codec.build_message("SOLICITUD_TAREA", "agente_py", "agente_rb", id_sesion=str(uuid.uuid4()),
+                                      numero_secuencia=17, requiere_ack=True, datos=datos)
+        as_json = codec.encode_message(message)
+        as_binary = codec.encode_binary(message)
+        iterations = args.iterations if name != "large" else max(1, args.iterations // 20)
+        results["payloads"][name] = {
+            "json_bytes": len(as_json),
+            "binary_bytes": len(as_binary),
+            "size_ratio": round(len(as_binary) / len(as_json), 3),
+            "json_encode_us": per_call_us(lambda: codec.encode_message(message), iterations),
+            "binary_encode_us": per_call_us(lambda: codec.encode_binary(message), iterations),
+            "json_decode_us": per_call_us(lambda: codec.decode_message(as_json), iterations),
+            "binary_decode_us": per_call_us(lambda: codec.decode_binary(as_binary), iterations),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
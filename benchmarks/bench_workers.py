@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# bench_workers.py - Accept rate and routing throughput of lib/server.py vs --workers
+#
+# Genera certificados desechables con scripts/, arranca lib/server.py como
+# subproceso con 1, 2, 4... workers y mide desde varios procesos cliente:
+#   * accept_per_s: handshakes mTLS + WebSocket completados por segundo
+#   * messages_per_s: SOLICITUD_TAREA/RESPUESTA_TAREA enrutados por segundo
+#     entre pares de agentes (que pueden caer en workers distintos)
+#
+#   python benchmarks/bench_workers.py --workers 1 2 4 --clients 4
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import pathlib
+import socket
+import ssl
+import subprocess
+import sys
+import time
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import websockets
+
+from acpaas_agent_lib.python.agent_base import create_message
+from benchmarks.certs import generate_cert_dir
+
+
+def client_context(cert_dir, name):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_cert_chain(cert_dir / f"{name}-cert.pem", cert_dir / f"{name}-key.pem")
+    context.load_verify_locations(cafile=cert_dir / "ca-cert.pem")
+    return context
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+
+# --- Cargas de trabajo (se ejecutan en procesos cliente) ---
+
+async def accept_load(url, context, connections, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            async with websockets.connect(url, ssl=context):
+                pass
+
+    await asyncio.gather(*(one() for _ in range(connections)))
+
+
+async def pair_load(url, cert_dir, pairs, duration, window):
+    completed = 0
+
+    async def responder(websocket):
+        async for frame in websocket:
+            request = json.loads(frame)
+            if request["tipo"] == "SOLICITUD_TAREA":
+                await websocket.send(json.dumps(create_message(
+                    "RESPUESTA_TAREA", request["destino"], request["origen"],
+                    respuesta_a=request["id_mensaje"], datos={"estado": "exito"})))
+
+    async def requester(websocket, origen, destino, deadline):
+        nonlocal completed
+        for _ in range(window):
+            await websocket.send(json.dumps(create_message("SOLICITUD_TAREA", origen, destino, requiere_ack=True,
+                                                           datos={"descripcion_tarea": "bench"})))
+        outstanding = window
+        async for frame in websocket:
+            if json.loads(frame)["tipo"] != "RESPUESTA_TAREA":
+                continue
+            outstanding -= 1
+            if time.monotonic() < deadline:
+                completed += 1
+                await websocket.send(json.dumps(create_message("SOLICITUD_TAREA", origen, destino, requiere_ack=True,
+                                                               datos={"descripcion_tarea": "bench"})))
+                outstanding += 1
+            elif outstanding == 0:
+                # Todas las respuestas en vuelo drenadas: el cierre no queda bloqueado
+                break
+
+    sockets = []
+    for origen, destino in pairs:
+        sockets.append((origen, destino,
+                        await websockets.connect(url, ssl=client_context(cert_dir, origen)),
+                        await websockets.connect(url, ssl=client_context(cert_dir, destino))))
+    # Dar tiempo a que el directorio se replique entre workers
+    await asyncio.sleep(0.5)
+
+    responders = [asyncio.create_task(responder(b)) for _, _, _, b in sockets]
+    started = time.monotonic()
+    await asyncio.gather(*(requester(a, origen, destino, started + duration) for origen, destino, a, _ in sockets))
+    elapsed = time.monotonic() - started
+    for task in responders:
+        task.cancel()
+    for _, _, a, b in sockets:
+        await a.close()
+        await b.close()
+    return completed, elapsed
+
+
+def client_process(mode, url, cert_dir, args, results):
+    if mode == "accept":
+        context = client_context(cert_dir, "bench_agent_0")
+        started = time.monotonic()
+        asyncio.run(accept_load(url, context, args["connections"], args["concurrency"]))
+        results.put((args["connections"], time.monotonic() - started))
+    else:
+        results.put(asyncio.run(pair_load(url, cert_dir, args["pairs"], args["duration"], args["window"])))
+
+
+def run_clients(mode, url, cert_dir, per_client_args):
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=client_process, args=(mode, url, cert_dir, a, results))
+                 for a in per_client_args]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    total = sum(count for count, _ in collected)
+    elapsed = max(seconds for _, seconds in collected)
+    return total / elapsed
+
+
+def bench(workers, port, cert_dir, args):
+    env = dict(os.environ, ACPAAS_CERT_DIR=str(cert_dir))
+    server = subprocess.Popen([sys.executable, str(REPO_ROOT / "lib" / "server.py"),
+                               "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        time.sleep(0.5)
+        url = f"wss://localhost:{port}/"
+        accept_rate = run_clients("accept", url, cert_dir, [
+            {"connections": args.connections // args.clients, "concurrency": args.concurrency}
+            for _ in range(args.clients)])
+
+        names = [(f"bench_agent_{2 * i}", f"bench_agent_{2 * i + 1}") for i in range(args.pairs)]
+        message_rate = run_clients("pairs", url, cert_dir, [
+            {"pairs": names[c::args.clients], "duration": args.duration, "window": args.window}
+            for c in range(args.clients)])
+    finally:
+        server.terminate()
+        server.wait()
+    return {"workers": workers, "accept_per_s": round(accept_rate, 1), "messages_per_s": round(message_rate)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lib/server.py scaling with --workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--clients", type=int, default=4, help="Client processes generating load")
+    parser.add_argument("--connections", type=int, default=2000, help="Total handshakes for the accept test")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent handshakes per client process")
+    parser.add_argument("--pairs", type=int, default=16, help="Requester/responder agent pairs")
+    parser.add_argument("--window", type=int, default=32, help="Outstanding requests per pair")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    cert_dir = generate_cert_dir([f"bench_agent_{i}" for i in range(2 * args.pairs)])
+    results = [bench(workers, args.port, cert_dir, args) for workers in args.workers]
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# certs.py - Throwaway mTLS certificates for benchmarks, built with the scripts/ generators
+
+import pathlib
+import subprocess
+import tempfile
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = REPO_ROOT / "scripts"
+
+# Respuestas para los prompts de generate_ca.sh
+CA_ANSWERS = "US\nCalifornia\nSan Francisco\nACPaaS\nBenchmarks\nACPaaS Bench CA\nbench@example.com\n"
+
+SERVER_NAME = "acpaas_server"
+
+
+def generate_cert_dir(agent_names, target=None):
+    """Creates a CA, a server certificate and one certificate per agent.
+
+    Args:
+        agent_names (list): Agent IDs; each becomes the CN of its certificate.
+        target (str, optional): Directory to write into. A temporary directory
+            is created when omitted.
+
+    Returns:
+        pathlib.Path: Directory holding ca-cert.pem and <name>-cert.pem/-key.pem
+        files, laid out like scripts/ so it can be used as ACPAAS_CERT_DIR.
+    """
+    cert_dir = pathlib.Path(target or tempfile.mkdtemp(prefix="acpaas-certs-"))
+    cert_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["bash", str(SCRIPTS_DIR / "generate_ca.sh")], cwd=cert_dir, input=CA_ANSWERS,
+                   text=True, check=True, capture_output=True)
+    for name in [SERVER_NAME, *agent_names]:
+        subprocess.run(["bash", str(SCRIPTS_DIR / "generate_agent_cert.sh"), name], cwd=cert_dir,
+                       text=True, check=True, capture_output=True)
+    return cert_dir
+
+
+def ensure_cert_dir(agent_names, target):
+    """Like ``generate_cert_dir`` but reuses what ``target`` already holds.
+
+    The CA and server certificate are created only if missing, and only the
+    agents without a certificate get one, so a cached directory makes
+    repeated runs with many agents start quickly.
+    """
+    cert_dir = pathlib.Path(target)
+    cert_dir.mkdir(parents=True, exist_ok=True)
+    if not (cert_dir / "ca-cert.pem").is_file():
+        return generate_cert_dir(agent_names, cert_dir)
+    for name in agent_names:
+        if not (cert_dir / f"{name}-cert.pem").is_file():
+            subprocess.run(["bash", str(SCRIPTS_DIR / "generate_agent_cert.sh"), name], cwd=cert_dir,
+                           text=True, check=True, capture_output=True)
+    return cert_dir
@@ -0,0 +1,305 @@
+# directory.py - Agent directory with a capability index for session dispatch
+
+import heapq
+import itertools
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+POWER_OF_TWO = "p2c"
+LEAST_LOADED = "least_loaded"
+
+
+class AgentRecord:
+    """What the hub knows about one connected agent (PRD 4.3.2/4.3.3)."""
+
+    __slots__ = ("agent_id", "uri", "capacidades", "temas", "max_sesiones", "sessions", "registered_at", "last_seen")
+
+    def __init__(self, agent_id, uri=None):
+        self.agent_id = agent_id
+        self.uri = uri
+        self.capacidades = frozenset()
+        self.temas = frozenset()
+        self.max_sesiones = None
+        self.sessions = set()
+        self.registered_at = self.last_seen = time.time()
+
+    @property
+    def load(self):
+        return len(self.sessions)
+
+    @property
+    def has_free_slot(self):
+        return self.max_sesiones is None or len(self.sessions) < self.max_sesiones
+
+
+class _CapabilityPool:
+    """Agents offering one capability that still have a free session slot.
+
+    ``available``/``index`` form an array with O(1) removal (swap with the last
+    element), which is what power-of-two-choices samples from. ``heap`` holds
+    ``(load, seq, agent_id)`` entries for least-loaded selection; entries are
+    never updated in place, a stale one is skipped when it reaches the top.
+    ``members`` holds every agent offering the capability, full or not.
+    """
+
+    __slots__ = ("available", "index", "heap", "members")
+
+    def __init__(self):
+        self.available = []
+        self.index = {}
+        self.heap = []
+        self.members = set()
+
+    def add(self, agent_id):
+        if agent_id not in self.index:
+            self.index[agent_id] = len(self.available)
+            self.available.append(agent_id)
+
+    def discard(self, agent_id):
+        position = self.index.pop(agent_id, None)
+        if position is None:
+            return
+        last = self.available.pop()
+        if last != agent_id:
+            self.available[position] = last
+            self.index[last] = position
+
+
+class AgentDirectory:
+    """In-memory registry of connected agents with an inverted capability index.
+
+    Every update is incremental: REGISTRO adds a record, CAPABILITY_ANNOUNCE
+    diffs the capability set, disconnects remove the record, and session
+    open/close move the agent in or out of the "has a free slot" pools. Each
+    of these costs O(k) for an agent with k capabilities, and ``select`` never
+    scans the agents of a capability.
+
+    Args:
+        strategy (str): ``"p2c"`` (sample two agents with a free slot and keep
+            the less loaded one, O(1)) or ``"least_loaded"`` (exact minimum
+            through a lazily pruned heap, O(log n) amortized).
+        rng (random.Random, optional): Source of randomness for ``"p2c"``.
+    """
+
+    def __init__(self, strategy=POWER_OF_TWO, rng=None):
+        if strategy not in (POWER_OF_TWO, LEAST_LOADED):
+            raise ValueError(f"Unknown selection strategy '{strategy}'")
+        self.strategy = strategy
+        self.rng = rng or random.Random()
+        self.agents = {}
+        self.capabilities = {}
+        self.topics = {}
+        self.session_agents = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.agents)
+
+    def __contains__(self, agent_id):
+        return agent_id in self.agents
+
+    def get(self, agent_id):
+        return self.agents.get(agent_id)
+
+    # --- Altas, bajas y anuncios ---
+
+    def register(self, agent_id, uri=None):
+        """Records a REGISTRO. Returns the agent's record."""
+        record = self.agents.get(agent_id)
+        if record is None:
+            record = self.agents[agent_id] = AgentRecord(agent_id, uri)
+        else:
+            record.uri = uri or record.uri
+            record.last_seen = time.time()
+        return record
+
+    def announce(self, agent_id, capacidades, max_sesiones=None, temas=None):
+        """Applies a CAPABILITY_ANNOUNCE, touching only the capabilities and topics that changed."""
+        record = self.register(agent_id)
+        self._subscribe(record, temas)
+        new = frozenset(c for c in capacidades or () if isinstance(c, str))
+        if isinstance(max_sesiones, bool) or not isinstance(max_sesiones, int) or max_sesiones < 0:
+            max_sesiones = None
+        old = record.capacidades
+        for capability in old - new:
+            self._leave(capability, agent_id)
+        record.capacidades = new
+        record.max_sesiones = max_sesiones
+        for capability in new - old:
+            pool = self.capabilities.get(capability)
+            if pool is None:
+                pool = self.capabilities[capability] = _CapabilityPool()
+            pool.members.add(agent_id)
+        self._refresh(record)
+        return record
+
+    def _subscribe(self, record, temas):
+        new = frozenset(t for t in temas or () if isinstance(t, str))
+        for topic in record.temas - new:
+            self._unsubscribe(topic, record.agent_id)
+        for topic in new - record.temas:
+            self.topics.setdefault(topic, set()).add(record.agent_id)
+        record.temas = new
+
+    def _unsubscribe(self, topic, agent_id):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(agent_id)
+            if not subscribers:
+                del self.topics[topic]
+
+    def remove(self, agent_id):
+        """Forgets a disconnected agent and its sessions."""
+        record = self.agents.pop(agent_id, None)
+        if record is None:
+            return None
+        for capability in record.capacidades:
+            self._leave(capability, agent_id)
+        for topic in record.temas:
+            self._unsubscribe(topic, agent_id)
+        for id_sesion in record.sessions:
+            self.session_agents.pop(id_sesion, None)
+        return record
+
+    def _leave(self, capability, agent_id):
+        pool = self.capabilities.get(capability)
+        if pool is None:
+            return
+        pool.discard(agent_id)
+        pool.members.discard(agent_id)
+        if not pool.members:
+            del self.capabilities[capability]
+
+    # --- Carga ---
+
+    def session_opened(self, agent_id, id_sesion):
+        """Counts ``id_sesion`` against ``agent_id``'s ``max_sesiones_concurrentes``."""
+        record = self.agents.get(agent_id)
+        if record is None or id_sesion is None or id_sesion in record.sessions:
+            return
+        previous = self.session_agents.get(id_sesion)
+        if previous is not None and previous != agent_id:
+            self.session_closed(id_sesion)
+        record.sessions.add(id_sesion)
+        self.session_agents[id_sesion] = agent_id
+        self._refresh(record)
+
+    def session_closed(self, id_sesion):
+        """Frees the slot held by ``id_sesion``, if any."""
+        agent_id = self.session_agents.pop(id_sesion, None)
+        if agent_id is None:
+            return
+        record = self.agents.get(agent_id)
+        if record is not None:
+            record.sessions.discard(id_sesion)
+            self._refresh(record)
+
+    def _refresh(self, record):
+        free = record.has_free_slot
+        agent_id = record.agent_id
+        least_loaded = self.strategy == LEAST_LOADED
+        for capability in record.capacidades:
+            pool = self.capabilities[capability]
+            if free:
+                pool.add(agent_id)
+                if least_loaded:
+                    heapq.heappush(pool.heap, (record.load, next(self._seq), agent_id))
+                    if len(pool.heap) > 4 * len(pool.available) + 64:
+                        self._compact(pool)
+            else:
+                pool.discard(agent_id)
+
+    def _compact(self, pool):
+        agents = self.agents
+        pool.heap = [(agents[agent_id].load, next(self._seq), agent_id) for agent_id in pool.available]
+        heapq.heapify(pool.heap)
+
+    # --- Selección ---
+
+    def select(self, capability, exclude=None):
+        """Picks an agent offering ``capability`` with a free session slot.
+
+        Args:
+            capability (str): Required capability.
+            exclude (str, optional): Agent that must not be chosen (the requester).
+
+        Returns:
+            AgentRecord: The chosen agent, or None if no agent qualifies.
+        """
+        pool = self.capabilities.get(capability)
+        if pool is None or not pool.available:
+            return None
+        if self.strategy == LEAST_LOADED:
+            return self._least_loaded(pool, exclude)
+        return self._power_of_two(pool, exclude)
+
+    def _power_of_two(self, pool, exclude):
+        available = pool.available
+        count = len(available)
+        if count == 1:
+            return None if available[0] == exclude else self.agents[available[0]]
+        rng = self.rng
+        first = rng.randrange(count)
+        second = rng.randrange(count - 1)
+        if second >= first:
+            second += 1
+        a, b = self.agents[available[first]], self.agents[available[second]]
+        if a.agent_id == exclude:
+            return b
+        if b.agent_id == exclude:
+            return a
+        return a if a.load <= b.load else b
+
+    def _least_loaded(self, pool, exclude):
+        heap = pool.heap
+        agents = self.agents
+        skipped = None
+        while heap:
+            load, _, agent_id = heap[0]
+            record = agents.get(agent_id)
+            if record is None or agent_id not in pool.index or record.load != load:
+                heapq.heappop(heap)  # entrada obsoleta
+                continue
+            if agent_id == exclude:
+                skipped = heapq.heappop(heap)
+                continue
+            break
+        else:
+            record = None
+        if skipped is not None:
+            heapq.heappush(heap, skipped)
+        return record
+
+    def recipients(self, capability=None, topic=None):
+        """Returns the agents matching a broadcast filter, or None for "everyone".
+
+        With both filters the smaller set is iterated against the larger one.
+        """
+        sets = []
+        if capability is not None:
+            pool = self.capabilities.get(capability)
+            sets.append(pool.members if pool is not None else set())
+        if topic is not None:
+            sets.append(self.topics.get(topic, set()))
+        if not sets:
+            return None
+        if len(sets) == 1:
+            return sets[0]
+        small, large = sorted(sets, key=len)
+        return {agent_id for agent_id in small if agent_id in large}
+
+    def snapshot(self):
+        """Returns a JSON-friendly view of the directory (for logs and debugging)."""
+        return {
+            agent_id: {
+                "uri": record.uri,
+                "capacidades": sorted(record.capacidades),
+                "temas": sorted(record.temas),
+                "max_sesiones_concurrentes": record.max_sesiones,
+                "sesiones_activas": record.load,
+            }
+            for agent_id, record in self.agents.items()
+        }
@@ -0,0 +1,170 @@
+# eventlog.py - Eventos estructurados por mensaje: filtrado por nivel, muestreo y escritura en un hilo aparte
+
+import json
+import logging
+import logging.handlers
+import queue
+import weakref
+
+MESSAGE_LEVEL = logging.DEBUG
+DEFAULT_LOG_QUEUE_SIZE = 10_000
+
+_event_logs = weakref.WeakSet()
+
+
+class _Fields:
+    """An event rendered as ``event=... key=value`` only when a handler formats it."""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        parts = [f"event={self.event}"]
+        for key, value in self.fields.items():
+            if value is None:
+                continue
+            text = str(value)
+            if not text or any(c in text for c in ' "='):
+                text = json.dumps(text, ensure_ascii=False)
+            parts.append(f"{key}={text}")
+        return " ".join(parts)
+
+
+class EventLog:
+    """Structured, sampled events for per-message hot paths.
+
+    Callers test ``enabled`` (a plain attribute) before calling ``message``,
+    so a disabled log costs one attribute lookup per message and no
+    formatting. Enabled events are sampled and carry metadata only. Frames
+    are logged only with ``log_bodies``. The ``key=value`` text is built
+    when a handler formats the record; behind ``BoundedQueueHandler`` that
+    happens on the logging thread.
+
+    ``enabled`` follows the logger's level when the log is created and
+    whenever ``refresh`` or ``configure_logging`` runs, not on later
+    ``setLevel`` calls.
+
+    Args:
+        name (str): Logger name; events are emitted on it at DEBUG.
+        sample_every (int): Emit one of every N events.
+        log_bodies (bool): Include the full frame in message events.
+    """
+
+    def __init__(self, name, sample_every=1, log_bodies=False):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.logger = logging.getLogger(name)
+        self.sample_every = sample_every
+        self.log_bodies = log_bodies
+        self.enabled = False
+        self._countdown = 1
+        self.refresh()
+        _event_logs.add(self)
+
+    def refresh(self):
+        """Re-reads the logger's level (call after changing it)."""
+        self.enabled = self.logger.isEnabledFor(MESSAGE_LEVEL)
+        self._countdown = 1
+
+    def message(self, event, message, frame=None, **fields):
+        """Records one sampled event about ``message``; ``fields`` are added as-is."""
+        self._countdown -= 1
+        if self._countdown:
+            return
+        self._countdown = self.sample_every
+        fields = {
+            "tipo": message.get("tipo"),
+            "origen": message.get("origen"),
+            "destino": message.get("destino"),
+            "id_mensaje": message.get("id_mensaje"),
+            "id_sesion": message.get("id_sesion"),
+            **fields,
+        }
+        if frame is not None:
+            fields["bytes"] = len(frame)
+            if self.log_bodies:
+                fields["body"] = frame if isinstance(frame, str) else bytes(frame).hex()
+        # stacklevel=2: el registro apunta a quien emite el evento, no a este módulo
+        self.logger.log(MESSAGE_LEVEL, "%s", _Fields(event, fields), stacklevel=2)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to ``handlers`` on a background thread through a bounded queue.
+
+    Unlike ``QueueHandler``, records are queued unformatted, so the message
+    is built on the logging thread. A record logged while the queue is
+    full is dropped and counted in ``dropped``; logging never blocks the
+    event loop. Arguments are formatted later, so they must not be mutated
+    after the call.
+
+    Args:
+        handlers (list): Handlers that write the records.
+        queue_size (int): Records held before new ones are dropped.
+    """
+
+    def __init__(self, handlers, queue_size=DEFAULT_LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._running = False
+
+    def start(self):
+        self.listener.start()
+        self._running = True
+
+    def prepare(self, record):
+        # Sin formatear aquí: getMessage() se hace en el hilo del QueueListener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._running:
+            self._running = False
+            self.listener.stop()  # escribe lo que quede en la cola
+            if self.dropped:
+                record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                           "Log queue overflowed; %d record(s) dropped", (self.dropped,), None)
+                self.listener.handle(record)
+        super().close()
+
+
+def configure_logging(level=logging.INFO, messages=False, sample_every=1, log_bodies=False,
+                      queue_size=DEFAULT_LOG_QUEUE_SIZE):
+    """Moves the root logger's handlers behind a ``BoundedQueueHandler``.
+
+    Call once per process, after ``logging.basicConfig`` and, with worker
+    processes, after the fork. The queue is flushed by ``logging.shutdown``
+    at exit.
+
+    Args:
+        level (int): Root logger level.
+        messages (bool): Enable the per-message ``EventLog`` events.
+        sample_every (int): Emit one of every N per-message events.
+        log_bodies (bool): Include frames in per-message events.
+        queue_size (int): Records buffered for the logging thread.
+
+    Returns:
+        BoundedQueueHandler: The installed handler (its ``dropped`` counts lost records).
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+    queue_handler = BoundedQueueHandler(handlers, queue_size)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    queue_handler.start()
+    for log in list(_event_logs):
+        log.sample_every = sample_every
+        log.log_bodies = log_bodies
+        log.logger.setLevel(MESSAGE_LEVEL if messages else logging.INFO)
+        log.refresh()
+    return queue_handler
@@ -0,0 +1,136 @@
+# liveness.py - Detección de conexiones muertas: HEARTBEAT solo a las inactivas, con la rueda de temporizadores
+
+import logging
+import math
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TIMEOUT = 30.0
+DEFAULT_PROBE_TIMEOUT = 10.0
+
+
+class LivenessRecord:
+    """Liveness state of one connection.
+
+    ``last_seen`` and ``probed`` are timer wheel ticks, so noting inbound
+    traffic is a single attribute write. ``probed`` is the tick a HEARTBEAT
+    was sent at, or None while the connection is not being probed.
+    """
+
+    __slots__ = ("key", "last_seen", "probed", "timer")
+
+    def __init__(self, key, now):
+        self.key = key
+        self.last_seen = now
+        self.probed = None
+        self.timer = None
+
+
+class LivenessMonitor:
+    """Detects dead connections without per-connection tasks or periodic scans.
+
+    Every watched connection has exactly one timer in a shared
+    ``TimerWheel``. Inbound traffic only updates ``last_seen``. When the timer
+    fires and the connection has been silent for ``idle_timeout``, it gets
+    ``send_heartbeat(key)`` and a second timer of ``probe_timeout``; any
+    traffic before that one fires (the HEARTBEAT_ACK or anything else) keeps
+    it alive, otherwise ``on_dead(key)`` is called. A timer that fires while
+    the connection is busy is re-armed for the rest of its idle time, so busy
+    connections are never sent a HEARTBEAT and each connection costs at most
+    one timer per ``idle_timeout``, however many are connected.
+
+    Args:
+        wheel (TimerWheel, optional): Timer wheel to share (e.g. the one of the
+            session table). One is created (and started on first use) if
+            omitted.
+        idle_timeout (float): Seconds of silence before a connection is probed.
+        probe_timeout (float): Seconds to wait for traffic after a HEARTBEAT.
+        send_heartbeat (callable): ``send_heartbeat(key)`` probes a connection.
+        on_dead (callable): ``on_dead(key)`` is called once for a connection
+            that did not answer; it is no longer watched by then.
+    """
+
+    def __init__(self, wheel=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, probe_timeout=DEFAULT_PROBE_TIMEOUT,
+                 send_heartbeat=None, on_dead=None):
+        if idle_timeout <= 0 or probe_timeout <= 0:
+            raise ValueError("idle_timeout and probe_timeout must be positive")
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self._owns_wheel = wheel is None
+        self.idle_timeout = idle_timeout
+        self.probe_timeout = probe_timeout
+        self._idle_ticks = self._ticks(idle_timeout)
+        self.send_heartbeat = send_heartbeat
+        self.on_dead = on_dead
+        self.watched = 0
+        self.probing = 0
+        self.heartbeats = 0
+        self.dead = 0
+
+    def __len__(self):
+        return self.watched
+
+    def stop(self):
+        if self._owns_wheel:
+            self.wheel.stop()
+
+    def _ticks(self, seconds):
+        return max(1, math.ceil(seconds / self.wheel.resolution))
+
+    def watch(self, key):
+        """Starts watching a connection; returns the record to pass to ``seen`` and ``unwatch``."""
+        wheel = self.wheel
+        if self._owns_wheel and not wheel.running:
+            wheel.start()
+        record = LivenessRecord(key, wheel.current)
+        record.timer = wheel.schedule(self.idle_timeout, self._fire, record)
+        self.watched += 1
+        return record
+
+    def seen(self, record):
+        """Notes inbound traffic on a connection: it counts as a heartbeat."""
+        record.last_seen = self.wheel.current
+
+    def unwatch(self, record):
+        """Stops watching a connection (closed or replaced). Safe to call more than once."""
+        if record.timer is not None:
+            record.timer.cancel()
+            record.timer = None
+            self.watched -= 1
+            if record.probed is not None:
+                record.probed = None
+                self.probing -= 1
+
+    # --- Vencimientos ---
+
+    def _fire(self, record):
+        wheel = self.wheel
+        now = wheel.current
+        if record.probed is not None:
+            if record.last_seen < record.probed:
+                self._declare_dead(record)
+                return
+            # Contestó (o hubo otro tráfico) después del HEARTBEAT
+            record.probed = None
+            self.probing -= 1
+        remaining = self._idle_ticks - (now - record.last_seen)
+        if remaining > 0:
+            record.timer = wheel.schedule(remaining * wheel.resolution, self._fire, record)
+            return
+        record.probed = now
+        self.probing += 1
+        self.heartbeats += 1
+        record.timer = wheel.schedule(self.probe_timeout, self._fire, record)
+        try:
+            self.send_heartbeat(record.key)
+        except Exception:
+            logger.exception("Sending HEARTBEAT failed")
+
+    def _declare_dead(self, record):
+        record.timer = None
+        record.probed = None
+        self.watched -= 1
+        self.probing -= 1
+        self.dead += 1
+        self.on_dead(record.key)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# metrics_dump.py - Vuelca las métricas (o el perfil) de un hub en marcha
+#
+# Hace un GET por HTTPS al puerto WSS del hub con el certificado de un agente
+# (mTLS) e imprime la respuesta:
+#
+#   python lib/metrics_dump.py                          # /metrics de localhost:8080
+#   python lib/metrics_dump.py --profile start          # con el hub lanzado con --profiling
+#   python lib/metrics_dump.py --profile stop > stacks.txt
+#
+# Con --workers cada conexión llega a un worker cualquiera: la salida es la de ese proceso.
+
+import argparse
+import http.client
+import os
+import pathlib
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python import tls
+
+PROFILE_PATHS = {"start": "/debug/profile/start", "show": "/debug/profile", "stop": "/debug/profile/stop"}
+
+
+def fetch(host, port, path, context, timeout=10.0):
+    connection = http.client.HTTPSConnection(host, port, context=context, timeout=timeout)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        body = response.read().decode("utf-8")
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"GET {path} returned {response.status} {response.reason}: {body.strip()}")
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the metrics or profile of a running ACPaaS hub")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--agent", default="agente_py", help="Certificate name in the certificate directory")
+    parser.add_argument("--cert-dir", default=os.environ.get("ACPAAS_CERT_DIR", REPO_ROOT / "scripts"))
+    parser.add_argument("--profile", choices=sorted(PROFILE_PATHS),
+                        help="Control the sampling profiler instead of reading /metrics")
+    args = parser.parse_args()
+
+    context = tls.client_context(*tls.agent_files(args.cert_dir, args.agent))
+    path = PROFILE_PATHS[args.profile] if args.profile else "/metrics"
+    try:
+        sys.stdout.write(fetch(args.host, args.port, path, context))
+    except (OSError, RuntimeError, http.client.HTTPException) as e:
+        sys.exit(f"metrics_dump: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,991 @@
+# router.py - Protocol-aware message router for the ACPaaS WSS hub
+
+import asyncio
+import logging
+import time
+
+from websockets.frames import Frame, Opcode
+from websockets.protocol import SERVER, State
+
+from acpaas_agent_lib.python.flow_control import DEFAULT_CONNECTION_WINDOW
+from acpaas_agent_lib.python.metrics import REGISTRY
+from acpaas_agent_lib.python.codec import (
+    FORMAT_JSON, MAX_BATCH_MESSAGES, SUPPORTED_FORMATS, build_message, decode_frame, encode_batch, encode_frame,
+    frame_matches, is_batch_frame, negotiate_format, split_batch)
+from acpaas_agent_lib.python.reliability import ack_range
+from lib.directory import AgentDirectory
+from lib.eventlog import EventLog
+from lib.liveness import LivenessMonitor
+from lib.sessions import SessionTable
+
+logger = logging.getLogger(__name__)
+# Un evento por mensaje enrutado; desactivado salvo con --log-messages
+events = EventLog(__name__ + ".messages")
+
+# --- Métricas ---
+MESSAGES_IN = REGISTRY.counter("acpaas_messages_in_total", "Messages received from agents", label="tipo")
+MESSAGES_OUT = REGISTRY.counter("acpaas_messages_out_total", "Messages queued for delivery by this process",
+                                label="tipo")
+BYTES_IN = REGISTRY.counter("acpaas_bytes_in_total", "Payload bytes received from agents")
+BYTES_OUT = REGISTRY.counter("acpaas_bytes_out_total", "Payload bytes written to agents")
+MESSAGES_STORED = REGISTRY.counter("acpaas_messages_stored_total", "Messages stored for offline agents")
+MESSAGES_REPLAYED = REGISTRY.counter("acpaas_messages_replayed_total", "Stored messages replayed to agents")
+BATCHES_IN = REGISTRY.counter("acpaas_batches_in_total", "Batch frames received from agents")
+BATCHES_OUT = REGISTRY.counter("acpaas_batches_out_total", "Batch frames written to agents")
+HEARTBEATS_OUT = REGISTRY.counter("acpaas_heartbeats_out_total", "HEARTBEATs sent to idle agents")
+DEAD_CONNECTIONS = REGISTRY.counter("acpaas_dead_connections_total",
+                                    "Connections closed because the agent did not answer a HEARTBEAT")
+BATCHED_MESSAGES_OUT = REGISTRY.counter("acpaas_batched_messages_out_total",
+                                        "Messages written to agents inside batch frames")
+ROUTING_SECONDS = REGISTRY.histogram("acpaas_routing_seconds", "Time to decode, validate and route one inbound frame")
+ACK_RTT_SECONDS = REGISTRY.histogram("acpaas_ack_round_trip_seconds",
+                                     "Forwarded requiere_ack message to its MESSAGE_ACK, seen by the hub (sampled)")
+# Uno de cada N mensajes con requiere_ack se cronometra; como mucho CAPACITY a la vez
+ACK_SAMPLE_EVERY = 16
+ACK_SAMPLE_CAPACITY = 1024
+
+SERVER_AGENT_ID = "acpaas_server"
+BROADCAST = "BROADCAST"
+DEFAULT_QUEUE_SIZE = 1024
+DEFAULT_BROADCAST_TIMEOUT = 5.0
+DEFAULT_BATCH_BYTES = 64 * 1024
+
+# Mensajes efímeros que no se guardan para agentes desconectados
+UNSTORED_TYPES = frozenset({"MESSAGE_ACK", "FLOW_CONTROL", "HEARTBEAT", "HEARTBEAT_ACK"})
+
+# Mensajes que cambian el estado de una sesión (y ocupan o liberan su plaza en el directorio)
+SESSION_STATE_TYPES = frozenset({"SESSION_INIT", "SESSION_ACCEPT", "SESSION_REJECT", "SESSION_CLOSE"})
+
+
+class Peer:
+    """A connected agent: its live connection plus a bounded delivery queue.
+
+    Frames destined for the agent are appended to ``queue`` and written by a
+    dedicated writer task, so a slow receiver only ever backs up its own queue.
+    ``paused_senders`` holds the agents that were sent FLOW_CONTROL PAUSE
+    because this queue passed its high-water mark. ``paused`` is set while the
+    agent itself has asked the hub to PAUSE, and ``slow`` after a broadcast
+    write timed out; broadcasts skip the agent in both cases.
+
+    ``batching`` and ``range_acks`` record what the agent announced it
+    understands (``lotes`` / ``acks_por_rango``). ``replayed`` maps the
+    ``(id_sesion, numero_secuencia)`` of replayed messages to their
+    ``id_mensaje`` so range ACKs can release them from the store.
+    ``liveness`` is the agent's record in the router's ``LivenessMonitor``.
+    """
+
+    __slots__ = ("agent_id", "connection", "queue", "writer", "dropped", "payload_format", "paused_senders",
+                 "paused", "slow", "raw_frames", "batching", "range_acks", "replayed", "coalescing", "liveness")
+
+    def __init__(self, agent_id, connection, queue_size=DEFAULT_QUEUE_SIZE):
+        self.agent_id = agent_id
+        self.connection = connection
+        self.payload_format = FORMAT_JSON
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+        self.dropped = 0
+        self.paused_senders = set()
+        self.paused = False
+        self.slow = False
+        self.raw_frames = _accepts_raw_frames(connection)
+        self.batching = False
+        self.range_acks = False
+        self.replayed = {}
+        self.coalescing = False
+        self.liveness = None
+
+    def enqueue(self, frame):
+        """Queues a frame for delivery. Returns False if the queue is full."""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+
+def _accepts_raw_frames(connection):
+    """True if pre-serialized frames can be written straight to the transport.
+
+    That holds for a server-side websockets connection without extensions:
+    frames are neither masked nor compressed, so the bytes are the same for
+    every recipient.
+    """
+    protocol = getattr(connection, "protocol", None)
+    return (getattr(protocol, "side", None) is SERVER and not getattr(protocol, "extensions", True)
+            and hasattr(connection, "transport") and hasattr(connection, "drain"))
+
+
+def _frame_size(frame):
+    """Bytes ``frame`` takes on the wire: a text frame counts its UTF-8 encoding."""
+    if type(frame) is PreparedFrame:
+        return frame.size
+    if type(frame) is str and not frame.isascii():  # isascii() no recorre la cadena
+        return len(frame.encode("utf-8"))
+    return len(frame)
+
+
+class PreparedFrame:
+    """A broadcast payload encoded once, together with its WebSocket frame bytes."""
+
+    __slots__ = ("payload", "wire", "size")
+
+    def __init__(self, payload):
+        self.payload = payload
+        if isinstance(payload, str):
+            encoded = payload.encode("utf-8")
+            self.wire = Frame(Opcode.TEXT, encoded).serialize(mask=False)
+        else:
+            encoded = bytes(payload)
+            self.wire = Frame(Opcode.BINARY, encoded).serialize(mask=False)
+        self.size = len(encoded)
+
+
+class MessageRouter:
+    """Routes protocol frames between connected agents by ``destino``.
+
+    The router keeps a single ``agent_id -> Peer`` map, so forwarding a frame is
+    one dict lookup. Frames are forwarded untouched (no re-serialization) unless
+    the destination negotiated a different payload format (including a
+    dictionary-compressed one, see acpaas_agent_lib/python/compression.py);
+    only messages addressed to the server itself are answered by the router.
+    Chunk frames of a chunked transfer (PROTOCOL_SPEC 3.6) are routed by
+    their message alone and always forwarded untouched.
+
+    When ``bus`` is set (multi-worker mode, see lib/workers.py), agents that are
+    not connected to this process are reached through the inter-worker bus.
+
+    Once a delivery queue holds ``high_water`` frames, every agent that keeps
+    sending to it gets a FLOW_CONTROL PAUSE naming the congested destination
+    (``datos.valor.destino``); they all get RESUME when the writer has drained
+    it to ``low_water``. Frames beyond ``queue_size`` are still refused with
+    RATE_LIMIT_EXCEEDED, so a sender that ignores PAUSE cannot grow the queue.
+
+    ``directory`` (lib/directory.py) records what REGISTRO and
+    CAPABILITY_ANNOUNCE tell the hub about local agents. A SESSION_INIT
+    addressed to the server with ``datos.requisitos.required_capability`` is
+    dispatched to an agent picked from it.
+
+    ``sessions`` (lib/sessions.py) follows every session routed through the
+    hub. When one times out, or one of its agents disconnects, the remaining
+    participants get a SESSION_CLOSE from the server.
+
+    With a ``store`` (lib/store.py), messages for agents that are not
+    connected are written to disk instead of bounced. The sender gets
+    MESSAGE_ACK with ``datos.almacenado`` once the write is durable. The
+    backlog is replayed when the agent sends REGISTRO again, at most
+    ``replay_window`` unacknowledged messages at a time and never past the
+    delivery queue's high-water mark.
+
+    A message with ``destino`` ``"BROADCAST"`` is encoded once per payload
+    format and queued for every matching agent (see ``broadcast``).
+
+    With ``batch_messages`` above 1, the writer of an agent that announced
+    ``lotes`` packs whatever is already queued for it, up to ``batch_messages``
+    frames or ``batch_bytes``, into one batch frame (PROTOCOL_SPEC 3.4): one
+    WebSocket frame, TLS record and write instead of one per message. A frame
+    of ``batch_bytes`` or more is written on its own.
+    ``batch_delay`` additionally holds a short batch back that long for more
+    frames to arrive. Batches received from agents are always unpacked.
+
+    ``enable_liveness`` makes the hub probe agents that have been silent for
+    a while with HEARTBEAT and drop the ones that do not answer, as if they
+    had disconnected (lib/liveness.py).
+
+    Traffic counters and latency histograms go to the process ``REGISTRY``
+    (acpaas_agent_lib/python/metrics.py); ``register_metrics`` adds gauges
+    read from the router's state when metrics are scraped.
+    """
+
+    def __init__(self, server_id=SERVER_AGENT_ID, queue_size=DEFAULT_QUEUE_SIZE, bus=None,
+                 payload_formats=SUPPORTED_FORMATS, high_water=None, low_water=None, directory=None,
+                 broadcast_timeout=DEFAULT_BROADCAST_TIMEOUT, sessions=None, store=None,
+                 replay_window=DEFAULT_CONNECTION_WINDOW, batch_messages=1, batch_bytes=DEFAULT_BATCH_BYTES,
+                 batch_delay=0.0):
+        if not 1 <= batch_messages <= MAX_BATCH_MESSAGES:
+            raise ValueError(f"batch_messages must be between 1 and {MAX_BATCH_MESSAGES}")
+        self.server_id = server_id
+        self.batch_messages = batch_messages
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        self.store = store
+        self.replay_window = replay_window
+        self.broadcast_timeout = broadcast_timeout
+        self.directory = directory if directory is not None else AgentDirectory()
+        self.sessions = sessions if sessions is not None else SessionTable()
+        if self.sessions.on_expired is None:
+            self.sessions.on_expired = self._session_expired
+        self.queue_size = queue_size
+        self.high_water = high_water if high_water is not None else max(1, queue_size * 3 // 4)
+        self.low_water = low_water if low_water is not None else queue_size // 4
+        if not 0 <= self.low_water < self.high_water <= queue_size:
+            raise ValueError("Expected 0 <= low_water < high_water <= queue_size")
+        self.payload_formats = tuple(payload_formats)
+        self.peers = {}
+        self.bus = bus
+        self.ack_sent = {}
+        self._ack_countdown = 1
+        self.liveness = None
+
+    def register_metrics(self, registry=REGISTRY):
+        """Adds gauges computed from the router's state at scrape time."""
+        peers = self.peers
+        registry.gauge("acpaas_connections", "Agents connected to this process", lambda: len(peers))
+        registry.gauge("acpaas_queued_frames", "Frames waiting in delivery queues",
+                       lambda: sum(peer.queue.qsize() for peer in peers.values()))
+        registry.gauge("acpaas_queue_depth_max", "Longest delivery queue",
+                       lambda: max((peer.queue.qsize() for peer in peers.values()), default=0))
+        registry.gauge("acpaas_paused_senders", "Senders paused by the hub because their destination is congested",
+                       lambda: sum(len(peer.paused_senders) for peer in peers.values()))
+        registry.gauge("acpaas_paused_agents", "Agents that asked the hub to pause with FLOW_CONTROL",
+                       lambda: sum(1 for peer in peers.values() if peer.paused))
+        registry.gauge("acpaas_sessions", "Sessions tracked by the hub", lambda: len(self.sessions))
+        registry.gauge("acpaas_probed_connections", "Idle connections sent a HEARTBEAT and not answered yet",
+                       lambda: self.liveness.probing if self.liveness is not None else 0)
+        registry.gauge("acpaas_stored_messages", "Messages waiting in the store for offline agents",
+                       lambda: len(self.store) if self.store is not None else 0)
+
+    def enable_liveness(self, idle_timeout, probe_timeout):
+        """Probes agents silent for ``idle_timeout`` seconds and drops those that stay silent ``probe_timeout`` more.
+
+        The monitor shares the timer wheel of the session table, so the hub
+        keeps a single timer task however many agents are connected.
+        """
+        self.liveness = LivenessMonitor(self.sessions.wheel, idle_timeout, probe_timeout,
+                                        send_heartbeat=self._send_heartbeat, on_dead=self._connection_dead)
+        for peer in self.peers.values():
+            peer.liveness = self.liveness.watch(peer)
+        return self.liveness
+
+    # --- Registro de conexiones ---
+
+    def attach(self, agent_id, connection):
+        """Registers a live connection for ``agent_id`` and starts its writer.
+
+        A newer connection for the same agent replaces the previous one.
+        """
+        previous = self.peers.get(agent_id)
+        if previous is not None:
+            logger.warning("Agent '%s' reconnected; replacing previous connection.", agent_id)
+            self._stop_writer(previous)
+
+        peer = Peer(agent_id, connection, self.queue_size)
+        peer.writer = asyncio.get_running_loop().create_task(self._writer(peer))
+        if self.liveness is not None:
+            if not self.liveness.wheel.running:
+                self.liveness.wheel.start()
+            peer.liveness = self.liveness.watch(peer)
+        self.peers[agent_id] = peer
+        if self.bus is not None:
+            self.bus.agent_attached(agent_id)
+        return peer
+
+    def detach(self, peer):
+        """Removes ``peer`` from the routing table if it is still the current one."""
+        if self.peers.get(peer.agent_id) is peer:
+            del self.peers[peer.agent_id]
+            self.directory.remove(peer.agent_id)
+            self._drop_sessions(peer.agent_id)
+            if self.bus is not None:
+                self.bus.agent_detached(peer.agent_id)
+        self._stop_writer(peer)
+
+    def evict(self, agent_id):
+        """Drops the local connection of an agent that reconnected elsewhere."""
+        peer = self.peers.pop(agent_id, None)
+        if peer is None:
+            return
+        logger.warning("Agent '%s' reconnected on another worker; closing local connection.", agent_id)
+        self.directory.remove(agent_id)
+        self._stop_writer(peer)
+        close = getattr(peer.connection, "close", None)
+        if close is not None:
+            asyncio.get_running_loop().create_task(close())
+
+    def _send_heartbeat(self, peer):
+        HEARTBEATS_OUT.inc()
+        self.send(peer, "HEARTBEAT")
+        if hasattr(peer.connection, "ping"):
+            # El pong también cuenta: los agentes que no contestan HEARTBEAT_ACK no se dan por muertos
+            asyncio.get_running_loop().create_task(self._ping(peer))
+
+    async def _ping(self, peer):
+        try:
+            pong = await peer.connection.ping()
+            await pong
+        except Exception:
+            return
+        if peer.liveness is not None:
+            self.liveness.seen(peer.liveness)
+
+    def _connection_dead(self, peer):
+        """Drops an agent that did not answer a HEARTBEAT, as if it had disconnected."""
+        DEAD_CONNECTIONS.inc()
+        logger.warning("Agent '%s' did not answer HEARTBEAT within %.0fs; closing its connection.",
+                       peer.agent_id, self.liveness.probe_timeout)
+        self.detach(peer)
+        # Probablemente medio abierta: cortar sin esperar al cierre ordenado de WebSocket
+        transport = getattr(peer.connection, "transport", None)
+        if transport is not None:
+            transport.abort()
+        else:
+            close = getattr(peer.connection, "close", None)
+            if close is not None:
+                asyncio.get_running_loop().create_task(close())
+
+    def _stop_writer(self, peer):
+        if peer.liveness is not None:
+            self.liveness.unwatch(peer.liveness)
+        if peer.writer is not None and not peer.writer.done():
+            peer.writer.cancel()
+        if peer.paused_senders:
+            # Nadie más va a vaciar esta cola
+            self._resume_senders(peer)
+
+    async def _writer(self, peer):
+        queue = peer.queue
+        send = peer.connection.send
+        low_water = self.low_water
+        while True:
+            frame = await queue.get()
+            if peer.batching and self.batch_messages > 1 and (queue.qsize() or self.batch_delay):
+                frame = await self._coalesce(peer, frame)
+            try:
+                if type(frame) is PreparedFrame:
+                    BYTES_OUT.value += frame.size
+                    sent = await self._send_prepared(peer, frame)
+                else:
+                    BYTES_OUT.value += _frame_size(frame)
+                    await send(frame)
+                    sent = True
+            except Exception as e:
+                logger.warning("Delivery to '%s' failed, stopping writer: %s", peer.agent_id, e)
+                break
+            if peer.paused_senders and queue.qsize() <= low_water:
+                self._resume_senders(peer)
+            if peer.slow and sent and not queue.qsize():
+                peer.slow = False
+            if self.store is not None and queue.qsize() <= low_water:
+                self._replay(peer)
+
+    async def _coalesce(self, peer, frame):
+        """Packs ``frame`` and the frames queued behind it into one batch frame.
+
+        Returns ``frame`` itself if nothing else was queued. A batch that
+        carries a broadcast comes back as a ``PreparedFrame`` so it is written
+        with the broadcast deadline.
+        """
+        queue = peer.queue
+        limit = self.batch_messages
+        if self.batch_delay and queue.qsize() < limit - 1:
+            # Mientras espera, _write_now no puede adelantar a lo ya sacado de la cola
+            peer.coalescing = True
+            try:
+                await asyncio.sleep(self.batch_delay)
+            finally:
+                peer.coalescing = False
+        size = _frame_size(frame)
+        max_bytes = self.batch_bytes
+        if not queue.qsize() or size >= max_bytes:
+            # Un fragmento de transferencia ya llena el lote: se envía tal cual, sin copiarlo
+            return frame
+        frames = [frame]
+        while queue.qsize() and len(frames) < limit and size < max_bytes:
+            frame = queue.get_nowait()
+            frames.append(frame)
+            size += _frame_size(frame)
+        prepared = False
+        for i, frame in enumerate(frames):
+            if type(frame) is PreparedFrame:
+                frames[i] = frame.payload
+                prepared = True
+        BATCHES_OUT.value += 1
+        BATCHED_MESSAGES_OUT.value += len(frames)
+        batch = encode_batch(frames)
+        return PreparedFrame(batch) if prepared else batch
+
+    async def _send_prepared(self, peer, frame):
+        connection = peer.connection
+        if peer.raw_frames and connection.protocol.state is State.OPEN:
+            # Mismo frame para todos los destinatarios: sin serializar por conexión
+            connection.transport.write(frame.wire)
+            pending = connection.drain()
+        else:
+            pending = connection.send(frame.payload)
+        try:
+            await asyncio.wait_for(pending, self.broadcast_timeout)
+        except asyncio.TimeoutError:
+            peer.slow = True
+            logger.warning("Broadcast to '%s' timed out after %.1fs; skipping it until it catches up.",
+                           peer.agent_id, self.broadcast_timeout)
+            return False
+        return True
+
+    # --- Enrutamiento ---
+
+    async def serve(self, connection, agent_id=None):
+        """Reads frames from ``connection`` until it closes, routing each one.
+
+        ``agent_id`` is the authenticated identity (the mTLS CN). When it is not
+        known, the ``origen`` of the first valid message is used instead.
+        """
+        peer = None
+        if agent_id is not None:
+            peer = self.attach(agent_id, connection)
+        try:
+            async for frame in connection:
+                if peer is None:
+                    peer = self._attach_from_first_frame(connection, frame)
+                    if peer is None:
+                        continue
+                started = time.perf_counter()
+                self.handle_frame(peer, frame)
+                ROUTING_SECONDS.observe(time.perf_counter() - started)
+        finally:
+            if peer is not None:
+                self.detach(peer)
+
+    def _attach_from_first_frame(self, connection, frame):
+        try:
+            message = decode_frame(frame)
+        except ValueError as e:
+            logger.warning("Dropping frame from unidentified connection: %s", e)
+            return None
+        return self.attach(message["origen"], connection)
+
+    def handle_frame(self, peer, frame):
+        """Decodes and validates one inbound frame from ``peer`` and routes it.
+
+        A batch frame is unpacked and the messages in it are routed in order.
+        """
+        BYTES_IN.value += _frame_size(frame)
+        if peer.liveness is not None:
+            # Cualquier tráfico entrante cuenta como latido
+            self.liveness.seen(peer.liveness)
+        if is_batch_frame(frame):
+            try:
+                frames = split_batch(frame)
+            except ValueError as e:
+                self.send_error(peer, "INVALID_MESSAGE_FORMAT", str(e))
+                return
+            BATCHES_IN.value += 1
+            for frame in frames:
+                self.route_frame(peer, frame)
+        else:
+            self.route_frame(peer, frame)
+
+    def route_frame(self, peer, frame):
+        """Decodes, validates and routes a single message frame from ``peer``."""
+        try:
+            message = decode_frame(frame)
+        except ValueError as e:
+            self.send_error(peer, "INVALID_MESSAGE_FORMAT", str(e))
+            return
+        MESSAGES_IN.inc_label(message["tipo"])
+
+        if message["origen"] != peer.agent_id:
+            self.send_error(peer, "AUTH_FAILED",
+                            f"origen '{message['origen']}' does not match authenticated agent '{peer.agent_id}'",
+                            respuesta_a=message["id_mensaje"])
+            return
+
+        destino = message["destino"]
+        if destino == self.server_id:
+            self.handle_control(peer, message)
+        elif destino == BROADCAST:
+            self.handle_broadcast(peer, message)
+        else:
+            self.forward(peer, message, frame)
+
+    def forward(self, peer, message, frame):
+        """Queues ``frame`` on the destination's delivery queue."""
+        destino = message["destino"]
+        if self.ack_sent and message["tipo"] == "MESSAGE_ACK":
+            started = self.ack_sent.pop(message.get("respuesta_a"), None)
+            if started is not None:
+                ACK_RTT_SECONDS.observe(time.perf_counter() - started)
+        store = self.store
+        if store is not None:
+            if message["tipo"] == "MESSAGE_ACK":
+                acknowledged = store.acknowledge_id(peer.agent_id, message.get("respuesta_a"))
+                if peer.replayed and self._acknowledge_replayed(peer, message):
+                    acknowledged = True
+                if acknowledged:
+                    self._replay(peer)
+            elif (message["tipo"] not in UNSTORED_TYPES and store.pending(destino)
+                  and not self._hand_off(destino)):
+                # Quedan mensajes guardados para el destino: este va detrás para no adelantarlos
+                if self._store(peer, message, frame):
+                    return
+        try:
+            delivered = self.deliver(destino, frame, message)
+        except ValueError as e:
+            self.send_error(peer, "INVALID_MESSAGE_FORMAT",
+                            f"Message cannot be converted to the format of '{destino}': {e}",
+                            respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+            return
+        if delivered is None and self.bus is not None:
+            delivered = self.bus.forward(destino, frame)
+        if delivered is None and store is not None and message["tipo"] not in UNSTORED_TYPES:
+            if self._store(peer, message, frame):
+                return
+
+        if delivered:
+            MESSAGES_OUT.inc_label(message["tipo"])
+            if message.get("requiere_ack"):
+                self._sample_ack(message["id_mensaje"])
+            id_sesion = message.get("id_sesion")
+            if id_sesion is not None:
+                if message["tipo"] in SESSION_STATE_TYPES:
+                    self._track_session(message, id_sesion)
+                else:
+                    self.sessions.touch(id_sesion)
+
+        if delivered is None:
+            self.send_error(peer, "DESTINATION_NOT_FOUND",
+                            f"Agent '{destino}' is not connected",
+                            respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+        elif not delivered:
+            self.send_error(peer, "RATE_LIMIT_EXCEEDED",
+                            f"Delivery queue for '{destino}' is full",
+                            respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+        elif events.enabled:
+            events.message("routed", message, frame)
+
+    def _sample_ack(self, id_mensaje):
+        sent = self.ack_sent
+        if sent.pop(id_mensaje, None) is not None:
+            return  # retransmisión: no se sabe a cuál de los envíos respondería el ACK
+        self._ack_countdown -= 1
+        if self._ack_countdown:
+            return
+        self._ack_countdown = ACK_SAMPLE_EVERY
+        if len(sent) >= ACK_SAMPLE_CAPACITY:
+            del sent[next(iter(sent))]  # el más antiguo: ese ACK ya no va a llegar
+        sent[id_mensaje] = time.perf_counter()
+
+    # --- Almacenamiento para agentes desconectados ---
+
+    def _store(self, peer, message, frame):
+        destino = message["destino"]
+        requiere_ack = bool(message.get("requiere_ack"))
+        if not self.store.append(destino, message["id_mensaje"], frame, requiere_ack):
+            logger.warning("Backlog for '%s' is full; not storing %s", destino, message["tipo"])
+            return False
+        if requiere_ack:
+            ack = dict(respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"),
+                       datos={"almacenado": True})
+            self.store.when_durable(lambda: self.send(peer, "MESSAGE_ACK", **ack))
+        MESSAGES_STORED.inc()
+        if events.enabled:
+            events.message("stored", message, frame)
+        target = self.peers.get(destino)
+        if target is not None:
+            self._replay(target)
+        return True
+
+    def _hand_off(self, destino):
+        """Sends the backlog of an agent connected to another worker over the bus.
+
+        Returns True once nothing is left stored for ``destino`` here.
+        """
+        bus = self.bus
+        if bus is None or destino not in bus.remote:
+            return False
+        handed = self.store.hand_off(destino, lambda frame: bus.forward(destino, frame))
+        if handed:
+            logger.info("Handed %d stored message(s) for '%s' to worker %d", handed, destino,
+                        bus.remote[destino][0])
+        return not self.store.pending(destino)
+
+    def remote_attached(self, agent_id):
+        """Called by the bus when ``agent_id`` connects to another worker."""
+        if self.store is not None and self.store.pending(agent_id):
+            self._hand_off(agent_id)
+
+    def store_forwarded(self, destino, frame):
+        """Stores a frame the bus brought for an agent that already left this worker.
+
+        Returns:
+            bool: Whether the frame was stored (it is bounced otherwise).
+        """
+        if self.store is None:
+            return False
+        message = decode_frame(frame, validate=False)
+        if message["tipo"] in UNSTORED_TYPES:
+            return False
+        if not self.store.append(destino, message["id_mensaje"], frame, bool(message.get("requiere_ack"))):
+            return False
+        MESSAGES_STORED.inc()
+        return True
+
+    def _acknowledge_replayed(self, peer, message):
+        """Releases the replayed messages covered by a range MESSAGE_ACK from the store."""
+        replayed = peer.replayed
+        # Un ACK simple también libera la entrada de su mensaje
+        replayed.pop((message.get("id_sesion"), message.get("numero_secuencia")), None)
+        bounds = ack_range(message)
+        if bounds is None:
+            return False
+        id_sesion = message["id_sesion"]
+        first, last = bounds
+        if last - first >= len(replayed):
+            keys = [key for key in replayed if key[0] == id_sesion and first <= key[1] <= last]
+        else:
+            keys = [(id_sesion, n) for n in range(first, last + 1) if (id_sesion, n) in replayed]
+        acknowledged = False
+        for key in keys:
+            if self.store.acknowledge_id(peer.agent_id, replayed.pop(key)):
+                acknowledged = True
+        return acknowledged
+
+    def _replay(self, peer):
+        """Moves stored messages for ``peer`` into its delivery queue, as far as flow control allows."""
+        store = self.store
+        agent_id = peer.agent_id
+        if agent_id not in store.backlogs or peer.paused or self.peers.get(agent_id) is not peer:
+            return
+        room = min(self.high_water - 1 - peer.queue.qsize(), self.replay_window - store.in_flight(agent_id))
+        if room <= 0:
+            return
+        payload_format = peer.payload_format
+        for index, frame, requiere_ack in store.next_batch(agent_id, room):
+            message = None
+            if not frame_matches(frame, payload_format):
+                message = decode_frame(frame, validate=False)
+                try:
+                    frame = encode_frame(message, payload_format)
+                except ValueError as e:
+                    # No se puede entregar en el formato del agente: se descarta y se avisa al origen
+                    logger.warning("Dropping stored %s for '%s': %s", message["tipo"], agent_id, e)
+                    self.bounce(frame, "INVALID_MESSAGE_FORMAT", str(e))
+                    store.acknowledge(agent_id, index)
+                    continue
+            if requiere_ack and peer.range_acks:
+                # Para poder liberarlo con un ACK por rango, que no nombra cada id_mensaje
+                if message is None:
+                    message = decode_frame(frame, validate=False)
+                if message.get("id_sesion") is not None and message.get("numero_secuencia") is not None:
+                    peer.replayed[(message["id_sesion"], message["numero_secuencia"])] = message["id_mensaje"]
+            peer.enqueue(frame)
+            MESSAGES_REPLAYED.inc()
+            if not requiere_ack:
+                store.acknowledge(agent_id, index)
+
+    # --- Sesiones ---
+
+    def _track_session(self, message, id_sesion):
+        tipo = message["tipo"]
+        if tipo == "SESSION_INIT":
+            requisitos = (message.get("datos") or {}).get("requisitos")
+            timeout_min = requisitos.get("timeout_min") if isinstance(requisitos, dict) else None
+            if isinstance(timeout_min, bool) or not isinstance(timeout_min, (int, float)) or timeout_min <= 0:
+                timeout_min = None
+            self.sessions.open(id_sesion, message["origen"], message["destino"],
+                               timeout_min * 60 if timeout_min is not None else None)
+            self.directory.session_opened(message["destino"], id_sesion)
+        elif tipo == "SESSION_ACCEPT":
+            self.sessions.accept(id_sesion)
+        else:
+            if tipo == "SESSION_REJECT":
+                self.sessions.remove(id_sesion)
+            else:
+                self.sessions.close(id_sesion)
+            self.directory.session_closed(id_sesion)
+
+    def _session_expired(self, record):
+        self.directory.session_closed(record.id_sesion)
+        for agent_id in (record.initiator, record.responder):
+            self.notify(agent_id, "SESSION_CLOSE", id_sesion=record.id_sesion, datos={"motivo": "Timeout"})
+
+    def _drop_sessions(self, agent_id):
+        dropped = self.sessions.drop_agent(agent_id)
+        for record in dropped:
+            self.directory.session_closed(record.id_sesion)
+            self.notify(record.peer_of(agent_id), "SESSION_CLOSE", id_sesion=record.id_sesion,
+                        datos={"motivo": "Agente desconectado"})
+        if dropped:
+            logger.info("Closed %d session(s) of disconnected agent '%s'", len(dropped), agent_id)
+
+    def deliver(self, destino, frame, message=None):
+        """Queues ``frame`` for a locally connected agent.
+
+        The frame is re-encoded only when it does not match the format the
+        agent negotiated (``frame_matches``: small JSON frames are valid in a
+        dictionary format too). Returns None if the agent is not connected to this
+        process, otherwise whether the frame fit in its delivery queue.
+
+        Raises:
+            ValueError: If the message cannot be represented in the agent's
+                format (e.g. a ``numero_secuencia`` too large for ``acpaas-bin/1``).
+        """
+        target = self.peers.get(destino)
+        if target is None:
+            return None
+        if not frame_matches(frame, target.payload_format):
+            if message is None:
+                message = decode_frame(frame, validate=False)
+            frame = encode_frame(message, target.payload_format)
+        if not target.enqueue(frame):
+            return False
+        if target.queue.qsize() >= self.high_water:
+            self._pause_sender(target, frame, message)
+        return True
+
+    # --- Difusión ---
+
+    def handle_broadcast(self, peer, message):
+        """Fans out a BROADCAST from ``peer`` to local agents and to the other workers."""
+        requiere_ack = message.get("requiere_ack")
+        if requiere_ack:
+            # El hub confirma la difusión; los destinatarios no deben responder todos con ACK
+            message = dict(message, requiere_ack=False)
+        try:
+            delivered, skipped = self.broadcast(message)
+        except ValueError as e:
+            self.send_error(peer, "INVALID_MESSAGE_FORMAT", f"Broadcast cannot be converted: {e}",
+                            respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+            return
+        if requiere_ack:
+            self.send(peer, "MESSAGE_ACK", respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+        MESSAGES_OUT.inc_label(message["tipo"], delivered)
+        if self.bus is not None:
+            self.bus.publish(encode_frame(message))
+        if events.enabled:
+            events.message("broadcast", message, queued=delivered, skipped=skipped)
+
+    def broadcast(self, message):
+        """Queues ``message`` for every local agent matching its filter.
+
+        ``datos.filtro`` may name a ``capacidad`` (agents that announced it)
+        and/or a ``tema`` (agents that listed it in ``temas``). The sender,
+        agents that asked the hub to PAUSE, slow agents and agents whose queue
+        is above the high-water mark are skipped. The message is encoded and
+        framed at most once per payload format; idle recipients get the frame
+        written to their transport on the spot, the others through their writer
+        with a ``broadcast_timeout`` deadline.
+
+        Returns:
+            tuple: ``(queued, skipped)`` recipient counts.
+
+        Raises:
+            ValueError: If the message cannot be encoded in the format of one
+                of the recipients; nothing is queued then.
+        """
+        filtro = (message.get("datos") or {}).get("filtro")
+        if isinstance(filtro, dict):
+            targets = self.directory.recipients(filtro.get("capacidad"), filtro.get("tema"))
+        else:
+            targets = None
+        peers = self.peers
+        if targets is None:
+            recipients = peers.values()
+        else:
+            recipients = [peers[agent_id] for agent_id in targets if agent_id in peers]
+
+        prepared = {}
+        origen = message["origen"]
+        high_water = self.high_water
+        targets = []
+        skipped = 0
+        for target in recipients:
+            if target.agent_id == origen:
+                continue
+            if target.paused or target.slow or target.queue.qsize() >= high_water:
+                skipped += 1
+                continue
+            fmt = target.payload_format
+            if fmt not in prepared:
+                # Se codifica todo antes de encolar: si un formato falla no llega a nadie a medias
+                prepared[fmt] = PreparedFrame(encode_frame(message, fmt))
+            targets.append(target)
+
+        queued = 0
+        for target in targets:
+            frame = prepared[target.payload_format]
+            if self._write_now(target, frame) or target.enqueue(frame):
+                queued += 1
+            else:
+                skipped += 1
+        return queued, skipped
+
+    @staticmethod
+    def _write_now(peer, frame):
+        """Writes ``frame`` to an idle peer's transport without going through its writer.
+
+        Only for connections that take raw frames, with nothing queued and a
+        transport below its high-water mark: everything the writer sent before
+        is already in the transport buffer, so order is kept, and the write
+        cannot block.
+        """
+        if not peer.raw_frames or peer.queue.qsize() or peer.coalescing:
+            return False
+        connection = peer.connection
+        if connection.paused or connection.protocol.state is not State.OPEN:
+            return False
+        connection.transport.write(frame.wire)
+        BYTES_OUT.value += frame.size
+        return True
+
+    def bounce(self, frame, codigo_error, mensaje_error):
+        """Reports a failed remote delivery of ``frame`` back to its ``origen``."""
+        message = decode_frame(frame, validate=False)
+        self.notify(message["origen"], "ERROR", respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"),
+                    datos={
+                        "codigo_error": codigo_error,
+                        "mensaje_error": mensaje_error,
+                        "detalles_adicionales": None,
+                    })
+
+    def notify(self, agent_id, tipo, **fields):
+        """Sends a server-originated message to an agent on any worker."""
+        message = build_message(tipo, self.server_id, agent_id, **fields)
+        frame = encode_frame(message)
+        if self.deliver(agent_id, frame, message) is None and self.bus is not None:
+            self.bus.forward(agent_id, frame)
+
+    # --- Control de flujo ---
+
+    def _pause_sender(self, target, frame, message):
+        if message is None:
+            message = decode_frame(frame, validate=False)
+        sender = message["origen"]
+        if sender in target.paused_senders or sender == self.server_id:
+            return
+        target.paused_senders.add(sender)
+        logger.info("Queue for '%s' at %d frames; pausing '%s'.", target.agent_id, target.queue.qsize(), sender)
+        self.notify(sender, "FLOW_CONTROL", datos={"accion": "PAUSE", "valor": {"destino": target.agent_id}})
+
+    def _resume_senders(self, target):
+        senders, target.paused_senders = target.paused_senders, set()
+        logger.info("Queue for '%s' drained; resuming %d sender(s).", target.agent_id, len(senders))
+        for sender in senders:
+            self.notify(sender, "FLOW_CONTROL", datos={"accion": "RESUME", "valor": {"destino": target.agent_id}})
+
+    def handle_control(self, peer, message):
+        """Answers messages addressed to the server itself."""
+        tipo = message["tipo"]
+        if tipo == "REGISTRO":
+            self.directory.register(peer.agent_id, (message.get("datos") or {}).get("uri"))
+            self.send(peer, "ACK_REGISTRO", respuesta_a=message["id_mensaje"])
+            if self.store is not None and self.store.pending(peer.agent_id):
+                logger.info("Replaying %d stored message(s) to '%s'", self.store.pending(peer.agent_id),
+                            peer.agent_id)
+                self.store.rewind(peer.agent_id)
+                self._replay(peer)
+        elif tipo == "CAPABILITY_ANNOUNCE":
+            datos = message.get("datos") or {}
+            self.directory.announce(peer.agent_id, datos.get("capacidades"), datos.get("max_sesiones_concurrentes"),
+                                    datos.get("temas"))
+            peer.payload_format = negotiate_format(self.payload_formats, datos.get("formatos_payload"))
+            peer.batching = self.batch_messages > 1 and datos.get("lotes") is True
+            peer.range_acks = datos.get("acks_por_rango") is True
+            self.send(peer, "CAPABILITY_ACK", respuesta_a=message["id_mensaje"])
+            self.send(peer, "CAPABILITY_ANNOUNCE", datos={
+                "version_protocolo": "1.1",
+                "capacidades": ["routing"],
+                "max_sesiones_concurrentes": None,
+                "formatos_payload": list(self.payload_formats),
+                "lotes": self.batch_messages > 1,
+                "acks_por_rango": True,
+            })
+        elif tipo == "HEARTBEAT":
+            self.send(peer, "HEARTBEAT_ACK", respuesta_a=message["id_mensaje"])
+        elif tipo == "SESSION_INIT":
+            self.dispatch_session(peer, message)
+        elif tipo == "FLOW_CONTROL":
+            # El agente pide al hub que no le difunda mensajes no críticos
+            peer.paused = (message.get("datos") or {}).get("accion") == "PAUSE"
+            if not peer.paused and self.store is not None:
+                self._replay(peer)
+        elif message.get("requiere_ack"):
+            self.send(peer, "MESSAGE_ACK", respuesta_a=message["id_mensaje"],
+                      id_sesion=message.get("id_sesion"), numero_secuencia=message.get("numero_secuencia"))
+
+    def dispatch_session(self, peer, message):
+        """Routes a SESSION_INIT addressed to the hub to an agent with the required capability.
+
+        The message is forwarded with ``destino`` rewritten to the chosen agent,
+        which answers the initiator directly with SESSION_ACCEPT/REJECT. When no
+        agent qualifies the hub itself answers SESSION_REJECT.
+        """
+        if message.get("requiere_ack"):
+            self.send(peer, "MESSAGE_ACK", respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"))
+        requisitos = (message.get("datos") or {}).get("requisitos") or {}
+        capability = requisitos.get("required_capability") if isinstance(requisitos, dict) else None
+        if not capability:
+            self.send(peer, "SESSION_REJECT", respuesta_a=message["id_mensaje"], id_sesion=message.get("id_sesion"),
+                      datos={"motivo": "SESSION_INIT to the server requires requisitos.required_capability",
+                             "codigo_error": 400})
+            return
+
+        target = self.directory.select(capability, exclude=peer.agent_id)
+        if target is None:
+            known = capability in self.directory.capabilities
+            # El directorio solo ve los agentes de este worker: se pregunta a los demás antes de rechazar
+            bus = self.bus
+            if bus is None or not bus.dispatch(encode_frame(message, FORMAT_JSON), bus.index, known):
+                self._reject_dispatch(message, capability, known)
+            return
+
+        message = dict(message, destino=target.agent_id)
+        logger.debug("Dispatching session %s from '%s' to '%s' (%s)",
+                     message.get("id_sesion"), peer.agent_id, target.agent_id, capability)
+        self.forward(peer, message, encode_frame(message, FORMAT_JSON))
+
+    def dispatch_forwarded(self, frame, origin, known):
+        """Places a SESSION_INIT that the workers before this one had no agent for.
+
+        Called by the bus (``WorkerBus.dispatch``). If no local agent qualifies
+        either, the SESSION_INIT moves on to the next worker, and the last one
+        answers SESSION_REJECT.
+
+        Args:
+            frame: The SESSION_INIT, still addressed to the hub.
+            origin (int): Worker the initiator is connected to.
+            known (bool): Whether a previous worker knew the capability.
+        """
+        message = decode_frame(frame, validate=False)
+        capability = message["datos"]["requisitos"]["required_capability"]
+        target = self.directory.select(capability, exclude=message["origen"])
+        if target is not None:
+            routed = dict(message, destino=target.agent_id)
+            try:
+                delivered = self.deliver(target.agent_id, encode_frame(routed, FORMAT_JSON), routed)
+            except ValueError as e:
+                logger.warning("Cannot dispatch session %s to '%s': %s", routed.get("id_sesion"), target.agent_id, e)
+                delivered = False
+            if delivered:
+                logger.debug("Dispatching session %s from '%s' (worker %d) to '%s' (%s)",
+                             routed.get("id_sesion"), routed["origen"], origin, target.agent_id, capability)
+                MESSAGES_OUT.inc_label("SESSION_INIT")
+                if routed.get("id_sesion") is not None:
+                    self._track_session(routed, routed["id_sesion"])
+                return
+        known = known or capability in self.directory.capabilities
+        if not self.bus.dispatch(frame, origin, known):
+            self._reject_dispatch(message, capability, known)
+
+    def _reject_dispatch(self, message, capability, known):
+        MESSAGES_OUT.inc_label("SESSION_REJECT")
+        self.notify(message["origen"], "SESSION_REJECT", respuesta_a=message["id_mensaje"],
+                    id_sesion=message.get("id_sesion"),
+                    datos={"motivo": ("Recursos insuficientes" if known
+                                      else "Capacidad requerida no soportada") + f": '{capability}'",
+                           "codigo_error": 503 if known else 404})
+
+    # --- Mensajes generados por el servidor ---
+
+    def send(self, peer, tipo, **fields):
+        """Builds a server-originated message and queues it for ``peer``."""
+        message = build_message(tipo, self.server_id, peer.agent_id, **fields)
+        MESSAGES_OUT.inc_label(tipo)
+        return peer.enqueue(encode_frame(message, peer.payload_format))
+
+    def send_error(self, peer, codigo_error, mensaje_error, respuesta_a=None, id_sesion=None):
+        logger.warning("ERROR %s for '%s': %s", codigo_error, peer.agent_id, mensaje_error)
+        return self.send(peer, "ERROR", respuesta_a=respuesta_a, id_sesion=id_sesion, datos={
+            "codigo_error": codigo_error,
+            "mensaje_error": mensaje_error,
+            "detalles_adicionales": None,
+        })
@@ -3,13 +3,34 @@
 
 # server_py.py - WebSocket Secure (WSS) Server with mTLS using asyncio and websockets
 
+import argparse
 import asyncio
+import os
+from http import HTTPStatus
 import websockets
 import ssl
 import pathlib
 import logging
 import sys # Para verificar la ruta
 
+# Permitir importar acpaas_agent_lib y lib/ al ejecutar este archivo como script
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python import tls
+from acpaas_agent_lib.python.codec import MAX_BATCH_MESSAGES, SUPPORTED_FORMATS
+from acpaas_agent_lib.python.compression import (
+    DEFAULT_LEVEL, DEFAULT_MEM_LEVEL, DEFAULT_MIN_SIZE, DEFAULT_WINDOW_BITS, DeflateSettings, DictionaryCodec,
+    protocol_codec)
+from acpaas_agent_lib.python.metrics import REGISTRY, monitor_event_loop
+from acpaas_agent_lib.python.profiler import StackSampler
+from lib.eventlog import DEFAULT_LOG_QUEUE_SIZE, configure_logging
+from lib.liveness import DEFAULT_IDLE_TIMEOUT, DEFAULT_PROBE_TIMEOUT
+from lib.router import DEFAULT_BATCH_BYTES, MessageRouter
+from lib.store import MessageStore
+from lib.workers import WorkerBus, run_workers
+
 # --- 1. Configuración de Logging ---
 log_format = '[%(asctime)s %(levelname)s %(filename)s:%(lineno)d Server] %(message)s'
 logging.basicConfig(level=logging.INFO, format=log_format, datefmt='%Y-%m-%d %H:%M:%S')
@@ -20,7 +41,8 @@ SERVER_PORT = 8080
 
 try:
     SCRIPT_DIR = pathlib.Path(__file__).parent.resolve()
-    CERT_DIR = SCRIPT_DIR / "../scripts"
+    # ACPAAS_CERT_DIR permite usar otro directorio (p. ej. certificados desechables de benchmarks)
+    CERT_DIR = pathlib.Path(os.environ.get("ACPAAS_CERT_DIR", SCRIPT_DIR / "../scripts"))
     if not CERT_DIR.is_dir():
         CERT_DIR = pathlib.Path("../scripts").resolve() # Ajusta si server.py está en raíz
         if not CERT_DIR.is_dir():
@@ -55,16 +77,15 @@ except Exception as e:
 
 # --- 3. Configuración del Contexto SSL ---
 logging.info("Setting up SSL context for mTLS...")
-ssl_server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
 try:
-    ssl_server_context.load_cert_chain(SERVER_CERT, SERVER_KEY)
+    # Contexto compartido (acpaas_agent_lib/python/tls.py): mTLS obligatorio,
+    # TLS >= 1.2 y tickets de sesión para que las reconexiones se reanuden.
+    # Se crea antes del fork de --workers, así todos comparten la clave de tickets.
+    ssl_server_context = tls.server_context(SERVER_CERT, SERVER_KEY, CA_CERT)
     logging.info(f"Loaded server certificate: {SERVER_CERT}")
     logging.info(f"Loaded server key: {SERVER_KEY}")
-    ssl_server_context.load_verify_locations(cafile=CA_CERT)
     logging.info(f"Loaded CA certificate for client verification: {CA_CERT}")
-    ssl_server_context.verify_mode = ssl.CERT_REQUIRED
     logging.info("SSL verify_mode set to CERT_REQUIRED (mTLS enabled).")
-    ssl_server_context.minimum_version = ssl.TLSVersion.TLSv1_2
     logging.info("SSL context configured successfully.")
 except ssl.SSLError as e:
     logging.error(f"FATAL: SSL Error setting up context: {e}")
@@ -74,7 +95,45 @@ except Exception as e:
     sys.exit(1)
 
 
-# --- 4. Handler para Conexiones WebSocket (Función Simple) ---
+# --- 4. Router de mensajes y Handler para Conexiones WebSocket ---
+router = MessageRouter()
+router.register_metrics()
+
+HANDSHAKE_SECONDS = REGISTRY.histogram("acpaas_handshake_seconds",
+                                       "Start of the TLS handshake to WebSocket open (includes the HTTP upgrade)")
+LOOP_LAG_SECONDS = REGISTRY.histogram("acpaas_event_loop_lag_seconds", "How late the event loop runs a timer")
+
+# Perfilador de muestreo, solo con --profiling; se arranca y se para por HTTP
+profiler = None
+
+# permessage-deflate con umbral (setup_compression); None = sin compresión
+deflate = DeflateSettings()
+
+
+async def process_request(connection, request):
+    """Answers plain HTTPS GETs on the WSS port instead of upgrading them.
+
+    ``/metrics`` returns the Prometheus text format. With --profiling,
+    ``/debug/profile/start`` starts sampling the event loop thread,
+    ``/debug/profile`` returns the stacks collected so far (collapsed format)
+    and ``/debug/profile/stop`` stops sampling and returns them.
+    """
+    path = request.path.partition("?")[0]
+    if path == "/metrics":
+        return connection.respond(HTTPStatus.OK, REGISTRY.render())
+    if profiler is not None and path.startswith("/debug/profile"):
+        if path == "/debug/profile/start":
+            profiler.clear()
+            profiler.start()
+            logging.info("Sampling profiler started")
+            return connection.respond(HTTPStatus.OK, "started\n")
+        if path == "/debug/profile/stop":
+            profiler.stop()
+            logging.info("Sampling profiler stopped after %d samples", profiler.samples)
+        return connection.respond(HTTPStatus.OK, profiler.collapsed())
+    return None
+
+
 # Acepta websocket y path, como requiere la librería
 async def connection_handler(websocket):
     """Maneja una conexión WebSocket entrante."""
@@ -87,11 +146,14 @@ async def connection_handler(websocket):
     handler_id = f"{remote_addr[0]}:{remote_addr[1]}"
    
     try:
-        logging.info(f"[{handler_id}] Connection received for path: '{path}'") # Mostrar path
+        logging.info("[%s] Connection received for path: '%s'", handler_id, path) # Mostrar path
         # Obtener info del certificado de cliente
         try:
             ssl_object = websocket.transport.get_extra_info('ssl_object')
             if ssl_object:
+                elapsed = tls.handshake_elapsed(ssl_object)
+                if elapsed is not None:
+                    HANDSHAKE_SECONDS.observe(elapsed)
                 client_cert = ssl_object.getpeercert()
                 if client_cert and 'subject' in client_cert:
                      subject_tuples = client_cert.get('subject', ())
@@ -99,48 +161,51 @@ async def connection_handler(websocket):
                      if cn_tuple:
                          client_cn = cn_tuple[0][1]
             else:
-                logging.warning(f"[{handler_id}] Could not get ssl_object from transport.")
+                logging.warning("[%s] Could not get ssl_object from transport.", handler_id)
         except Exception as cert_e:
-            logging.warning(f"[{handler_id}] Error getting client certificate details: {cert_e}")
+            logging.warning("[%s] Error getting client certificate details: %s", handler_id, cert_e)
 
-        logging.info(f"[{handler_id}] WebSocket Connection opened. Client CN: '{client_cn}'")
+        logging.info("[%s] WebSocket Connection opened. Client CN: '%s'", handler_id, client_cn)
 
-        # Bucle de eco
-        async for message in websocket:
-            logging.info(f"[{handler_id}] Received from CN '{client_cn}': {message}")
-            try:
-                await websocket.send(message)
-                logging.info(f"[{handler_id}] Echoed back to CN '{client_cn}'")
-            except websockets.exceptions.ConnectionClosed:
-                logging.warning(f"[{handler_id}] Tried to echo but connection closing for CN '{client_cn}'.")
-                break
-            except Exception as e:
-                logging.error(f"[{handler_id}] Error sending echo to CN '{client_cn}': {e}")
-                break
+        # Enrutar cada mensaje hacia su 'destino'. Sin CN conocido, el router
+        # usa el 'origen' del primer mensaje como identidad.
+        agent_id = client_cn if client_cn != "Unknown CN" else None
+        await router.serve(websocket, agent_id)
 
     except websockets.exceptions.ConnectionClosedOK:
-        logging.info(f"[{handler_id}] Connection closed normally by CN '{client_cn}'.")
+        logging.info("[%s] Connection closed normally by CN '%s'.", handler_id, client_cn)
     except websockets.exceptions.ConnectionClosedError as e:
-        logging.warning(f"[{handler_id}] Connection closed with error for CN '{client_cn}': Code={e.code}, Reason='{e.reason}'")
+        logging.warning("[%s] Connection closed with error for CN '%s': Code=%s, Reason='%s'", handler_id, client_cn,
+                        e.code, e.reason)
     except Exception as e:
-        logging.error(f"[{handler_id}] Unexpected error in handler for CN '{client_cn}': {type(e).__name__} - {e}")
+        logging.error("[%s] Unexpected error in handler for CN '%s': %s - %s", handler_id, client_cn,
+                      type(e).__name__, e)
         logging.exception("Traceback for unexpected handler error:")
     finally:
-        logging.info(f"[{handler_id}] Handler finished for CN '{client_cn}'.")
+        logging.info("[%s] Handler finished for CN '%s'.", handler_id, client_cn)
 
 
 # --- 5. Iniciar el Servidor ---
-async def main():
-    logging.info(f"Starting WebSocket server on wss://{SERVER_HOST}:{SERVER_PORT}")
+async def main(host=SERVER_HOST, port=SERVER_PORT, reuse_port=False):
+    logging.info(f"Starting WebSocket server on wss://{host}:{port}")
     stop_event = asyncio.Future()
+    # Recarga el certificado si cambia en disco, sin reiniciar el servidor
+    cert_watcher = asyncio.create_task(tls.watch())
+    lag_monitor = asyncio.create_task(monitor_event_loop(LOOP_LAG_SECONDS))
 
     try:
         # Usar async with y pasar la función handler
         async with websockets.serve(
             connection_handler,
-            SERVER_HOST,
-            SERVER_PORT,
-            ssl=ssl_server_context
+            host,
+            port,
+            ssl=ssl_server_context,
+            reuse_port=reuse_port,
+            process_request=process_request,
+            compression=None,
+            extensions=deflate.server_extensions() if deflate else None,
+            # Con --heartbeat-idle la vida de las conexiones la vigila el router, sin un ping por conexión
+            ping_interval=None if router.liveness is not None else 20
         ) as server:
             # Mostrar la dirección real en la que está escuchando
             actual_addr = server.sockets[0].getsockname() if server.sockets else 'unknown socket'
@@ -150,7 +215,7 @@ async def main():
 
     except OSError as e:
         if "Address already in use" in str(e):
-            logging.error(f"FATAL: Port {SERVER_PORT} is already in use.")
+            logging.error(f"FATAL: Port {port} is already in use.")
         else:
             logging.error(f"FATAL: OS Error starting server: {e}")
         sys.exit(1)
@@ -160,14 +225,162 @@ async def main():
         sys.exit(1)
     # No hay 'finally' aquí porque el shutdown se maneja con KeyboardInterrupt
 
+
+# --- 6. Modo multi-proceso (--workers N) ---
+# Cada worker abre su propio socket en el mismo puerto con SO_REUSEPORT y el
+# kernel reparte las conexiones. Los mensajes hacia agentes conectados a otro
+# worker viajan por el WorkerBus (sockets Unix en run_dir).
+async def worker_main(index, count, run_dir, host, port):
+    bus = WorkerBus(index, count, run_dir, router)
+    router.bus = bus
+    await bus.start()
+    try:
+        await main(host, port, reuse_port=True)
+    finally:
+        await bus.close()
+
+
+def run_worker(index, count, run_dir, args):
+    # El hilo de logging no sobrevive al fork: cada worker arranca el suyo
+    setup_logging(args)
+    setup_profiling(args)
+    setup_batching(args)
+    setup_compression(args)
+    setup_liveness(args)
+    # Cada worker guarda en su propio directorio: el agente recibe lo pendiente al volver a ese worker
+    open_store(os.path.join(args.store_dir, f"worker-{index}") if args.store_dir else None)
+    try:
+        asyncio.run(worker_main(index, count, run_dir, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_store()
+
+
+def setup_profiling(args):
+    global profiler
+    if args.profiling:
+        profiler = StackSampler()  # hilo actual: el del bucle de eventos
+
+
+def setup_batching(args):
+    router.batch_messages = args.batch
+    router.batch_bytes = args.batch_bytes
+    router.batch_delay = args.batch_delay / 1000
+
+
+def setup_compression(args):
+    global deflate
+    if args.no_deflate:
+        deflate = None
+    else:
+        deflate = DeflateSettings(args.deflate_min_size, args.deflate_window_bits, args.deflate_mem_level,
+                                  args.deflate_level)
+        logging.info(f"permessage-deflate for messages >= {args.deflate_min_size} bytes, "
+                     f"~{deflate.memory_per_connection() // 1024} KiB per connection")
+    # Los diccionarios de --dictionary se prefieren al del protocolo, que siempre se ofrece
+    codecs = [DictionaryCodec(pathlib.Path(path).read_bytes()).register() for path in args.dictionary]
+    codecs.append(protocol_codec())
+    router.payload_formats = (*(c.format for c in codecs), *SUPPORTED_FORMATS)
+
+
+def setup_liveness(args):
+    if args.heartbeat_idle > 0:
+        router.enable_liveness(args.heartbeat_idle, args.heartbeat_timeout)
+
+
+def setup_logging(args):
+    configure_logging(level=getattr(logging, args.log_level), messages=args.log_messages,
+                      sample_every=args.log_sample, log_bodies=args.log_bodies, queue_size=args.log_queue)
+
+
+def open_store(path):
+    if path:
+        router.store = MessageStore(path)
+        logging.info(f"Storing messages for offline agents in {path}")
+
+
+def close_store():
+    if router.store is not None:
+        router.store.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ACPaaS WSS/mTLS message router")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--store-dir", default=None,
+                        help="Directory for the write-ahead log of messages to offline agents "
+                             "(default: reject them with DESTINATION_NOT_FOUND)")
+    parser.add_argument("--batch", type=int, default=1, metavar="N",
+                        help="Pack up to N queued messages into one batch frame for agents that announce 'lotes' "
+                             "(default: 1, no batching)")
+    parser.add_argument("--batch-bytes", type=int, default=DEFAULT_BATCH_BYTES,
+                        help="Stop adding messages to a batch once it holds this many bytes")
+    parser.add_argument("--batch-delay", type=float, default=0.0, metavar="MS",
+                        help="With --batch, wait this many milliseconds for more messages before writing "
+                             "(default: 0, only batch what is already queued)")
+    parser.add_argument("--no-deflate", action="store_true",
+                        help="Do not negotiate permessage-deflate")
+    parser.add_argument("--deflate-min-size", type=int, default=DEFAULT_MIN_SIZE, metavar="BYTES",
+                        help="Send messages shorter than this uncompressed")
+    parser.add_argument("--deflate-window-bits", type=int, default=DEFAULT_WINDOW_BITS, choices=range(9, 16),
+                        metavar="9-15", help="LZ77 window of each connection (memory per connection grows with it)")
+    parser.add_argument("--deflate-mem-level", type=int, default=DEFAULT_MEM_LEVEL, choices=range(1, 10),
+                        metavar="1-9", help="zlib memLevel of each connection's compressor")
+    parser.add_argument("--deflate-level", type=int, default=DEFAULT_LEVEL, choices=range(0, 10),
+                        metavar="0-9", help="zlib compression level")
+    parser.add_argument("--dictionary", action="append", default=[], metavar="FILE",
+                        help="Offer a dictionary-compressed payload format with this dictionary "
+                             "(see lib/train_dictionary.py); repeatable, preferred in order")
+    parser.add_argument("--heartbeat-idle", type=float, default=DEFAULT_IDLE_TIMEOUT, metavar="SECONDS",
+                        help="Send HEARTBEAT to agents silent for this long; 0 falls back to WebSocket pings "
+                             "(default: %(default)s)")
+    parser.add_argument("--heartbeat-timeout", type=float, default=DEFAULT_PROBE_TIMEOUT, metavar="SECONDS",
+                        help="Close the connection of an agent that stays silent this long after a HEARTBEAT, "
+                             "ending its sessions (default: %(default)s)")
+    parser.add_argument("--profiling", action="store_true",
+                        help="Allow starting the sampling profiler at runtime via GET /debug/profile/start")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--log-messages", action="store_true",
+                        help="Log one structured event per routed message (metadata only)")
+    parser.add_argument("--log-sample", type=int, default=1, metavar="N",
+                        help="With --log-messages, log one of every N messages")
+    parser.add_argument("--log-bodies", action="store_true",
+                        help="With --log-messages, include the full frame in each event")
+    parser.add_argument("--log-queue", type=int, default=DEFAULT_LOG_QUEUE_SIZE,
+                        help="Records buffered for the logging thread before new ones are dropped")
+    args = parser.parse_args()
+    if not 1 <= args.batch <= MAX_BATCH_MESSAGES:
+        parser.error(f"--batch must be between 1 and {MAX_BATCH_MESSAGES}")
+    if args.heartbeat_timeout <= 0:
+        parser.error("--heartbeat-timeout must be positive")
+    return args
+
+
 if __name__ == "__main__":
     logging.info(f"Executing script: {pathlib.Path(__file__).resolve()}")
+    args = parse_args()
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            run_workers(args.workers, lambda index, count, run_dir: run_worker(index, count, run_dir, args))
+        else:
+            setup_logging(args)
+            setup_profiling(args)
+            setup_batching(args)
+            setup_compression(args)
+            setup_liveness(args)
+            open_store(args.store_dir)
+            try:
+                asyncio.run(main(args.host, args.port))
+            finally:
+                close_store()
     except KeyboardInterrupt:
         logging.info("\nCtrl+C received. Stopping server...")
     except Exception as e:
         logging.error(f"Application level error: {type(e).__name__} - {e}")
         logging.exception("Traceback for application error:")
     finally:
-        logging.info("Server process finished.")
\ No newline at end of file
+        logging.info("Server process finished.")
@@ -0,0 +1,221 @@
+# sessions.py - Session state table (PRD 4.4.2/4.4.4) with timer-wheel expiry
+
+import logging
+import math
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+ACTIVE = "active"
+CLOSING = "closing"
+
+DEFAULT_PENDING_TIMEOUT = 30.0
+# Las tareas pueden durar hasta 15 minutos sin tráfico intermedio
+DEFAULT_IDLE_TIMEOUT = 20 * 60.0
+DEFAULT_CLOSING_TIMEOUT = 5.0
+
+
+class SessionRecord:
+    """State of one session between an initiator and a responder agent.
+
+    ``last_activity`` and ``timeout`` are kept in timer wheel ticks, so
+    recording traffic is a single attribute write.
+    """
+
+    __slots__ = ("id_sesion", "initiator", "responder", "state", "timeout", "last_activity", "timer")
+
+    def __init__(self, id_sesion, initiator, responder, timeout, now):
+        self.id_sesion = id_sesion
+        self.initiator = initiator
+        self.responder = responder
+        self.state = PENDING
+        self.timeout = timeout
+        self.last_activity = now
+        self.timer = None
+
+    def peer_of(self, agent_id):
+        """Returns the other participant of the session."""
+        return self.responder if agent_id == self.initiator else self.initiator
+
+
+class SessionTable:
+    """Sessions known to the hub, keyed by ``id_sesion``.
+
+    A session is *pending* from SESSION_INIT until SESSION_ACCEPT, *active*
+    until one side sends SESSION_CLOSE, then *closing* for a short grace
+    period. SESSION_REJECT removes it at once. ``by_agent`` indexes the
+    sessions of each participant, so a disconnect clears an agent's k sessions
+    in O(k).
+
+    Deadlines live in one ``TimerWheel`` with a single timer per session.
+    Traffic on an active session only updates ``last_activity``; when the
+    timer fires early (it may still be the pending one) it is re-armed for the
+    remaining idle time instead of being moved on every message.
+
+    Args:
+        wheel (TimerWheel, optional): Timer wheel driving the deadlines. One is
+            created (and started on first use) if omitted.
+        pending_timeout (float): Seconds to wait for SESSION_ACCEPT/REJECT.
+        idle_timeout (float): Seconds an active session may go without traffic,
+            unless SESSION_INIT asked for ``requisitos.timeout_min``.
+        closing_timeout (float): Seconds a closing session is kept around.
+        on_expired (callable, optional): ``on_expired(record)`` called when a
+            pending or active session times out.
+    """
+
+    def __init__(self, wheel=None, pending_timeout=DEFAULT_PENDING_TIMEOUT, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 closing_timeout=DEFAULT_CLOSING_TIMEOUT, on_expired=None):
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self._owns_wheel = wheel is None
+        self.pending_timeout = pending_timeout
+        self.idle_timeout = idle_timeout
+        self.closing_timeout = closing_timeout
+        self.on_expired = on_expired
+        self.sessions = {}
+        self.by_agent = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, id_sesion):
+        return id_sesion in self.sessions
+
+    def get(self, id_sesion):
+        return self.sessions.get(id_sesion)
+
+    def stop(self):
+        if self._owns_wheel:
+            self.wheel.stop()
+
+    def _ticks(self, seconds):
+        return max(1, math.ceil(seconds / self.wheel.resolution))
+
+    def _arm(self, record, seconds):
+        if record.timer is not None:
+            record.timer.cancel()
+        wheel = self.wheel
+        if self._owns_wheel and not wheel.running:
+            wheel.start()
+        record.timer = wheel.schedule(seconds, self._fire, record)
+
+    # --- Transiciones ---
+
+    def open(self, id_sesion, initiator, responder, timeout=None):
+        """Records a SESSION_INIT. A retransmitted SESSION_INIT returns the existing record.
+
+        Args:
+            timeout (float, optional): Idle timeout for this session once active.
+        """
+        record = self.sessions.get(id_sesion)
+        if record is not None:
+            return record
+        idle = timeout if timeout is not None else self.idle_timeout
+        record = SessionRecord(id_sesion, initiator, responder, self._ticks(idle), self.wheel.current)
+        self.sessions[id_sesion] = record
+        by_agent = self.by_agent
+        for agent_id in (initiator, responder):
+            ids = by_agent.get(agent_id)
+            if ids is None:
+                by_agent[agent_id] = {id_sesion}
+            else:
+                ids.add(id_sesion)
+        self._arm(record, self.pending_timeout)
+        return record
+
+    def accept(self, id_sesion):
+        """Marks a pending session active (SESSION_ACCEPT).
+
+        The pending timer is kept: when it fires the session is active and gets
+        re-armed for the rest of its idle timeout, so accepting allocates nothing.
+        """
+        record = self.sessions.get(id_sesion)
+        if record is None or record.state != PENDING:
+            return record
+        record.state = ACTIVE
+        record.last_activity = self.wheel.current
+        return record
+
+    def close(self, id_sesion):
+        """Handles a SESSION_CLOSE: the first one starts the grace period, the reply ends it."""
+        record = self.sessions.get(id_sesion)
+        if record is None:
+            return None
+        if record.state == CLOSING:
+            return self.remove(id_sesion)
+        record.state = CLOSING
+        self._arm(record, self.closing_timeout)
+        return record
+
+    def touch(self, id_sesion):
+        """Notes traffic on a session, postponing its idle timeout."""
+        record = self.sessions.get(id_sesion)
+        if record is not None:
+            record.last_activity = self.wheel.current
+
+    def remove(self, id_sesion):
+        """Forgets a session (SESSION_REJECT, end of closing). Returns its record, if any."""
+        record = self.sessions.pop(id_sesion, None)
+        if record is None:
+            return None
+        if record.timer is not None:
+            record.timer.cancel()
+            record.timer = None
+        by_agent = self.by_agent
+        for agent_id in (record.initiator, record.responder):
+            ids = by_agent.get(agent_id)
+            if ids is not None:
+                ids.discard(id_sesion)
+                if not ids:
+                    del by_agent[agent_id]
+        return record
+
+    def drop_agent(self, agent_id):
+        """Removes every session ``agent_id`` takes part in. Returns their records."""
+        ids = self.by_agent.pop(agent_id, None)
+        if not ids:
+            return []
+        sessions = self.sessions
+        by_agent = self.by_agent
+        dropped = []
+        for id_sesion in ids:
+            record = sessions.pop(id_sesion)
+            if record.timer is not None:
+                record.timer.cancel()
+                record.timer = None
+            other = record.peer_of(agent_id)
+            others = by_agent.get(other)
+            if others is not None:
+                others.discard(id_sesion)
+                if not others:
+                    del by_agent[other]
+            dropped.append(record)
+        return dropped
+
+    # --- Vencimientos ---
+
+    def _fire(self, record):
+        record.timer = None
+        if self.sessions.get(record.id_sesion) is not record:
+            return
+        if record.state == ACTIVE:
+            remaining = record.last_activity + record.timeout - self.wheel.current
+            if remaining > 0:
+                # Hubo tráfico desde que se programó: volver a armar por lo que falta
+                record.timer = self.wheel.schedule(remaining * self.wheel.resolution, self._fire, record)
+                return
+        self.remove(record.id_sesion)
+        if record.state == CLOSING:
+            return
+        logger.info("Session %s (%s -> %s) expired while %s", record.id_sesion, record.initiator,
+                    record.responder, record.state)
+        if self.on_expired is not None:
+            self.on_expired(record)
+
+    def snapshot(self):
+        """Counts sessions per state (for logs and debugging)."""
+        counts = {PENDING: 0, ACTIVE: 0, CLOSING: 0}
+        for record in self.sessions.values():
+            counts[record.state] += 1
+        return counts
@@ -0,0 +1,429 @@
+# store.py - Store-and-forward for offline agents: segmented write-ahead log indexed by destino
+
+import array
+import asyncio
+import logging
+import os
+import struct
+import uuid
+import zlib
+
+from acpaas_agent_lib.python.reliability import DedupWindow
+
+logger = logging.getLogger(__name__)
+
+KIND_APPEND = 0
+KIND_ACK = 1
+
+FLAG_TEXT = 0x01
+FLAG_REQUIERE_ACK = 0x02
+
+_CRC = struct.Struct("!I")
+_HEAD = struct.Struct("!IBB16sH")   # longitud del cuerpo, tipo, flags, id_mensaje, longitud del destino
+_POSITION = struct.Struct("!Q")
+_RECORD_OVERHEAD = _CRC.size + _HEAD.size
+_OFFSET_BITS = 40                   # posición = segmento << 40 | desplazamiento
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_SYNC_INTERVAL = 0.01
+DEFAULT_MAX_BACKLOG = 100_000
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+class _Segment:
+    __slots__ = ("number", "path", "fd", "size", "live", "ack_refs")
+
+    def __init__(self, number, path):
+        self.number = number
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self.size = os.fstat(self.fd).st_size
+        self.live = 0
+        self.ack_refs = set()
+
+
+class _Backlog:
+    """Stored messages of one destination, oldest first.
+
+    ``positions``/``lengths`` locate each record in the log (12 bytes per
+    message). Indices are absolute: entry ``i`` lives at ``i - base``.
+    Everything before ``head`` is acknowledged; ``cursor`` is the next entry to
+    replay; ``inflight`` maps the ``id_mensaje`` of replayed ``requiere_ack``
+    messages to their index until the agent's MESSAGE_ACK arrives.
+    """
+
+    __slots__ = ("positions", "lengths", "acked", "base", "head", "cursor", "pending", "inflight")
+
+    def __init__(self):
+        self.positions = array.array("Q")
+        self.lengths = array.array("I")
+        self.acked = bytearray()
+        self.base = 0
+        self.head = 0
+        self.cursor = 0
+        self.pending = 0
+        self.inflight = {}
+
+    def add(self, position, length):
+        self.positions.append(position)
+        self.lengths.append(length)
+        self.acked.append(0)
+        self.pending += 1
+
+    def end(self):
+        return self.base + len(self.positions)
+
+    def compact(self):
+        drop = self.head - self.base
+        if drop > 4096 and drop * 2 > len(self.positions):
+            del self.positions[:drop]
+            del self.lengths[:drop]
+            del self.acked[:drop]
+            self.base = self.head
+
+
+class MessageStore:
+    """Durable queue of frames for agents that are not connected.
+
+    Frames are appended to numbered segment files under ``path``. Each record
+    carries a CRC32, so a torn write at the tail is cut off on recovery. The
+    in-memory index only keeps the position and length of each pending
+    record per ``destino``; frames are read back from the log on replay.
+
+    Appends go through a write buffer. ``when_durable`` callbacks run after
+    the next fsync, which happens at most ``sync_interval`` seconds later and
+    covers every append since the previous one (group commit). Acknowledged
+    messages get an ACK record. A segment is deleted once all its messages
+    are acknowledged and the segments its ACK records refer to are gone.
+
+    Args:
+        path (str): Directory holding the segment files.
+        segment_bytes (int): Size at which a new segment is started.
+        sync_interval (float): Maximum delay before appends are fsynced.
+        max_backlog (int): Pending messages kept per destination; ``append``
+            refuses more.
+    """
+
+    def __init__(self, path, segment_bytes=DEFAULT_SEGMENT_BYTES, sync_interval=DEFAULT_SYNC_INTERVAL,
+                 max_backlog=DEFAULT_MAX_BACKLOG, dedup_capacity=100_000):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.sync_interval = sync_interval
+        self.max_backlog = max_backlog
+        self.dedup = DedupWindow(dedup_capacity)
+        self.segments = {}
+        self.backlogs = {}
+        self._active = None
+        self._buffer = bytearray()
+        self._waiters = []
+        self._sync_handle = None
+        os.makedirs(path, exist_ok=True)
+        self._recover()
+
+    def __len__(self):
+        return sum(backlog.pending for backlog in self.backlogs.values())
+
+    def pending(self, destino):
+        backlog = self.backlogs.get(destino)
+        return backlog.pending if backlog is not None else 0
+
+    def in_flight(self, destino):
+        backlog = self.backlogs.get(destino)
+        return len(backlog.inflight) if backlog is not None else 0
+
+    # --- Escritura ---
+
+    def append(self, destino, id_mensaje, frame, requiere_ack=False):
+        """Stores ``frame`` for ``destino``.
+
+        Returns:
+            bool: False if the destination's backlog is full. A frame whose
+            ``id_mensaje`` was stored recently (a retransmission) counts as stored.
+        """
+        backlog = self.backlogs.get(destino)
+        if backlog is not None and backlog.pending >= self.max_backlog:
+            return False
+        if self.dedup.check(id_mensaje):
+            return True
+        if isinstance(frame, str):
+            payload = frame.encode("utf-8")
+            flags = FLAG_TEXT
+        else:
+            payload = bytes(frame)
+            flags = 0
+        if requiere_ack:
+            flags |= FLAG_REQUIERE_ACK
+        segment, position, length = self._write(KIND_APPEND, flags, uuid.UUID(id_mensaje).bytes, destino, payload)
+        segment.live += 1
+        if backlog is None:
+            backlog = self.backlogs[destino] = _Backlog()
+        backlog.add(position, length)
+        return True
+
+    def _write(self, kind, flags, id_bytes, destino, payload):
+        encoded = destino.encode("utf-8")
+        length = _RECORD_OVERHEAD + len(encoded) + len(payload)
+        segment = self._active
+        if segment.size and segment.size + length > self.segment_bytes:
+            segment = self._rotate()
+        head = _HEAD.pack(len(encoded) + len(payload), kind, flags, id_bytes, len(encoded))
+        buffer = self._buffer
+        buffer += _CRC.pack(zlib.crc32(payload, zlib.crc32(encoded, zlib.crc32(head))))
+        buffer += head
+        buffer += encoded
+        buffer += payload
+        position = segment.number << _OFFSET_BITS | segment.size
+        segment.size += length
+        if len(buffer) >= _WRITE_BUFFER_BYTES:
+            self._flush_buffer()
+        return segment, position, length
+
+    def _flush_buffer(self):
+        buffer = self._buffer
+        if buffer:
+            view = memoryview(buffer)
+            fd = self._active.fd
+            while view:
+                view = view[os.write(fd, view):]
+            view.release()
+            del buffer[:]
+
+    def _rotate(self):
+        self.sync()
+        number = self._active.number + 1
+        segment = self._active = self.segments[number] = self._open_segment(number)
+        self._collect()
+        return segment
+
+    def _open_segment(self, number):
+        return _Segment(number, os.path.join(self.path, f"{number:016d}.wal"))
+
+    # --- Durabilidad ---
+
+    def sync(self):
+        """Writes and fsyncs everything appended so far, then runs the durability callbacks."""
+        self._flush_buffer()
+        os.fsync(self._active.fd)
+        waiters, self._waiters = self._waiters, []
+        for callback in waiters:
+            callback()
+
+    def when_durable(self, callback):
+        """Runs ``callback()`` once the appends made so far are on disk."""
+        self._waiters.append(callback)
+        if self._sync_handle is None:
+            self._sync_handle = asyncio.get_running_loop().call_later(self.sync_interval, self._start_sync)
+
+    def _start_sync(self):
+        asyncio.ensure_future(self._sync_async())
+
+    async def _sync_async(self):
+        self._sync_handle = None
+        waiters, self._waiters = self._waiters, []
+        self._flush_buffer()
+        try:
+            # fsync fuera del bucle de eventos; los append siguientes van al buffer entretanto
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._active.fd)
+        except OSError as e:
+            logger.error("fsync of %s failed: %s", self._active.path, e)
+            return
+        for callback in waiters:
+            callback()
+
+    # --- Reenvío ---
+
+    def next_batch(self, destino, limit):
+        """Reads up to ``limit`` stored frames for ``destino`` to replay.
+
+        Returns:
+            list: ``(index, frame, requiere_ack)`` tuples; pass ``index`` to
+            ``acknowledge`` once the message needs no further delivery.
+        """
+        backlog = self.backlogs.get(destino)
+        batch = []
+        if backlog is None:
+            return batch
+        if self._buffer:
+            self._flush_buffer()
+        segments = self.segments
+        end = backlog.end()
+        while backlog.cursor < end and len(batch) < limit:
+            index = backlog.cursor
+            backlog.cursor += 1
+            local = index - backlog.base
+            if backlog.acked[local]:
+                continue
+            frame, flags, id_bytes = self._read(segments, backlog, local)
+            requiere_ack = bool(flags & FLAG_REQUIERE_ACK)
+            if requiere_ack:
+                backlog.inflight[str(uuid.UUID(bytes=id_bytes))] = index
+            batch.append((index, frame, requiere_ack))
+        return batch
+
+    @staticmethod
+    def _read(segments, backlog, local):
+        position = backlog.positions[local]
+        segment = segments[position >> _OFFSET_BITS]
+        data = os.pread(segment.fd, backlog.lengths[local], position & ((1 << _OFFSET_BITS) - 1))
+        _, _, flags, id_bytes, destino_length = _HEAD.unpack_from(data, _CRC.size)
+        payload = data[_RECORD_OVERHEAD + destino_length:]
+        return (payload.decode("utf-8") if flags & FLAG_TEXT else payload), flags, id_bytes
+
+    def hand_off(self, destino, send):
+        """Passes the stored messages for ``destino`` to ``send(frame)`` in order.
+
+        For an agent connected to another worker: every frame ``send`` accepts
+        is acknowledged here, since delivering it is now up to that worker.
+        Stops at the first frame ``send`` refuses; it and the rest stay stored
+        and are handed off or replayed from there next time.
+
+        Returns:
+            int: Number of messages handed off.
+        """
+        backlog = self.backlogs.get(destino)
+        if backlog is None:
+            return 0
+        if self._buffer:
+            self._flush_buffer()
+        # Lo que estaba en vuelo hacia una conexión anterior también pasa al otro worker
+        backlog.inflight.clear()
+        segments = self.segments
+        handed = 0
+        index = backlog.head
+        while self.backlogs.get(destino) is backlog and index < backlog.end():
+            local = index - backlog.base
+            if not backlog.acked[local]:
+                if not send(self._read(segments, backlog, local)[0]):
+                    break
+                self.acknowledge(destino, index)
+                handed += 1
+            index += 1
+        backlog.cursor = backlog.head
+        return handed
+
+    def acknowledge_id(self, destino, id_mensaje):
+        """Acknowledges a replayed message by ``id_mensaje`` (its MESSAGE_ACK arrived)."""
+        backlog = self.backlogs.get(destino)
+        if backlog is None:
+            return False
+        index = backlog.inflight.pop(id_mensaje, None)
+        if index is None:
+            return False
+        self.acknowledge(destino, index)
+        return True
+
+    def acknowledge(self, destino, index):
+        """Marks a stored message delivered so it is neither replayed again nor kept on disk."""
+        backlog = self.backlogs.get(destino)
+        if backlog is None:
+            return
+        local = index - backlog.base
+        if local < 0 or backlog.acked[local]:
+            return
+        backlog.acked[local] = 1
+        backlog.pending -= 1
+        position = backlog.positions[local]
+        number = position >> _OFFSET_BITS
+        active = self._write(KIND_ACK, 0, bytes(16), destino, _POSITION.pack(position))[0]
+        if number != active.number:
+            active.ack_refs.add(number)
+        acked = backlog.acked
+        end = backlog.end()
+        while backlog.head < end and acked[backlog.head - backlog.base]:
+            backlog.head += 1
+        if backlog.head == end and not backlog.inflight:
+            del self.backlogs[destino]
+        else:
+            backlog.compact()
+        segment = self.segments.get(number)
+        if segment is not None:
+            segment.live -= 1
+            if not segment.live and segment is not self._active:
+                self._collect()
+
+    def rewind(self, destino):
+        """Replays unacknowledged messages again from the oldest (after a disconnect)."""
+        backlog = self.backlogs.get(destino)
+        if backlog is not None:
+            backlog.cursor = backlog.head
+            backlog.inflight.clear()
+
+    # --- Compactación y recuperación ---
+
+    def _collect(self):
+        segments = self.segments
+        for number in sorted(segments):
+            segment = segments[number]
+            if segment is self._active or segment.live:
+                continue
+            if any(ref in segments for ref in segment.ack_refs):
+                continue  # sus ACK aún hacen falta para segmentos anteriores
+            del segments[number]
+            os.close(segment.fd)
+            os.unlink(segment.path)
+            logger.debug("Deleted fully acknowledged WAL segment %s", segment.path)
+
+    def _recover(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.path)
+                         if name.endswith(".wal") and name[:-4].isdigit())
+        entries = {}
+        acked = set()
+        for number in numbers:
+            segment = self.segments[number] = self._open_segment(number)
+            self._scan(segment, entries, acked)
+        for destino, (positions, lengths) in entries.items():
+            backlog = None
+            for position, length in zip(positions, lengths):
+                if position in acked:
+                    continue
+                if backlog is None:
+                    backlog = self.backlogs[destino] = _Backlog()
+                backlog.add(position, length)
+                self.segments[position >> _OFFSET_BITS].live += 1
+        number = numbers[-1] + 1 if numbers else 0
+        self._active = self.segments[number] = self._open_segment(number)
+        self._collect()
+        if self.backlogs:
+            logger.info("Recovered %d stored message(s) for %d agent(s) from %s", len(self), len(self.backlogs),
+                        self.path)
+
+    def _scan(self, segment, entries, acked):
+        with open(segment.path, "rb") as f:
+            data = f.read()
+        offset = 0
+        size = len(data)
+        base = segment.number << _OFFSET_BITS
+        while offset + _RECORD_OVERHEAD <= size:
+            crc, = _CRC.unpack_from(data, offset)
+            body_length, kind, flags, id_bytes, destino_length = _HEAD.unpack_from(data, offset + _CRC.size)
+            end = offset + _RECORD_OVERHEAD + body_length
+            if end > size or zlib.crc32(data[offset + _CRC.size:end]) != crc:
+                break
+            start = offset + _RECORD_OVERHEAD
+            destino = data[start:start + destino_length].decode("utf-8")
+            if kind == KIND_APPEND:
+                # Una retransmisión de algo ya guardado antes del reinicio no se duplica
+                self.dedup.check(str(uuid.UUID(bytes=id_bytes)))
+                positions, lengths = entries.get(destino) or entries.setdefault(
+                    destino, (array.array("Q"), array.array("I")))
+                positions.append(base | offset)
+                lengths.append(end - offset)
+            elif kind == KIND_ACK:
+                target, = _POSITION.unpack_from(data, start + destino_length)
+                acked.add(target)
+                if target >> _OFFSET_BITS != segment.number:
+                    segment.ack_refs.add(target >> _OFFSET_BITS)
+            offset = end
+        if offset < size:
+            logger.warning("Truncating %s at byte %d: torn or corrupt record", segment.path, offset)
+            os.ftruncate(segment.fd, offset)
+            segment.size = offset
+
+    def close(self):
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        self.sync()
+        for segment in self.segments.values():
+            os.close(segment.fd)
+        self.segments = {}
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# train_dictionary.py - Entrena un diccionario para el formato acpaas-zdict (PROTOCOL_SPEC 3.5)
+#
+# Lee mensajes de muestra, uno por línea en JSON (p. ej. tráfico real capturado),
+# y escribe el diccionario para pasarlo al hub y a los agentes:
+#
+#   python lib/train_dictionary.py muestras.jsonl -o trafico.dict
+#   python lib/server.py --dictionary trafico.dict
+#
+# Sin ficheros de muestra usa el corpus del diccionario integrado del protocolo.
+
+import argparse
+import pathlib
+import sys
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python.compression import (
+    DEFAULT_DICTIONARY_SIZE, DictionaryCodec, protocol_samples, train_dictionary)
+
+
+def read_samples(paths):
+    samples = []
+    for path in paths:
+        with open(path, "rb") as f:
+            samples.extend(line.strip() for line in f if line.strip())
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a preset dictionary for dictionary-compressed payloads")
+    parser.add_argument("samples", nargs="*", help="Files with one JSON message per line")
+    parser.add_argument("-o", "--output", required=True, help="Where to write the dictionary")
+    parser.add_argument("--size", type=int, default=DEFAULT_DICTIONARY_SIZE, help="Dictionary size in bytes")
+    args = parser.parse_args()
+
+    samples = read_samples(args.samples) if args.samples else protocol_samples()
+    try:
+        dictionary = train_dictionary(samples, size=args.size)
+        format_name = DictionaryCodec(dictionary).format
+    except ValueError as e:
+        sys.exit(f"train_dictionary: {e}")
+    pathlib.Path(args.output).write_bytes(dictionary)
+    print(f"{len(dictionary)} bytes from {len(samples)} samples, format {format_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# workers.py - Multi-process SO_REUSEPORT workers and the inter-worker routing bus
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+
+from acpaas_agent_lib.python.codec import decode_frame
+
+logger = logging.getLogger(__name__)
+
+# Tipos de frame del bus
+KIND_HELLO = 0
+KIND_ATTACH = 1
+KIND_DETACH = 2
+KIND_FORWARD = 3
+KIND_BROADCAST = 4
+KIND_DISPATCH = 5
+
+_HEADER = struct.Struct("!IB")      # longitud del cuerpo, tipo
+_AGENT = struct.Struct("!QH")       # stamp, longitud del agent_id
+_FORWARD = struct.Struct("!HB")     # longitud del destino, 1 si el frame es texto
+_BROADCAST = struct.Struct("!B")    # 1 si el frame es texto
+_DISPATCH = struct.Struct("!HB")    # worker del iniciador, 1 si algún worker conoce la capacidad
+
+# Si el buffer hacia otro worker supera esto, se trata como cola llena
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+RECONNECT_DELAY = 0.1
+RECONNECT_DELAY_MAX = 2.0
+
+
+class WorkerBus:
+    """Local channel between server workers over Unix domain sockets.
+
+    Every worker listens on ``<run_dir>/worker-<index>.sock`` and keeps one
+    outbound stream to each other worker. Workers announce the agents they
+    accept (ATTACH) and lose (DETACH), so each process holds a replica of the
+    agent directory as ``agent_id -> (worker, stamp)``. The stamp is the attach
+    time in nanoseconds; when the same agent shows up on two workers the newest
+    attachment wins and the older worker evicts its connection.
+    """
+
+    def __init__(self, index, count, run_dir, router):
+        self.index = index
+        self.count = count
+        self.run_dir = run_dir
+        self.router = router
+        self.remote = {}
+        self.local_stamps = {}
+        self.writers = {}
+        self._server = None
+        self._tasks = []
+
+    def socket_path(self, index):
+        return os.path.join(self.run_dir, f"worker-{index}.sock")
+
+    async def start(self):
+        path = self.socket_path(self.index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = await asyncio.start_unix_server(self._handle_inbound, path=path)
+        loop = asyncio.get_running_loop()
+        for other in range(self.count):
+            if other != self.index:
+                self._tasks.append(loop.create_task(self._maintain_outbound(other)))
+        logger.info("Worker %d bus listening on %s", self.index, path)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for writer in self.writers.values():
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- Directorio replicado ---
+
+    def agent_attached(self, agent_id):
+        stamp = time.time_ns()
+        self.local_stamps[agent_id] = stamp
+        self.remote.pop(agent_id, None)
+        self._broadcast(KIND_ATTACH, self._agent_body(agent_id, stamp))
+
+    def agent_detached(self, agent_id):
+        stamp = self.local_stamps.pop(agent_id, None)
+        if stamp is not None:
+            self._broadcast(KIND_DETACH, self._agent_body(agent_id, stamp))
+
+    def _on_attach(self, worker, agent_id, stamp):
+        local = self.local_stamps.get(agent_id)
+        if local is not None:
+            if local > stamp:
+                return
+            self.local_stamps.pop(agent_id)
+            self.router.evict(agent_id)
+        current = self.remote.get(agent_id)
+        if current is None or current[1] <= stamp:
+            self.remote[agent_id] = (worker, stamp)
+            # Lo guardado aquí para el agente sigue al worker donde está ahora
+            self.router.remote_attached(agent_id)
+
+    def _on_detach(self, worker, agent_id, stamp):
+        if self.remote.get(agent_id) == (worker, stamp):
+            del self.remote[agent_id]
+
+    def _forget_worker(self, worker):
+        stale = [agent_id for agent_id, (owner, _) in self.remote.items() if owner == worker]
+        for agent_id in stale:
+            del self.remote[agent_id]
+        if stale:
+            logger.warning("Worker %d lost bus link to worker %d; dropped %d remote agents.",
+                           self.index, worker, len(stale))
+
+    # --- Reenvío ---
+
+    def forward(self, destino, frame):
+        """Sends ``frame`` to the worker that owns ``destino``.
+
+        Returns None if no worker owns the agent, False if the link to the owner
+        is down or saturated, True once the frame is written to the bus.
+        """
+        owner = self.remote.get(destino)
+        if owner is None:
+            return None
+        writer = self.writers.get(owner[0])
+        if writer is None or writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            return False
+        is_text = isinstance(frame, str)
+        payload = frame.encode("utf-8") if is_text else bytes(frame)
+        destino_bytes = destino.encode("utf-8")
+        body = _FORWARD.pack(len(destino_bytes), is_text) + destino_bytes + payload
+        writer.write(_HEADER.pack(len(body), KIND_FORWARD) + body)
+        return True
+
+    def publish(self, frame):
+        """Sends a BROADCAST frame to every other worker for local fan-out."""
+        is_text = isinstance(frame, str)
+        payload = frame.encode("utf-8") if is_text else bytes(frame)
+        body = _BROADCAST.pack(is_text) + payload
+        data = _HEADER.pack(len(body), KIND_BROADCAST) + body
+        for other, writer in self.writers.items():
+            if writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                logger.warning("Bus link to worker %d saturated; dropping broadcast.", other)
+                continue
+            writer.write(data)
+
+    def dispatch(self, frame, origin, known):
+        """Passes a SESSION_INIT no local agent can take to the next worker in index order.
+
+        ``frame`` is the JSON SESSION_INIT addressed to the hub; ``origin`` is
+        the worker of the initiator, where the round ends. Returns False when
+        there is no further worker to ask, so the caller rejects the session.
+        """
+        for step in range(1, self.count):
+            other = (self.index + step) % self.count
+            if other == origin:
+                break
+            writer = self.writers.get(other)
+            if writer is None or writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                continue
+            body = _DISPATCH.pack(origin, known) + frame.encode("utf-8")
+            writer.write(_HEADER.pack(len(body), KIND_DISPATCH) + body)
+            return True
+        return False
+
+    def _on_dispatch(self, body):
+        origin, known = _DISPATCH.unpack_from(body)
+        self.router.dispatch_forwarded(body[_DISPATCH.size:].decode("utf-8"), origin, bool(known))
+
+    def _on_broadcast(self, body):
+        is_text, = _BROADCAST.unpack_from(body)
+        payload = body[_BROADCAST.size:]
+        frame = payload.decode("utf-8") if is_text else payload
+        try:
+            self.router.broadcast(decode_frame(frame, validate=False))
+        except ValueError as e:
+            self.router.bounce(frame, "INVALID_MESSAGE_FORMAT", f"Broadcast cannot be converted: {e}")
+
+    def _on_forward(self, body):
+        destino_len, is_text = _FORWARD.unpack_from(body)
+        offset = _FORWARD.size
+        destino = body[offset:offset + destino_len].decode("utf-8")
+        payload = body[offset + destino_len:]
+        frame = payload.decode("utf-8") if is_text else payload
+        try:
+            delivered = self.router.deliver(destino, frame)
+        except ValueError as e:
+            self.router.bounce(frame, "INVALID_MESSAGE_FORMAT",
+                               f"Message cannot be converted to the format of '{destino}': {e}")
+            return
+        if delivered is None:
+            if self.router.store_forwarded(destino, frame):
+                return
+            self.router.bounce(frame, "DESTINATION_NOT_FOUND", f"Agent '{destino}' is not connected")
+        elif not delivered:
+            self.router.bounce(frame, "RATE_LIMIT_EXCEEDED", f"Delivery queue for '{destino}' is full")
+
+    # --- Transporte ---
+
+    @staticmethod
+    def _agent_body(agent_id, stamp):
+        encoded = agent_id.encode("utf-8")
+        return _AGENT.pack(stamp, len(encoded)) + encoded
+
+    @staticmethod
+    def _parse_agent(body):
+        stamp, length = _AGENT.unpack_from(body)
+        return body[_AGENT.size:_AGENT.size + length].decode("utf-8"), stamp
+
+    def _broadcast(self, kind, body):
+        frame = _HEADER.pack(len(body), kind) + body
+        for writer in self.writers.values():
+            writer.write(frame)
+
+    async def _maintain_outbound(self, other):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path(other))
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+            delay = RECONNECT_DELAY
+            hello = struct.pack("!H", self.index)
+            writer.write(_HEADER.pack(len(hello), KIND_HELLO) + hello)
+            # Instantánea de los agentes locales para que el otro worker se ponga al día
+            for agent_id, stamp in self.local_stamps.items():
+                body = self._agent_body(agent_id, stamp)
+                writer.write(_HEADER.pack(len(body), KIND_ATTACH) + body)
+            self.writers[other] = writer
+            logger.info("Worker %d connected to worker %d", self.index, other)
+            try:
+                # El otro extremo nunca escribe: read() solo vuelve al cerrarse el enlace
+                await reader.read()
+            except OSError:
+                pass
+            finally:
+                if self.writers.get(other) is writer:
+                    del self.writers[other]
+                writer.close()
+
+    async def _handle_inbound(self, reader, writer):
+        worker = None
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                length, kind = _HEADER.unpack(header)
+                body = await reader.readexactly(length)
+                if kind == KIND_FORWARD:
+                    self._on_forward(body)
+                elif kind == KIND_BROADCAST:
+                    self._on_broadcast(body)
+                elif kind == KIND_DISPATCH:
+                    self._on_dispatch(body)
+                elif kind == KIND_ATTACH:
+                    self._on_attach(worker, *self._parse_agent(body))
+                elif kind == KIND_DETACH:
+                    self._on_detach(worker, *self._parse_agent(body))
+                elif kind == KIND_HELLO:
+                    worker = struct.unpack("!H", body)[0]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            if worker is not None:
+                self._forget_worker(worker)
+
+
+def run_workers(count, target, run_dir=None):
+    """Forks ``count`` worker processes running ``target(index, count, run_dir)``.
+
+    Each worker is expected to bind the shared port with SO_REUSEPORT so the
+    kernel spreads incoming connections across them. Workers that die are
+    restarted with the same index; the call returns when interrupted.
+    """
+    owns_run_dir = run_dir is None
+    if owns_run_dir:
+        run_dir = tempfile.mkdtemp(prefix="acpaas-workers-")
+    context = multiprocessing.get_context("fork")
+
+    def spawn(index):
+        process = context.Process(target=target, args=(index, count, run_dir), name=f"acpaas-worker-{index}")
+        process.start()
+        logger.info("Started worker %d (pid %d)", index, process.pid)
+        return process
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # SIGTERM se trata como Ctrl+C (los workers heredan el handler al hacer fork)
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+    processes = [spawn(index) for index in range(count)]
+    try:
+        while True:
+            for index, process in enumerate(processes):
+                process.join(timeout=0.5 / count)
+                if not process.is_alive():
+                    logger.error("Worker %d exited with code %s; restarting.", index, process.exitcode)
+                    processes[index] = spawn(index)
+    except KeyboardInterrupt:
+        logger.info("Stopping %d workers...", count)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        signal.signal(signal.SIGTERM, previous_handler)
+        if owns_run_dir:
+            shutil.rmtree(run_dir, ignore_errors=True)
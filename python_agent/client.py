@@ -1,15 +1,28 @@
 # client_py.py
 import asyncio
-import websockets
 import ssl
 import pathlib
 import logging
+import sys
+import time
+
+# Permitir importar acpaas_agent_lib al ejecutar este archivo como script
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from acpaas_agent_lib.python import tls
+from acpaas_agent_lib.python.agent_client import AgentClient
+from acpaas_agent_lib.python.codec import SUPPORTED_FORMATS
+from acpaas_agent_lib.python.compression import protocol_codec
 
 # Configuración de Logging
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s Client] %(message)s')
 
 # --- Configuración de Rutas y SSL ---
 SERVER_URL = "wss://localhost:8080/" # URL del servidor (usa localhost)
+AGENT_ID = "agente_py"
+CONNECT_TIMEOUT = 10.0
 SCRIPT_DIR = pathlib.Path(__file__).parent
 
 CERT_DIR = SCRIPT_DIR / "../scripts" # Asume que los certs están en 'scripts' relativo a este archivo
@@ -25,22 +38,10 @@ for f in [CLIENT_CERT, CLIENT_KEY, CA_CERT]:
         exit(1)
 
 logging.info("Setting up SSL context for mTLS...")
-ssl_client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
 try:
-    # 1. Cargar el certificado y la clave del PROPIO cliente
-    ssl_client_context.load_cert_chain(CLIENT_CERT, CLIENT_KEY)
-
-    # 2. Cargar la CA que se usará para verificar el certificado del SERVIDOR
-    ssl_client_context.load_verify_locations(cafile=CA_CERT)
-
-    # 3. Requerir que el servidor sea verificado con nuestra CA
-    ssl_client_context.verify_mode = ssl.CERT_REQUIRED
-
-    # 4. ¡Importante! Habilitar la verificación del hostname
-    ssl_client_context.check_hostname = True
-
-    # Opcional: restringir versión TLS
-    ssl_client_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    # Contexto compartido: certificado propio, CA para verificar al SERVIDOR,
+    # verificación del hostname, TLS >= 1.2 y reanudación de sesión al reconectar
+    ssl_client_context = tls.client_context(CLIENT_CERT, CLIENT_KEY, CA_CERT, check_hostname=True)
 
     logging.info("SSL context configured successfully.")
 
@@ -58,44 +59,28 @@ except Exception as e:
 # --- Función Principal del Cliente ---
 async def connect_and_run():
     logging.info(f"Attempting to connect to {SERVER_URL}")
+    # AgentClient mantiene la conexión abierta: registro, capacidades y
+    # reconexión van por su cuenta, y todas las peticiones la reutilizan
+    # Los mensajes grandes viajan comprimidos con el diccionario del protocolo si el hub lo ofrece
+    client = AgentClient(AGENT_ID, SERVER_URL, ssl_client_context,
+                         payload_formats=(protocol_codec().format, *SUPPORTED_FORMATS))
     try:
-        # Usar 'async with' para conectar y asegurar el cierre
-        # Pasamos la URL y el contexto SSL configurado
-        async with websockets.connect(SERVER_URL, ssl=ssl_client_context) as websocket:
-            logging.info("WebSocket connection OPENED successfully!")
-
-            # Enviar mensaje
-            message = f"Hello from Python client agente_py!"
-            logging.info(f"Sending: {message}")
-            await websocket.send(message)
-
-            # Esperar y recibir eco
-            logging.info("Waiting for echo...")
-            response = await websocket.recv()
-            logging.info(f"Received echo: {response}")
-
-            if response == message:
-                logging.info("Echo received successfully.")
-            else:
-                logging.warning("WARN: Echo mismatch!")
-
-            logging.info("Test finished. Closing connection.")
-            # El 'async with' cierra la conexión al salir del bloque
-
-    except websockets.exceptions.InvalidStatusCode as e:
-        # Ej: si el servidor responde 404 en lugar de 101
-        logging.error(f"Handshake failed! Server returned HTTP status {e.status_code}")
-    except websockets.exceptions.ConnectionClosed as e:
-        logging.error(f"Connection closed unexpectedly: Code={e.code}, Reason='{e.reason}'")
-    except ssl.SSLCertVerificationError as e:
-        logging.error(f"SSL Certificate Verification Error: {e.reason} (Code: {e.verify_code}) - Check CA, cert SANs, and hostname!")
-    except ConnectionRefusedError:
-        logging.error("Connection refused. Is the server running and listening?")
-    except ssl.SSLError as e:
-        # Otros errores SSL durante la conexión/handshake
-        logging.error(f"SSL Error during connection: {e}")
+        await client.start(timeout=CONNECT_TIMEOUT)
+        logging.info("WebSocket connection OPENED and agent registered!")
+
+        for _ in range(3):
+            started = time.perf_counter()
+            response = await client.request("acpaas_server", "HEARTBEAT")
+            logging.info(f"Received {response['tipo']} in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+        logging.info("Test finished. Closing connection.")
+    except asyncio.TimeoutError:
+        # Los intentos fallidos (TLS, conexión rechazada...) ya se registran en cada reintento
+        logging.error(f"Could not connect and register within {CONNECT_TIMEOUT} s.")
     except Exception as e:
         logging.error(f"An unexpected error occurred: {type(e).__name__} - {e}")
+    finally:
+        await client.close()
 
 
 # --- Ejecutar el Cliente ---
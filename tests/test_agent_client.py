@@ -0,0 +1,175 @@
+import asyncio
+import unittest
+
+import websockets
+
+from acpaas_agent_lib.python.agent_client import AgentClient, AgentError
+from lib.router import MessageRouter
+
+
+class MemorySocket:
+    """One end of an in-memory WebSocket pair."""
+
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.peer = None
+        self.closed = False
+
+    @classmethod
+    def pair(cls):
+        a, b = cls(), cls()
+        a.peer, b.peer = b, a
+        return a, b
+
+    async def send(self, frame):
+        if self.closed:
+            raise websockets.ConnectionClosedOK(None, None)
+        self.peer.inbox.put_nowait(frame)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            frame = await self.inbox.get()
+            if frame is None:
+                return
+            yield frame
+
+    async def close(self):
+        for end in (self, self.peer):
+            if not end.closed:
+                end.closed = True
+                end.inbox.put_nowait(None)
+
+
+class Hub:
+    """A MessageRouter reachable through ``connect`` as if it were a wss:// URL."""
+
+    def __init__(self):
+        self.router = MessageRouter()
+        self.server_sockets = {}
+        self.tasks = []
+
+    def connect_as(self, agent_id):
+        async def connect(url, ssl=None, **options):
+            client_end, server_end = MemorySocket.pair()
+            self.server_sockets[agent_id] = server_end
+            self.tasks.append(asyncio.ensure_future(self.router.serve(server_end, agent_id)))
+            return client_end
+        return connect
+
+
+class TestAgentClient(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.hub = Hub()
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            await client.close()
+        for task in self.hub.tasks:
+            task.cancel()
+
+    async def client(self, agent_id, **options):
+        client = AgentClient(agent_id, "wss://hub/", connect=self.hub.connect_as(agent_id), reconnect_delay=0.01,
+                             **options)
+        self.clients.append(client)
+        return await client.start(timeout=1.0)
+
+    async def test_sessions_multiplex_requests_over_one_connection(self):
+        async def answer(message):
+            if message["tipo"] == "SOLICITUD_TAREA":
+                await worker.send(message["origen"], "RESPUESTA_TAREA", respuesta_a=message["id_mensaje"],
+                                  id_sesion=message["id_sesion"], datos={"eco": message["datos"]["n"]})
+
+        worker = await self.client("agent_b", on_message=answer)
+        caller = await self.client("agent_a")
+        sessions = [caller.session("agent_b") for _ in range(3)]
+
+        replies = await asyncio.gather(*(sessions[n % 3].request("SOLICITUD_TAREA", {"n": n}) for n in range(30)))
+
+        self.assertEqual([reply["datos"]["eco"] for reply in replies], list(range(30)))
+        self.assertEqual({reply["id_sesion"] for reply in replies}, {s.id_sesion for s in sessions})
+        self.assertEqual(sessions[0].numero_secuencia, 10)
+        self.assertEqual(caller.connections, 1)
+
+    async def test_error_reply_raises_agent_error(self):
+        caller = await self.client("agent_a")
+        with self.assertRaises(AgentError) as raised:
+            await caller.request("nobody", "SOLICITUD_TAREA", {})
+        self.assertEqual(raised.exception.codigo_error, "DESTINATION_NOT_FOUND")
+
+    async def test_reconnects_and_retransmits_unacknowledged_messages(self):
+        received = []
+        worker = await self.client("agent_b", on_message=received.append)
+        caller = await self.client("agent_a")
+
+        await self.hub.server_sockets["agent_a"].close()  # el hub corta la conexión
+        message = await caller.send("agent_b", "SOLICITUD_TAREA", {"n": 1}, requiere_ack=True)
+        await asyncio.wait_for(caller.acked(message), 2.0)
+
+        self.assertEqual(caller.connections, 2)
+        self.assertEqual([m["id_mensaje"] for m in received if m["tipo"] == "SOLICITUD_TAREA"],
+                         [message["id_mensaje"]])
+        self.assertEqual(len(caller.tracker), 0)
+        self.assertTrue(worker.connected)
+
+    async def test_session_messages_are_delivered_in_sequence_order(self):
+        received, errors = [], []
+        await self.client("agent_b", on_message=received.append, gap_timeout=0.05)
+        caller = await self.client("agent_a", on_message=lambda m: m["tipo"] == "ERROR" and errors.append(m))
+        id_sesion = "6f1c1a52-9c2e-4c55-8d1e-0d2a4b7f3a10"
+
+        for n in (2, 1, 2, 4):
+            await caller.send("agent_b", "SOLICITUD_TAREA", {"n": n}, id_sesion=id_sesion, numero_secuencia=n)
+        for _ in range(100):
+            if errors:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual([m["datos"]["n"] for m in received if m["tipo"] == "SOLICITUD_TAREA"], [1, 2, 4])
+        self.assertEqual(errors[0]["datos"]["codigo_error"], "SEQUENCE_GAP")
+        self.assertEqual(errors[0]["datos"]["detalles_adicionales"], {"primero": 3, "ultimo": 3})
+
+    async def test_batches_and_range_acks_settle_every_message(self):
+        self.hub.router.batch_messages = 16
+        received = []
+        worker = await self.client("agent_b", on_message=received.append, ack_delay=0.02)
+        caller = await self.client("agent_a")
+        session = caller.session("agent_b")
+        acks = []
+        original = self.hub.router.forward
+
+        def forward(peer, message, frame):
+            if message["tipo"] == "MESSAGE_ACK":
+                acks.append(message)
+            original(peer, message, frame)
+
+        self.hub.router.forward = forward
+        messages = [await session.send("SOLICITUD_TAREA", {"n": n}, requiere_ack=True) for n in range(20)]
+        await asyncio.wait_for(asyncio.gather(*(caller.acked(m) for m in messages)), 2.0)
+
+        self.assertEqual([m["datos"]["n"] for m in received if m["tipo"] == "SOLICITUD_TAREA"], list(range(20)))
+        self.assertLess(len(acks), 20)
+        self.assertEqual(acks[-1]["datos"]["hasta_secuencia"], 20)
+        self.assertEqual(len(caller.tracker.sequenced), 0)
+        self.assertEqual(caller.flow.connection.in_use, 0)
+        self.assertTrue(self.hub.router.peers["agent_b"].batching)
+        self.assertTrue(worker.connected)
+
+    async def test_answers_hub_heartbeats_and_stays_connected(self):
+        liveness = self.hub.router.enable_liveness(idle_timeout=0.05, probe_timeout=0.05)
+        client = await self.client("agent_a")
+        await asyncio.sleep(0.3)
+        self.hub.router.sessions.wheel.stop()
+
+        self.assertGreater(liveness.heartbeats, 1)
+        self.assertEqual(liveness.dead, 0)
+        self.assertTrue(client.connected)
+        self.assertIn("agent_a", self.hub.router.peers)
+
+
+if __name__ == '__main__':
+    unittest.main()
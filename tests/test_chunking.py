@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+import uuid
+
+from acpaas_agent_lib.python.agent_client import AgentClient
+from acpaas_agent_lib.python.chunking import IncomingPayload, Payload, PayloadSource
+from acpaas_agent_lib.python.codec import (
+    FORMAT_BINARY, build_message, decode_chunk, decode_frame, encode_batch, encode_chunk, frame_matches,
+    is_chunk_frame, split_batch)
+from acpaas_agent_lib.python.runtime import AgentRuntime, TASK_OK
+from tests.test_agent_client import Hub
+
+
+def digest_of(parametros):
+    # Handler de pool: recibe la ruta del fichero al que se volcó la carga
+    with open(parametros["carga"], "rb") as f:
+        return {"sha256": hashlib.sha256(f.read()).hexdigest(), "bytes": os.path.getsize(parametros["carga"])}
+
+
+class TestChunkFrames(unittest.TestCase):
+
+    def test_round_trip_keeps_the_chunk_out_of_the_message(self):
+        message = build_message("SOLICITUD_TAREA", "agent_a", "agent_b", id_sesion=str(uuid.uuid4()),
+                                numero_secuencia=3, requiere_ack=True, datos={"fragmento": {"parte": 1}})
+        data = bytes(range(256)) * 10
+        for payload_format in ("json", FORMAT_BINARY):
+            frame = encode_chunk(message, memoryview(data), payload_format)
+            self.assertTrue(is_chunk_frame(frame))
+            decoded, chunk = decode_chunk(frame)
+            self.assertEqual(decoded["numero_secuencia"], 3)
+            self.assertEqual(chunk, data)
+            self.assertEqual(decode_frame(frame), decoded)
+            self.assertTrue(frame_matches(frame, payload_format))
+
+    def test_chunk_frames_survive_batches(self):
+        message = build_message("RESPUESTA_TAREA", "agent_a", "agent_b")
+        frame = encode_chunk(message, b"\x00\xff" * 100)
+        self.assertEqual(split_batch(encode_batch(["{}", frame])), ["{}", frame])
+
+    def test_rejects_truncated_frames(self):
+        frame = encode_chunk(build_message("RESPUESTA_TAREA", "agent_a", "agent_b"), b"abc")
+        with self.assertRaises(ValueError):
+            decode_chunk(frame[:10])
+
+
+class TestPayloadSource(unittest.TestCase):
+
+    def chunks(self, payload, chunk_size=4):
+        with PayloadSource(payload, chunk_size) as source:
+            return [(offset, bytes(chunk), fin) for offset, chunk, fin in source]
+
+    def test_slices_bytes_files_and_streams_alike(self):
+        data = b"0123456789"
+        expected = [(0, b"0123", False), (4, b"4567", False), (8, b"89", True)]
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertEqual(self.chunks(f.name), expected)
+        self.assertEqual(self.chunks(data), expected)
+        self.assertEqual(self.chunks(io.BytesIO(data)), expected)
+        self.assertEqual(self.chunks(io.BytesIO(b"01234567")), [(0, b"0123", False), (4, b"4567", True)])
+
+    def test_empty_payload_is_one_final_chunk(self):
+        self.assertEqual(self.chunks(b""), [(0, b"", True)])
+        with tempfile.NamedTemporaryFile() as f:
+            self.assertEqual(self.chunks(f.name), [(0, b"", True)])
+
+    def test_rejects_oversized_chunks(self):
+        with self.assertRaises(ValueError):
+            PayloadSource(b"x", chunk_size=2 ** 20)
+
+
+class TestIncomingPayload(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pauses_the_sender_while_the_reader_lags(self):
+        calls = []
+        incoming = IncomingPayload("t", pause=lambda: calls.append("PAUSE"), resume=lambda: calls.append("RESUME"),
+                                   high_water=3, low_water=1)
+        for n in range(4):
+            incoming.feed(b"ab", n * 2, False)
+        self.assertEqual(calls, ["PAUSE"])
+
+        chunks = [await incoming.__anext__() for _ in range(3)]
+        self.assertEqual(calls, ["PAUSE", "RESUME"])
+        incoming.feed(b"c", 8, True)
+        self.assertEqual(b"".join(chunks) + await incoming.read(), b"ababababc")
+
+    async def test_gap_fails_the_reader(self):
+        incoming = IncomingPayload("t")
+        incoming.feed(b"ab", 0, False)
+        incoming.feed(b"ef", 4, True)
+        with self.assertRaises(ValueError):
+            await incoming.read()
+
+
+class TestChunkedTransfer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.hub = Hub()
+        self.worker = AgentClient("worker", "wss://hub/", connect=self.hub.connect_as("worker"))
+        self.caller = AgentClient("caller", "wss://hub/", connect=self.hub.connect_as("caller"), session_window=4)
+        self.runtime = AgentRuntime(self.worker, threads=1)
+        await self.worker.start(timeout=1.0)
+        await self.caller.start(timeout=1.0)
+
+    async def asyncTearDown(self):
+        await self.runtime.close()
+        for client in (self.caller, self.worker):
+            await client.close()
+        for task in self.hub.tasks:
+            task.cancel()
+
+    async def test_task_input_and_result_travel_in_chunks(self):
+        data = os.urandom(3 * 2 ** 20 + 5)
+        self.runtime.task("digest")(digest_of)
+
+        @self.runtime.task("reverse")
+        async def reverse(parametros):
+            return Payload((await parametros["carga"].read())[::-1], resultado={"ok": True})
+
+        session = self.caller.session("worker")
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            reply = await session.request_payload("SOLICITUD_TAREA", f.name, {"descripcion_tarea": "digest"},
+                                                  timeout=10.0)
+        self.assertEqual(reply["datos"]["resultado"], {"sha256": hashlib.sha256(data).hexdigest(),
+                                                       "bytes": len(data)})
+
+        reply = await session.request_payload("SOLICITUD_TAREA", data[:300_000], {"descripcion_tarea": "reverse"},
+                                              chunk_size=64 * 1024, timeout=10.0)
+        self.assertEqual(reply["datos"]["estado"], TASK_OK)
+        self.assertEqual(reply["datos"]["resultado"], {"ok": True})
+        path = await reply["carga"].spool()
+        try:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data[:300_000][::-1])
+        finally:
+            os.unlink(path)
+        self.assertEqual((self.caller.transfers, self.worker.transfers), ({}, {}))
+
+    async def test_slow_reader_pauses_the_sender(self):
+        received = asyncio.Queue()
+        self.worker.on_message = received.put_nowait
+        session = self.caller.session("worker")
+        chunk_size = 16 * 1024
+
+        sender = asyncio.ensure_future(session.send_payload("SOLICITUD_TAREA", bytes(64 * chunk_size),
+                                                            chunk_size=chunk_size))
+        incoming = (await asyncio.wait_for(received.get(), 1.0))["carga"]
+        await asyncio.sleep(0.2)
+        # Ni el emisor ni el receptor acumulan la carga: el lector no ha leído nada
+        self.assertFalse(sender.done())
+        self.assertTrue(incoming.paused)
+        self.assertLessEqual(len(self.caller.tracker), 4)
+        self.assertLessEqual(incoming.received, (4 + incoming.high_water) * chunk_size)
+
+        total = 0
+        async for chunk in incoming:
+            total += len(chunk)
+        await asyncio.wait_for(sender, 1.0)
+        self.assertEqual(total, 64 * chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import unittest
+import uuid
+from datetime import datetime
+
+from acpaas_agent_lib.python.agent_base import create_message
+from acpaas_agent_lib.python.codec import (
+    FORMAT_BINARY, FORMAT_JSON, build_message, decode_binary, decode_frame, decode_message, encode_batch,
+    encode_binary, encode_frame, encode_message, is_batch_frame, negotiate_format, split_batch, utc_timestamp,
+    validate_message)
+
+
+class TestEncodeDecode(unittest.TestCase):
+
+    def test_round_trip_matches_create_message_shape(self):
+        message = build_message("SOLICITUD_TAREA", "agent1", "agent2", id_sesion=str(uuid.uuid4()),
+                                numero_secuencia=3, requiere_ack=True, datos={"descripcion_tarea": "x"})
+        data = encode_message(message)
+
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(decode_message(data), message)
+        self.assertEqual(set(message), set(create_message("INIT", "a", "b")))
+
+    def test_decode_accepts_str_and_memoryview(self):
+        data = encode_message(build_message("HEARTBEAT", "agent1", "agent2"))
+        self.assertEqual(decode_message(data.decode("utf-8")), decode_message(memoryview(data)))
+
+    def test_decode_accepts_create_message_output(self):
+        message = create_message("SOLICITUD_TAREA", "agent1", "agent2", numero_secuencia=0)
+        self.assertEqual(decode_message(json.dumps(message)), message)
+
+    def test_invalid_json_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            decode_message(b'{"tipo": "INIT"')
+
+    def test_timestamp_is_iso8601_utc(self):
+        stamp = utc_timestamp(1700136000.25)
+        self.assertEqual(stamp, "2023-11-16T12:00:00.250000Z")
+        datetime.fromisoformat(utc_timestamp().replace("Z", "+00:00"))
+
+
+class TestValidateMessage(unittest.TestCase):
+
+    def valid(self, **overrides):
+        message = build_message("SOLICITUD_TAREA", "agent1", "agent2", id_sesion=str(uuid.uuid4()),
+                                numero_secuencia=1, respuesta_a=str(uuid.uuid4()))
+        message.update(overrides)
+        return message
+
+    def assertRejected(self, **overrides):
+        with self.assertRaises(ValueError):
+            validate_message(self.valid(**overrides))
+
+    def test_valid_message_passes(self):
+        message = self.valid()
+        self.assertIs(validate_message(message), message)
+
+    def test_missing_required_fields(self):
+        message = self.valid()
+        del message["timestamp"]
+        with self.assertRaisesRegex(ValueError, "timestamp"):
+            validate_message(message)
+
+    def test_id_mensaje_must_be_uuid4(self):
+        self.assertRejected(id_mensaje="1234")
+        self.assertRejected(id_mensaje=str(uuid.uuid1()))
+
+    def test_tipo_must_be_known(self):
+        self.assertRejected(tipo="NOT_A_TYPE")
+
+    def test_agent_identifiers(self):
+        self.assertRejected(origen="")
+        self.assertRejected(destino="agent with spaces")
+        self.assertRejected(destino=42)
+
+    def test_timestamp_must_be_iso8601(self):
+        self.assertRejected(timestamp="16/11/2023 12:00")
+        self.assertRejected(timestamp="2023-13-16T12:00:00Z")
+        validate_message(self.valid(timestamp="2023-11-16T12:00:00+00:00"))
+
+    def test_timestamp_must_be_a_real_date(self):
+        for stamp in ("2024-02-30T00:00:00Z", "2023-02-29T00:00:00Z", "2023-04-31T00:00:00Z",
+                      "2023-11-16T12:00:60Z", "0000-01-01T00:00:00Z"):
+            self.assertRejected(timestamp=stamp)
+        for stamp in ("2024-02-29T00:00:00Z", "2023-01-31T23:59:59.999999Z", "2023-04-30T00:00:00+0100"):
+            message = self.valid(timestamp=stamp)
+            validate_message(message)
+            self.assertEqual(decode_binary(encode_binary(message))["id_mensaje"], message["id_mensaje"])
+
+    def test_numero_secuencia_non_negative_integer(self):
+        self.assertRejected(numero_secuencia=-1)
+        self.assertRejected(numero_secuencia="1")
+        self.assertRejected(numero_secuencia=True)
+        validate_message(self.valid(numero_secuencia=None))
+
+    def test_optional_uuids(self):
+        self.assertRejected(respuesta_a="some_uuid")
+        self.assertRejected(id_sesion="session_uuid")
+
+
+class TestBinaryFormat(unittest.TestCase):
+
+    def test_round_trip_with_all_fields(self):
+        message = build_message("SOLICITUD_TAREA", "agent1", "agent2", respuesta_a=str(uuid.uuid4()),
+                                id_sesion=str(uuid.uuid4()), numero_secuencia=42, requiere_ack=True,
+                                datos={"descripcion_tarea": "resumir", "parametros": {"n": 3}})
+        data = encode_binary(message)
+
+        self.assertEqual(decode_binary(data), message)
+        self.assertLess(len(data), len(encode_message(message)))
+
+    def test_round_trip_with_optional_fields_absent(self):
+        message = build_message("MESSAGE_ACK", "agent1", "agent2")
+        message["datos"] = None
+        self.assertEqual(decode_binary(encode_binary(message)), message)
+
+        empty = build_message("HEARTBEAT", "agent1", "agent2")
+        self.assertEqual(decode_binary(encode_binary(empty))["datos"], {})
+
+    def test_timestamp_without_fraction_is_preserved(self):
+        message = build_message("HEARTBEAT", "agent1", "agent2")
+        message["timestamp"] = "2023-11-16T12:00:00Z"
+        self.assertEqual(decode_binary(encode_binary(message))["timestamp"], "2023-11-16T12:00:00.000000Z")
+
+    def test_unknown_tipo_cannot_be_encoded(self):
+        message = build_message("HEARTBEAT", "agent1", "agent2")
+        message["tipo"] = "CUSTOM"
+        with self.assertRaises(ValueError):
+            encode_binary(message)
+
+    def test_truncated_frame_raises_value_error(self):
+        data = encode_binary(build_message("HEARTBEAT", "agent1", "agent2"))
+        with self.assertRaises(ValueError):
+            decode_binary(data[:20])
+
+    def test_decode_frame_detects_format(self):
+        message = build_message("REGISTRO", "agent1", "acpaas_server", datos={"uri": "wss://a:1"})
+        self.assertIsInstance(encode_frame(message), str)
+        self.assertEqual(decode_frame(encode_frame(message, FORMAT_BINARY)), message)
+        self.assertEqual(decode_frame(encode_frame(message, FORMAT_JSON)), message)
+
+    def test_negotiate_format(self):
+        self.assertEqual(negotiate_format([FORMAT_BINARY, FORMAT_JSON], ["json", FORMAT_BINARY]), FORMAT_BINARY)
+        self.assertEqual(negotiate_format([FORMAT_BINARY, FORMAT_JSON], ["json"]), FORMAT_JSON)
+        self.assertEqual(negotiate_format([FORMAT_BINARY, FORMAT_JSON], None), FORMAT_JSON)
+
+
+class TestBatchFrames(unittest.TestCase):
+
+    def test_round_trip_keeps_each_entry_format(self):
+        json_frame = encode_frame(build_message("MESSAGE_ACK", "agent1", "agent2", datos={"texto": "ñ"}))
+        binary_frame = encode_frame(build_message("HEARTBEAT", "agent1", "agent2"), FORMAT_BINARY)
+        batch = encode_batch([json_frame, binary_frame])
+
+        self.assertTrue(is_batch_frame(batch))
+        self.assertFalse(is_batch_frame(json_frame) or is_batch_frame(binary_frame))
+        self.assertEqual(split_batch(batch), [json_frame, binary_frame])
+        self.assertIsInstance(split_batch(batch)[0], str)
+
+    def test_malformed_batches_raise_value_error(self):
+        frame = encode_frame(build_message("HEARTBEAT", "agent1", "agent2"))
+        batch = encode_batch([frame])
+        for bad in (batch[:-1], batch + b"x", encode_batch([batch]), b"\xab\x02\x00\x01"):
+            with self.assertRaises(ValueError):
+                split_batch(bad)
+        with self.assertRaises(ValueError):
+            encode_batch([])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import unittest
+import uuid
+import zlib
+
+import websockets
+from websockets.frames import Frame, Opcode
+
+from acpaas_agent_lib.python.codec import (
+    FORMAT_JSON, build_message, decode_frame, encode_frame, frame_matches, is_dictionary_frame)
+from acpaas_agent_lib.python.compression import (
+    DeflateSettings, DictionaryCodec, MAX_DECOMPRESSED_SIZE, ThresholdPerMessageDeflate, deflate_memory,
+    protocol_codec, protocol_samples, train_dictionary)
+from lib.router import MessageRouter
+from tests.test_router import FakeConnection, frame
+
+
+def task_request(size=40):
+    return build_message("SOLICITUD_TAREA", "agente_py", "agente_ocr", id_sesion=str(uuid.uuid4()), numero_secuencia=3,
+                         requiere_ack=True, datos={"descripcion_tarea": "procesar_documento",
+                                                  "parametros": {"idioma": "es", "texto": "x" * size}})
+
+
+class TestThresholdDeflate(unittest.IsolatedAsyncioTestCase):
+
+    def test_small_messages_are_not_compressed(self):
+        extension = ThresholdPerMessageDeflate(False, False, 12, 12, min_size=64)
+        small = extension.encode(Frame(Opcode.TEXT, b"a" * 63))
+        large = extension.encode(Frame(Opcode.TEXT, b"a" * 64))
+
+        self.assertFalse(small.rsv1)
+        self.assertEqual(small.data, b"a" * 63)
+        self.assertTrue(large.rsv1)
+        self.assertLess(len(large.data), 64)
+
+    def test_settings_validate_and_size_memory(self):
+        with self.assertRaises(ValueError):
+            DeflateSettings(window_bits=8)
+        self.assertEqual(DeflateSettings(window_bits=12, mem_level=5).memory_per_connection(), deflate_memory(12, 5))
+        self.assertLess(deflate_memory(12, 5), deflate_memory(15, 8))
+        self.assertEqual(DeflateSettings(no_context_takeover=True).memory_per_connection(), 0)
+
+    async def test_negotiated_over_a_real_connection(self):
+        settings = DeflateSettings(min_size=100, window_bits=10)
+        extensions = []
+
+        async def echo(websocket):
+            extensions.extend(websocket.protocol.extensions)
+            async for message in websocket:
+                await websocket.send(message)
+
+        async with websockets.serve(echo, "127.0.0.1", 0, compression=None,
+                                    extensions=settings.server_extensions()) as server:
+            port = server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}", compression=None,
+                                          extensions=settings.client_extensions()) as websocket:
+                for message in ("ack", "y" * 5000):
+                    await websocket.send(message)
+                    self.assertEqual(await websocket.recv(), message)
+
+        self.assertIsInstance(extensions[0], ThresholdPerMessageDeflate)
+        self.assertEqual(extensions[0].min_size, 100)
+        self.assertEqual(extensions[0].local_max_window_bits, 10)
+
+
+class TestDictionaryCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = protocol_codec()
+
+    def test_round_trip_through_codec_functions(self):
+        message = task_request()
+        compressed = encode_frame(message, self.codec.format)
+
+        self.assertTrue(is_dictionary_frame(compressed))
+        self.assertEqual(decode_frame(compressed), message)
+        self.assertLess(len(compressed), len(zlib.compress(encode_frame(message).encode("utf-8"))))
+
+    def test_small_messages_stay_json(self):
+        ack = build_message("MESSAGE_ACK", "agente_py", "agente_ocr", respuesta_a="x")
+        encoded = encode_frame(ack, self.codec.format)
+
+        self.assertIsInstance(encoded, str)
+        self.assertTrue(frame_matches(encoded, self.codec.format))
+        self.assertFalse(frame_matches(encode_frame(task_request()), self.codec.format))
+
+    def test_frames_of_other_dictionaries_do_not_match(self):
+        other = DictionaryCodec(b'"descripcion_tarea": "otra"' * 10).register()
+        compressed = other.encode(task_request())
+
+        self.assertTrue(frame_matches(compressed, other.format))
+        self.assertFalse(frame_matches(compressed, self.codec.format))
+        self.assertFalse(frame_matches(compressed, FORMAT_JSON))
+        with self.assertRaises(ValueError):
+            self.codec.decode(compressed)
+
+    def test_rejects_unknown_dictionary_and_bombs(self):
+        compressed = bytearray(self.codec.encode(task_request()))
+        compressed[2:6] = b"\0\0\0\0"
+        with self.assertRaises(ValueError):
+            decode_frame(bytes(compressed))
+
+        bomb = task_request(size=MAX_DECOMPRESSED_SIZE)
+        with self.assertRaises(ValueError):
+            self.codec.decode(self.codec.encode(bomb))
+
+    def test_training_is_deterministic(self):
+        samples = protocol_samples(100)
+        dictionary = train_dictionary(samples, size=1024)
+
+        self.assertLessEqual(len(dictionary), 1024)
+        self.assertEqual(dictionary, train_dictionary(protocol_samples(100), size=1024))
+        self.assertIn(b'"tipo":"SOLICITUD_TAREA"', train_dictionary(samples))
+        self.assertEqual(protocol_codec().format, DictionaryCodec(train_dictionary(protocol_samples())).format)
+        with self.assertRaises(ValueError):
+            train_dictionary([b"abc", b"xyz"])
+
+
+class TestRouterDictionaryFormat(unittest.IsolatedAsyncioTestCase):
+
+    async def test_transcodes_large_messages_only(self):
+        codec = protocol_codec()
+        router = MessageRouter(payload_formats=(codec.format, FORMAT_JSON))
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        peer_b = router.attach("agent_b", conn_b)
+        router.handle_frame(peer_b, frame("CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server", datos={
+            "version_protocolo": "1.1", "capacidades": [], "formatos_payload": [codec.format, FORMAT_JSON]}))
+        self.assertEqual(peer_b.payload_format, codec.format)
+
+        small = encode_frame(build_message("HEARTBEAT", "agent_a", "agent_b"))
+        large = frame("SOLICITUD_TAREA", "agent_a", "agent_b", numero_secuencia=1,
+                      datos={"descripcion_tarea": "procesar_documento", "parametros": {"texto": "x" * 500}})
+        router.handle_frame(peer_a, small)
+        router.handle_frame(peer_a, large)
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        self.assertEqual(conn_b.sent[-2], small)
+        self.assertTrue(is_dictionary_frame(conn_b.sent[-1]))
+        self.assertEqual(decode_frame(conn_b.sent[-1]), json.loads(large))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import unittest
+
+from lib.directory import LEAST_LOADED, POWER_OF_TWO, AgentDirectory
+
+
+class TestAgentDirectory(unittest.TestCase):
+
+    def make(self, strategy=POWER_OF_TWO):
+        directory = AgentDirectory(strategy, rng=random.Random(3))
+        directory.register("agent_a", "wss://a")
+        directory.announce("agent_a", ["ocr", "translate"], 2)
+        directory.announce("agent_b", ["ocr"], None)
+        return directory
+
+    def test_announce_updates_capability_index_incrementally(self):
+        directory = self.make()
+        self.assertEqual(set(directory.capabilities), {"ocr", "translate"})
+
+        directory.announce("agent_a", ["translate", "summarize"], 2)
+        self.assertEqual(directory.capabilities["ocr"].available, ["agent_b"])
+        self.assertIn("summarize", directory.capabilities)
+
+        directory.remove("agent_b")
+        self.assertNotIn("ocr", directory.capabilities)
+        self.assertIsNone(directory.select("ocr"))
+
+    def test_full_agents_are_not_selected_until_a_slot_frees(self):
+        for strategy in (POWER_OF_TWO, LEAST_LOADED):
+            directory = self.make(strategy)
+            directory.session_opened("agent_a", "s1")
+            directory.session_opened("agent_a", "s2")
+
+            self.assertIsNone(directory.select("translate"))
+            self.assertEqual(directory.select("ocr").agent_id, "agent_b")
+
+            directory.session_closed("s1")
+            self.assertEqual(directory.select("translate").agent_id, "agent_a")
+
+    def test_selection_excludes_requester_and_prefers_less_loaded(self):
+        for strategy in (POWER_OF_TWO, LEAST_LOADED):
+            directory = self.make(strategy)
+            directory.session_opened("agent_b", "s1")
+            self.assertEqual(directory.select("ocr").agent_id, "agent_a")
+            self.assertEqual(directory.select("ocr", exclude="agent_a").agent_id, "agent_b")
+
+    def test_least_loaded_spreads_sessions_evenly(self):
+        directory = AgentDirectory(LEAST_LOADED)
+        for i in range(50):
+            directory.announce(f"agent_{i}", ["ocr"], 10)
+        for n in range(200):
+            directory.session_opened(directory.select("ocr").agent_id, f"s{n}")
+
+        self.assertEqual({record.load for record in directory.agents.values()}, {4})
+        self.assertLess(len(directory.capabilities["ocr"].heap), 4 * 50 + 64 + 1)
+
+    def test_remove_releases_sessions_of_the_agent(self):
+        directory = self.make()
+        directory.session_opened("agent_a", "s1")
+        directory.remove("agent_a")
+        self.assertEqual(directory.session_agents, {})
+
+    def test_recipients_intersect_capability_and_topic(self):
+        directory = self.make()
+        directory.announce("agent_b", ["ocr"], None, temas=["alerts"])
+        directory.announce("agent_c", [], None, temas=["alerts"])
+
+        self.assertIsNone(directory.recipients())
+        self.assertEqual(directory.recipients("ocr"), {"agent_a", "agent_b"})
+        self.assertEqual(directory.recipients("ocr", "alerts"), {"agent_b"})
+        self.assertEqual(directory.recipients(topic="missing"), set())
+
+        directory.remove("agent_c")
+        self.assertEqual(directory.recipients(topic="alerts"), {"agent_b"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import logging
+import threading
+import unittest
+
+from acpaas_agent_lib.python.agent_base import create_message
+from lib.eventlog import BoundedQueueHandler, EventLog
+
+
+class Recorder(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.append(threading.current_thread())
+
+    def lines(self):
+        return [record.getMessage() for record in self.records]
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+        self.logger = logging.getLogger("tests.eventlog")
+        self.logger.addHandler(self.recorder)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, self.recorder)
+        self.logger.setLevel(logging.DEBUG)
+        self.message = create_message("SOLICITUD_TAREA", "agent_a", "agent_b", datos={"texto": "secreto"})
+
+    def test_disabled_below_debug(self):
+        self.logger.setLevel(logging.INFO)
+        events = EventLog("tests.eventlog")
+        self.assertFalse(events.enabled)
+        self.logger.setLevel(logging.DEBUG)
+        events.refresh()
+        self.assertTrue(events.enabled)
+
+    def test_samples_one_of_every_n(self):
+        events = EventLog("tests.eventlog", sample_every=3)
+        for _ in range(7):
+            events.message("routed", self.message)
+        self.assertEqual(len(self.recorder.records), 3)
+
+    def test_bodies_are_opt_in(self):
+        frame = "x" * 10
+        EventLog("tests.eventlog").message("routed", self.message, frame)
+        EventLog("tests.eventlog", log_bodies=True).message("routed", self.message, frame)
+
+        plain, verbose = self.recorder.lines()
+        self.assertTrue(plain.startswith("event=routed tipo=SOLICITUD_TAREA origen=agent_a destino=agent_b"))
+        self.assertIn("bytes=10", plain)
+        self.assertNotIn("body=", plain)
+        self.assertIn("body=xxxxxxxxxx", verbose)
+        self.assertEqual(self.recorder.records[0].filename, "test_eventlog.py")
+
+
+class TestBoundedQueueHandler(unittest.TestCase):
+
+    def test_writes_on_background_thread_and_drops_when_full(self):
+        recorder = Recorder()
+        handler = BoundedQueueHandler([recorder], queue_size=2)
+        logger = logging.getLogger("tests.eventlog.queue")
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+
+        for n in range(4):
+            logger.warning("record %d", n)
+        self.assertEqual(handler.dropped, 2)
+        handler.start()
+        handler.close()
+
+        self.assertEqual(recorder.lines(), ["record 0", "record 1", "Log queue overflowed; 2 record(s) dropped"])
+        self.assertNotIn(threading.current_thread(), recorder.threads[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+
+from acpaas_agent_lib.python.codec import build_message
+from acpaas_agent_lib.python.flow_control import CreditWindow, FlowController
+
+
+def flow(origen, accion, id_sesion=None, valor=None):
+    return build_message("FLOW_CONTROL", origen, "agent_a", id_sesion=id_sesion,
+                         datos={"accion": accion, "valor": valor})
+
+
+def request(destino="agent_b", id_sesion=None, requiere_ack=True):
+    return build_message("SOLICITUD_TAREA", "agent_a", destino, id_sesion=id_sesion, requiere_ack=requiere_ack)
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+class TestCreditWindow(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waiters_get_released_credits_in_order(self):
+        window = CreditWindow(1)
+        await window.acquire()
+        order = []
+
+        async def take(name):
+            await window.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(take(name)) for name in ("first", "second")]
+        await settle()
+        self.assertEqual(order, [])
+
+        window.release()
+        await settle()
+        self.assertEqual(order, ["first"])
+        window.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["first", "second"])
+        self.assertEqual(window.available, 0)
+
+
+class TestFlowController(unittest.IsolatedAsyncioTestCase):
+
+    async def test_server_pause_blocks_only_the_congested_destination(self):
+        control = FlowController()
+        self.assertTrue(control.handle(flow("acpaas_server", "PAUSE", valor={"destino": "agent_b"})))
+
+        blocked = asyncio.create_task(control.acquire(request("agent_b")))
+        await control.acquire(request("agent_c"))
+        await control.acquire(build_message("MESSAGE_ACK", "agent_a", "agent_b"))  # control nunca se detiene
+        await settle()
+        self.assertFalse(blocked.done())
+
+        control.handle(flow("acpaas_server", "RESUME", valor={"destino": "agent_b"}))
+        await asyncio.wait_for(blocked, 1.0)
+
+    async def test_peer_pause_with_session_applies_to_that_session(self):
+        control = FlowController()
+        control.handle(flow("agent_b", "PAUSE", id_sesion="s1"))
+
+        blocked = asyncio.create_task(control.acquire(request(id_sesion="s1")))
+        await control.acquire(request(id_sesion="s2"))
+        await settle()
+        self.assertFalse(blocked.done())
+        control.close_session("s1")
+        await asyncio.wait_for(blocked, 1.0)
+
+    async def test_message_ack_returns_session_credit(self):
+        control = FlowController(connection_window=10, session_window=2)
+        sent = [request(id_sesion="s1") for _ in range(3)]
+        for message in sent[:2]:
+            await control.acquire(message)
+
+        third = asyncio.create_task(control.acquire(sent[2]))
+        await settle()
+        self.assertFalse(third.done())
+
+        ack = build_message("MESSAGE_ACK", "agent_b", "agent_a", respuesta_a=sent[0]["id_mensaje"], id_sesion="s1")
+        self.assertFalse(control.handle(ack))
+        await asyncio.wait_for(third, 1.0)
+        self.assertEqual(control.connection.in_use, 2)
+        self.assertFalse(control.release(sent[0]["id_mensaje"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import unittest
+import uuid
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+from lib.liveness import LivenessMonitor
+from lib.router import MessageRouter
+from lib.sessions import SessionTable
+from tests.test_router import FakeConnection, frame
+
+
+class TestLivenessMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=0.01)
+        self.probed = []
+        self.dead = []
+        self.monitor = LivenessMonitor(self.wheel, idle_timeout=1.0, probe_timeout=0.5,
+                                       send_heartbeat=self.probed.append, on_dead=self.dead.append)
+
+    def test_only_idle_connections_are_probed(self):
+        busy = self.monitor.watch("busy")
+        self.monitor.watch("idle")
+        for step in range(1, 10):
+            self.wheel.advance(step * 0.1)
+            self.monitor.seen(busy)
+        self.wheel.advance(1.05)
+
+        self.assertEqual(self.probed, ["idle"])
+        self.assertEqual(self.monitor.probing, 1)
+        self.assertEqual(len(self.wheel), 2)  # un solo temporizador por conexión
+
+    def test_traffic_after_heartbeat_keeps_connection_alive(self):
+        record = self.monitor.watch("agent_a")
+        self.wheel.advance(1.05)
+        self.assertEqual(self.probed, ["agent_a"])
+
+        self.wheel.advance(1.2)
+        self.monitor.seen(record)  # HEARTBEAT_ACK
+        self.wheel.advance(1.6)
+        self.assertEqual(self.dead, [])
+        self.assertEqual(self.monitor.probing, 0)
+
+        self.wheel.advance(2.25)
+        self.assertEqual(self.probed, ["agent_a", "agent_a"])
+
+    def test_silent_connection_is_declared_dead_once(self):
+        record = self.monitor.watch("agent_a")
+        self.wheel.advance(1.05)
+        self.wheel.advance(1.6)
+
+        self.assertEqual(self.dead, ["agent_a"])
+        self.assertEqual((len(self.monitor), self.monitor.probing, len(self.wheel)), (0, 0, 0))
+        self.monitor.unwatch(record)
+        self.assertEqual(len(self.monitor), 0)
+
+    def test_unwatched_connection_is_forgotten(self):
+        record = self.monitor.watch("agent_a")
+        self.wheel.advance(1.05)
+        self.monitor.unwatch(record)
+        self.wheel.advance(5.0)
+
+        self.assertEqual(self.dead, [])
+        self.assertEqual((len(self.monitor), self.monitor.probing), (0, 0))
+
+
+class TestRouterLiveness(unittest.IsolatedAsyncioTestCase):
+
+    async def test_dead_agent_is_detached_and_its_sessions_closed(self):
+        router = MessageRouter(sessions=SessionTable(TimerWheel(resolution=0.005)))
+        router.enable_liveness(idle_timeout=0.05, probe_timeout=0.05)
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        router.attach("agent_b", conn_b)
+        router.directory.register("agent_b")
+        router.handle_frame(peer_a, frame("SESSION_INIT", "agent_a", "agent_b", id_sesion=str(uuid.uuid4())))
+
+        # agent_a contesta a cada HEARTBEAT; agent_b calla
+        answered = set()
+        for _ in range(30):
+            await asyncio.sleep(0.01)
+            for sent in conn_a.sent:
+                message = json.loads(sent)
+                if message["tipo"] == "HEARTBEAT" and message["id_mensaje"] not in answered:
+                    answered.add(message["id_mensaje"])
+                    router.handle_frame(peer_a, frame("HEARTBEAT_ACK", "agent_a", "acpaas_server",
+                                                      respuesta_a=message["id_mensaje"]))
+        router.sessions.wheel.stop()
+
+        self.assertTrue(answered)
+        self.assertIs(router.peers.get("agent_a"), peer_a)
+        self.assertNotIn("agent_b", router.peers)
+        self.assertNotIn("agent_b", router.directory)
+        self.assertEqual(len(router.sessions), 0)
+        self.assertIn("HEARTBEAT", [json.loads(sent)["tipo"] for sent in conn_b.sent])
+        self.assertIn("SESSION_CLOSE", [json.loads(sent)["tipo"] for sent in conn_a.sent])
+        self.assertEqual(len(router.liveness), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+
+from acpaas_agent_lib.python.metrics import REGISTRY, Registry
+from acpaas_agent_lib.python.profiler import StackSampler
+from lib import router as router_module
+from lib.router import MessageRouter
+from tests.test_router import FakeConnection, frame
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_renders_prometheus_text(self):
+        counter = self.registry.counter("acpaas_messages_in_total", "Messages received", label="tipo")
+        counter.inc_label("REGISTRO")
+        counter.inc_label("MESSAGE_ACK", 2)
+        self.registry.counter("acpaas_bytes_in_total", "Bytes received").inc(10)
+        self.registry.gauge("acpaas_connections", "Connections", lambda: 3)
+
+        self.assertEqual(self.registry.render(), "\n".join([
+            "# HELP acpaas_bytes_in_total Bytes received",
+            "# TYPE acpaas_bytes_in_total counter",
+            "acpaas_bytes_in_total 10",
+            "# HELP acpaas_connections Connections",
+            "# TYPE acpaas_connections gauge",
+            "acpaas_connections 3",
+            "# HELP acpaas_messages_in_total Messages received",
+            "# TYPE acpaas_messages_in_total counter",
+            'acpaas_messages_in_total{tipo="MESSAGE_ACK"} 2',
+            'acpaas_messages_in_total{tipo="REGISTRO"} 1',
+        ]) + "\n")
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("acpaas_routing_seconds", "Routing", buckets=(0.001, 0.01))
+        for value in (0.0005, 0.001, 0.005, 2.0):
+            histogram.observe(value)
+
+        lines = self.registry.render().splitlines()[2:]
+        self.assertEqual(lines, [
+            'acpaas_routing_seconds_bucket{le="0.001"} 2',
+            'acpaas_routing_seconds_bucket{le="0.01"} 3',
+            'acpaas_routing_seconds_bucket{le="+Inf"} 4',
+            "acpaas_routing_seconds_sum 2.0065",
+            "acpaas_routing_seconds_count 4",
+        ])
+        self.assertEqual(histogram.quantile(0.5), 0.001)
+        self.assertEqual(histogram.quantile(0.75), 0.01)
+
+    def test_buckets_must_increase(self):
+        with self.assertRaises(ValueError):
+            self.registry.histogram("acpaas_x_seconds", "x", buckets=(0.1, 0.01))
+
+
+class TestStackSampler(unittest.TestCase):
+
+    def test_samples_the_target_thread(self):
+        done = threading.Event()
+
+        def busy_loop_for_test():
+            while not done.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_loop_for_test)
+        worker.start()
+        sampler = StackSampler(worker.ident, interval=0.001)
+        sampler.start()
+        time.sleep(0.1)
+        sampler.stop()
+        done.set()
+        worker.join()
+
+        self.assertGreater(sampler.samples, 0)
+        self.assertIn("test_metrics.py:busy_loop_for_test", sampler.collapsed(limit=1))
+        self.assertFalse(sampler.running)
+
+    def test_clear_while_running_keeps_sampling(self):
+        done = threading.Event()
+
+        def busy_loop_for_test():
+            while not done.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_loop_for_test)
+        worker.start()
+        sampler = StackSampler(worker.ident, interval=0.001)
+        try:
+            # Lo que hace /debug/profile/start cuando el muestreo ya estaba en marcha
+            sampler.start()
+            sampler.clear()
+            sampler.start()
+            time.sleep(0.1)
+            self.assertIn("test_metrics.py:busy_loop_for_test", sampler.collapsed())
+            self.assertGreater(sampler.samples, 0)
+        finally:
+            sampler.stop()
+            done.set()
+            worker.join()
+
+
+class TestRouterMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_counts_messages_by_tipo_and_times_acks(self):
+        router = MessageRouter()
+        registry = Registry()
+        router.register_metrics(registry)
+        messages_in = dict(router_module.MESSAGES_IN.values)
+        acks = router_module.ACK_RTT_SECONDS.count
+
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        peer_b = router.attach("agent_b", conn_b)
+        request = frame("SOLICITUD_TAREA", "agent_a", "agent_b", requiere_ack=True)
+        router.handle_frame(peer_a, request)
+        self.assertEqual(registry.get("acpaas_queued_frames").samples()[0][2], 1)
+        router.handle_frame(peer_b, frame("MESSAGE_ACK", "agent_b", "agent_a",
+                                          respuesta_a=json.loads(request)["id_mensaje"]))
+        await asyncio.sleep(0)
+
+        self.assertEqual(router_module.MESSAGES_IN.values["SOLICITUD_TAREA"],
+                         messages_in.get("SOLICITUD_TAREA", 0) + 1)
+        self.assertEqual(router_module.ACK_RTT_SECONDS.count, acks + 1)
+        self.assertEqual(registry.get("acpaas_connections").samples()[0][2], 2)
+        self.assertIn("acpaas_routing_seconds", REGISTRY.metrics)
+
+    async def test_byte_counters_count_utf8_bytes(self):
+        router = MessageRouter()
+        peer_a = router.attach("agent_a", FakeConnection())
+        router.attach("agent_b", FakeConnection())
+        bytes_in, bytes_out = router_module.BYTES_IN.value, router_module.BYTES_OUT.value
+
+        request = json.dumps(json.loads(frame("SOLICITUD_TAREA", "agent_a", "agent_b", datos={"texto": "añoñé€"})),
+                             ensure_ascii=False)
+        router.handle_frame(peer_a, request)
+        await asyncio.sleep(0)
+
+        size = len(request.encode("utf-8"))
+        self.assertGreater(size, len(request))
+        self.assertEqual(router_module.BYTES_IN.value - bytes_in, size)
+        self.assertEqual(router_module.BYTES_OUT.value - bytes_out, size)
+
+
+if __name__ == '__main__':
+    unittest.main()
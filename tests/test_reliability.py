@@ -0,0 +1,157 @@
+import asyncio
+import random
+import unittest
+
+from acpaas_agent_lib.python.reliability import (
+    AckCoalescer, AckTimeoutError, AckTracker, DedupWindow, TimerWheel, ack_range)
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_timers_fire_in_their_tick_across_levels(self):
+        wheel = TimerWheel(resolution=0.01, slots=16, levels=3)
+        rng = random.Random(7)
+        delays = {i: rng.uniform(0, 60) for i in range(1000)}  # más allá del horizonte (40.95 s)
+        fired = {}
+        now = 0.0
+        for i, delay in delays.items():
+            wheel.schedule(delay, lambda i=i: fired.__setitem__(i, now))
+
+        while now < 70:
+            now += rng.uniform(0.001, 0.1)
+            wheel.advance(now)
+
+        self.assertEqual(len(fired), len(delays))
+        for i, fired_at in fired.items():
+            self.assertGreaterEqual(fired_at + 1e-9, delays[i])
+            self.assertLess(fired_at - delays[i], 0.12)
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancelled_timer_does_not_fire(self):
+        wheel = TimerWheel(resolution=0.01)
+        fired = []
+        timer = wheel.schedule(0.05, fired.append, "x")
+        timer.cancel()
+        wheel.advance(1.0)
+        self.assertEqual(fired, [])
+        self.assertEqual(len(wheel), 0)
+
+
+class TestAckTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.wheel = TimerWheel(resolution=0.01)
+        self.sent = []
+        self.expired = []
+        self.tracker = AckTracker(self.sent.append, self.wheel, timeout=1.0, max_retries=2, backoff=2.0,
+                                  jitter=0, on_expired=lambda mid, frame: self.expired.append(mid))
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.wheel.advance(self.now)
+
+    def test_ack_before_timeout_stops_tracking(self):
+        self.tracker.track("m1", "frame-1")
+        self.assertTrue(self.tracker.ack("m1"))
+        self.advance(10)
+        self.assertEqual(self.sent, [])
+        self.assertFalse(self.tracker.ack("m1"))
+
+    def test_retransmits_with_backoff_then_expires(self):
+        self.tracker.track("m1", "frame-1")
+        self.advance(1.01)
+        self.assertEqual(self.sent, ["frame-1"])
+        self.advance(1.0)
+        self.assertEqual(len(self.sent), 1)  # segundo intento espera 2 s
+        self.advance(1.01)
+        self.assertEqual(len(self.sent), 2)
+        self.advance(4.01)
+        self.assertEqual(self.expired, ["m1"])
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_range_ack_settles_session_messages(self):
+        for n in range(1, 6):
+            self.tracker.track(f"m{n}", f"frame-{n}", "s1", n)
+        self.tracker.track("other", "frame-x", "s2", 2)
+
+        self.assertEqual(self.tracker.ack_range("s1", 2, 4), ["m2", "m3", "m4"])
+        self.assertEqual(self.tracker.ack_range("s1", 0, 1000), ["m1", "m5"])
+        self.assertEqual(list(self.tracker.in_flight), ["other"])
+        self.assertEqual(self.tracker.sequenced, {("s2", 2): "other"})
+
+
+class TestAckCoalescer(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=0.01)
+        self.acks = []
+        self.coalescer = AckCoalescer(lambda *ack: self.acks.append(ack), self.wheel, delay=0.05, max_range=4)
+
+    def test_consecutive_messages_share_one_ack(self):
+        for n in (1, 2, 3):
+            self.coalescer.add("agent_a", "s1", n, f"m{n}")
+        self.coalescer.add("agent_b", "s1", 7, "b7")
+        self.assertEqual(self.acks, [])
+
+        self.wheel.advance(0.1)
+        self.assertEqual(sorted(self.acks), [("agent_a", "s1", 1, 3, "m3"), ("agent_b", "s1", 7, 7, "b7")])
+        self.assertEqual(len(self.coalescer), 0)
+
+    def test_gap_or_full_range_flushes_at_once(self):
+        for n in (1, 2, 4, 5, 6, 7):
+            self.coalescer.add("agent_a", "s1", n, f"m{n}")
+        self.assertEqual(self.acks, [("agent_a", "s1", 1, 2, "m2"), ("agent_a", "s1", 4, 7, "m7")])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_ack_range_reads_datos(self):
+        message = {"id_sesion": "s1", "datos": {"desde_secuencia": 3, "hasta_secuencia": 9}}
+        self.assertEqual(ack_range(message), (3, 9))
+        self.assertIsNone(ack_range(dict(message, id_sesion=None)))
+        self.assertIsNone(ack_range({"id_sesion": "s1", "datos": {"desde_secuencia": 9, "hasta_secuencia": 3}}))
+        self.assertIsNone(ack_range({"id_sesion": "s1", "datos": None}))
+
+
+class TestAckTrackerWaiters(unittest.IsolatedAsyncioTestCase):
+
+    async def test_idle_wheel_resyncs_before_scheduling(self):
+        loop = asyncio.get_running_loop()
+        wheel = TimerWheel(resolution=0.01)
+        wheel.start()
+        await asyncio.sleep(0.1)  # rueda vacía: la tarea duerme sin avanzar
+        fired = loop.create_future()
+        scheduled_at = loop.time()
+        wheel.schedule(0.05, lambda: fired.set_result(loop.time()))
+        fired_at = await asyncio.wait_for(fired, 1.0)
+        wheel.stop()
+        self.assertGreaterEqual(fired_at - scheduled_at, 0.04)
+
+    async def test_wait_resolves_on_ack_and_fails_on_expiry(self):
+        wheel = TimerWheel(resolution=0.01)
+        tracker = AckTracker(lambda frame: None, wheel, timeout=0.5, max_retries=0, jitter=0)
+        tracker.track("ok", "a")
+        tracker.track("lost", "b")
+        ok, lost = tracker.wait("ok"), tracker.wait("lost")
+
+        tracker.ack("ok")
+        wheel.advance(wheel.current * wheel.resolution + 1.0)
+
+        self.assertIsNone(await ok)
+        with self.assertRaises(AckTimeoutError):
+            await lost
+
+
+class TestDedupWindow(unittest.TestCase):
+
+    def test_detects_duplicates_within_capacity(self):
+        window = DedupWindow(capacity=3)
+        self.assertFalse(window.check("a"))
+        self.assertTrue(window.check("a"))
+        for message_id in ("b", "c", "d"):
+            window.check(message_id)
+        self.assertEqual(len(window), 3)
+        self.assertFalse(window.check("a"))  # ya salió de la ventana
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,367 @@
+import asyncio
+import json
+import unittest
+
+from acpaas_agent_lib.python.agent_base import create_message
+from acpaas_agent_lib.python.codec import (
+    FORMAT_BINARY, decode_frame, encode_batch, encode_binary, is_batch_frame, is_binary_frame, split_batch)
+from lib.router import MessageRouter
+
+
+class FakeConnection:
+    """Minimal stand-in for a websockets connection."""
+
+    def __init__(self, frames=()):
+        self.frames = list(frames)
+        self.sent = []
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for frame in self.frames:
+            yield frame
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+
+def frame(tipo, origen, destino, **fields):
+    return json.dumps(create_message(tipo, origen, destino, **fields))
+
+
+class TestMessageRouter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.router = MessageRouter()
+
+    async def drain(self):
+        # Dejar que los writers vacíen sus colas
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_forwards_frame_to_destino_untouched(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        self.router.attach("agent_b", conn_b)
+
+        raw = frame("SOLICITUD_TAREA", "agent_a", "agent_b", numero_secuencia=1)
+        self.router.handle_frame(peer_a, raw)
+        await self.drain()
+
+        self.assertEqual(conn_b.sent, [raw])
+        self.assertEqual(conn_a.sent, [])
+
+    async def test_unknown_destination_returns_error(self):
+        conn_a = FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+
+        self.router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_a", "nobody"))
+        await self.drain()
+
+        error = json.loads(conn_a.sent[0])
+        self.assertEqual(error["tipo"], "ERROR")
+        self.assertEqual(error["datos"]["codigo_error"], "DESTINATION_NOT_FOUND")
+
+    async def test_spoofed_origen_is_rejected(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        self.router.attach("agent_b", conn_b)
+
+        self.router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_x", "agent_b"))
+        await self.drain()
+
+        self.assertEqual(conn_b.sent, [])
+        self.assertEqual(json.loads(conn_a.sent[0])["datos"]["codigo_error"], "AUTH_FAILED")
+
+    async def test_full_queue_does_not_block_sender(self):
+        router = MessageRouter(queue_size=2)
+        conn_a = FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        peer_b = router.attach("agent_b", FakeConnection())
+        peer_b.writer.cancel()  # receptor que nunca lee
+
+        for _ in range(3):
+            router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_a", "agent_b"))
+        await self.drain()
+
+        self.assertEqual(peer_b.queue.qsize(), 2)
+        self.assertEqual(peer_b.dropped, 1)
+        errors = [m for m in map(json.loads, conn_a.sent) if m["tipo"] == "ERROR"]
+        self.assertEqual(errors[0]["datos"]["codigo_error"], "RATE_LIMIT_EXCEEDED")
+
+    async def test_high_water_pauses_sender_until_queue_drains(self):
+        router = MessageRouter(queue_size=8, high_water=4, low_water=1)
+        conn_a = FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        slow = asyncio.Event()
+
+        class SlowConnection(FakeConnection):
+            async def send(inner, frame):
+                await slow.wait()
+                inner.sent.append(frame)
+
+        conn_b = SlowConnection()
+        router.attach("agent_b", conn_b)
+        for _ in range(6):
+            router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_a", "agent_b"))
+        await self.drain()
+
+        control = [json.loads(sent) for sent in conn_a.sent]
+        self.assertEqual([m["datos"] for m in control],
+                         [{"accion": "PAUSE", "valor": {"destino": "agent_b"}}])  # una sola vez
+
+        slow.set()
+        await self.drain()
+
+        self.assertEqual(len(conn_b.sent), 6)
+        self.assertEqual(json.loads(conn_a.sent[-1])["datos"]["accion"], "RESUME")
+
+    async def test_paused_senders_resume_when_destination_leaves(self):
+        router = MessageRouter(queue_size=4, high_water=1, low_water=0)
+        conn_a = FakeConnection()
+        peer_a = router.attach("agent_a", conn_a)
+        peer_b = router.attach("agent_b", FakeConnection())
+        peer_b.writer.cancel()
+
+        router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_a", "agent_b"))
+        router.detach(peer_b)
+        await self.drain()
+
+        self.assertEqual([json.loads(sent)["datos"]["accion"] for sent in conn_a.sent], ["PAUSE", "RESUME"])
+
+    async def test_registro_is_acknowledged_by_server(self):
+        conn_a = FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        registro = create_message("REGISTRO", "agent_a", "acpaas_server", datos={"uri": "wss://agent_a:8765"})
+
+        self.router.handle_frame(peer_a, json.dumps(registro))
+        await self.drain()
+
+        ack = json.loads(conn_a.sent[0])
+        self.assertEqual(ack["tipo"], "ACK_REGISTRO")
+        self.assertEqual(ack["respuesta_a"], registro["id_mensaje"])
+
+    async def test_capability_announce_negotiates_binary_format(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        peer_b = self.router.attach("agent_b", conn_b)
+        announce = frame("CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server",
+                         datos={"version_protocolo": "1.1", "capacidades": [], "formatos_payload": ["json", FORMAT_BINARY]})
+
+        self.router.handle_frame(peer_b, announce)
+        await self.drain()
+
+        self.assertEqual(peer_b.payload_format, FORMAT_BINARY)
+        replies = [decode_frame(sent)["tipo"] for sent in conn_b.sent]
+        self.assertEqual(replies, ["CAPABILITY_ACK", "CAPABILITY_ANNOUNCE"])
+
+        # JSON de agent_a -> binario para agent_b, y binario de vuelta -> JSON
+        request = create_message("SOLICITUD_TAREA", "agent_a", "agent_b", numero_secuencia=1)
+        self.router.handle_frame(peer_a, json.dumps(request))
+        reply = create_message("RESPUESTA_TAREA", "agent_b", "agent_a", respuesta_a=request["id_mensaje"])
+        self.router.handle_frame(peer_b, encode_binary(reply))
+        await self.drain()
+
+        self.assertTrue(is_binary_frame(conn_b.sent[-1]))
+        self.assertEqual(decode_frame(conn_b.sent[-1])["id_mensaje"], request["id_mensaje"])
+        self.assertIsInstance(conn_a.sent[-1], str)
+        self.assertEqual(json.loads(conn_a.sent[-1])["respuesta_a"], request["id_mensaje"])
+
+    async def test_unconvertible_message_for_binary_peer_is_rejected(self):
+        # 200 caracteres pasan la validación, pero son 400 bytes: no caben en acpaas-bin/1
+        sender = "á" * 200
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach(sender, conn_a)
+        peer_b = self.router.attach("agent_b", conn_b)
+        self.router.handle_frame(peer_b, frame("CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server",
+                                               datos={"capacidades": [], "formatos_payload": [FORMAT_BINARY]}))
+        await self.drain()
+        conn_b.sent.clear()
+
+        bad_date = create_message("SOLICITUD_TAREA", sender, "agent_b")
+        bad_date["timestamp"] = "2024-02-30T00:00:00Z"
+        for raw in (json.dumps(bad_date), frame("SOLICITUD_TAREA", sender, "agent_b"),
+                    frame("SOLICITUD_TAREA", sender, "BROADCAST", requiere_ack=True)):
+            self.router.handle_frame(peer_a, raw)
+        await self.drain()
+
+        replies = [json.loads(sent) for sent in conn_a.sent]
+        self.assertEqual([(reply["tipo"], reply["datos"]["codigo_error"]) for reply in replies],
+                         [("ERROR", "INVALID_MESSAGE_FORMAT")] * 3)
+        self.assertEqual(conn_b.sent, [])
+
+        # La conexión del emisor sigue sirviendo: lo que sí se puede convertir llega
+        self.router.peers["agent_b"].payload_format = "json"
+        self.router.handle_frame(peer_a, frame("SOLICITUD_TAREA", sender, "agent_b", numero_secuencia=1))
+        await self.drain()
+        self.assertEqual([json.loads(sent)["numero_secuencia"] for sent in conn_b.sent], [1])
+
+    async def test_serve_identifies_agent_from_first_origen(self):
+        registro = frame("REGISTRO", "agent_a", "acpaas_server")
+        seen = []
+
+        class Recording(FakeConnection):
+            async def _iterate(inner):
+                yield registro
+                seen.append(set(self.router.peers))
+
+        await self.router.serve(Recording())
+
+        self.assertEqual(seen, [{"agent_a"}])
+        self.assertEqual(self.router.peers, {})
+
+    async def test_session_init_is_dispatched_by_required_capability(self):
+        conn_a, conn_b, conn_c = FakeConnection(), FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        for agent_id, conn, capacidades in (("agent_b", conn_b, ["ocr"]), ("agent_c", conn_c, ["translate"])):
+            peer = self.router.attach(agent_id, conn)
+            self.router.handle_frame(peer, frame("CAPABILITY_ANNOUNCE", agent_id, "acpaas_server",
+                                                 datos={"capacidades": capacidades, "max_sesiones_concurrentes": 1}))
+        init = create_message("SESSION_INIT", "agent_a", "acpaas_server", id_sesion="6f1c1a52-9c2e-4c55-8d1e-0d2a4b7f3a10",
+                              datos={"proposito": None, "requisitos": {"required_capability": "ocr"}})
+
+        self.router.handle_frame(peer_a, json.dumps(init))
+        self.router.handle_frame(peer_a, json.dumps(dict(init, id_mensaje="0b6f6a3e-2a2f-4f55-9a57-0f7a8b9c1d2e",
+                                                         id_sesion="9a8b7c6d-5e4f-4a3b-8c2d-1e0f9a8b7c6d")))
+        await self.drain()
+
+        dispatched = json.loads(conn_b.sent[-1])
+        self.assertEqual((dispatched["tipo"], dispatched["destino"]), ("SESSION_INIT", "agent_b"))
+        self.assertEqual(dispatched["id_mensaje"], init["id_mensaje"])
+        rejected = json.loads(conn_a.sent[-1])  # agent_b ya no tiene plazas libres
+        self.assertEqual((rejected["tipo"], rejected["datos"]["codigo_error"]), ("SESSION_REJECT", 503))
+
+        close = frame("SESSION_CLOSE", "agent_b", "agent_a", id_sesion=init["id_sesion"])
+        self.router.handle_frame(self.router.peers["agent_b"], close)
+        self.assertIsNotNone(self.router.directory.select("ocr"))
+
+    async def test_broadcast_reaches_matching_agents_except_sender(self):
+        conns = {agent_id: FakeConnection() for agent_id in ("agent_a", "agent_b", "agent_c", "agent_d")}
+        peers = {agent_id: self.router.attach(agent_id, conn) for agent_id, conn in conns.items()}
+        for agent_id, capacidades, temas in (("agent_b", ["ocr"], ["alerts"]), ("agent_c", ["ocr"], []),
+                                             ("agent_d", [], ["alerts"])):
+            self.router.handle_frame(peers[agent_id], frame("CAPABILITY_ANNOUNCE", agent_id, "acpaas_server",
+                                                            datos={"capacidades": capacidades, "temas": temas}))
+        await self.drain()
+        for conn in conns.values():
+            conn.sent.clear()
+
+        everyone = create_message("SOLICITUD_TAREA", "agent_a", "BROADCAST", requiere_ack=True, datos={"texto": "hola"})
+        self.router.handle_frame(peers["agent_a"], json.dumps(everyone))
+        filtered = frame("SOLICITUD_TAREA", "agent_a", "BROADCAST", datos={"filtro": {"capacidad": "ocr", "tema": "alerts"}})
+        self.router.handle_frame(peers["agent_a"], filtered)
+        await self.drain()
+
+        self.assertEqual([json.loads(sent)["tipo"] for sent in conns["agent_a"].sent], ["MESSAGE_ACK"])
+        received = {agent_id: [json.loads(sent) for sent in conns[agent_id].sent]
+                    for agent_id in ("agent_b", "agent_c", "agent_d")}
+        self.assertEqual([len(messages) for messages in received.values()], [2, 1, 1])
+        self.assertFalse(received["agent_c"][0]["requiere_ack"])  # sin implosión de ACKs hacia el emisor
+        self.assertEqual(received["agent_b"][1]["datos"]["filtro"]["tema"], "alerts")
+
+    async def test_broadcast_skips_paused_and_slow_agents(self):
+        conn_a, conn_b, conn_c = FakeConnection(), FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        peer_b = self.router.attach("agent_b", conn_b)
+        peer_c = self.router.attach("agent_c", conn_c)
+        self.router.handle_frame(peer_b, frame("FLOW_CONTROL", "agent_b", "acpaas_server",
+                                               datos={"accion": "PAUSE", "valor": {}}))
+        peer_c.slow = True
+
+        self.assertEqual(self.router.broadcast(create_message("SOLICITUD_TAREA", "agent_a", "BROADCAST")), (0, 2))
+
+        self.router.handle_frame(peer_b, frame("FLOW_CONTROL", "agent_b", "acpaas_server",
+                                               datos={"accion": "RESUME", "valor": {}}))
+        self.router.handle_frame(peer_a, frame("SOLICITUD_TAREA", "agent_a", "BROADCAST"))
+        await self.drain()
+        self.assertEqual(len(conn_b.sent), 1)
+        self.assertEqual(conn_c.sent, [])
+
+    async def test_slow_broadcast_recipient_times_out(self):
+        router = MessageRouter(broadcast_timeout=0.01)
+
+        class Stuck(FakeConnection):
+            async def send(inner, frame):
+                await asyncio.sleep(1)
+
+        peer_b = router.attach("agent_b", Stuck())
+        router.broadcast(create_message("SOLICITUD_TAREA", "agent_a", "BROADCAST"))
+        await asyncio.sleep(0.05)
+
+        self.assertTrue(peer_b.slow)
+        self.assertEqual(router.broadcast(create_message("SOLICITUD_TAREA", "agent_a", "BROADCAST")), (0, 1))
+
+    async def test_disconnect_closes_sessions_of_the_agent(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        peer_b = self.router.attach("agent_b", conn_b)
+        self.router.handle_frame(peer_b, frame("CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server",
+                                               datos={"capacidades": ["ocr"], "max_sesiones_concurrentes": 1}))
+        id_sesion = "6f1c1a52-9c2e-4c55-8d1e-0d2a4b7f3a10"
+        self.router.handle_frame(peer_a, frame("SESSION_INIT", "agent_a", "agent_b", id_sesion=id_sesion))
+        self.router.handle_frame(peer_b, frame("SESSION_ACCEPT", "agent_b", "agent_a", id_sesion=id_sesion))
+        self.assertEqual(self.router.sessions.get(id_sesion).state, "active")
+        self.assertIsNone(self.router.directory.select("ocr"))
+
+        self.router.detach(peer_b)
+        await self.drain()
+
+        self.assertNotIn(id_sesion, self.router.sessions)
+        closed = json.loads(conn_a.sent[-1])
+        self.assertEqual((closed["tipo"], closed["origen"], closed["id_sesion"]),
+                         ("SESSION_CLOSE", "acpaas_server", id_sesion))
+        self.assertEqual(closed["datos"]["motivo"], "Agente desconectado")
+
+    async def test_reconnect_replaces_previous_connection(self):
+        old, new = FakeConnection(), FakeConnection()
+        old_peer = self.router.attach("agent_a", old)
+        new_peer = self.router.attach("agent_a", new)
+
+        self.router.detach(old_peer)
+
+        self.assertIs(self.router.peers["agent_a"], new_peer)
+
+    async def test_writer_batches_queued_frames_for_agents_that_announce_lotes(self):
+        self.router = MessageRouter(batch_messages=8)
+        conn_a, conn_b, conn_c = FakeConnection(), FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        peer_b = self.router.attach("agent_b", conn_b)
+        self.router.attach("agent_c", conn_c)
+        self.router.handle_frame(peer_b, frame("CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server",
+                                               datos={"capacidades": [], "lotes": True}))
+        await self.drain()
+        self.assertTrue(peer_b.batching)
+        # CAPABILITY_ACK y CAPABILITY_ANNOUNCE se encolan juntos: ya van en un lote
+        replies = [decode_frame(sent) for sent in split_batch(conn_b.sent[0])]
+        self.assertEqual([reply["tipo"] for reply in replies], ["CAPABILITY_ACK", "CAPABILITY_ANNOUNCE"])
+        self.assertTrue(replies[1]["datos"]["lotes"])
+        conn_b.sent.clear()
+
+        raws = [frame("SOLICITUD_TAREA", "agent_a", destino, numero_secuencia=n)
+                for n in (1, 2, 3) for destino in ("agent_b", "agent_c")]
+        for raw in raws:
+            self.router.handle_frame(peer_a, raw)
+        await self.drain()
+
+        self.assertEqual(len(conn_b.sent), 1)
+        self.assertTrue(is_batch_frame(conn_b.sent[0]))
+        self.assertEqual(split_batch(conn_b.sent[0]), raws[0::2])
+        self.assertEqual(conn_c.sent, raws[1::2])
+
+    async def test_inbound_batch_is_routed_message_by_message(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        self.router.attach("agent_b", conn_b)
+
+        raws = [frame("SOLICITUD_TAREA", "agent_a", "agent_b", numero_secuencia=n) for n in (1, 2)]
+        spoofed = frame("SOLICITUD_TAREA", "agent_x", "agent_b")
+        self.router.handle_frame(peer_a, encode_batch(raws + [spoofed]))
+        await self.drain()
+
+        self.assertEqual(conn_b.sent, raws)
+        self.assertEqual(json.loads(conn_a.sent[0])["datos"]["codigo_error"], "AUTH_FAILED")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+from acpaas_agent_lib.python.agent_client import AgentClient, TASK_PARTIAL
+from acpaas_agent_lib.python.runtime import AgentRuntime, TASK_FAILED, TASK_OK, TaskHandler
+from tests.test_agent_client import Hub
+
+
+def process_id(parametros):
+    # Nivel de módulo: se envía al pool de procesos por pickle
+    return {"pid": os.getpid(), "n": parametros["n"] ** 2}
+
+
+class TestAgentRuntime(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.hub = Hub()
+        self.clients = []
+        self.worker = AgentClient("worker", "wss://hub/", connect=self.hub.connect_as("worker"))
+        self.runtime = AgentRuntime(self.worker, max_sesiones=2, threads=2, processes=1)
+        self.clients.append(self.worker)
+
+    async def asyncTearDown(self):
+        await self.runtime.close()
+        for client in self.clients:
+            await client.close()
+        for task in self.hub.tasks:
+            task.cancel()
+
+    async def start(self):
+        await self.worker.start(timeout=1.0)
+        caller = AgentClient("caller", "wss://hub/", connect=self.hub.connect_as("caller"))
+        self.clients.append(caller)
+        return await caller.start(timeout=1.0)
+
+    async def open_session(self, caller):
+        session = caller.session("worker")
+        reply = await session.request("SESSION_INIT", {"proposito": "test"}, timeout=1.0)
+        return session, reply
+
+    async def test_runs_handlers_on_loop_thread_and_process(self):
+        loop_thread = threading.get_ident()
+
+        @self.runtime.task("eco")
+        async def eco(parametros):
+            return {"eco": parametros["texto"], "hilo": threading.get_ident()}
+
+        @self.runtime.task("bloqueante")
+        def bloqueante(parametros):
+            time.sleep(0.2)
+            return {"hilo": threading.get_ident()}
+
+        self.runtime.task("cuadrado", executor="process")(process_id)
+        caller = await self.start()
+        session, _ = await self.open_session(caller)
+
+        slow = asyncio.ensure_future(session.request("SOLICITUD_TAREA", {"descripcion_tarea": "bloqueante"},
+                                                     timeout=2.0))
+        await asyncio.sleep(0.01)
+        fast = await session.request("SOLICITUD_TAREA", {"descripcion_tarea": "eco",
+                                                         "parametros": {"texto": "hola"}}, timeout=1.0)
+        self.assertFalse(slow.done())  # el handler bloqueante no frena el bucle
+        self.assertEqual(fast["datos"]["estado"], TASK_OK)
+        self.assertEqual(fast["datos"]["resultado"]["eco"], "hola")
+        self.assertEqual(fast["datos"]["resultado"]["hilo"], loop_thread)
+        self.assertNotEqual((await slow)["datos"]["resultado"]["hilo"], loop_thread)
+
+        square = await session.request("SOLICITUD_TAREA", {"descripcion_tarea": "cuadrado",
+                                                           "parametros": {"n": 7}}, timeout=10.0)
+        self.assertEqual(square["datos"]["resultado"]["n"], 49)
+        self.assertNotEqual(square["datos"]["resultado"]["pid"], os.getpid())
+
+    async def test_enforces_max_sesiones(self):
+        caller = await self.start()
+        self.assertEqual(self.hub.router.directory.get("worker").max_sesiones, 2)
+
+        opened = [await self.open_session(caller) for _ in range(3)]
+        self.assertEqual([reply["tipo"] for _, reply in opened],
+                         ["SESSION_ACCEPT", "SESSION_ACCEPT", "SESSION_REJECT"])
+
+        await opened[0][0].close()
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.runtime.sessions), 1)
+        self.assertEqual((await self.open_session(caller))[1]["tipo"], "SESSION_ACCEPT")
+
+    async def test_streams_partial_results(self):
+        @self.runtime.task("contar")
+        async def contar(parametros):
+            for n in range(parametros["hasta"]):
+                yield {"n": n}
+
+        @self.runtime.task("lineas")
+        def lineas(parametros):
+            for n in range(3):
+                yield f"linea {n}"
+
+        caller = await self.start()
+        session, _ = await self.open_session(caller)
+
+        replies = [reply["datos"] async for reply in session.stream(
+            "SOLICITUD_TAREA", {"descripcion_tarea": "contar", "parametros": {"hasta": 50}}, timeout=1.0)]
+        self.assertEqual([datos["resultado"]["n"] for datos in replies[:-1]], list(range(50)))
+        self.assertTrue(all(datos["estado"] == TASK_PARTIAL for datos in replies[:-1]))
+        self.assertEqual(replies[-1]["estado"], TASK_OK)
+        self.assertEqual(replies[-1]["partes"], 50)
+
+        replies = [reply["datos"]["resultado"] async for reply in session.stream(
+            "SOLICITUD_TAREA", {"descripcion_tarea": "lineas"}, timeout=1.0)]
+        self.assertEqual(replies, ["linea 0", "linea 1", "linea 2", None])
+        self.assertEqual(caller.streams, {})
+
+    async def test_failures_are_reported_in_the_reply(self):
+        @self.runtime.task("rompe")
+        async def rompe(parametros):
+            raise KeyError("falta")
+
+        caller = await self.start()
+        session, _ = await self.open_session(caller)
+
+        failed = await session.request("SOLICITUD_TAREA", {"descripcion_tarea": "rompe"}, timeout=1.0)
+        unknown = await session.request("SOLICITUD_TAREA", {"descripcion_tarea": "nada"}, timeout=1.0)
+
+        self.assertEqual(failed["datos"]["estado"], TASK_FAILED)
+        self.assertEqual(failed["datos"]["error_detalle"]["tipo"], "KeyError")
+        self.assertEqual(unknown["datos"]["estado"], TASK_FAILED)
+        self.assertIn("nada", unknown["datos"]["error_detalle"]["mensaje"])
+
+    def test_rejects_handlers_that_would_block_the_loop(self):
+        async def coroutine(parametros):
+            pass
+
+        def generator(parametros):
+            yield parametros
+
+        with self.assertRaises(ValueError):
+            TaskHandler(coroutine, "thread")
+        with self.assertRaises(ValueError):
+            TaskHandler(process_id, "loop")
+        with self.assertRaises(ValueError):
+            TaskHandler(generator, "process")
+        self.assertEqual(TaskHandler(process_id).executor, "thread")
+
+
+if __name__ == '__main__':
+    unittest.main()
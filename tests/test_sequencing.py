@@ -0,0 +1,74 @@
+import unittest
+
+from acpaas_agent_lib.python.agent_base import create_message
+from acpaas_agent_lib.python.reliability import TimerWheel
+from acpaas_agent_lib.python.sequencing import Resequencer
+
+SESSION = "6f1c1a52-9c2e-4c55-8d1e-0d2a4b7f3a10"
+
+
+def task(numero_secuencia, origen="agent_a", tipo="SOLICITUD_TAREA"):
+    return create_message(tipo, origen, "agent_b", id_sesion=SESSION, numero_secuencia=numero_secuencia)
+
+
+class TestResequencer(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=0.01)
+        self.delivered = []
+        self.gaps = []
+        self.sequencer = Resequencer(self.delivered.append, self.wheel, gap_timeout=1.0, max_buffer=3,
+                                     on_gap=lambda *gap: self.gaps.append(gap))
+
+    def sequences(self):
+        return [message["numero_secuencia"] for message in self.delivered]
+
+    def test_out_of_order_messages_are_delivered_in_sequence(self):
+        for n in (2, 3, 1, 5, 4):
+            self.sequencer.push(task(n))
+        self.assertEqual(self.sequences(), [1, 2, 3, 4, 5])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_duplicates_are_dropped(self):
+        for n in (1, 2, 1, 4, 4, 3, 2):
+            self.sequencer.push(task(n))
+        self.assertEqual(self.sequences(), [1, 2, 3, 4])
+        self.assertEqual(self.sequencer.duplicates, 3)
+
+    def test_senders_and_unsequenced_messages_are_independent(self):
+        self.sequencer.push(task(2, origen="agent_a"))
+        self.sequencer.push(task(1, origen="agent_c"))
+        self.sequencer.push(task(7, tipo="MESSAGE_ACK"))
+        self.sequencer.push(create_message("HEARTBEAT", "agent_a", "agent_b"))
+
+        self.assertEqual([(m["origen"], m["tipo"]) for m in self.delivered],
+                         [("agent_c", "SOLICITUD_TAREA"), ("agent_a", "MESSAGE_ACK"), ("agent_a", "HEARTBEAT")])
+
+    def test_gap_is_reported_and_skipped_after_timeout(self):
+        for n in (1, 4, 5):
+            self.sequencer.push(task(n))
+        self.wheel.advance(0.5)
+        self.assertEqual(self.sequences(), [1])
+
+        self.wheel.advance(1.1)
+        self.assertEqual(self.sequences(), [1, 4, 5])
+        self.assertEqual(self.gaps, [(SESSION, "agent_a", 2, 3)])
+
+        self.sequencer.push(task(2))  # llega tarde: ya se dio por perdido
+        self.assertEqual(self.sequences(), [1, 4, 5])
+
+    def test_full_buffer_skips_gap_immediately(self):
+        for n in (3, 4, 5, 6):
+            self.sequencer.push(task(n))
+        self.assertEqual(self.sequences(), [3, 4, 5, 6])
+        self.assertEqual(self.gaps, [(SESSION, "agent_a", 1, 2)])
+
+    def test_forget_drops_session_state(self):
+        self.sequencer.push(task(2))
+        self.sequencer.forget(SESSION)
+        self.assertEqual(self.sequencer.streams, {})
+        self.assertEqual(len(self.wheel), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from acpaas_agent_lib.python.reliability import TimerWheel
+from lib.sessions import ACTIVE, CLOSING, PENDING, SessionTable
+
+
+class TestSessionTable(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=0.01)
+        self.expired = []
+        self.table = SessionTable(self.wheel, pending_timeout=1.0, idle_timeout=10.0, closing_timeout=0.5,
+                                  on_expired=self.expired.append)
+
+    def test_lifecycle_init_accept_close(self):
+        record = self.table.open("s1", "agent_a", "agent_b")
+        self.assertEqual(record.state, PENDING)
+        self.assertIs(self.table.open("s1", "agent_a", "agent_b"), record)  # SESSION_INIT retransmitido
+
+        self.table.accept("s1")
+        self.assertEqual(record.state, ACTIVE)
+        self.table.close("s1")
+        self.assertEqual(record.state, CLOSING)
+        self.table.close("s1")  # el otro extremo confirma el cierre
+
+        self.assertNotIn("s1", self.table)
+        self.assertEqual(self.table.by_agent, {})
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_pending_session_expires_without_accept(self):
+        self.table.open("s1", "agent_a", "agent_b")
+        self.wheel.advance(0.5)
+        self.assertEqual(self.expired, [])
+
+        self.wheel.advance(1.1)
+        self.assertEqual([record.id_sesion for record in self.expired], ["s1"])
+        self.assertEqual(len(self.table), 0)
+
+    def test_traffic_postpones_idle_timeout(self):
+        self.table.open("s1", "agent_a", "agent_b", timeout=2.0)
+        self.table.accept("s1")
+        self.wheel.advance(1.5)
+        self.table.touch("s1")
+
+        self.wheel.advance(2.5)
+        self.assertEqual(self.expired, [])
+        self.wheel.advance(3.6)
+        self.assertEqual([record.id_sesion for record in self.expired], ["s1"])
+
+    def test_closing_session_is_removed_silently(self):
+        self.table.open("s1", "agent_a", "agent_b")
+        self.table.close("s1")
+        self.wheel.advance(1.0)
+
+        self.assertEqual(len(self.table), 0)
+        self.assertEqual(self.expired, [])
+
+    def test_drop_agent_clears_only_its_sessions(self):
+        for n, (initiator, responder) in enumerate([("a", "b"), ("c", "a"), ("b", "c")]):
+            self.table.open(f"s{n}", initiator, responder)
+
+        dropped = self.table.drop_agent("a")
+
+        self.assertEqual({record.id_sesion for record in dropped}, {"s0", "s1"})
+        self.assertEqual(set(self.table.sessions), {"s2"})
+        self.assertEqual(self.table.by_agent, {"b": {"s2"}, "c": {"s2"}})
+        self.assertEqual(len(self.wheel), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
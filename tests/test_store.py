@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import uuid
+
+from lib.router import MessageRouter
+from lib.store import MessageStore
+from tests.test_router import FakeConnection, frame
+
+
+def stored(index):
+    return json.dumps({"tipo": "SOLICITUD_TAREA", "n": index})
+
+
+class TestMessageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = MessageStore(self.tmp.name, segment_bytes=4096)
+        self.addCleanup(lambda: self.store.segments and self.store.close())
+
+    def fill(self, count, destino="agent_b", requiere_ack=False):
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+        for n, id_mensaje in enumerate(ids):
+            self.assertTrue(self.store.append(destino, id_mensaje, stored(n), requiere_ack))
+        return ids
+
+    def reopen(self):
+        self.store.close()
+        self.store = MessageStore(self.tmp.name, segment_bytes=4096)
+
+    def test_replays_in_order_and_drops_acknowledged(self):
+        self.fill(3)
+        self.store.append("agent_c", str(uuid.uuid4()), b"\x00binary")
+
+        batch = self.store.next_batch("agent_b", 2)
+        self.assertEqual([json.loads(f)["n"] for _, f, _ in batch], [0, 1])
+        for index, _, _ in batch:
+            self.store.acknowledge("agent_b", index)
+        self.assertEqual(self.store.pending("agent_b"), 1)
+        self.assertEqual(self.store.next_batch("agent_c", 10)[0][1], b"\x00binary")
+
+    def test_requiere_ack_messages_wait_for_message_ack(self):
+        ids = self.fill(2, requiere_ack=True)
+        self.assertEqual([r for _, _, r in self.store.next_batch("agent_b", 10)], [True, True])
+        self.assertEqual(self.store.in_flight("agent_b"), 2)
+
+        self.assertTrue(self.store.acknowledge_id("agent_b", ids[0]))
+        self.store.rewind("agent_b")  # reconexión: lo no confirmado se repite
+        self.assertEqual([json.loads(f)["n"] for _, f, _ in self.store.next_batch("agent_b", 10)], [1])
+
+    def test_retransmission_is_stored_once(self):
+        id_mensaje = str(uuid.uuid4())
+        self.store.append("agent_b", id_mensaje, stored(0))
+        self.store.append("agent_b", id_mensaje, stored(0))
+        self.assertEqual(self.store.pending("agent_b"), 1)
+
+    def test_retransmission_after_recovery_is_stored_once(self):
+        id_mensaje = self.fill(1, requiere_ack=True)[0]
+        self.reopen()
+        self.assertTrue(self.store.append("agent_b", id_mensaje, stored(0), True))
+        self.assertEqual(self.store.pending("agent_b"), 1)
+        self.assertEqual(len(self.store.next_batch("agent_b", 10)), 1)
+
+    def test_recovery_restores_unacknowledged_messages(self):
+        self.fill(50)
+        for index, _, _ in self.store.next_batch("agent_b", 20):
+            self.store.acknowledge("agent_b", index)
+        self.reopen()
+
+        self.assertEqual(self.store.pending("agent_b"), 30)
+        self.assertEqual(json.loads(self.store.next_batch("agent_b", 1)[0][1])["n"], 20)
+
+    def test_torn_tail_is_truncated(self):
+        self.fill(3)
+        self.store.sync()
+        path = self.store._active.path
+        self.store.close()
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 5)
+
+        self.store = MessageStore(self.tmp.name, segment_bytes=4096)
+        self.assertEqual(self.store.pending("agent_b"), 2)
+        self.assertEqual(os.path.getsize(path), self.store.segments[0].size)
+
+    def test_acknowledged_segments_are_deleted(self):
+        self.fill(200)
+        self.assertGreater(len(self.store.segments), 3)
+        for index, _, _ in self.store.next_batch("agent_b", 200):
+            self.store.acknowledge("agent_b", index)
+        self.store.sync()
+
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(list(self.store.segments), [self.store._active.number])
+        self.reopen()
+        self.assertEqual(len(self.store), 0)
+
+    def test_full_backlog_refuses_appends(self):
+        self.store.max_backlog = 2
+        self.fill(2)
+        self.assertFalse(self.store.append("agent_b", str(uuid.uuid4()), stored(2)))
+
+
+class TestRouterStoreAndForward(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = MessageStore(self.tmp.name, sync_interval=0)
+        self.router = MessageRouter(store=self.store, replay_window=2)
+
+    async def asyncTearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    async def drain(self):
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def test_offline_messages_are_replayed_on_registro(self):
+        conn_a = FakeConnection()
+        peer_a = self.router.attach("agent_a", conn_a)
+        raws = [frame("SOLICITUD_TAREA", "agent_a", "agent_b", requiere_ack=True) for _ in range(3)]
+        for raw in raws:
+            self.router.handle_frame(peer_a, raw)
+        await asyncio.sleep(0.01)
+        await self.drain()
+
+        custody = [json.loads(sent) for sent in conn_a.sent]
+        self.assertEqual([m["tipo"] for m in custody], ["MESSAGE_ACK"] * 3)
+        self.assertTrue(all(m["datos"]["almacenado"] for m in custody))
+        self.assertEqual(self.store.pending("agent_b"), 3)
+
+        conn_b = FakeConnection()
+        peer_b = self.router.attach("agent_b", conn_b)
+        self.router.handle_frame(peer_b, frame("REGISTRO", "agent_b", "acpaas_server"))
+        await self.drain()
+        # Ventana de 2: el tercero espera al MESSAGE_ACK de uno de los anteriores
+        self.assertEqual(conn_b.sent[1:], raws[:2])
+
+        first = json.loads(raws[0])
+        self.router.handle_frame(peer_b, frame("MESSAGE_ACK", "agent_b", "agent_a",
+                                               respuesta_a=first["id_mensaje"]))
+        await self.drain()
+        self.assertEqual(conn_b.sent[1:], raws)
+        self.assertEqual(self.store.pending("agent_b"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
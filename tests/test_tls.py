@@ -0,0 +1,82 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from acpaas_agent_lib.python import tls
+from benchmarks.certs import SCRIPTS_DIR, generate_cert_dir
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl is required to generate test certificates")
+class TestTLSContexts(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cert_dir = generate_cert_dir(["agent_x"], tempfile.mkdtemp(prefix="acpaas-tls-test-"))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cert_dir, ignore_errors=True)
+
+    async def asyncSetUp(self):
+        self.server_ctx = tls.server_context(*tls.agent_files(self.cert_dir, "acpaas_server"))
+        self.client_ctx = tls.client_context(*tls.agent_files(self.cert_dir, "agent_x"))
+        self.client_ctx.forget_sessions()  # el contexto está cacheado entre tests
+        self.peers = []
+
+        async def handle(reader, writer):
+            ssl_object = writer.get_extra_info("ssl_object")
+            self.peers.append((ssl_object.session_reused, dict(x[0] for x in ssl_object.getpeercert()["subject"])))
+            writer.write(b"ok")
+            await writer.drain()
+            writer.close()
+
+        self.server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=self.server_ctx)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port, ssl=self.client_ctx,
+                                                       server_hostname="localhost")
+        await reader.read()  # incluye los tickets de sesión enviados tras el handshake
+        ssl_object = writer.get_extra_info("ssl_object")
+        writer.close()
+        return ssl_object.session_reused, ssl_object.getpeercert()["serialNumber"]
+
+    async def test_contexts_are_cached_per_file_set(self):
+        self.assertIs(tls.server_context(*tls.agent_files(self.cert_dir, "acpaas_server")), self.server_ctx)
+        self.assertIs(tls.client_context(*tls.agent_files(self.cert_dir, "agent_x")), self.client_ctx)
+
+    async def test_reconnect_resumes_session_and_keeps_client_identity(self):
+        first, _ = await self.connect()
+        second, _ = await self.connect()
+
+        self.assertFalse(first)
+        self.assertTrue(second)
+        self.assertEqual([peer[1]["commonName"] for peer in self.peers], ["agent_x", "agent_x"])
+        self.assertTrue(self.peers[1][0])
+
+    async def test_changed_certificate_is_reloaded_without_restart(self):
+        _, old_serial = await self.connect()
+        subprocess.run(["bash", str(SCRIPTS_DIR / "generate_agent_cert.sh"), "acpaas_server"], cwd=self.cert_dir,
+                       check=True, capture_output=True)
+        cert_file = self.cert_dir / "acpaas_server-cert.pem"
+        stat = cert_file.stat()
+        os.utime(cert_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertIn(self.server_ctx, tls.reload_changed())
+        self.client_ctx.forget_sessions()  # una sesión reanudada no vuelve a presentar el certificado
+        reused, new_serial = await self.connect()
+
+        self.assertFalse(reused)
+        self.assertNotEqual(new_serial, old_serial)
+        self.assertEqual(tls.reload_changed(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,15 @@
 import asyncio
 import websockets
-import ssl
+
+from acpaas_agent_lib.python import tls
 
 async def test_websocket():
     uri = "wss://localhost:8000/ws/test_agent"
     
     # Load SSL context for client
-    ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-    ssl_context.load_cert_chain(certfile="scripts/agente_py-cert.pem", keyfile="scripts/agente_py-key.pem")
-    ssl_context.load_verify_locations(cafile="scripts/ca-cert.pem")
-    ssl_context.verify_mode = ssl.CERT_REQUIRED
-    ssl_context.check_hostname = False  # Disable hostname verification for testing
+    # Disable hostname verification for testing
+    ssl_context = tls.client_context("scripts/agente_py-cert.pem", "scripts/agente_py-key.pem", "scripts/ca-cert.pem",
+                                     check_hostname=False)
 
     async with websockets.connect(uri, ssl=ssl_context) as websocket:
         message = "Hello, server!"
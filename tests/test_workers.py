@@ -0,0 +1,135 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from acpaas_agent_lib.python.agent_base import create_message
+from lib.router import MessageRouter
+from lib.store import MessageStore
+from lib.workers import WorkerBus
+from tests.test_router import FakeConnection
+
+
+class TestWorkerBus(unittest.IsolatedAsyncioTestCase):
+    """Two workers in one event loop, linked through real Unix sockets."""
+
+    async def asyncSetUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        self.routers = [MessageRouter(), MessageRouter()]
+        self.buses = [WorkerBus(i, 2, self.run_dir, router) for i, router in enumerate(self.routers)]
+        for router, bus in zip(self.routers, self.buses):
+            router.bus = bus
+        for bus in self.buses:
+            await bus.start()
+        await self.wait_for(lambda: all(len(bus.writers) == 1 for bus in self.buses))
+
+    async def asyncTearDown(self):
+        for bus in self.buses:
+            await bus.close()
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    async def wait_for(self, condition, timeout=5.0):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition():
+            if asyncio.get_running_loop().time() > deadline:
+                self.fail("condition not met before timeout")
+            await asyncio.sleep(0.01)
+
+    async def test_directory_is_replicated_across_workers(self):
+        peer = self.routers[0].attach("agent_a", FakeConnection())
+        await self.wait_for(lambda: "agent_a" in self.buses[1].remote)
+        self.assertEqual(self.buses[1].remote["agent_a"][0], 0)
+
+        self.routers[0].detach(peer)
+        await self.wait_for(lambda: "agent_a" not in self.buses[1].remote)
+
+    async def test_message_reaches_agent_on_other_worker(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.routers[0].attach("agent_a", conn_a)
+        self.routers[1].attach("agent_b", conn_b)
+        await self.wait_for(lambda: "agent_b" in self.buses[0].remote)
+
+        raw = json.dumps(create_message("SOLICITUD_TAREA", "agent_a", "agent_b", numero_secuencia=1))
+        self.routers[0].handle_frame(peer_a, raw)
+
+        await self.wait_for(lambda: conn_b.sent)
+        self.assertEqual(conn_b.sent, [raw])
+
+    async def test_broadcast_fans_out_on_every_worker(self):
+        conn_a, conn_b, conn_c = FakeConnection(), FakeConnection(), FakeConnection()
+        peer_a = self.routers[0].attach("agent_a", conn_a)
+        self.routers[0].attach("agent_b", conn_b)
+        self.routers[1].attach("agent_c", conn_c)
+
+        raw = json.dumps(create_message("SOLICITUD_TAREA", "agent_a", "BROADCAST", datos={"texto": "hola"}))
+        self.routers[0].handle_frame(peer_a, raw)
+
+        await self.wait_for(lambda: conn_b.sent and conn_c.sent)
+        self.assertEqual(json.loads(conn_c.sent[0])["datos"], {"texto": "hola"})
+        self.assertEqual(conn_a.sent, [])
+
+    async def test_session_dispatch_finds_capable_agent_on_other_worker(self):
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.routers[0].attach("agent_a", conn_a)
+        peer_b = self.routers[1].attach("agent_b", conn_b)
+        self.routers[1].handle_frame(peer_b, json.dumps(create_message(
+            "CAPABILITY_ANNOUNCE", "agent_b", "acpaas_server",
+            datos={"capacidades": ["ocr"], "max_sesiones_concurrentes": 1})))
+        await self.wait_for(lambda: len(conn_b.sent) == 2)
+        conn_b.sent.clear()
+
+        def session_init(capability):
+            return create_message("SESSION_INIT", "agent_a", "acpaas_server", id_sesion=str(uuid.uuid4()),
+                                  datos={"requisitos": {"required_capability": capability}})
+
+        first = session_init("ocr")
+        self.routers[0].handle_frame(peer_a, json.dumps(first))
+        await self.wait_for(lambda: conn_b.sent)
+        dispatched = json.loads(conn_b.sent[0])
+        self.assertEqual((dispatched["destino"], dispatched["id_sesion"]), ("agent_b", first["id_sesion"]))
+        self.assertEqual(self.routers[1].directory.get("agent_b").load, 1)
+
+        # Sin hueco libre (503) y capacidad que nadie ofrece (404): rechazo tras preguntar a todos los workers
+        for capability in ("ocr", "tts"):
+            self.routers[0].handle_frame(peer_a, json.dumps(session_init(capability)))
+        await self.wait_for(lambda: len(conn_a.sent) == 2)
+        replies = [json.loads(sent) for sent in conn_a.sent]
+        self.assertEqual([(reply["tipo"], reply["datos"]["codigo_error"]) for reply in replies],
+                         [("SESSION_REJECT", 503), ("SESSION_REJECT", 404)])
+
+    async def test_backlog_follows_agent_to_other_worker(self):
+        for router in self.routers:
+            router.store = MessageStore(tempfile.mkdtemp(dir=self.run_dir))
+            self.addCleanup(router.store.close)
+        conn_a, conn_b = FakeConnection(), FakeConnection()
+        peer_a = self.routers[0].attach("agent_a", conn_a)
+        stored = create_message("SOLICITUD_TAREA", "agent_a", "agent_b", requiere_ack=True)
+        self.routers[0].handle_frame(peer_a, json.dumps(stored))
+        self.assertEqual(self.routers[0].store.pending("agent_b"), 1)
+
+        # agent_b vuelve por el otro worker: el backlog le llega por el bus
+        self.routers[1].attach("agent_b", conn_b)
+        await self.wait_for(lambda: conn_b.sent)
+        self.assertEqual(self.routers[0].store.pending("agent_b"), 0)
+
+        live = create_message("SOLICITUD_TAREA", "agent_a", "agent_b", requiere_ack=True)
+        self.routers[0].handle_frame(peer_a, json.dumps(live))
+        await self.wait_for(lambda: len(conn_b.sent) == 2)
+        self.assertEqual([json.loads(sent)["id_mensaje"] for sent in conn_b.sent],
+                         [stored["id_mensaje"], live["id_mensaje"]])
+        self.assertEqual(len(self.routers[0].store), 0)
+
+    async def test_newest_attachment_evicts_older_worker(self):
+        self.routers[0].attach("agent_a", FakeConnection())
+        await self.wait_for(lambda: "agent_a" in self.buses[1].remote)
+
+        self.routers[1].attach("agent_a", FakeConnection())
+
+        await self.wait_for(lambda: "agent_a" not in self.routers[0].peers)
+        await self.wait_for(lambda: self.buses[0].remote.get("agent_a", (None,))[0] == 1)
+
+
+if __name__ == '__main__':
+    unittest.main()